@@ -0,0 +1,93 @@
+"""
+Throughput benchmark for the chunked raw-mode container.
+
+Encrypts and decrypts an in-memory payload with increasing worker counts and
+reports MB/s for each, so CPU limits can be sized for hosts that back up and
+re-verify many vaults. The PBKDF2 cost is a fixed per-file overhead and is
+excluded by default (see --iterations).
+
+Usage:
+    python -m benchmarks.bench_crypto --size-mb 256 --workers 1 2 4 8
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+
+from src.crypto import DEFAULT_CHUNK_SIZE, decrypt_stream, encrypt_stream
+
+
+class _NullSink(io.RawIOBase):
+    """Write-only sink that discards data, so disk speed is not measured."""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        return len(b)
+
+
+def bench(
+    payload: bytes, workers: int, chunk_size: int, iterations: int, repeat: int
+) -> dict:
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(payload), encrypted, "bench", chunk_size, iterations)
+    blob = encrypted.getvalue()
+
+    encrypt_times = []
+    decrypt_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encrypt_stream(
+            io.BytesIO(payload), _NullSink(), "bench", chunk_size, iterations, workers
+        )
+        encrypt_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decrypt_stream(io.BytesIO(blob), _NullSink(), "bench", workers)
+        decrypt_times.append(time.perf_counter() - start)
+
+    size_mb = len(payload) / (1024 * 1024)
+    return {
+        "workers": workers,
+        "size_mb": size_mb,
+        "encrypt_mb_s": size_mb / min(encrypt_times),
+        "decrypt_mb_s": size_mb / min(decrypt_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=128)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=1000,
+        help="PBKDF2 iterations; keep low to measure AES-GCM throughput only",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    print(f"CPUs available: {os.cpu_count()}")
+    print(f"{'workers':>8} {'encrypt MB/s':>14} {'decrypt MB/s':>14}")
+    results = []
+    for workers in args.workers:
+        result = bench(payload, workers, args.chunk_size, args.iterations, args.repeat)
+        results.append(result)
+        print(
+            f"{workers:>8} {result['encrypt_mb_s']:>14.1f} {result['decrypt_mb_s']:>14.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "crypto", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+End-to-end benchmark of a backup run against the fake `bw` CLI.
+
+Every scenario (vault size x encryption mode x transport) runs `run.main` in
+a fresh Python process with a real SQLCipher database, the synthetic vault
+from benchmarks.vaultgen and benchmarks/fake_bw.py on PATH as `bw`. For each
+one it reports the wall time, the time spent in each phase (client setup,
+login, unlock, export, attachments, logout), the peak RSS of Backvault and
+of its `bw` child processes, and the bytes written to the backup dir.
+Results can be saved as JSON and compared with an earlier release's.
+
+Usage:
+    python -m benchmarks.bench_run --items 1000 50000 --modes bitwarden raw --json run.json
+    python -m benchmarks.bench_run --items 1000 50000 --compare run.json
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_BW = os.path.join(ROOT, "benchmarks", "fake_bw.py")
+MASTER_PASSWORD = "bench-master-password"
+FILE_PASSWORD = "bench-file-password"
+SCENARIO_KEYS = (
+    "items",
+    "mode",
+    "transport",
+    "compression",
+    "org_ratio",
+    "attachment_ratio",
+    "latency",
+    "runs",
+)
+
+
+def _disk_usage(path: str) -> int:
+    """Bytes stored under `path`, counting hardlinked files once."""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_size
+    return total
+
+
+def _prepare(workdir: str, scenario: dict) -> None:
+    """Create the vault, database and `bw` shim, and point the env at them."""
+    from benchmarks.vaultgen import synthetic_export
+    from src.db import db_connect, init_db, put_key
+
+    vault_file = os.path.join(workdir, "vault.json")
+    with open(vault_file, "w") as f:
+        json.dump(
+            synthetic_export(
+                scenario["items"],
+                org_ratio=scenario["org_ratio"],
+                attachment_ratio=scenario["attachment_ratio"],
+            ),
+            f,
+        )
+
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    shim = os.path.join(bin_dir, "bw")
+    with open(shim, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_BW}" "$@"\n')
+    os.chmod(shim, 0o755)
+
+    db_path = os.path.join(workdir, "backvault.db")
+    pragma_file = os.path.join(workdir, "backvault.db.pragma")
+    init_db(db_path, pragma_file)
+    conn, _ = db_connect(db_path, pragma_file)
+    for name, value in (
+        ("client_id", "user.bench"),
+        ("client_secret", "bench-secret"),
+        ("master_password", MASTER_PASSWORD),
+        ("file_password", FILE_PASSWORD),
+    ):
+        put_key(conn, name, value)
+    conn.close()
+
+    os.environ.update(
+        {
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "BW_SERVER": "https://vault.bench.invalid",
+            "BACKUP_DIR": os.path.join(workdir, "backups"),
+            "BACKUP_STATE_DIR": os.path.join(workdir, "state"),
+            "DB_PATH": db_path,
+            "PRAGMA_KEY_FILE": pragma_file,
+            "BACKUP_ENCRYPTION_MODE": scenario["mode"],
+            "BW_TRANSPORT": scenario["transport"],
+            "BACKUP_COMPRESSION": scenario["compression"],
+            "BACKUP_ATTACHMENTS": "true" if scenario["attachment_ratio"] else "false",
+            "FAKE_BW_VAULT": vault_file,
+            "FAKE_BW_HOME": os.path.join(workdir, "bw"),
+            "FAKE_BW_LATENCY": str(scenario["latency"]),
+            "FAKE_BW_PASSWORD": MASTER_PASSWORD,
+        }
+    )
+
+
+def _instrument(phases: dict[str, float]) -> None:
+    """Accumulate the time spent in each backup phase into `phases`."""
+    from src import run
+    from src.bw_client import BitwardenClient
+    from src.db import CredentialStore
+
+    def timed(phase, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                phases[phase] += time.perf_counter() - start
+
+        return wrapper
+
+    for phase, method in (
+        ("setup", "__init__"),
+        ("login", "login"),
+        ("unlock", "unlock"),
+        ("export", "export_raw_encrypted"),
+        ("export", "export_bitwarden_encrypted"),
+        ("logout", "logout"),
+    ):
+        setattr(BitwardenClient, method, timed(phase, getattr(BitwardenClient, method)))
+    # Opening the credential store and reading the profiles out of it
+    CredentialStore.open = timed("database", CredentialStore.open)
+    run.load_profiles = timed("database", run.load_profiles)
+    run.backup_attachments = timed("attachments", run.backup_attachments)
+
+
+def child(scenario: dict, result_file: str) -> None:
+    """Run one scenario in this process and write its measurements."""
+    with tempfile.TemporaryDirectory(prefix="backvault-bench-") as workdir:
+        _prepare(workdir, scenario)
+        from src import run
+
+        phases = defaultdict(float)
+        _instrument(phases)
+        walls = []
+        succeeded = 0
+        for _ in range(scenario["runs"]):
+            start = time.perf_counter()
+            results = run.main() or []
+            walls.append(time.perf_counter() - start)
+            succeeded += sum(1 for result in results if result.success)
+
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        measurements = {
+            **scenario,
+            "succeeded": succeeded,
+            "wall_s": sum(walls),
+            "wall_per_run_s": walls,
+            "phases_s": dict(phases),
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": self_usage.ru_maxrss / 1024,
+            "peak_child_rss_mb": child_usage.ru_maxrss / 1024,
+            "cpu_s": self_usage.ru_utime + self_usage.ru_stime,
+            "child_cpu_s": child_usage.ru_utime + child_usage.ru_stime,
+            "bytes_written": _disk_usage(os.environ["BACKUP_DIR"]),
+        }
+    with open(result_file, "w") as f:
+        json.dump(measurements, f)
+
+
+def run_scenario(scenario: dict) -> dict:
+    """Run a scenario in a fresh interpreter so RSS is not shared between them."""
+    with tempfile.NamedTemporaryFile(suffix=".json") as result:
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_run",
+                "--child",
+                json.dumps(scenario),
+                "--result",
+                result.name,
+            ],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f"Scenario {scenario} failed:\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}"
+            )
+        return json.load(result)
+
+
+def _metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "benchmark": "run",
+        "commit": commit or None,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _compare(results: list[dict], baseline_file: str) -> None:
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    previous = {
+        tuple(result[key] for key in SCENARIO_KEYS): result
+        for result in baseline["results"]
+    }
+    print(f"\nCompared with {baseline.get('commit') or baseline_file}:")
+    print(
+        f"{'items':>7} {'mode':>9} {'transport':>9} {'wall':>8} {'RSS':>8} {'bytes':>8}"
+    )
+    for result in results:
+        before = previous.get(tuple(result[key] for key in SCENARIO_KEYS))
+        if before is None:
+            continue
+
+        def change(key):
+            if not before[key]:
+                return "n/a"
+            return f"{(result[key] / before[key] - 1) * 100:+.1f}%"
+
+        print(
+            f"{result['items']:>7} {result['mode']:>9} {result['transport']:>9} "
+            f"{change('wall_s'):>8} {change('peak_rss_mb'):>8} "
+            f"{change('bytes_written'):>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--modes", nargs="+", default=["bitwarden", "raw"])
+    parser.add_argument("--transports", nargs="+", default=["cli"])
+    parser.add_argument("--compression", default="none")
+    parser.add_argument("--org-ratio", type=float, default=0.1)
+    parser.add_argument(
+        "--attachment-ratio",
+        type=float,
+        default=0.0,
+        help="Share of items with an attachment; enables BACKUP_ATTACHMENTS",
+    )
+    parser.add_argument(
+        "--latency",
+        default="0",
+        help="FAKE_BW_LATENCY for every bw command, e.g. 0.2 or login=1,default=0.1",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=1, help="Backups per scenario (same process)"
+    )
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    parser.add_argument("--compare", help="Earlier --json results to compare with")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child), args.result)
+        return
+
+    print(f"CPUs available: {os.cpu_count()}")
+    print(
+        f"{'items':>7} {'mode':>9} {'transport':>9} {'wall s':>7} {'login':>6} "
+        f"{'unlock':>6} {'export':>7} {'attach':>7} {'RSS MB':>7} {'bw RSS':>7} "
+        f"{'written MB':>10}"
+    )
+    results = []
+    for items, mode, transport in itertools.product(
+        args.items, args.modes, args.transports
+    ):
+        scenario = {
+            "items": items,
+            "mode": mode,
+            "transport": transport,
+            "compression": args.compression,
+            "org_ratio": args.org_ratio,
+            "attachment_ratio": args.attachment_ratio,
+            "latency": args.latency,
+            "runs": args.runs,
+        }
+        result = run_scenario(scenario)
+        results.append(result)
+        phases = result["phases_s"]
+        print(
+            f"{items:>7} {mode:>9} {transport:>9} {result['wall_s']:>7.2f} "
+            f"{phases.get('login', 0):>6.2f} {phases.get('unlock', 0):>6.2f} "
+            f"{phases.get('export', 0):>7.2f} {phases.get('attachments', 0):>7.2f} "
+            f"{result['peak_rss_mb']:>7.1f} {result['peak_child_rss_mb']:>7.1f} "
+            f"{result['bytes_written'] / 1048576:>10.2f}"
+        )
+        if result["succeeded"] != args.runs:
+            print(f"  warning: only {result['succeeded']}/{args.runs} runs succeeded")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({**_metadata(), "results": results}, f, indent=2)
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
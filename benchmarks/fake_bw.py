@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+A scriptable stand-in for the Bitwarden CLI.
+
+Implements the `bw` commands Backvault uses (config, login, unlock, status,
+sync, list, export, get attachment, logout and serve) against a synthetic
+vault, with a configurable delay per command, so backups can be measured
+end to end without a server or Node.js. Configured through the environment:
+
+    FAKE_BW_VAULT     vault JSON written by benchmarks.vaultgen
+    FAKE_BW_ITEMS     items to generate when FAKE_BW_VAULT is unset (default 1000)
+    FAKE_BW_LATENCY   seconds per command, either one number or per command,
+                      e.g. "login=0.5,unlock=0.8,export=1,default=0.05"
+    FAKE_BW_PASSWORD  master password unlock accepts (default: any)
+    FAKE_BW_FAIL      comma separated commands that exit with an error;
+                      "export:<organization id>" fails one organization's export
+    FAKE_BW_LOG       append every command line (secrets redacted) to this file
+
+State (server, session) is kept in BITWARDENCLI_APPDATA_DIR like the real
+CLI, falling back to FAKE_BW_HOME or the current directory, and mirrored
+into a data.json in the layout of current CLI versions, whose session
+protected key has a valid MAC but random content. Bitwarden encrypted
+exports are only shaped like the real ones: `data` holds the plaintext
+base64-encoded, not encrypted.
+
+Usage:
+    ln -s "$PWD/benchmarks/fake_bw.py" /tmp/fakebin/bw && PATH=/tmp/fakebin:$PATH bw status
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import signal
+import sys
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.vaultgen import (  # noqa: E402
+    organization_export,
+    organizations,
+    personal_export,
+    synthetic_export,
+)
+from src.export_format import iter_csv  # noqa: E402
+
+VERSION = "2025.1.0"
+USER_ID = "00000000-0000-0000-0000-000000000000"
+EMAIL = "bench@example.com"
+SENSITIVE = {"--password", "--apikey", "--clientsecret", "unlock"}
+
+
+def _home() -> str:
+    home = (
+        os.getenv("BITWARDENCLI_APPDATA_DIR")
+        or os.getenv("FAKE_BW_HOME")
+        or os.getcwd()
+    )
+    os.makedirs(home, exist_ok=True)
+    return home
+
+
+def _state_file() -> str:
+    return os.path.join(_home(), "fake-bw.json")
+
+
+def load_state() -> dict:
+    try:
+        with open(_state_file()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _protect(session: str) -> str:
+    """Return an EncArrayBuffer the session key authenticates, as the CLI stores its user key."""
+    key = base64.b64decode(session)
+    iv, ciphertext = os.urandom(16), os.urandom(80)
+    mac = hmac.new(key[32:], iv + ciphertext, hashlib.sha256).digest()
+    return base64.b64encode(bytes([2]) + iv + mac + ciphertext).decode("ascii")
+
+
+def cli_data(state: dict) -> dict:
+    """Return the state the way the real CLI lays out its data.json."""
+    data = {
+        "global_environment_environment": {
+            "region": "Self-hosted",
+            "urls": {"base": state.get("server")},
+        },
+        "global_account_activeAccountId": None,
+    }
+    if state.get("logged_in"):
+        data["global_account_activeAccountId"] = USER_ID
+        data["global_account_accounts"] = {USER_ID: {"email": EMAIL, "name": None}}
+        data[f"user_{USER_ID}_sync_lastSync"] = state.get("last_sync")
+        if state.get("session"):
+            data[f"__PROTECTED__{USER_ID}_user_auto"] = _protect(state["session"])
+    return data
+
+
+def save_state(state: dict) -> None:
+    with open(_state_file(), "w") as f:
+        json.dump(state, f)
+    with open(os.path.join(_home(), "data.json"), "w") as f:
+        json.dump(cli_data(state), f)
+
+
+def load_vault() -> dict:
+    path = os.getenv("FAKE_BW_VAULT")
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return synthetic_export(int(os.getenv("FAKE_BW_ITEMS", "1000")))
+
+
+def delay(command: str) -> None:
+    spec = os.getenv("FAKE_BW_LATENCY", "")
+    if not spec:
+        return
+    if "=" not in spec:
+        time.sleep(float(spec))
+        return
+    latencies = dict(part.split("=", 1) for part in spec.split(",") if part)
+    time.sleep(float(latencies.get(command, latencies.get("default", 0))))
+
+
+def attachment_bytes(vault: dict, item_id: str, attachment_id: str) -> bytes:
+    """Return the deterministic content of one attachment of the vault."""
+    for item in vault["items"]:
+        if item["id"] != item_id:
+            continue
+        for attachment in item.get("attachments") or []:
+            if attachment["id"] == attachment_id:
+                size = int(attachment.get("size") or 0)
+                return random.Random(attachment_id).randbytes(size)
+    raise KeyError(f"Attachment {attachment_id} of item {item_id} not found")
+
+
+def status(state: dict) -> dict:
+    if not state.get("logged_in"):
+        current = "unauthenticated"
+    elif state.get("session") and os.getenv("BW_SESSION") == state["session"]:
+        current = "unlocked"
+    else:
+        current = "locked"
+    return {
+        "serverUrl": state.get("server"),
+        "lastSync": state.get("last_sync"),
+        "userEmail": EMAIL if state.get("logged_in") else None,
+        "userId": USER_ID if state.get("logged_in") else None,
+        "status": current,
+    }
+
+
+class Fail(Exception):
+    pass
+
+
+def _option(args: list[str], name: str) -> str | None:
+    if name in args:
+        return args[args.index(name) + 1]
+    return None
+
+
+def _require_unlocked(state: dict) -> None:
+    if not state.get("logged_in"):
+        raise Fail("You are not logged in.")
+    if not state.get("session") or os.getenv("BW_SESSION") != state["session"]:
+        raise Fail("Vault is locked.")
+
+
+def _unlock(state: dict, password: str | None) -> str:
+    expected = os.getenv("FAKE_BW_PASSWORD")
+    if not state.get("logged_in"):
+        raise Fail("You are not logged in.")
+    if expected is not None and password != expected:
+        raise Fail("Invalid master password.")
+    state["session"] = base64.b64encode(secrets.token_bytes(64)).decode("ascii")
+    save_state(state)
+    return state["session"]
+
+
+def command(args: list[str]) -> str | None:
+    """Run one CLI command and return what it prints to stdout."""
+    if not args:
+        raise Fail("No command given")
+    if args[0] in ("--version", "-v"):
+        return VERSION
+    name = args[0]
+    if name in os.getenv("FAKE_BW_FAIL", "").split(","):
+        raise Fail(f"Simulated failure of '{name}'")
+    delay(name)
+    state = load_state()
+
+    if name == "config":
+        if args[1:2] == ["server"] and len(args) > 2:
+            state["server"] = args[2]
+            save_state(state)
+            return "Saved setting `config`."
+        return state.get("server")
+    if name == "login":
+        if state.get("logged_in"):
+            raise Fail(f"You are already logged in as {EMAIL}.")
+        if "--apikey" in args and not (
+            os.getenv("BW_CLIENTID") and os.getenv("BW_CLIENTSECRET")
+        ):
+            raise Fail("client_id or client_secret is missing.")
+        state["logged_in"] = True
+        save_state(state)
+        if "--raw" in args:
+            return _unlock(state, _option(args, "--password"))
+        return "You are logged in!"
+    if name == "unlock":
+        password = args[1] if len(args) > 1 and not args[1].startswith("--") else None
+        if password is None and _option(args, "--passwordenv"):
+            password = os.getenv(_option(args, "--passwordenv"))
+        return _unlock(state, password)
+    if name == "status":
+        return json.dumps(status(state))
+    if name == "logout":
+        if not state.get("logged_in"):
+            raise Fail("You are not logged in.")
+        save_state({"server": state.get("server")})
+        return "You have logged out."
+    if name == "sync":
+        _require_unlocked(state)
+        state["last_sync"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        save_state(state)
+        return "Syncing complete."
+
+    _require_unlocked(state)
+    vault = load_vault()
+    if name == "list" and len(args) > 1:
+        if args[1] == "organizations":
+            return json.dumps(organizations(vault))
+        if args[1] not in ("items", "folders"):
+            raise Fail(f"Unknown object '{args[1]}'")
+        return json.dumps(vault[args[1]])
+    if name == "export":
+        org_id = _option(args, "--organizationid")
+        if org_id is None:
+            export = personal_export(vault)
+        elif f"export:{org_id}" in os.getenv("FAKE_BW_FAIL", "").split(","):
+            raise Fail(f"Simulated failure of 'export' for {org_id}")
+        elif org_id in {org["id"] for org in organizations(vault)}:
+            export = organization_export(vault, org_id)
+        else:
+            raise Fail("Organization not found.")
+        if _option(args, "--format") == "csv":
+            # Like the CLI, without a line break after the last record
+            export = b"".join(iter_csv(export)).decode("utf-8").rstrip("\r\n")
+        else:
+            export = json.dumps(export, indent=2)
+        output = _option(args, "--output")
+        if output is None:
+            return export
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "encrypted": True,
+                    "passwordProtected": True,
+                    "salt": base64.b64encode(os.urandom(16)).decode("ascii"),
+                    "kdfType": 0,
+                    "kdfIterations": 600000,
+                    "data": base64.b64encode(export.encode("utf-8")).decode("ascii"),
+                },
+                f,
+            )
+        return f"Saved {output}"
+    if name == "get" and args[1:2] == ["attachment"] and len(args) > 2:
+        data = attachment_bytes(vault, _option(args, "--itemid"), args[2])
+        output = _option(args, "--output")
+        if output is None:
+            sys.stdout.buffer.write(data)
+            return None
+        with open(output, "wb") as f:
+            f.write(data)
+        return f"Saved {output}"
+    raise Fail(f"Unknown command: {' '.join(args)}")
+
+
+class ServeHandler(BaseHTTPRequestHandler):
+    """The subset of the `bw serve` Vault Management API Backvault uses."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict | None = None, body: bytes = b""):
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header(
+            "Content-Type",
+            "application/json" if payload is not None else "application/octet-stream",
+        )
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str) -> None:
+        url = urllib.parse.urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        state = load_state()
+        try:
+            if method == "GET" and url.path == "/status":
+                delay("status")
+                serve_status = status(state)
+                if state.get("serve_unlocked"):
+                    serve_status["status"] = "unlocked"
+                data = {"object": "template", "template": serve_status}
+            elif method == "POST" and url.path == "/unlock":
+                delay("unlock")
+                data = {"raw": _unlock(state, body.get("password"))}
+                state["serve_unlocked"] = True
+                save_state(state)
+            elif not state.get("serve_unlocked"):
+                raise Fail("Vault is locked.")
+            elif method == "POST" and url.path == "/sync":
+                delay("sync")
+                data = None
+            elif method == "GET" and url.path.startswith("/list/object/"):
+                delay("list")
+                kind = url.path.rsplit("/", 1)[1]
+                vault = load_vault()
+                if kind == "organizations":
+                    objects = organizations(vault)
+                elif kind == "collections":
+                    objects = [
+                        collection
+                        for org in organizations(vault)
+                        for collection in organization_export(vault, org["id"])[
+                            "collections"
+                        ]
+                    ]
+                else:
+                    objects = vault[kind]
+                data = {"object": "list", "data": objects}
+            elif method == "GET" and url.path.startswith("/object/attachment/"):
+                delay("get")
+                item_id = urllib.parse.parse_qs(url.query)["itemid"][0]
+                attachment_id = url.path.rsplit("/", 1)[1]
+                self._reply(
+                    200, body=attachment_bytes(load_vault(), item_id, attachment_id)
+                )
+                return
+            else:
+                self._reply(404, {"success": False, "message": "Not found"})
+                return
+        except (Fail, KeyError) as e:
+            self._reply(400, {"success": False, "message": str(e)})
+            return
+        self._reply(200, {"success": True, "data": data})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def serve(args: list[str]) -> None:
+    host = _option(args, "--hostname") or "localhost"
+    port = int(_option(args, "--port") or 8087)
+    delay("serve")
+    server = ThreadingHTTPServer((host, port), ServeHandler)
+    # BwServe.stop() terminates the process; leave the state file consistent
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state = load_state()
+        state.pop("serve_unlocked", None)
+        save_state(state)
+
+
+def main(argv: list[str]) -> int:
+    log = os.getenv("FAKE_BW_LOG")
+    if log:
+        redacted = [
+            "[REDACTED]" if i and argv[i - 1] in SENSITIVE else arg
+            for i, arg in enumerate(argv)
+        ]
+        with open(log, "a") as f:
+            f.write(" ".join(redacted) + "\n")
+    if argv[:1] == ["serve"]:
+        serve(argv)
+        return 0
+    try:
+        output = command(argv)
+    except Fail as e:
+        print(e, file=sys.stderr)
+        return 1
+    if output is not None:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
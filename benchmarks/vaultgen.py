@@ -0,0 +1,188 @@
+"""
+Synthetic vault generator shared by the benchmarks and the fake `bw` CLI.
+
+Builds vaults in the `bw list items` / `bw export --format json` layout with
+a chosen number of items. Secure notes, organization ciphers (spread over one
+or more organizations) and attachments can be mixed in. Passwords, TOTP
+secrets and ids are random, like in a real vault, so compression and
+encryption are not flattered by repetitive test data. The same arguments
+always produce the same vault.
+
+Usage:
+    python -m benchmarks.vaultgen --items 50000 --org-ratio 0.2 --out vault.json
+"""
+
+import argparse
+import base64
+import json
+import random
+import uuid
+
+DOMAINS = ["mail", "bank", "shop", "forum", "cloud", "news", "git", "travel"]
+WORDS = ["personal", "work", "family", "old", "shared", "primary", "backup"]
+
+
+def _secret(rng: random.Random, size: int) -> str:
+    return base64.b64encode(rng.randbytes(size)).decode("ascii")[:size]
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def synthetic_export(
+    items: int,
+    seed: int = 0,
+    notes_every: int = 10,
+    note_words: int = 40,
+    org_ratio: float = 0.0,
+    attachment_ratio: float = 0.0,
+    attachment_size: int = 64 * 1024,
+    orgs: int = 1,
+) -> dict:
+    """
+    Return a vault with `items` logins and secure notes.
+
+    :param notes_every: every n-th item is a secure note (0 for none)
+    :param note_words: words in each secure note
+    :param org_ratio: share of items that belong to an organization
+    :param attachment_ratio: share of items with one attachment
+    :param attachment_size: size of every attachment in bytes
+    :param orgs: organizations the organization ciphers are spread over
+    """
+    rng = random.Random(seed)
+    # Organization ciphers and attachments draw from their own generator so
+    # the personal vault is the same with or without them
+    extra = random.Random(seed + 1)
+    folders = [{"id": _uuid(rng), "name": word.title()} for word in WORDS]
+    org_collections = [(_uuid(extra), _uuid(extra)) for _ in range(max(1, orgs))]
+    exported = []
+    for index in range(items):
+        domain = f"{rng.choice(DOMAINS)}{index % 97}.example.com"
+        item = {
+            "passwordHistory": None,
+            "revisionDate": f"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T10:00:00.000Z",
+            "creationDate": "2024-01-01T00:00:00.000Z",
+            "deletedDate": None,
+            "id": _uuid(rng),
+            "organizationId": None,
+            "folderId": rng.choice(folders)["id"] if rng.random() < 0.7 else None,
+            "type": 1,
+            "reprompt": 0,
+            "name": f"{domain} ({rng.choice(WORDS)})",
+            "notes": None,
+            "favorite": rng.random() < 0.1,
+            "fields": [],
+            "login": {
+                "fido2Credentials": [],
+                "uris": [{"match": None, "uri": f"https://{domain}/login"}],
+                "username": f"user{rng.randint(1, 50)}@example.com",
+                "password": _secret(rng, rng.randint(12, 32)),
+                "totp": _secret(rng, 32) if rng.random() < 0.2 else None,
+            },
+            "collectionIds": None,
+        }
+        if notes_every and index % notes_every == 0:
+            item["type"] = 2
+            item["secureNote"] = {"type": 0}
+            item["notes"] = " ".join(rng.choice(WORDS) for _ in range(note_words))
+            del item["login"]
+        if org_ratio and extra.random() < org_ratio:
+            org_id, collection_id = org_collections[
+                extra.randrange(orgs) if orgs > 1 else 0
+            ]
+            item["organizationId"] = org_id
+            item["folderId"] = None
+            item["collectionIds"] = [collection_id]
+        if attachment_ratio and extra.random() < attachment_ratio:
+            item["attachments"] = [
+                {
+                    "id": _uuid(extra),
+                    "fileName": f"{item['id'][:8]}.pdf",
+                    "size": str(attachment_size),
+                    "sizeName": f"{attachment_size / 1024:.0f} KB",
+                    "url": None,
+                }
+            ]
+        exported.append(item)
+    return {"encrypted": False, "folders": folders, "items": exported}
+
+
+def personal_export(vault: dict) -> dict:
+    """Return what `bw export` writes for a vault: personal items only."""
+    return {
+        "encrypted": False,
+        "folders": vault["folders"],
+        "items": [
+            {key: value for key, value in item.items() if key != "attachments"}
+            for item in vault["items"]
+            if item.get("organizationId") is None
+        ],
+    }
+
+
+def organizations(vault: dict) -> list[dict]:
+    """Return what `bw list organizations` prints for a vault."""
+    org_ids = dict.fromkeys(
+        item["organizationId"] for item in vault["items"] if item.get("organizationId")
+    )
+    return [
+        {"object": "organization", "id": org_id, "name": f"Organization {index}"}
+        for index, org_id in enumerate(org_ids, 1)
+    ]
+
+
+def organization_export(vault: dict, org_id: str) -> dict:
+    """Return what `bw export --organizationid` writes for one organization."""
+    items = [
+        {key: value for key, value in item.items() if key != "attachments"}
+        for item in vault["items"]
+        if item.get("organizationId") == org_id
+    ]
+    collection_ids = dict.fromkeys(
+        collection_id for item in items for collection_id in item["collectionIds"]
+    )
+    return {
+        "encrypted": False,
+        "collections": [
+            {
+                "id": collection_id,
+                "organizationId": org_id,
+                "name": f"Collection {index}",
+                "externalId": None,
+            }
+            for index, collection_id in enumerate(collection_ids, 1)
+        ],
+        "items": items,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--notes-every", type=int, default=10)
+    parser.add_argument("--note-words", type=int, default=40)
+    parser.add_argument("--org-ratio", type=float, default=0.0)
+    parser.add_argument("--orgs", type=int, default=1)
+    parser.add_argument("--attachment-ratio", type=float, default=0.0)
+    parser.add_argument("--attachment-size", type=int, default=64 * 1024)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    vault = synthetic_export(
+        args.items,
+        args.seed,
+        args.notes_every,
+        args.note_words,
+        args.org_ratio,
+        args.attachment_ratio,
+        args.attachment_size,
+        args.orgs,
+    )
+    with open(args.out, "w") as f:
+        json.dump(vault, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ CRON_EXPRESSION=${CRON_EXPRESSION:-"0 */$BACKUP_INTERVAL_HOURS * * *"}
 UI_HOST="${SETUP_UI_HOST:-0.0.0.0}"
 UI_PORT="${SETUP_UI_PORT:-8080}"
 DB_FILE="/app/db/backvault.db"
+BACKUP_SCHEDULER="${BACKUP_SCHEDULER:-supercronic}"
 
 # Prepare wrapper that runs backup
 cat > /app/run_wrapper.sh <<EOF
@@ -14,7 +15,7 @@ cat > /app/run_wrapper.sh <<EOF
 set -euo pipefail
 export PATH="/usr/local/bin:\$PATH"
 $(printenv | grep -E 'BW_|BACKUP_' | sed 's/^/export /')
-/usr/local/bin/python /app/src/run.py 2>&1 | tee -a /app/logs/cron.log
+/usr/local/bin/python /app/src/run.py "\$@" 2>&1 | tee -a /app/logs/cron.log
 EOF
 
 chmod +x /app/run_wrapper.sh
@@ -27,6 +28,13 @@ $CRON_EXPRESSION /app/run_wrapper.sh
 0 0 * * * /app/cleanup.sh 2>&1 | tee -a /app/logs/cron.log
 EOF
 
+if [ -n "${BACKUP_VERIFY_CRON:-}" ]; then
+  cat >> /app/crontab <<EOF
+# Restore verification of stored backups
+$BACKUP_VERIFY_CRON /app/run_wrapper.sh --verify
+EOF
+fi
+
 if [ ! -f "${DB_FILE}" ]; then
   echo "Secure DB not found; starting one-time setup UI at http://${UI_HOST}:${UI_PORT}"
   cd /app/src
@@ -43,6 +51,14 @@ if [ ! -f "${DB_FILE}" ]; then
   cd /app
 fi
 
+if [ "${BACKUP_SCHEDULER}" = "daemon" ]; then
+  # The resident scheduler runs the initial backup itself and keeps the
+  # interpreter, DB connection and CLI configuration warm between runs
+  echo "Starting resident Python scheduler..."
+  exec > >(tee -a /app/logs/cron.log) 2>&1
+  exec /usr/local/bin/python /app/src/run.py --daemon
+fi
+
 echo "Running initial backup..."
 
 ./run_wrapper.sh
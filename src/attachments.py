@@ -0,0 +1,293 @@
+import contextvars
+import glob
+import hashlib
+import hmac
+import io
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from sys import stdout
+from typing import Any
+from cryptography.exceptions import InvalidTag
+from src.crypto import (
+    BackupFormatError,
+    decrypt_stream,
+    encrypt_stream,
+    fingerprint_key,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+# Content-addressed blobs are shared by every backup in a backup dir
+BLOBS_DIR = "attachments"
+MANIFEST_SUFFIX = ".attachments.enc"
+
+# Serializes moving finished blobs into place, so two workers downloading the
+# same content agree on which of them stored it
+_store_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class AttachmentRef:
+    """One file attached to a vault item."""
+
+    item_id: str
+    attachment_id: str
+    file_name: str | None = None
+    size: int = 0
+
+
+@dataclass
+class AttachmentReport:
+    """What one attachment backup did and how long each download took."""
+
+    total: int = 0
+    downloaded: int = 0
+    reused: int = 0
+    stored: int = 0
+    failed: int = 0
+    bytes_downloaded: int = 0
+    elapsed: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    # Blob ids the manifest references
+    blobs: list[str] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Downloaded bytes per second of wall time."""
+        return self.bytes_downloaded / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile of the per-attachment latencies."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    def summary(self) -> str:
+        return (
+            f"Attachments: {self.total} total, {self.downloaded} downloaded, "
+            f"{self.reused} unchanged, {self.stored} new blobs, "
+            f"{self.failed} failed; "
+            f"{self.bytes_downloaded / 1048576:.2f} MiB in {self.elapsed:.1f}s "
+            f"({self.throughput / 1048576:.2f} MiB/s); latency "
+            f"p50 {self.percentile(50):.2f}s, p90 {self.percentile(90):.2f}s, "
+            f"p99 {self.percentile(99):.2f}s, "
+            f"max {max(self.latencies, default=0.0):.2f}s"
+        )
+
+
+def attachment_refs(items: list[dict[str, Any]]) -> list[AttachmentRef]:
+    """
+    Collect the attachments of personal items in the `bw list items` layout,
+    matching what the vault export itself covers.
+    """
+    refs = []
+    for item in items:
+        if item.get("organizationId") is not None or item.get("deletedDate"):
+            continue
+        for attachment in item.get("attachments") or []:
+            refs.append(
+                AttachmentRef(
+                    item_id=item["id"],
+                    attachment_id=attachment["id"],
+                    file_name=attachment.get("fileName"),
+                    size=int(attachment.get("size") or 0),
+                )
+            )
+    return refs
+
+
+def manifest_path(backup_file: str) -> str:
+    """Return the attachment manifest written alongside `backup_file`."""
+    base = backup_file[: -len(".enc")] if backup_file.endswith(".enc") else backup_file
+    return f"{base}{MANIFEST_SUFFIX}"
+
+
+def load_manifest(path: str, file_pw: str) -> list[dict[str, Any]]:
+    """Decrypt an attachment manifest and return its entries."""
+    out = io.BytesIO()
+    with open(path, "rb") as f:
+        decrypt_stream(f, out, file_pw)
+    return json.loads(out.getvalue())["attachments"]
+
+
+def _previous_entries(
+    backup_dir: str, current: str, file_pw: str
+) -> dict[tuple[str, str], dict]:
+    """
+    Return the newest earlier manifest's entries whose blob still exists,
+    keyed by (item id, attachment id).
+    """
+    manifests = sorted(
+        path
+        for path in glob.glob(os.path.join(backup_dir, f"*{MANIFEST_SUFFIX}"))
+        if os.path.abspath(path) != os.path.abspath(current)
+    )
+    if not manifests:
+        return {}
+    try:
+        entries = load_manifest(manifests[-1], file_pw)
+    except (OSError, ValueError, KeyError, InvalidTag, BackupFormatError) as e:
+        logger.warning(
+            f"Could not read {os.path.basename(manifests[-1])}, "
+            f"downloading every attachment again: {e}"
+        )
+        return {}
+    blobs_dir = os.path.join(backup_dir, BLOBS_DIR)
+    return {
+        (entry["item_id"], entry["attachment_id"]): entry
+        for entry in entries
+        if os.path.isfile(os.path.join(blobs_dir, f"{entry['blob']}.enc"))
+    }
+
+
+def _store_blob(
+    source, ref: AttachmentRef, blobs_dir: str, file_pw: str, kdf_salt, key: bytes
+) -> tuple[str, int, bool]:
+    """
+    Download one attachment and encrypt it into the blob store.
+
+    The blob name is an HMAC of the plaintext under a key derived from the file
+    password, computed while encrypting. A blob that already exists (the same
+    file attached twice, or re-uploaded under a new id) is not stored again.
+
+    :return: blob name, plaintext size and whether a new blob was stored
+    """
+    digest = hmac.new(key, digestmod=hashlib.sha256)
+    fd, partial_file = tempfile.mkstemp(dir=blobs_dir, suffix=".partial")
+    try:
+        # The fd is wrapped first, so it is closed even if the download fails
+        with os.fdopen(fd, "wb") as f, source.open_attachment(ref) as stream:
+            size = encrypt_stream(stream, f, file_pw, kdf_salt=kdf_salt, hasher=digest)
+    except BaseException:
+        os.remove(partial_file)
+        raise
+    blob = digest.hexdigest()
+    blob_file = os.path.join(blobs_dir, f"{blob}.enc")
+    with _store_lock:
+        if os.path.exists(blob_file):
+            os.remove(partial_file)
+            return blob, size, False
+        os.replace(partial_file, blob_file)
+    return blob, size, True
+
+
+def backup_attachments(
+    source,
+    backup_file: str,
+    file_pw: str,
+    kdf_salt: bytes | None = None,
+    workers: int = 4,
+) -> AttachmentReport:
+    """
+    Back up the attachments of every item next to `backup_file`.
+
+    `source` is a logged-in client providing `list_attachments()` and
+    `open_attachment(ref)`. Attachments listed in the previous run's manifest
+    whose blob still exists are not downloaded again; the rest are downloaded
+    and encrypted on a pool of `workers` threads. An encrypted manifest
+    mapping every attachment to its blob is written next to `backup_file`,
+    and every referenced blob has its mtime refreshed afterwards so age-based
+    retention keeps it for as long as a backup refers to it.
+    """
+    started = time.monotonic()
+    report = AttachmentReport()
+    backup_dir = os.path.dirname(os.path.abspath(backup_file))
+    blobs_dir = os.path.join(backup_dir, BLOBS_DIR)
+    os.makedirs(blobs_dir, exist_ok=True)
+    manifest_file = manifest_path(backup_file)
+
+    refs = source.list_attachments()
+    report.total = len(refs)
+    previous = _previous_entries(backup_dir, manifest_file, file_pw)
+    entries = []
+    pending = []
+    for ref in refs:
+        known = previous.get((ref.item_id, ref.attachment_id))
+        if known is not None:
+            entries.append({**known, "file_name": ref.file_name})
+            report.reused += 1
+        else:
+            pending.append(ref)
+
+    if pending:
+        key = fingerprint_key(file_pw, kdf_salt)
+        workers = max(1, min(workers, len(pending)))
+        logger.info(
+            f"Downloading {len(pending)} of {len(refs)} attachments "
+            f"with {workers} workers"
+        )
+
+        def timed(ref: AttachmentRef):
+            begin = time.perf_counter()
+            stored = _store_blob(source, ref, blobs_dir, file_pw, kdf_salt, key)
+            return stored, time.perf_counter() - begin
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="backvault-attachment"
+        ) as pool:
+            # Each download runs in a copy of this context, so its bw process
+            # is traced as part of the backup
+            futures = {
+                pool.submit(contextvars.copy_context().run, timed, ref): ref
+                for ref in pending
+            }
+            for future in as_completed(futures):
+                ref = futures[future]
+                try:
+                    (blob, size, stored), latency = future.result()
+                except Exception as e:
+                    report.failed += 1
+                    logger.error(
+                        f"Attachment {ref.attachment_id} of item {ref.item_id} "
+                        f"failed: {e}"
+                    )
+                    continue
+                report.downloaded += 1
+                report.stored += stored
+                report.bytes_downloaded += size
+                report.latencies.append(latency)
+                entries.append(
+                    {
+                        "item_id": ref.item_id,
+                        "attachment_id": ref.attachment_id,
+                        "file_name": ref.file_name,
+                        "size": size,
+                        "blob": blob,
+                    }
+                )
+
+    entries.sort(key=lambda entry: (entry["item_id"], entry["attachment_id"]))
+    partial_file = f"{manifest_file}.partial"
+    try:
+        with open(partial_file, "wb") as f:
+            encrypt_stream(
+                io.BytesIO(json.dumps({"attachments": entries}).encode("utf-8")),
+                f,
+                file_pw,
+                kdf_salt=kdf_salt,
+            )
+    except BaseException:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+    os.replace(partial_file, manifest_file)
+    for entry in entries:
+        os.utime(os.path.join(blobs_dir, f"{entry['blob']}.enc"))
+    report.blobs = sorted({entry["blob"] for entry in entries})
+
+    report.elapsed = time.monotonic() - started
+    logger.info(report.summary())
+    return report
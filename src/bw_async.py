@@ -0,0 +1,463 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from sys import stdout
+from typing import Any
+from src import catalog, metrics, tracing
+from src.bw_client import (
+    BitwardenError,
+    _CsvRecordCounter,
+    _ExportItemCounter,
+    _mask_secrets,
+    _organization_args,
+    _redact_cmd,
+)
+from src.bw_state import normalize_url, read_cli_state
+from src.crypto import encrypt_stream
+from src.snapshots import HashingWriter, finish_snapshot, new_fingerprint
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+# How long a cancelled bw process gets to exit after SIGTERM
+KILL_TIMEOUT = 5.0
+
+
+async def _stop(process: asyncio.subprocess.Process) -> None:
+    """Terminate a bw process that is no longer wanted, and reap it."""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(asyncio.shield(process.wait()), KILL_TIMEOUT)
+    except TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+class AsyncBitwardenClient:
+    """
+    The CLI transport of BitwardenClient on asyncio subprocesses, so the
+    commands of several vaults (or anything else on the event loop) can run
+    side by side on one thread.
+
+    Commands are redacted, traced and counted exactly as BitwardenClient
+    does. A cancelled command terminates its bw process (and kills it if it
+    does not exit within KILL_TIMEOUT) before the cancellation propagates.
+    The server is configured by the first command instead of the
+    constructor, which cannot await.
+    """
+
+    def __init__(
+        self,
+        bw_cmd: str = "bw",
+        session: str | None = None,
+        server: str | None = None,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        use_api_key: bool = True,
+        encrypt_workers: int = 1,
+        appdata_dir: str | None = None,
+        kdf_salt: bytes | None = None,
+    ):
+        """
+        :param bw_cmd: Path to bw CLI command (default "bw")
+        :param session: Existing BW_SESSION token (optional)
+        :param server: Bitwarden server URL (optional, Vaultwarden compatible)
+        :param client_id: Client ID for API key login (optional)
+        :param client_secret: Client Secret for API key login (optional)
+        :param use_api_key: Whether to use API key login if client_id and client_secret are provided (Default to True)
+        :param encrypt_workers: Number of threads encrypting raw exports in parallel (Default to 1)
+        :param appdata_dir: Private BITWARDENCLI_APPDATA_DIR for this client, so several clients can run side by side (optional)
+        :param kdf_salt: Stored salt shared by raw exports so their master key is derived once (optional)
+        """
+        self.bw_cmd = bw_cmd
+        self.session = session
+        self.server = server
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.use_api_key = (
+            use_api_key and client_id is not None and client_secret is not None
+        )
+        self.encrypt_workers = encrypt_workers
+        self.kdf_salt = kdf_salt
+        self.appdata_dir = appdata_dir
+        if appdata_dir:
+            os.makedirs(appdata_dir, mode=0o700, exist_ok=True)
+        self._configured = server is None
+
+    def _base_env(self) -> dict[str, str]:
+        """Return a fresh environment for a bw process, without BW_SESSION."""
+        env = os.environ.copy()
+        env.pop("BW_SESSION", None)
+        if self.appdata_dir:
+            env["BITWARDENCLI_APPDATA_DIR"] = self.appdata_dir
+        return env
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.logout()
+
+    async def _configure(self) -> None:
+        if self._configured:
+            return
+        state = read_cli_state(self.appdata_dir)
+        if state is not None and state.server_url == normalize_url(self.server):
+            logger.debug(f"BW server already configured: {self.server}")
+            self._configured = True
+            return
+        logger.debug(f"Configuring BW server: {self.server}")
+        metrics.SUBPROCESSES.inc(command="config")
+        with tracing.span("bw config"):
+            returncode, _, stderr = await self._exec(
+                [self.bw_cmd, "config", "server", self.server], self._base_env()
+            )
+        # 1 means the server was already set to this URL
+        if returncode not in (0, 1):
+            message = _mask_secrets(stderr.strip())
+            logger.error(f"Bitwarden CLI error: {message}")
+            raise BitwardenError(message)
+        self._configured = True
+
+    async def _exec(
+        self, full_cmd: list[str], env: dict[str, str]
+    ) -> tuple[int, str, str]:
+        process = await asyncio.create_subprocess_exec(
+            *full_cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+        )
+        try:
+            out, err = await process.communicate()
+        except BaseException:
+            await _stop(process)
+            raise
+        return (
+            process.returncode,
+            out.decode("utf-8", errors="replace"),
+            err.decode("utf-8", errors="replace"),
+        )
+
+    async def _run(
+        self,
+        cmd: list[str],
+        capture_json: bool = True,
+        check: bool = True,
+        env: dict[str, str] | None = None,
+    ) -> Any:
+        """
+        Run a bw CLI command, as BitwardenClient._run does.
+        :param cmd: list of arguments, e.g., ["list", "items"]
+        :param capture_json: parse stdout as JSON if True
+        :param check: log out after a failed command
+        :param env: environment for the process (default: a fresh copy per call)
+        """
+        await self._configure()
+        env = self._base_env() if env is None else env
+        if self.session:
+            env["BW_SESSION"] = self.session
+        full_cmd = [self.bw_cmd] + cmd
+        redacted_cmd = _redact_cmd(full_cmd)
+        logger.debug(f"Running command: {' '.join(redacted_cmd)}")
+        metrics.SUBPROCESSES.inc(command=cmd[0])
+        with tracing.span(f"bw {cmd[0]}", argv=redacted_cmd[1:]) as span:
+            returncode, output, stderr = await self._exec(full_cmd, env)
+            span.set(child_exit_code=returncode)
+
+        if returncode != 0:
+            if not check:
+                message = _mask_secrets(stderr.strip())
+                logger.error(f"Bitwarden CLI error: {message}")
+                raise BitwardenError(message)
+            # Built from the redacted command, so no secret can leak into it
+            message = (
+                f"Command '{redacted_cmd}' returned non-zero exit status {returncode}."
+            )
+            logger.error(f"Failed to run command: {message}")
+            metrics.SUBPROCESSES.inc(command="logout")
+            with tracing.span("bw logout"):
+                logout_code, _, logout_err = await self._exec(
+                    [self.bw_cmd, "logout"], env
+                )
+            if logout_code != 0:
+                logger.error(
+                    "Failed to log out after error. Failure: "
+                    f"{_mask_secrets(logout_err.strip())}"
+                )
+            raise BitwardenError(f"Failed to run command: {message}")
+
+        output = output.strip()
+        if capture_json:
+            try:
+                return json.loads(output)
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse JSON output: {output}")
+                raise BitwardenError("Failed to parse JSON output")
+        return output
+
+    # -------------------------------
+    # Core API methods
+    # -------------------------------
+    async def logout(self) -> None:
+        """Logout and clear session"""
+        await self._run(["logout"], capture_json=False)
+        self.session = None
+        logger.info("Logged out successfully")
+
+    async def status(self) -> dict[str, Any]:
+        """Return current session status"""
+        state = read_cli_state(self.appdata_dir)
+        if state is not None:
+            return state.as_status(self.session)
+        return await self._run(["status"])
+
+    async def sync(self) -> None:
+        """Pull the latest vault data from the server"""
+        await self._run(["sync"], capture_json=False)
+        logger.info("Vault synced successfully")
+
+    async def list_items(self) -> list[dict[str, Any]]:
+        """Return all items in the vault"""
+        return await self._run(["list", "items"])
+
+    async def list_organizations(self) -> list[dict[str, Any]]:
+        """Return the organizations the account is a member of"""
+        return await self._run(["list", "organizations"])
+
+    async def login(
+        self, email: str | None = None, password: str | None = None, raw: bool = True
+    ) -> str:
+        """
+        Login with email/password or API key.
+        Returns session key if raw=True.
+        """
+        if self.use_api_key:
+            logger.info("Logging in via API key")
+            env = self._base_env()
+            env["BW_CLIENTID"] = self.client_id
+            env["BW_CLIENTSECRET"] = self.client_secret
+            self.session = await self._run(
+                ["login", "--apikey"], capture_json=False, env=env
+            )
+        else:
+            logger.info("Logging in via email/password")
+            cmd = ["login", email]
+            if password:
+                cmd += ["--password", password]
+            if raw:
+                cmd.append("--raw")
+            self.session = await self._run(cmd, capture_json=False)
+        logger.info("Logged in successfully")
+        return self.session
+
+    async def unlock(self, password: str) -> str:
+        """
+        Unlock vault with master password or API key secret.
+        Returns session token.
+        """
+        self.session = await self._run(
+            ["unlock", password, "--raw"], capture_json=False
+        )
+        logger.info("Vault unlocked successfully")
+        return self.session
+
+    async def export_bitwarden_encrypted(
+        self, backup_file: str, file_pw: str, organization_id: str | None = None
+    ):
+        """
+        Exports using Bitwarden's built-in encryption. With `organization_id`,
+        that organization's vault is exported instead of the personal one.
+        """
+        logger.info(f"Exporting with Bitwarden encryption to {backup_file}...")
+        await self._run(
+            [
+                "export",
+                *_organization_args(organization_id),
+                "--output",
+                backup_file,
+                "--format",
+                "json",
+                "--password",
+                file_pw,
+            ],
+            capture_json=False,
+        )
+        # The CLI writes this file itself, so it has to be read back to hash it
+        if os.path.exists(backup_file):
+            sha256 = await asyncio.to_thread(catalog.file_sha256, backup_file)
+            catalog.note(sha256=sha256)
+
+    async def export_raw_encrypted(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool = True,
+        compression: str | None = None,
+        organization_id: str | None = None,
+    ):
+        """
+        Exports raw data and encrypts it while it streams out of the CLI, as
+        BitwardenClient.export_raw_encrypted does (see _stream_export()).
+        """
+        logger.info("Exporting raw data from Bitwarden...")
+        fingerprint = new_fingerprint(file_pw, self.kdf_salt, compression)
+        counter = _ExportItemCounter(fingerprint)
+        partial_file = f"{backup_file}.partial"
+        size, sha256 = await self._stream_export(
+            ["export", *_organization_args(organization_id), "--format", "json"],
+            partial_file,
+            file_pw,
+            compression,
+            counter,
+        )
+        if not counter.is_json_object():
+            await asyncio.to_thread(os.remove, partial_file)
+            raise BitwardenError("bw export did not write a JSON export")
+        # Organization exports list collections, not folders
+        catalog.note(
+            items=counter.count, folders=None if organization_id else counter.folders
+        )
+        with metrics.phase("write"):
+            reused = await asyncio.to_thread(
+                finish_snapshot,
+                partial_file,
+                backup_file,
+                fingerprint.hexdigest(),
+                dedup,
+                sha256=sha256,
+            )
+        if not reused:
+            logger.info(f"Encrypted {size} bytes of raw export.")
+
+    async def export_csv_encrypted(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool = True,
+        compression: str | None = None,
+        organization_id: str | None = None,
+    ):
+        """
+        Exports with `bw export --format csv` and encrypts it while it streams
+        out of the CLI, as BitwardenClient.export_csv_encrypted does.
+        """
+        logger.info("Exporting CSV data from Bitwarden...")
+        fingerprint = new_fingerprint(file_pw, self.kdf_salt, compression)
+        counter = _CsvRecordCounter(fingerprint)
+        partial_file = f"{backup_file}.partial"
+        size, sha256 = await self._stream_export(
+            ["export", *_organization_args(organization_id), "--format", "csv"],
+            partial_file,
+            file_pw,
+            compression,
+            counter,
+        )
+        catalog.note(items=counter.count, folders=None)
+        with metrics.phase("write"):
+            reused = await asyncio.to_thread(
+                finish_snapshot,
+                partial_file,
+                backup_file,
+                fingerprint.hexdigest(),
+                dedup,
+                sha256=sha256,
+            )
+        if not reused:
+            logger.info(f"Encrypted {size} bytes of CSV export.")
+
+    async def _stream_export(
+        self,
+        argv: list[str],
+        partial_file: str,
+        file_pw: str,
+        compression: str | None,
+        hasher: Any,
+    ) -> tuple[int, str]:
+        """
+        Run `bw <argv> --raw` and encrypt its stdout into `partial_file`.
+
+        `bw` writes into a pipe that a worker thread encrypts from, so the
+        event loop stays free and memory use stays fixed. Cancelling stops the
+        CLI, waits for the encryptor to drain the pipe and removes the
+        partial file, as does a failing CLI.
+
+        :return: the plaintext size and the SHA-256 of the encrypted file
+        """
+        await self._configure()
+        env = self._base_env()
+        if self.session:
+            env["BW_SESSION"] = self.session
+        cmd = [self.bw_cmd, *argv, "--raw"]
+
+        def encrypt(pipe, writer: HashingWriter) -> int:
+            with pipe:
+                return encrypt_stream(
+                    pipe,
+                    writer,
+                    file_pw,
+                    workers=self.encrypt_workers,
+                    kdf_salt=self.kdf_salt,
+                    hasher=hasher,
+                    compression=compression,
+                )
+
+        metrics.SUBPROCESSES.inc(command=argv[0])
+        # stderr goes to a file so a chatty CLI can never block the stdout pipe
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                with (
+                    metrics.phase("encrypt"),
+                    tracing.span(f"bw {argv[0]}", argv=cmd[1:]) as span,
+                    open(partial_file, "wb") as f,
+                ):
+                    read_fd, write_fd = os.pipe()
+                    try:
+                        process = await asyncio.create_subprocess_exec(
+                            *cmd,
+                            stdin=asyncio.subprocess.DEVNULL,
+                            stdout=write_fd,
+                            stderr=stderr,
+                            env=env,
+                        )
+                    except BaseException:
+                        os.close(read_fd)
+                        raise
+                    finally:
+                        os.close(write_fd)
+                    writer = HashingWriter(f)
+                    encrypting = asyncio.ensure_future(
+                        asyncio.to_thread(encrypt, open(read_fd, "rb"), writer)
+                    )
+                    try:
+                        size = await asyncio.shield(encrypting)
+                        await process.wait()
+                    except BaseException:
+                        await _stop(process)
+                        # The pipe is closed now, so the encryptor finishes
+                        await asyncio.gather(encrypting, return_exceptions=True)
+                        raise
+                    span.set(child_exit_code=process.returncode)
+            except BaseException:
+                if os.path.exists(partial_file):
+                    await asyncio.to_thread(os.remove, partial_file)
+                raise
+            if process.returncode != 0:
+                await asyncio.to_thread(os.remove, partial_file)
+                stderr.seek(0)
+                message = _mask_secrets(
+                    stderr.read().decode("utf-8", errors="replace").strip()
+                )
+                logger.error(f"Bitwarden CLI error: {message}")
+                raise BitwardenError(message)
+        return size, writer.hexdigest()
@@ -1,18 +1,30 @@
 import os
-from subprocess import CalledProcessError, run as sprun
+from subprocess import CalledProcessError, PIPE, Popen
+import io
 import json
 import logging
 import re
-from typing import Any
+import tempfile
+import urllib.parse
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator
 from sys import stdout
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+from src import catalog, metrics, tracing
+from src.attachments import AttachmentRef, attachment_refs
+from src.bw_serve import BwServe, BwServeError
+from src.bw_state import normalize_url, read_cli_state
+from src.export_format import CSV_TYPES, iter_csv, iter_json
+from src.crypto import encrypt_stream
+from src.snapshots import (
+    ExportCache,
+    HashingWriter,
+    finish_snapshot,
+    new_fingerprint,
+    write_encrypted,
+)
+from src.tracing import run as sprun
 
-# Constants for encryption
-SALT_SIZE = 16
-KEY_SIZE = 32  # For AES-256
-PBKDF2_ITERATIONS = 600000
+TRANSPORTS = ("cli", "serve")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,12 +38,143 @@ password_regex = re.compile(r"('--password',\s*)('[^']*')(\s*]')", re.IGNORECASE
 unlock_regex = re.compile(r"('unlock',\s*)('[^']*\s*--raw)", re.IGNORECASE)
 
 
+def _mask_secrets(text: str) -> str:
+    """Mask passwords that may appear in CLI error output."""
+    masked = password_regex.sub("('--password', '****')]", text)
+    return unlock_regex.sub("'unlock', '**** --raw'", masked)
+
+
+def _organization_args(organization_id: str | None) -> list[str]:
+    return ["--organizationid", organization_id] if organization_id else []
+
+
+def _redact_cmd(cmd: list[str]) -> list[str]:
+    """Redact sensitive values from a bw command line before logging it."""
+    redacted = []
+    sensitive_flags = {"--password", "--apikey", "--clientsecret", "password"}
+    skip_next = False
+    for i, arg in enumerate(cmd):
+        if skip_next:
+            redacted.append("[REDACTED]")
+            skip_next = False
+        elif arg in sensitive_flags:
+            redacted.append(arg)
+            skip_next = True
+        else:
+            # For direct password (e.g. `bw unlock <password>`) redact if flag is not used
+            if i > 0 and cmd[i-1] == "unlock":
+                redacted.append("[REDACTED]")
+            else:
+                redacted.append(arg)
+    return redacted
+
+
 class BitwardenError(Exception):
     """Base exception for Bitwarden wrapper."""
 
     pass
 
 
+class _ExportItemCounter:
+    """
+    Counts the items and folders of a streamed `bw export --format json`
+    while passing the data on to `hasher`, if any. Every item has exactly one
+    "revisionDate" key and folders have none. Folders come before the items
+    and each has one "name" key. Inside string values the quotes are
+    escaped, so they can never match.
+
+    It also keeps the first and last non-whitespace bytes, to check the
+    export's structure without parsing it (see is_json_object()).
+    """
+
+    MARKER = b'"revisionDate":'
+    FOLDER_MARKER = b'"name":'
+    ITEMS_KEY = b'"items":'
+    # Long enough to hold all but the last byte of any marker
+    TAIL = max(len(MARKER), len(ITEMS_KEY)) - 1
+    WHITESPACE = b" \t\r\n"
+
+    def __init__(self, hasher: Any = None):
+        self.hasher = hasher
+        self.count = 0
+        self.folders = 0
+        self._in_items = False
+        self._tail = b""
+        self.first: int | None = None
+        self.last: int | None = None
+
+    def update(self, data: bytes) -> None:
+        if self.hasher is not None:
+            self.hasher.update(data)
+        tail = self._tail
+        window = tail + data
+        # Matches entirely inside the tail were counted with the last chunk
+        self.count += window.count(self.MARKER) - tail.count(self.MARKER)
+        if not self._in_items:
+            end = window.find(self.ITEMS_KEY)
+            head = window if end < 0 else window[:end]
+            self.folders += head.count(self.FOLDER_MARKER) - tail.count(
+                self.FOLDER_MARKER
+            )
+            self._in_items = end >= 0
+        self._tail = window[-self.TAIL :]
+        if self.first is None:
+            start = 0
+            while start < len(data) and data[start] in self.WHITESPACE:
+                start += 1
+            if start < len(data):
+                self.first = data[start]
+        end = len(data)
+        while end and data[end - 1] in self.WHITESPACE:
+            end -= 1
+        if end:
+            self.last = data[end - 1]
+
+    def is_json_object(self) -> bool:
+        """
+        Whether the export is framed like a single JSON object, so an error
+        message or a truncated export is never stored as a backup.
+        """
+        return self.first == ord("{") and self.last == ord("}")
+
+    @property
+    def has_items(self) -> bool:
+        """Whether the export's "items" key went past."""
+        return self._in_items
+
+
+class _CsvRecordCounter:
+    """
+    Counts the records of a CSV export, header excluded, while passing the
+    data on to `hasher`, if any. Quotes are escaped by doubling them, so a
+    line break ends a record exactly when an even number of quotes came
+    before it.
+    """
+
+    def __init__(self, hasher: Any = None):
+        self.hasher = hasher
+        self.lines = 0
+        self._quoted = False
+        self._last = b""
+
+    def update(self, data: bytes) -> None:
+        if self.hasher is not None:
+            self.hasher.update(data)
+        for i, part in enumerate(data.split(b'"')):
+            if i:
+                self._quoted = not self._quoted
+            if not self._quoted:
+                self.lines += part.count(b"\n")
+        if data:
+            self._last = data[-1:]
+
+    @property
+    def count(self) -> int:
+        # The last record may or may not end with a line break
+        records = self.lines + (self._last not in (b"", b"\n"))
+        return max(0, records - 1)
+
+
 class BitwardenClient:
     def __init__(
         self,
@@ -41,6 +184,10 @@ class BitwardenClient:
         client_id: str | None = None,
         client_secret: str | None = None,
         use_api_key: bool = True,
+        encrypt_workers: int = 1,
+        transport: str = "cli",
+        appdata_dir: str | None = None,
+        kdf_salt: bytes | None = None,
     ):
         """
         Initialize Bitwarden client wrapper.
@@ -51,7 +198,15 @@ class BitwardenClient:
         :param client_id: Client ID for API key login (optional)
         :param client_secret: Client Secret for API key login (optional)
         :param use_api_key: Whether to use API key login if client_id and client_secret are provided (Default to True)
+        :param encrypt_workers: Number of threads encrypting raw exports in parallel (Default to 1)
+        :param appdata_dir: Private BITWARDENCLI_APPDATA_DIR for this client, so several clients can run side by side (optional)
+        :param transport: "cli" runs one bw process per command, "serve" drives unlock, sync, status, listing and raw export through a single `bw serve` process (Default to "cli")
+        :param kdf_salt: Stored salt shared by raw exports so their master key is derived once (optional)
         """
+        if transport not in TRANSPORTS:
+            raise BitwardenError(
+                f"Invalid transport: '{transport}'. Must be one of {', '.join(TRANSPORTS)}."
+            )
         self.bw_cmd = bw_cmd
         self.session = session
         self.client_id = client_id
@@ -59,18 +214,30 @@ class BitwardenClient:
         self.use_api_key = (
             use_api_key and client_id is not None and client_secret is not None
         )
-        if server:
+        self.encrypt_workers = encrypt_workers
+        self.kdf_salt = kdf_salt
+        self.transport = transport
+        self._serve: BwServe | None = None
+        self._exports = ExportCache()
+        self.appdata_dir = appdata_dir
+        if appdata_dir:
+            os.makedirs(appdata_dir, mode=0o700, exist_ok=True)
+        if server and self._server_configured(server):
+            logger.debug(f"BW server already configured: {server}")
+        elif server:
             logger.debug(f"Configuring BW server: {server}")
-            env = os.environ.copy()  # do not add BW_SESSION
+            env = self._base_env()  # do not add BW_SESSION
+            metrics.SUBPROCESSES.inc(command="config")
             try:
-                sprun(
-                    [self.bw_cmd, "config", "server", server],
-                    text=True,
-                    capture_output=True,
-                    check=True,
-                    env=env,
-                    preexec_fn=None,  # Disable process group creation
-                )
+                with tracing.span("bw config"):
+                    sprun(
+                        [self.bw_cmd, "config", "server", server],
+                        text=True,
+                        capture_output=True,
+                        check=True,
+                        env=env,
+                        preexec_fn=None,  # Disable process group creation
+                    )
             except CalledProcessError as e:
                 if e.returncode == 1:
                     pass
@@ -84,6 +251,19 @@ class BitwardenClient:
                     pass
                 raise BitwardenError(f"Failed to configure BW server to {server}")
 
+    def _server_configured(self, server: str) -> bool:
+        """Whether the CLI state already points at `server`, so `bw config` can be skipped."""
+        state = read_cli_state(self.appdata_dir)
+        return state is not None and state.server_url == normalize_url(server)
+
+    def _base_env(self) -> dict[str, str]:
+        """Return a fresh environment for a bw process, without BW_SESSION."""
+        env = os.environ.copy()
+        env.pop("BW_SESSION", None)
+        if self.appdata_dir:
+            env["BITWARDENCLI_APPDATA_DIR"] = self.appdata_dir
+        return env
+
     def __enter__(self):
         self.login()
         return self
@@ -98,56 +278,44 @@ class BitwardenClient:
         text: bool = True,
         capture_output: bool = True,
         check: bool = True,
-        env=os.environ.copy(),
+        env: dict[str, str] | None = None,
     ) -> Any:
         """
         Run a bw CLI command safely.
         :param cmd: list of arguments, e.g., ["list", "items"]
         :param capture_json: parse stdout as JSON if True
+        :param env: environment for the process (default: a fresh copy per call)
         """
+        env = self._base_env() if env is None else env
         if self.session:
             env["BW_SESSION"] = self.session
         full_cmd = [self.bw_cmd] + cmd
-        # Redact sensitive values before logging
-        def _redact_cmd(cmd):
-            redacted = []
-            sensitive_flags = {"--password", "--apikey", "--clientsecret", "password"}
-            skip_next = False
-            for i, arg in enumerate(cmd):
-                if skip_next:
-                    redacted.append("[REDACTED]")
-                    skip_next = False
-                elif arg in sensitive_flags:
-                    redacted.append(arg)
-                    skip_next = True
-                else:
-                    # For direct password (e.g. `bw unlock <password>`) redact if flag is not used
-                    if i > 0 and cmd[i-1] == "unlock":
-                        redacted.append("[REDACTED]")
-                    else:
-                        redacted.append(arg)
-            return redacted
-        logger.debug(f"Running command: {' '.join(_redact_cmd(full_cmd))}")
+        redacted_cmd = _redact_cmd(full_cmd)
+        logger.debug(f"Running command: {' '.join(redacted_cmd)}")
+        metrics.SUBPROCESSES.inc(command=cmd[0])
         try:
-            result = sprun(
-                full_cmd,
-                text=text,
-                capture_output=capture_output,
-                check=check,
-                env=env,
-            )
+            with tracing.span(f"bw {cmd[0]}", argv=redacted_cmd[1:]):
+                result = sprun(
+                    full_cmd,
+                    text=text,
+                    capture_output=capture_output,
+                    check=check,
+                    env=env,
+                )
         except CalledProcessError as e:
             masked_e = password_regex.sub("('--password', '****')]", e.__str__())
             masked_e = unlock_regex.sub("('unlock', '**** --raw')", masked_e)
             logger.error(f"Failed to run command: {masked_e}")
+            metrics.SUBPROCESSES.inc(command="logout")
             try:
-                sprun(
-                    [self.bw_cmd, "logout"],
-                    text=text,
-                    capture_output=capture_output,
-                    check=True,
-                    env=env,
-                )
+                with tracing.span("bw logout"):
+                    sprun(
+                        [self.bw_cmd, "logout"],
+                        text=text,
+                        capture_output=capture_output,
+                        check=True,
+                        env=env,
+                    )
             except CalledProcessError as inner_e:
                 masked_inner_e = password_regex.sub(
                     "('--password', '****')]", inner_e.__str__()
@@ -193,16 +361,114 @@ class BitwardenClient:
     # -------------------------------
     # Core API methods
     # -------------------------------
+    def _serve_api(self) -> BwServe:
+        """Return the running `bw serve` instance, starting it if needed."""
+        if self._serve is None:
+            serve = BwServe(bw_cmd=self.bw_cmd, env=self._base_env())
+            metrics.SUBPROCESSES.inc(command="serve")
+            try:
+                serve.start()
+            except BwServeError as e:
+                raise BitwardenError(str(e)) from None
+            self._serve = serve
+        return self._serve
+
+    def _stop_serve(self) -> None:
+        if self._serve is not None:
+            self._serve.stop()
+            self._serve = None
+
     def logout(self) -> None:
         """Logout and clear session"""
+        self._stop_serve()
         self._run(["logout"], capture_json=False)
         self.session = None
         logger.info("Logged out successfully")
 
     def status(self) -> dict[str, Any]:
         """Return current session status"""
+        if self.transport == "serve":
+            try:
+                return self._serve_api().status()
+            except BwServeError as e:
+                raise BitwardenError(str(e)) from None
+        # The CLI state answers this without starting Node.js when it is readable
+        state = read_cli_state(self.appdata_dir)
+        if state is not None:
+            return state.as_status(self.session)
         return self._run(["status"])
 
+    def sync(self) -> None:
+        """Pull the latest vault data from the server"""
+        if self.transport == "serve":
+            try:
+                self._serve_api().sync()
+            except BwServeError as e:
+                raise BitwardenError(str(e)) from None
+        else:
+            self._run(["sync"], capture_json=False)
+        logger.info("Vault synced successfully")
+
+    def list_items(self) -> list[dict[str, Any]]:
+        """Return all items in the vault"""
+        if self.transport == "serve":
+            try:
+                return self._serve_api().list_objects("items")
+            except BwServeError as e:
+                raise BitwardenError(str(e)) from None
+        return self._run(["list", "items"])
+
+    def list_organizations(self) -> list[dict[str, Any]]:
+        """Return the organizations the account is a member of"""
+        if self.transport == "serve":
+            try:
+                return self._serve_api().list_objects("organizations")
+            except BwServeError as e:
+                raise BitwardenError(str(e)) from None
+        return self._run(["list", "organizations"])
+
+    def list_attachments(self) -> list[AttachmentRef]:
+        """Return the attachments of every personal item"""
+        return attachment_refs(self.list_items())
+
+    @contextmanager
+    def open_attachment(self, ref: AttachmentRef) -> Iterator[BinaryIO]:
+        """
+        Download one attachment and yield it as a readable binary stream.
+
+        `bw serve` streams the file over HTTP. The CLI can only save it to a
+        file, so it is written to a private temporary directory that is
+        removed as soon as the caller is done with it. Safe to call from
+        several threads at once.
+        """
+        if self.transport == "serve":
+            query = urllib.parse.urlencode({"itemid": ref.item_id})
+            path = f"/object/attachment/{urllib.parse.quote(ref.attachment_id)}"
+            try:
+                with self._serve_api().download(f"{path}?{query}") as response:
+                    yield response
+            except BwServeError as e:
+                raise BitwardenError(str(e)) from None
+            return
+        with tempfile.TemporaryDirectory(prefix="backvault-") as tmp_dir:
+            output = os.path.join(tmp_dir, "attachment")
+            # check=False: a failed download must not log the session out
+            self._run(
+                [
+                    "get",
+                    "attachment",
+                    ref.attachment_id,
+                    "--itemid",
+                    ref.item_id,
+                    "--output",
+                    output,
+                ],
+                capture_json=False,
+                check=False,
+            )
+            with open(output, "rb") as f:
+                yield f
+
     def login(
         self, email: str | None = None, password: str | None = None, raw: bool = True
     ) -> str:
@@ -214,7 +480,7 @@ class BitwardenClient:
             logger.info("Logging in via API key")
 
             # Ensure env vars are set so bw login --apikey is non-interactive
-            env = os.environ.copy()
+            env = self._base_env()
             env["BW_CLIENTID"] = self.client_id
             env["BW_CLIENTSECRET"] = self.client_secret
 
@@ -249,7 +515,16 @@ class BitwardenClient:
         Unlock vault with master password or API key secret.
         Returns session token.
         """
-        env = os.environ.copy()
+        if self.transport == "serve":
+            try:
+                self.session = self._serve_api().unlock(password)
+            except BwServeError as e:
+                logger.error(f"Bitwarden CLI error: {e}")
+                raise BitwardenError(str(e)) from None
+            logger.info("Vault unlocked successfully")
+            return self.session
+
+        env = self._base_env()
         env["BW_SESSION"] = self.session
 
         cmd = ["unlock", password, "--raw"]
@@ -264,34 +539,32 @@ class BitwardenClient:
     def encrypt_data(self, data: bytes, password: str) -> bytes:
         """
         Encrypts data using AES-256-GCM with a key derived from the password.
-        Format: salt (16 bytes) + nonce (12 bytes) + ciphertext + tag (16 bytes)
+        Produces the chunked v3 container described in src.crypto.
         """
         logger.info("Encrypting data in-memory...")
-        salt = os.urandom(SALT_SIZE)
-
-        # Derive a key from the password and salt
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=KEY_SIZE,
-            salt=salt,
-            iterations=PBKDF2_ITERATIONS,
+        encrypted = io.BytesIO()
+        encrypt_stream(
+            io.BytesIO(data),
+            encrypted,
+            password,
+            workers=self.encrypt_workers,
+            kdf_salt=self.kdf_salt,
         )
-        key = kdf.derive(password.encode("utf-8"))
-
-        # Encrypt using AES-GCM
-        aesgcm = AESGCM(key)
-        nonce = os.urandom(12)  # GCM recommended nonce size
-        ciphertext = aesgcm.encrypt(nonce, data, None)
-
         logger.info("Encryption successful.")
-        return salt + nonce + ciphertext
+        return encrypted.getvalue()
 
-    def export_bitwarden_encrypted(self, backup_file: str, file_pw: str):
-        """Exports using Bitwarden's built-in encryption."""
+    def export_bitwarden_encrypted(
+        self, backup_file: str, file_pw: str, organization_id: str | None = None
+    ):
+        """
+        Exports using Bitwarden's built-in encryption. With `organization_id`,
+        that organization's vault is exported instead of the personal one.
+        """
         logger.info(f"Exporting with Bitwarden encryption to {backup_file}...")
         self._run(
             cmd=[
                 "export",
+                *_organization_args(organization_id),
                 "--output",
                 backup_file,
                 "--format",
@@ -301,15 +574,265 @@ class BitwardenClient:
             ],
             capture_json=False,
         )
+        # The CLI writes this file itself, so it has to be read back to hash it
+        if os.path.exists(backup_file):
+            catalog.note(sha256=catalog.file_sha256(backup_file))
 
-    def export_raw_encrypted(self, backup_file: str, file_pw: str):
-        """Exports raw data and encrypts it in-memory."""
+    def export_raw_encrypted(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool = True,
+        compression: str | None = None,
+        organization_id: str | None = None,
+    ):
+        """
+        Exports raw data and encrypts it while it streams out of the CLI.
+
+        `bw export` stdout is piped through the chunked encryptor straight to
+        disk, so memory use stays fixed regardless of the vault size. The
+        backup is written to a `.partial` file and only renamed into place
+        once the CLI has exited successfully. With `dedup`, an export that is
+        identical to the previous one is replaced by a hardlink to it (see
+        src.snapshots). `compression` (e.g. "zlib:9") compresses the export
+        before it is encrypted. With `organization_id`, that organization's
+        vault is exported instead of the personal one.
+        """
         logger.info("Exporting raw data from Bitwarden...")
-        raw_json = self._run(
-            cmd=["export", "--format", "json", "--raw"], capture_json=True
+        if self.transport == "serve":
+            self._export_raw_from_serve(
+                backup_file, file_pw, dedup, compression, organization_id
+            )
+            return
+        # Also validates `compression` before the CLI is started
+        fingerprint = new_fingerprint(file_pw, self.kdf_salt, compression)
+        counter = _ExportItemCounter(fingerprint)
+        partial_file = f"{backup_file}.partial"
+        size, sha256 = self._stream_export(
+            ["export", *_organization_args(organization_id), "--format", "json"],
+            partial_file,
+            file_pw,
+            compression,
+            counter,
+        )
+        if not counter.is_json_object():
+            os.remove(partial_file)
+            raise BitwardenError("bw export did not write a JSON export")
+        # Organization exports list collections, not folders
+        catalog.note(
+            items=counter.count, folders=None if organization_id else counter.folders
+        )
+        with metrics.phase("write"):
+            reused = finish_snapshot(
+                partial_file, backup_file, fingerprint.hexdigest(), dedup, sha256=sha256
+            )
+        if not reused:
+            logger.info(f"Encrypted {size} bytes of raw export.")
+
+    def export_csv_encrypted(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool = True,
+        compression: str | None = None,
+        organization_id: str | None = None,
+    ):
+        """
+        Exports with `bw export --format csv`, which only holds logins and
+        secure notes, and encrypts it while it streams out of the CLI, like
+        export_raw_encrypted(). Through `bw serve` the CSV is built from the
+        same listing as the raw export.
+        """
+        logger.info("Exporting CSV data from Bitwarden...")
+        if self.transport == "serve":
+            export = self._serve_export(organization_id)
+            catalog.note(
+                items=sum(
+                    1 for item in export["items"] if item.get("type") in CSV_TYPES
+                ),
+                folders=None,
+            )
+            size = write_encrypted(
+                backup_file,
+                lambda: iter_csv(export),
+                file_pw,
+                workers=self.encrypt_workers,
+                kdf_salt=self.kdf_salt,
+                dedup=dedup,
+                compression=compression,
+            )
+        else:
+            fingerprint = new_fingerprint(file_pw, self.kdf_salt, compression)
+            counter = _CsvRecordCounter(fingerprint)
+            partial_file = f"{backup_file}.partial"
+            size, sha256 = self._stream_export(
+                ["export", *_organization_args(organization_id), "--format", "csv"],
+                partial_file,
+                file_pw,
+                compression,
+                counter,
+            )
+            catalog.note(items=counter.count, folders=None)
+            with metrics.phase("write"):
+                if finish_snapshot(
+                    partial_file,
+                    backup_file,
+                    fingerprint.hexdigest(),
+                    dedup,
+                    sha256=sha256,
+                ):
+                    size = 0
+        if size:
+            logger.info(f"Encrypted {size} bytes of CSV export.")
+
+    def _stream_export(
+        self,
+        argv: list[str],
+        partial_file: str,
+        file_pw: str,
+        compression: str | None,
+        hasher: Any,
+    ) -> tuple[int, str]:
+        """
+        Run `bw <argv> --raw` and encrypt its stdout into `partial_file` as it
+        is written. The partial file is removed if the CLI fails.
+
+        :param hasher: fed the plaintext (see src.crypto.encrypt_stream)
+        :return: the plaintext size and the SHA-256 of the encrypted file
+        """
+        env = self._base_env()
+        if self.session:
+            env["BW_SESSION"] = self.session
+        argv = [*argv, "--raw"]
+        # stderr goes to a file so a chatty CLI can never block the stdout pipe
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                metrics.SUBPROCESSES.inc(command=argv[0])
+                with (
+                    metrics.phase("encrypt"),
+                    tracing.span(f"bw {argv[0]}", argv=argv),
+                    Popen(
+                        [self.bw_cmd, *argv],
+                        stdout=PIPE,
+                        stderr=stderr,
+                        env=env,
+                    ) as proc,
+                    open(partial_file, "wb") as f,
+                ):
+                    writer = HashingWriter(f)
+                    size = encrypt_stream(
+                        proc.stdout,
+                        writer,
+                        file_pw,
+                        workers=self.encrypt_workers,
+                        kdf_salt=self.kdf_salt,
+                        hasher=hasher,
+                        compression=compression,
+                    )
+                    tracing.wait(proc)
+            except BaseException:
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+                raise
+            if proc.returncode != 0:
+                os.remove(partial_file)
+                stderr.seek(0)
+                message = _mask_secrets(
+                    stderr.read().decode("utf-8", errors="replace").strip()
+                )
+                logger.error(f"Bitwarden CLI error: {message}")
+                raise BitwardenError(message)
+        return size, writer.hexdigest()
+
+    def _export_raw_from_serve(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool,
+        compression: str | None,
+        organization_id: str | None = None,
+    ):
+        """
+        Encrypts the export _serve_export() builds. Compressed exports are
+        serialized canonically, which compresses better.
+        """
+        export = self._serve_export(organization_id)
+        canonical = bool(compression and compression.lower() != "none")
+        size = write_encrypted(
+            backup_file,
+            lambda: iter_json(export, canonical=canonical),
+            file_pw,
+            workers=self.encrypt_workers,
+            kdf_salt=self.kdf_salt,
+            dedup=dedup,
+            compression=compression,
         )
-        encrypted_data = self.encrypt_data(
-            json.dumps(raw_json).encode("utf-8"), file_pw
+        if size:
+            logger.info(f"Encrypted {size} bytes of raw export.")
+
+    def shared_export(self):
+        """
+        List the vault through `bw serve` once for every format exported
+        inside the block. CLI exports each run their own `bw export`.
+        """
+        return self._exports.sharing()
+
+    def _serve_export(self, organization_id: str | None = None) -> dict[str, Any]:
+        """
+        Builds the `bw export --format json` document from the `bw serve` API.
+
+        The API has no export endpoint, so personal folders and items (or an
+        organization's collections and items) are listed and assembled in the
+        same layout the CLI exports.
+        """
+        export = self._exports.get(
+            organization_id, lambda: self._list_export(organization_id)
+        )
+        catalog.note(
+            items=len(export["items"]),
+            folders=len(export["folders"]) if "folders" in export else None,
         )
-        with open(backup_file, "wb") as f:
-            f.write(encrypted_data)
+        return export
+
+    def _list_export(self, organization_id: str | None) -> dict[str, Any]:
+        try:
+            serve = self._serve_api()
+            if organization_id:
+                query = urllib.parse.urlencode({"organizationId": organization_id})
+                groups = serve.list_objects(f"collections?{query}")
+                items = serve.list_objects(f"items?{query}")
+            else:
+                groups = serve.list_objects("folders")
+                items = serve.list_objects("items")
+        except BwServeError as e:
+            raise BitwardenError(str(e)) from None
+        # New dicts, so the listed results are never changed
+        items = [
+            {key: value for key, value in item.items() if key != "object"}
+            for item in items
+        ]
+        if organization_id:
+            export = {
+                "encrypted": False,
+                "collections": [
+                    {key: value for key, value in group.items() if key != "object"}
+                    for group in groups
+                    if group.get("organizationId") == organization_id
+                ],
+                "items": [
+                    item
+                    for item in items
+                    if item.get("organizationId") == organization_id
+                ],
+            }
+        else:
+            export = {
+                "encrypted": False,
+                "folders": [
+                    {"id": group["id"], "name": group["name"]}
+                    for group in groups
+                    if group.get("id") is not None
+                ],
+                "items": [item for item in items if item.get("organizationId") is None],
+            }
+        return export
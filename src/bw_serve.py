@@ -0,0 +1,226 @@
+import http.client
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from subprocess import DEVNULL, Popen, TimeoutExpired
+from sys import stdout
+from typing import Any, Iterator
+from src import tracing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BwServeError(Exception):
+    """Raised when `bw serve` cannot be started or rejects a request."""
+
+    pass
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class BwServe:
+    """
+    A long-lived `bw serve` process driven through its local REST API.
+
+    One Node.js process is started per backup instead of one per command, and
+    all requests go over a single keep-alive HTTP connection. The API is bound
+    to the loopback interface only and has no authentication of its own, so
+    the process is stopped as soon as the client is done with it.
+    """
+
+    def __init__(
+        self,
+        bw_cmd: str = "bw",
+        host: str = "127.0.0.1",
+        port: int | None = None,
+        env: dict[str, str] | None = None,
+        startup_timeout: float = 30.0,
+        request_timeout: float = 300.0,
+    ):
+        """
+        :param bw_cmd: Path to bw CLI command (default "bw")
+        :param host: Interface `bw serve` binds to (default loopback)
+        :param port: Port to listen on (default: a free ephemeral port)
+        :param env: Environment for the `bw serve` process
+        :param startup_timeout: Seconds to wait for the API to come up
+        :param request_timeout: Socket timeout for API requests
+        """
+        self.bw_cmd = bw_cmd
+        self.host = host
+        self.port = port or _free_port(host)
+        self.env = env if env is not None else os.environ.copy()
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.process: Popen | None = None
+        self._conn: http.client.HTTPConnection | None = None
+        self._lock = threading.Lock()
+        self._started: float | None = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> None:
+        """Start `bw serve` and wait until its API answers."""
+        if self.process is not None:
+            return
+        logger.info(f"Starting bw serve on {self.host}:{self.port}")
+        self._started = time.time()
+        self.process = Popen(
+            [
+                self.bw_cmd,
+                "serve",
+                "--hostname",
+                self.host,
+                "--port",
+                str(self.port),
+            ],
+            stdin=DEVNULL,
+            stdout=DEVNULL,
+            stderr=DEVNULL,
+            env=self.env,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            if self.process.poll() is not None:
+                code = self.process.returncode
+                self.process = None
+                raise BwServeError(f"bw serve exited during startup with code {code}")
+            try:
+                self.request("GET", "/status")
+                return
+            except (OSError, http.client.HTTPException):
+                self._close_connection()
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise BwServeError(
+                        f"bw serve did not start within {self.startup_timeout}s"
+                    ) from None
+                time.sleep(0.2)
+
+    def stop(self) -> None:
+        """Close the connection and terminate the `bw serve` process."""
+        self._close_connection()
+        if self.process is None:
+            return
+        # The span covers the whole lifetime of the process
+        with tracing.span("bw serve", start=self._started):
+            self.process.terminate()
+            try:
+                tracing.wait(self.process, timeout=10)
+            except TimeoutExpired:
+                self.process.kill()
+                tracing.wait(self.process)
+        self.process = None
+        logger.info("Stopped bw serve")
+
+    def _close_connection(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.request_timeout
+            )
+        return self._conn
+
+    def _send(self, method: str, path: str, body: bytes | None) -> tuple[int, bytes]:
+        conn = self._connection()
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+
+    def request(self, method: str, path: str, payload: dict | None = None) -> Any:
+        """
+        Send a request to the `bw serve` API and return its `data` member.
+
+        A dropped keep-alive connection is re-opened once before giving up.
+
+        :raises BwServeError: if the API reports a failure
+        """
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        with self._lock:
+            try:
+                status, raw = self._send(method, path, body)
+            except (ConnectionError, http.client.RemoteDisconnected):
+                self._close_connection()
+                status, raw = self._send(method, path, body)
+        try:
+            result = json.loads(raw) if raw else {}
+        except json.JSONDecodeError:
+            raise BwServeError(
+                f"Invalid response from bw serve for {method} {path} (HTTP {status})"
+            ) from None
+        if status >= 400 or not result.get("success", False):
+            message = result.get("message") or f"HTTP {status}"
+            raise BwServeError(f"{method} {path} failed: {message}")
+        return result.get("data")
+
+    @contextmanager
+    def download(self, path: str) -> Iterator[http.client.HTTPResponse]:
+        """
+        Stream a file from the API, e.g. an attachment.
+
+        Every download gets its own connection, so several can run in
+        parallel without holding the shared keep-alive connection.
+
+        :raises BwServeError: if the API reports a failure
+        """
+        conn = http.client.HTTPConnection(
+            self.host, self.port, timeout=self.request_timeout
+        )
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            if response.status >= 400:
+                try:
+                    message = json.loads(response.read()).get("message")
+                except (json.JSONDecodeError, AttributeError):
+                    message = None
+                raise BwServeError(
+                    f"GET {path} failed: {message or f'HTTP {response.status}'}"
+                )
+            yield response
+        finally:
+            conn.close()
+
+    # -------------------------------
+    # Vault Management API
+    # -------------------------------
+    def unlock(self, password: str) -> str:
+        """Unlock the vault and return the session key."""
+        data = self.request("POST", "/unlock", {"password": password})
+        return data["raw"]
+
+    def status(self) -> dict[str, Any]:
+        """Return the same status object as `bw status`."""
+        return self.request("GET", "/status")["template"]
+
+    def sync(self) -> None:
+        self.request("POST", "/sync")
+
+    def list_objects(self, kind: str) -> list[dict[str, Any]]:
+        """List vault objects, e.g. "items" or "folders"."""
+        return self.request("GET", f"/list/object/{kind}")["data"]
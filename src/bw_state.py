@@ -0,0 +1,190 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from sys import stdout
+from typing import Any
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "data.json"
+# Values the CLI encrypts with the BW_SESSION key are stored under this prefix
+PROTECTED_PREFIX = "__PROTECTED__"
+REGION_URLS = {
+    "US": "https://vault.bitwarden.com",
+    "EU": "https://vault.bitwarden.eu",
+}
+ENC_AES_CBC_256_HMAC_SHA256_B64 = 2
+
+
+def cli_appdata_dir(appdata_dir: str | None = None) -> str:
+    """Return the directory the bw CLI keeps its state in."""
+    if appdata_dir:
+        return appdata_dir
+    if os.getenv("BITWARDENCLI_APPDATA_DIR"):
+        return os.environ["BITWARDENCLI_APPDATA_DIR"]
+    if sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    elif sys.platform == "win32":
+        base = os.getenv("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.getenv("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "Bitwarden CLI")
+
+
+def normalize_url(url: str | None) -> str | None:
+    return url.rstrip("/") if url else None
+
+
+@dataclass
+class CliState:
+    """What `bw status` would report, read from the CLI's data.json."""
+
+    server_url: str | None = None
+    user_id: str | None = None
+    user_email: str | None = None
+    last_sync: str | None = None
+    # Session-encrypted values of the active account
+    protected: list[str] = field(default_factory=list)
+
+    def status(self, session: str | None) -> str:
+        """
+        Return "unauthenticated", "locked" or "unlocked" for `session`, the
+        way the CLI decides it: unlocked means the session key authenticates
+        the keys the CLI protected with it.
+        """
+        if self.user_id is None:
+            return "unauthenticated"
+        if session and any(_session_protects(session, v) for v in self.protected):
+            return "unlocked"
+        return "locked"
+
+    def as_status(self, session: str | None) -> dict[str, Any]:
+        """Return a status object shaped like `bw status`."""
+        return {
+            "serverUrl": self.server_url,
+            "lastSync": self.last_sync,
+            "userEmail": self.user_email,
+            "userId": self.user_id,
+            "status": self.status(session),
+        }
+
+
+def _session_protects(session: str, value: Any) -> bool:
+    """Check the MAC of a protected value with the MAC half of the session key."""
+    try:
+        key = base64.b64decode(session, validate=True)
+        if not isinstance(value, str) or len(key) != 64:
+            return False
+        if "|" in value:
+            # EncString: "2.<iv>|<ciphertext>|<mac>"
+            enc_type, _, data = value.partition(".")
+            iv, ciphertext, mac = (base64.b64decode(p) for p in data.split("|"))
+        else:
+            # EncArrayBuffer: type byte, 16 byte IV, 32 byte MAC, ciphertext
+            buffer = base64.b64decode(value)
+            enc_type = buffer[0]
+            iv, mac, ciphertext = buffer[1:17], buffer[17:49], buffer[49:]
+        if int(enc_type) != ENC_AES_CBC_256_HMAC_SHA256_B64:
+            return False
+    except (ValueError, IndexError, binascii.Error):
+        return False
+    expected = hmac.new(key[32:], iv + ciphertext, hashlib.sha256).digest()
+    return hmac.compare_digest(expected, mac)
+
+
+def _environment_url(environment: Any) -> str | None:
+    if not isinstance(environment, dict):
+        return None
+    urls = environment.get("urls") or {}
+    if urls.get("base"):
+        return normalize_url(urls["base"])
+    return REGION_URLS.get(environment.get("region"))
+
+
+def _parse(data: dict[str, Any]) -> CliState | None:
+    """
+    Parse both layouts the CLI has written: the flat "global_*"/"user_<id>_*"
+    keys of current versions and the nested "global"/"<id>" objects of older
+    ones. Returns None when it cannot tell who is logged in.
+    """
+    if "global_account_activeAccountId" in data:
+        user_id = data["global_account_activeAccountId"]
+        account = (data.get("global_account_accounts") or {}).get(user_id) or {}
+        server_url = _environment_url(
+            data.get(f"user_{user_id}_environment_environment")
+        ) or _environment_url(data.get("global_environment_environment"))
+        return CliState(
+            server_url=server_url,
+            user_id=user_id,
+            user_email=account.get("email"),
+            last_sync=data.get(f"user_{user_id}_sync_lastSync"),
+            protected=_protected(data, user_id),
+        )
+    if "activeUserId" in data:
+        user_id = data["activeUserId"]
+        account = (data.get(user_id) or {}) if user_id else {}
+        profile = account.get("profile") or {}
+        settings = account.get("settings") or {}
+        urls = settings.get("environmentUrls") or (data.get("global") or {}).get(
+            "environmentUrls"
+        )
+        return CliState(
+            server_url=normalize_url((urls or {}).get("base")),
+            user_id=user_id,
+            user_email=profile.get("email"),
+            last_sync=profile.get("lastSync"),
+            protected=_protected(data, user_id),
+        )
+    if any(k.startswith(("user_", PROTECTED_PREFIX)) for k in data):
+        return None
+    # Nobody has logged in yet; only the server may be configured
+    return CliState(
+        server_url=_environment_url(data.get("global_environment_environment"))
+        or normalize_url(
+            ((data.get("global") or {}).get("environmentUrls") or {}).get("base")
+        )
+    )
+
+
+def _protected(data: dict[str, Any], user_id: str | None) -> list[str]:
+    if not user_id:
+        return []
+    return [
+        value
+        for key, value in data.items()
+        if key.startswith(PROTECTED_PREFIX) and user_id in key
+    ]
+
+
+def read_cli_state(appdata_dir: str | None = None) -> CliState | None:
+    """
+    Read the bw CLI state from its data.json without starting Node.js.
+
+    :param appdata_dir: BITWARDENCLI_APPDATA_DIR to read (default: the CLI's own lookup)
+    :return: the state, or None when it has to be asked from `bw status`
+    """
+    path = os.path.join(cli_appdata_dir(appdata_dir), DATA_FILE)
+    try:
+        with open(path, "rb") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read bw CLI state from {path}: {e}")
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        return _parse(data)
+    except (AttributeError, TypeError) as e:
+        logger.debug(f"Unrecognized bw CLI state in {path}: {e}")
+        return None
@@ -0,0 +1,393 @@
+import argparse
+import contextvars
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from sys import stdout
+from typing import Any, Iterable, Iterator
+from src.attachments import BLOBS_DIR
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+# One index per backup dir, next to the backups it lists
+INDEX_FILE = ".backup-index.jsonl"
+LOCK_FILE = ".backup-index.lock"
+BACKUP_NAME = re.compile(r"^backup_(\d{8}_\d{6})\.enc$")
+# Organization exports go to "org-<organization id>" in their profile's dir,
+# and every export format but the first to "format-<mode>" next to it
+ORG_DIR_PREFIX = "org-"
+FORMAT_DIR_PREFIX = "format-"
+EXPORT_DIR_PREFIXES = (ORG_DIR_PREFIX, FORMAT_DIR_PREFIX)
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+@dataclass
+class BackupEntry:
+    """
+    One backup in a backup dir, as recorded when it was written. Fields a
+    backup from an older version (or an exporter) cannot tell are None.
+    """
+
+    file: str
+    created: float
+    size: int = 0
+    # Attachment manifest and the blobs it references
+    attachments: str | None = None
+    blobs: list[str] | None = None
+    profile: str | None = None
+    mode: str | None = None
+    # SHA-256 of the backup file, computed while it was written
+    sha256: str | None = None
+    items: int | None = None
+    folders: int | None = None
+    # Seconds spent in each phase of the run (see src.metrics)
+    phases: dict[str, float] | None = None
+    # Outcome of the latest restore check (see src.verify)
+    verified: float | None = None
+    verify_ok: bool | None = None
+    verify_error: str | None = None
+
+
+_FIELDS = {f.name for f in fields(BackupEntry)}
+
+# What the exporter of the running backup found out (see collect())
+_export_stats: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar(
+    "backvault_export_stats", default=None
+)
+
+
+@contextmanager
+def collect() -> Iterator[dict[str, Any]]:
+    """Collect what note() reports in this context, for record_backup()."""
+    stats: dict[str, Any] = {}
+    token = _export_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _export_stats.reset(token)
+
+
+def note(**stats) -> None:
+    """
+    Report facts about the backup being written, such as its `sha256` or the
+    number of `items` and `folders` exported. Ignored outside collect().
+    """
+    collected = _export_stats.get()
+    if collected is not None:
+        collected.update(stats)
+
+
+def created_from_name(name: str) -> float | None:
+    """Return the time encoded in a `backup_<timestamp>.enc` name."""
+    match = BACKUP_NAME.match(name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), TIMESTAMP_FORMAT).timestamp()
+
+
+@contextmanager
+def _locked(backup_dir: str) -> Iterator[None]:
+    """Serialize index updates between threads and processes."""
+    with open(os.path.join(backup_dir, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _append(backup_dir: str, records: list[dict]) -> None:
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    with open(os.path.join(backup_dir, INDEX_FILE), "a") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _replay(path: str) -> tuple[dict[str, BackupEntry], int]:
+    entries: dict[str, BackupEntry] = {}
+    lines = 0
+    with open(path) as f:
+        for line in f:
+            lines += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash; the next write compacts it
+                continue
+            op = record.pop("op", None)
+            if op == "add":
+                known = {k: v for k, v in record.items() if k in _FIELDS}
+                entries[record["file"]] = BackupEntry(**known)
+            elif op == "remove":
+                entries.pop(record["file"], None)
+            elif op == "verify" and record["file"] in entries:
+                entry = entries[record["file"]]
+                entry.verified = record.get("verified")
+                entry.verify_ok = record.get("verify_ok")
+                entry.verify_error = record.get("verify_error")
+    return entries, lines
+
+
+def _scan(backup_dir: str) -> dict[str, BackupEntry]:
+    """Build entries from the backups on disk, for dirs without an index."""
+    entries = {}
+    with os.scandir(backup_dir) as it:
+        for entry in it:
+            created = created_from_name(entry.name)
+            if created is None or not entry.is_file(follow_symlinks=False):
+                continue
+            manifest = entry.name[: -len(".enc")] + ".attachments.enc"
+            entries[entry.name] = BackupEntry(
+                file=entry.name,
+                created=created,
+                size=entry.stat(follow_symlinks=False).st_size,
+                attachments=manifest
+                if os.path.exists(os.path.join(backup_dir, manifest))
+                else None,
+            )
+    return entries
+
+
+def _compact(backup_dir: str, entries: dict[str, BackupEntry]) -> None:
+    path = os.path.join(backup_dir, INDEX_FILE)
+    partial = f"{path}.{os.getpid()}.partial"
+    with open(partial, "w") as f:
+        for entry in entries.values():
+            f.write(json.dumps({"op": "add", **asdict(entry)}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+
+def load_index(backup_dir: str) -> list[BackupEntry]:
+    """
+    Return the backups in `backup_dir`, oldest first, from its index.
+
+    The index is an append-only JSON lines file, so reading it never stats
+    the backups themselves. A dir without an index (backups from older
+    versions) is scanned once and the index is created from what is found.
+    Indexes that grew well past the number of live backups are compacted.
+    """
+    path = os.path.join(backup_dir, INDEX_FILE)
+    if not os.path.isdir(backup_dir):
+        return []
+    with _locked(backup_dir):
+        if os.path.exists(path):
+            entries, lines = _replay(path)
+            if lines > 2 * len(entries) + 100:
+                _compact(backup_dir, entries)
+        else:
+            entries = _scan(backup_dir)
+            _compact(backup_dir, entries)
+            if entries:
+                logger.info(f"Indexed {len(entries)} existing backups in {backup_dir}")
+    return sorted(entries.values(), key=lambda entry: (entry.created, entry.file))
+
+
+def record_backup(
+    backup_file: str,
+    created: float | None = None,
+    attachments: str | None = None,
+    blobs: Iterable[str] | None = None,
+    **details,
+) -> BackupEntry:
+    """
+    Add a finished backup to the index of its dir.
+
+    :param details: other BackupEntry fields, such as `mode`, `sha256` or `phases`
+    """
+    backup_dir, name = os.path.split(os.path.abspath(backup_file))
+    if created is None:
+        created = created_from_name(name) or time.time()
+    entry = BackupEntry(
+        file=name,
+        created=created,
+        size=os.path.getsize(backup_file),
+        attachments=os.path.basename(attachments) if attachments else None,
+        blobs=sorted(set(blobs)) if blobs is not None else None,
+        **details,
+    )
+    # Make sure older backups are indexed before the first entry is appended
+    load_index(backup_dir)
+    with _locked(backup_dir):
+        _append(backup_dir, [{"op": "add", **asdict(entry)}])
+    return entry
+
+
+def record_removed(backup_dir: str, files: Iterable[str]) -> None:
+    """Drop deleted backups from the index in a single write."""
+    records = [{"op": "remove", "file": os.path.basename(f)} for f in files]
+    if not records or not os.path.exists(os.path.join(backup_dir, INDEX_FILE)):
+        return
+    with _locked(backup_dir):
+        _append(backup_dir, records)
+
+
+def record_verified(
+    backup_dir: str,
+    results: Iterable[tuple[str, bool, str | None]],
+    verified: float | None = None,
+) -> None:
+    """Record the outcome of restore checks as (file, ok, error) in a single write."""
+    verified = time.time() if verified is None else verified
+    records = [
+        {
+            "op": "verify",
+            "file": os.path.basename(f),
+            "verified": verified,
+            "verify_ok": ok,
+            "verify_error": error,
+        }
+        for f, ok, error in results
+    ]
+    if not records or not os.path.exists(os.path.join(backup_dir, INDEX_FILE)):
+        return
+    with _locked(backup_dir):
+        _append(backup_dir, records)
+
+
+def file_sha256(path: str) -> str:
+    """Hash a backup that was written by another program."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def catalog_dirs(backup_dir: str, depth: int = 2) -> list[str]:
+    """
+    The backup dir itself, the per-profile dirs inside it and the
+    organization and format dirs inside those.
+    """
+    dirs = [backup_dir]
+    with os.scandir(backup_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False) or entry.name == BLOBS_DIR:
+                continue
+            if entry.name.startswith(EXPORT_DIR_PREFIXES):
+                dirs.extend(catalog_dirs(entry.path, 0))
+            elif depth > 1:
+                dirs.extend(catalog_dirs(entry.path, depth - 1))
+    return dirs
+
+
+def list_backups(backup_dir: str) -> list[tuple[str, BackupEntry]]:
+    """Return (dir, entry) for every indexed backup under `backup_dir`, oldest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    found = [
+        (directory, entry)
+        for directory in catalog_dirs(backup_dir)
+        for entry in load_index(directory)
+    ]
+    return sorted(found, key=lambda pair: (pair[1].created, pair[1].file))
+
+
+def find_backup(backup_dir: str, name: str) -> tuple[str, BackupEntry] | None:
+    """Look up one backup by file name or path."""
+    wanted = os.path.basename(name)
+    parent = os.path.dirname(os.path.abspath(name)) if os.sep in name else None
+    for directory, entry in reversed(list_backups(backup_dir)):
+        if entry.file == wanted and parent in (None, os.path.abspath(directory)):
+            return directory, entry
+    return None
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _format_row(directory: str, entry: BackupEntry, backup_dir: str) -> str:
+    created = datetime.fromtimestamp(entry.created).strftime("%Y-%m-%d %H:%M:%S")
+    profile = entry.profile or (
+        os.path.basename(directory) if directory != backup_dir else "default"
+    )
+
+    def unknown(value) -> str:
+        return "-" if value is None else str(value)
+
+    return (
+        f"{created}  {profile:<12} {unknown(entry.mode):<9} "
+        f"{_format_size(entry.size):>10} {unknown(entry.items):>6} "
+        f"{unknown(entry.folders):>7}  {(entry.sha256 or '-')[:12]:<12}  {entry.file}"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Query the Backvault backup catalog.")
+    parser.add_argument(
+        "--backup-dir",
+        default=os.getenv("BACKUP_DIR", "/app/backups"),
+        help="Backup dir to read (default: BACKUP_DIR)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_cmd = commands.add_parser("list", help="List backups, oldest first")
+    list_cmd.add_argument("--profile", help="Only list this vault profile")
+    list_cmd.add_argument("--last", type=int, help="Only list the newest N backups")
+    show_cmd = commands.add_parser("show", help="Show one backup in full")
+    show_cmd.add_argument("backup", help="Backup file name or path")
+    args = parser.parse_args(argv)
+    backup_dir = os.path.abspath(args.backup_dir)
+
+    if args.command == "show":
+        found = find_backup(backup_dir, args.backup)
+        if found is None:
+            print(
+                f"{args.backup} is not in the catalog of {backup_dir}", file=sys.stderr
+            )
+            return 1
+        directory, entry = found
+        print(
+            json.dumps(
+                {"path": os.path.join(directory, entry.file), **asdict(entry)}, indent=2
+            )
+        )
+        return 0
+
+    rows = list_backups(backup_dir)
+    if args.profile:
+        rows = [
+            (directory, entry)
+            for directory, entry in rows
+            if (entry.profile or "default") == args.profile
+        ]
+    if args.last:
+        rows = rows[-args.last :]
+    if args.json:
+        print(
+            json.dumps(
+                [{"path": os.path.join(d, e.file), **asdict(e)} for d, e in rows],
+                indent=2,
+            )
+        )
+        return 0
+    print(
+        f"{'created':<19}  {'profile':<12} {'mode':<9} {'size':>10} {'items':>6} "
+        f"{'folders':>7}  {'sha256':<12}  file"
+    )
+    for directory, entry in rows:
+        print(_format_row(directory, entry, backup_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
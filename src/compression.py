@@ -0,0 +1,97 @@
+import bz2
+import lzma
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable
+
+# Codec ids live in the low nibble of the v3 header's flags byte (see
+# src.crypto); 0 means the plaintext is stored uncompressed.
+CODEC_MASK = 0x0F
+
+
+@dataclass(frozen=True)
+class Codec:
+    """A streaming compression codec that raw-mode backups can be stored with."""
+
+    name: str
+    id: int
+    default_level: int
+    min_level: int
+    max_level: int
+    compressor: Callable[[int], Any]
+    decompressor: Callable[[], Any]
+
+
+CODECS: dict[str, Codec] = {}
+CODECS_BY_ID: dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    """Make a codec available by name for writing and by id for reading."""
+    if not 0 < codec.id <= CODEC_MASK:
+        raise ValueError(f"Codec id must be between 1 and {CODEC_MASK}")
+    if CODECS_BY_ID.get(codec.id, codec).name != codec.name:
+        raise ValueError(f"Codec id {codec.id} is already taken")
+    CODECS[codec.name] = codec
+    CODECS_BY_ID[codec.id] = codec
+
+
+register_codec(
+    Codec(
+        name="zlib",
+        id=1,
+        default_level=6,
+        min_level=0,
+        max_level=9,
+        compressor=lambda level: zlib.compressobj(level),
+        decompressor=zlib.decompressobj,
+    )
+)
+register_codec(
+    Codec(
+        name="lzma",
+        id=2,
+        default_level=6,
+        min_level=0,
+        max_level=9,
+        compressor=lambda level: lzma.LZMACompressor(preset=level),
+        decompressor=lzma.LZMADecompressor,
+    )
+)
+register_codec(
+    Codec(
+        name="bz2",
+        id=3,
+        default_level=9,
+        min_level=1,
+        max_level=9,
+        compressor=lambda level: bz2.BZ2Compressor(level),
+        decompressor=bz2.BZ2Decompressor,
+    )
+)
+
+
+def parse_compression(spec: str | None) -> tuple[Codec | None, int | None]:
+    """
+    Parse a compression setting such as "zlib", "lzma:9" or "none".
+
+    :return: the codec and level, or (None, None) for no compression
+    :raises ValueError: unknown codec or level out of range
+    """
+    if not spec or spec.lower() == "none":
+        return None, None
+    name, _, level = spec.lower().partition(":")
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(
+            f"Unknown compression codec '{name}'. "
+            f"Must be 'none' or one of {', '.join(sorted(CODECS))}."
+        )
+    if not level:
+        return codec, codec.default_level
+    if not level.isdigit() or not codec.min_level <= int(level) <= codec.max_level:
+        raise ValueError(
+            f"Invalid {codec.name} level '{level}'. "
+            f"Must be between {codec.min_level} and {codec.max_level}."
+        )
+    return codec, int(level)
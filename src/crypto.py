@@ -0,0 +1,472 @@
+import hmac
+import os
+import struct
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
+from sys import stdout
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from src.compression import CODEC_MASK, CODECS_BY_ID, parse_compression
+
+# Constants for encryption
+SALT_SIZE = 16
+KEY_SIZE = 32  # For AES-256
+NONCE_SIZE = 12  # GCM recommended nonce size
+TAG_SIZE = 16
+PBKDF2_ITERATIONS = 600000
+
+# Chunked (v2) container format
+#
+#   header: magic (4) | version (1) | flags (1) | salt (16) | iterations (4)
+#           | nonce prefix (7) | chunk size (4)
+#   body:   one AES-256-GCM record per chunk, each ciphertext + tag (16)
+#
+# Every chunk but the last holds exactly `chunk size` bytes of plaintext.
+# The nonce of chunk i is `nonce prefix | i (4 bytes, big endian) | last flag`
+# and the header is authenticated as associated data of every chunk, so
+# reordered, dropped, duplicated or truncated chunks all fail authentication.
+MAGIC = b"BVLT"
+FORMAT_V2 = 2
+NONCE_PREFIX_SIZE = 7
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+HEADER_V2 = struct.Struct(">4sBB16sI7sI")
+MAX_CHUNKS = 2**32
+
+# Keyed (v3) container format
+#
+#   header: magic (4) | version (1) | flags (1) | kdf salt (16) | iterations (4)
+#           | file salt (16) | nonce prefix (7) | chunk size (4)
+#   body:   exactly as in v2
+#
+# PBKDF2(password, kdf salt, iterations) yields a master key that is cached
+# for the lifetime of the process. Backups share the kdf salt (stored in the
+# database), so verifying or decrypting many of them costs a single PBKDF2
+# run. Each file is encrypted with its own key,
+# HKDF-SHA256(master key, salt=file salt, info=FILE_KEY_INFO).
+#
+# The low nibble of the flags byte names the codec the plaintext was
+# compressed with before encryption (see src.compression, 0 = none); the
+# high nibble is reserved and must be zero.
+FORMAT_V3 = 3
+HEADER_V3 = struct.Struct(">4sBB16sI16s7sI")
+FILE_KEY_INFO = b"backvault file key v3"
+HEADERS = {FORMAT_V2: HEADER_V2, FORMAT_V3: HEADER_V3}
+
+# Key of the keyed plaintext fingerprint used to recognise unchanged exports
+FINGERPRINT_INFO = b"backvault fingerprint v1"
+
+# Used when the caller has no stored kdf salt, so that at least backups made
+# by this process share one master key
+_PROCESS_KDF_SALT = os.urandom(SALT_SIZE)
+
+# Header iteration counts above this are refused rather than derived
+MAX_PBKDF2_ITERATIONS = 10 * PBKDF2_ITERATIONS
+
+# Master keys cached by master_key(), most recently used last
+MASTER_KEY_CACHE_SIZE = 32
+_CACHE_SECRET = os.urandom(32)
+_master_keys: OrderedDict[tuple[bytes, bytes, int], bytes] = OrderedDict()
+_master_keys_lock = threading.Lock()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BackupFormatError(Exception):
+    """Raised when a backup file is not in a recognised format."""
+
+    pass
+
+
+class _PlaintextReader:
+    """
+    Reads the plaintext from `src`, counting (and optionally hashing) it, and
+    hands out its compressed form when a compressor is given.
+    """
+
+    def __init__(self, src: BinaryIO, compressor: Any = None, hasher: Any = None):
+        self.src = src
+        self.compressor = compressor
+        self.hasher = hasher
+        self.total = 0
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _consume(self, size: int) -> bytes:
+        data = self.src.read(size)
+        self.total += len(data)
+        if self.hasher is not None and data:
+            self.hasher.update(data)
+        return data
+
+    def read(self, size: int) -> bytes:
+        if self.compressor is None:
+            return self._consume(size)
+        while len(self._buffer) < size and not self._eof:
+            data = self._consume(size)
+            if data:
+                self._buffer += self.compressor.compress(data)
+            else:
+                self._buffer += self.compressor.flush()
+                self._eof = True
+        out = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return out
+
+
+class _DecompressingWriter:
+    """Decompresses everything written to it into `dst`, counting the output."""
+
+    def __init__(self, dst: BinaryIO, decompressor: Any):
+        self.dst = dst
+        self.decompressor = decompressor
+        self.total = 0
+
+    def write(self, data: bytes) -> int:
+        if self.decompressor.eof and data:
+            raise BackupFormatError("Unexpected data after the compressed stream")
+        plain = self.decompressor.decompress(data)
+        self.total += len(plain)
+        self.dst.write(plain)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.decompressor.eof:
+            raise BackupFormatError("Compressed stream is incomplete")
+
+
+def derive_key(password: str, salt: bytes, iterations: int | None = None) -> bytes:
+    """Derive an AES-256 key from the password with PBKDF2-SHA256."""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=KEY_SIZE,
+        salt=salt,
+        iterations=iterations or PBKDF2_ITERATIONS,
+    )
+    return kdf.derive(password.encode("utf-8"))
+
+
+def _check_iterations(iterations: int) -> None:
+    # The count comes from the file header, so a crafted backup could ask for
+    # an arbitrarily expensive PBKDF2 run
+    if not 0 < iterations <= MAX_PBKDF2_ITERATIONS:
+        raise BackupFormatError(f"Unsupported PBKDF2 iteration count: {iterations}")
+
+
+def master_key(password: str, kdf_salt: bytes, iterations: int) -> bytes:
+    """
+    Derive (once per process) the v3 master key for a password and kdf salt.
+
+    Cached keys are looked up by an HMAC of the password under a per-process
+    secret, so the resident daemon never keeps file passwords around.
+    """
+    cache_key = (
+        hmac.digest(_CACHE_SECRET, password.encode("utf-8"), "sha256"),
+        kdf_salt,
+        iterations,
+    )
+    with _master_keys_lock:
+        if cache_key in _master_keys:
+            _master_keys.move_to_end(cache_key)
+            return _master_keys[cache_key]
+    key = derive_key(password, kdf_salt, iterations)
+    with _master_keys_lock:
+        _master_keys[cache_key] = key
+        while len(_master_keys) > MASTER_KEY_CACHE_SIZE:
+            _master_keys.popitem(last=False)
+    return key
+
+
+def file_key(master: bytes, file_salt: bytes) -> bytes:
+    """Derive the AES-256 key of one v3 file from the master key."""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(), length=KEY_SIZE, salt=file_salt, info=FILE_KEY_INFO
+    )
+    return hkdf.derive(master)
+
+
+def fingerprint_key(
+    password: str, kdf_salt: bytes | None = None, iterations: int | None = None
+) -> bytes:
+    """
+    Derive the HMAC key used to fingerprint plaintext exports, from the same
+    cached master key as the file keys.
+    """
+    kdf_salt = kdf_salt or _PROCESS_KDF_SALT
+    master = master_key(password, kdf_salt, iterations or PBKDF2_ITERATIONS)
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(), length=KEY_SIZE, salt=kdf_salt, info=FINGERPRINT_INFO
+    )
+    return hkdf.derive(master)
+
+
+def _chunk_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    if index >= MAX_CHUNKS:
+        raise BackupFormatError("Too many chunks for a single backup file")
+    return prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+
+def _read_full(src: BinaryIO, size: int) -> bytes:
+    """Read exactly `size` bytes unless EOF is reached first."""
+    data = src.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        part = src.read(remaining)
+        if not part:
+            break
+        parts.append(part)
+        remaining -= len(part)
+    return b"".join(parts)
+
+
+def _plain_chunks(src: BinaryIO, chunk_size: int) -> Iterator[tuple[int, bytes, bool]]:
+    """Yield (index, chunk, last) for the plaintext read from `src`."""
+    index = 0
+    chunk = _read_full(src, chunk_size)
+    while True:
+        # Look one chunk ahead so the final chunk can be flagged as such
+        following = _read_full(src, chunk_size) if len(chunk) == chunk_size else b""
+        last = not following
+        yield index, chunk, last
+        if last:
+            return
+        chunk = following
+        index += 1
+
+
+def _records(src: BinaryIO, record_size: int) -> Iterator[tuple[int, bytes, bool]]:
+    """Yield (index, record, last) for the encrypted records read from `src`."""
+    index = 0
+    record = _read_full(src, record_size)
+    while True:
+        if len(record) < TAG_SIZE:
+            raise BackupFormatError("Backup file is truncated")
+        following = _read_full(src, record_size) if len(record) == record_size else b""
+        last = not following
+        yield index, record, last
+        if last:
+            return
+        record = following
+        index += 1
+
+
+def _transform(
+    blocks: Iterable[tuple[int, bytes, bool]],
+    func: Callable[[int, bytes, bool], bytes],
+    dst: BinaryIO,
+    workers: int,
+) -> None:
+    """
+    Apply `func` to every block and write the results to `dst` in order.
+
+    With more than one worker, blocks are processed on a thread pool (AES-GCM
+    releases the GIL) while at most `2 * workers` blocks are in flight, which
+    keeps memory use bounded.
+    """
+    if workers <= 1:
+        for index, data, last in blocks:
+            dst.write(func(index, data, last))
+        return
+
+    pending: deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index, data, last in blocks:
+            pending.append(pool.submit(func, index, data, last))
+            if len(pending) >= 2 * workers:
+                dst.write(pending.popleft().result())
+        while pending:
+            dst.write(pending.popleft().result())
+
+
+def encrypt_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    password: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    iterations: int | None = None,
+    workers: int = 1,
+    kdf_salt: bytes | None = None,
+    hasher: Any = None,
+    compression: str | None = None,
+) -> int:
+    """
+    Encrypt everything read from `src` into `dst` using the chunked v3 format.
+
+    Memory use is bounded by a few chunks per worker regardless of the input
+    size.
+
+    :param src: binary stream with the plaintext, e.g. a `bw export` pipe
+    :param dst: binary stream the container is written to
+    :param password: file password the key is derived from
+    :param chunk_size: plaintext bytes per authenticated chunk
+    :param iterations: PBKDF2 iterations (defaults to PBKDF2_ITERATIONS)
+    :param workers: number of threads encrypting chunks in parallel
+    :param kdf_salt: stored salt of the cached master key (defaults to a salt generated once per process)
+    :param hasher: object whose update() is fed the plaintext, in order (e.g. an HMAC)
+    :param compression: codec (and level) to compress with first, e.g. "zlib" or "lzma:9" (default none)
+    :return: number of plaintext bytes encrypted
+    """
+    codec, level = parse_compression(compression)
+    iterations = iterations or PBKDF2_ITERATIONS
+    kdf_salt = kdf_salt or _PROCESS_KDF_SALT
+    if len(kdf_salt) != SALT_SIZE:
+        raise ValueError(f"kdf_salt must be {SALT_SIZE} bytes")
+    file_salt = os.urandom(SALT_SIZE)
+    prefix = os.urandom(NONCE_PREFIX_SIZE)
+    flags = codec.id if codec else 0
+    header = HEADER_V3.pack(
+        MAGIC, FORMAT_V3, flags, kdf_salt, iterations, file_salt, prefix, chunk_size
+    )
+    aesgcm = AESGCM(file_key(master_key(password, kdf_salt, iterations), file_salt))
+    dst.write(header)
+
+    plaintext = _PlaintextReader(
+        src, codec.compressor(level) if codec else None, hasher
+    )
+
+    def encrypt_chunk(index: int, chunk: bytes, last: bool) -> bytes:
+        return aesgcm.encrypt(_chunk_nonce(prefix, index, last), chunk, header)
+
+    _transform(_plain_chunks(plaintext, chunk_size), encrypt_chunk, dst, workers)
+    return plaintext.total
+
+
+def _decrypt_chunks(
+    header: bytes,
+    src: BinaryIO,
+    dst: BinaryIO,
+    key: bytes,
+    prefix: bytes,
+    chunk_size: int,
+    workers: int,
+) -> int:
+    if chunk_size <= 0:
+        raise BackupFormatError("Invalid chunk size in backup header")
+    aesgcm = AESGCM(key)
+
+    total = 0
+
+    def decrypt_record(index: int, record: bytes, last: bool) -> bytes:
+        return aesgcm.decrypt(_chunk_nonce(prefix, index, last), record, header)
+
+    def counted() -> Iterator[tuple[int, bytes, bool]]:
+        nonlocal total
+        for index, record, last in _records(src, chunk_size + TAG_SIZE):
+            total += len(record) - TAG_SIZE
+            yield index, record, last
+
+    _transform(counted(), decrypt_record, dst, workers)
+    return total
+
+
+def _decrypt_v2(
+    header: bytes, src: BinaryIO, dst: BinaryIO, password: str, workers: int
+) -> int:
+    _, _, flags, salt, iterations, prefix, chunk_size = HEADER_V2.unpack(header)
+    if flags:
+        raise BackupFormatError(f"Unsupported backup format flags: {flags:#04x}")
+    _check_iterations(iterations)
+    key = derive_key(password, salt, iterations)
+    return _decrypt_chunks(header, src, dst, key, prefix, chunk_size, workers)
+
+
+def _decrypt_v3(
+    header: bytes, src: BinaryIO, dst: BinaryIO, password: str, workers: int
+) -> int:
+    _, _, flags, kdf_salt, iterations, file_salt, prefix, chunk_size = HEADER_V3.unpack(
+        header
+    )
+    codec_id = flags & CODEC_MASK
+    if flags & ~CODEC_MASK or (codec_id and codec_id not in CODECS_BY_ID):
+        raise BackupFormatError(f"Unsupported backup format flags: {flags:#04x}")
+    _check_iterations(iterations)
+    key = file_key(master_key(password, kdf_salt, iterations), file_salt)
+    if not codec_id:
+        return _decrypt_chunks(header, src, dst, key, prefix, chunk_size, workers)
+    writer = _DecompressingWriter(dst, CODECS_BY_ID[codec_id].decompressor())
+    _decrypt_chunks(header, src, writer, key, prefix, chunk_size, workers)
+    writer.close()
+    return writer.total
+
+
+def decrypt_stream(
+    src: BinaryIO, dst: BinaryIO, password: str, workers: int = 1
+) -> int:
+    """
+    Decrypt a raw-mode backup from `src` into `dst`.
+
+    Chunked v2 and v3 containers are decrypted (and decompressed)
+    incrementally, on `workers` threads. Legacy v1 files (salt + nonce + ciphertext) are a single AES-GCM
+    message and are read whole.
+
+    :return: number of plaintext bytes written
+    :raises cryptography.exceptions.InvalidTag: wrong password or tampered file
+    """
+    head = _read_full(src, len(MAGIC) + 1)
+    if head[: len(MAGIC)] == MAGIC and len(head) == len(MAGIC) + 1:
+        version = head[len(MAGIC)]
+        header_struct = HEADERS.get(version)
+        if header_struct is None:
+            raise BackupFormatError(f"Unsupported backup format version: {version}")
+        head += _read_full(src, header_struct.size - len(head))
+        if len(head) == header_struct.size:
+            decrypt = _decrypt_v3 if version == FORMAT_V3 else _decrypt_v2
+            return decrypt(head, src, dst, password, workers)
+
+    data = head + src.read()
+    if len(data) < SALT_SIZE + NONCE_SIZE + TAG_SIZE:
+        raise BackupFormatError("Backup file is too short")
+    salt = data[:SALT_SIZE]
+    nonce = data[SALT_SIZE : SALT_SIZE + NONCE_SIZE]
+    aesgcm = AESGCM(derive_key(password, salt))
+    plaintext = aesgcm.decrypt(nonce, data[SALT_SIZE + NONCE_SIZE :], None)
+    dst.write(plaintext)
+    return len(plaintext)
+
+
+def decrypt_legacy(
+    data, dst: BinaryIO, password: str, block_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """
+    Decrypt a legacy v1 backup held in a bytes-like object such as an mmap,
+    `block_size` bytes at a time. A v1 file is a single AES-GCM message, so
+    its tag is checked in a first pass and nothing is written to `dst`
+    unless it is valid.
+
+    :return: number of plaintext bytes written
+    :raises cryptography.exceptions.InvalidTag: wrong password or tampered file
+    """
+    with memoryview(data) as view:
+        if len(view) < SALT_SIZE + NONCE_SIZE + TAG_SIZE:
+            raise BackupFormatError("Backup file is too short")
+        key = derive_key(password, bytes(view[:SALT_SIZE]))
+        nonce = bytes(view[SALT_SIZE : SALT_SIZE + NONCE_SIZE])
+        tag = bytes(view[-TAG_SIZE:])
+
+        def decrypt_pass(write: Callable[[bytes], Any]) -> None:
+            decryptor = Cipher(algorithms.AES(key), modes.GCM(nonce, tag)).decryptor()
+            for start in range(
+                SALT_SIZE + NONCE_SIZE, len(view) - TAG_SIZE, block_size
+            ):
+                end = min(start + block_size, len(view) - TAG_SIZE)
+                with view[start:end] as block:
+                    write(decryptor.update(block))
+            decryptor.finalize()
+
+        decrypt_pass(lambda _: None)
+        decrypt_pass(dst.write)
+        return len(view) - SALT_SIZE - NONCE_SIZE - TAG_SIZE
@@ -1,10 +1,13 @@
 import sqlcipher3
-import hashlib
-import base64
-import uuid
+import json
 import logging
+import re
+import time
+from contextlib import contextmanager
 from sys import stdout
+from typing import Iterable, Iterator
 import os
+from src import metrics
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -13,6 +16,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# A raw key ("x'<64 hex digits>'") is used as the database key as it is,
+# without running SQLCipher's PBKDF2 over it on every open
+RAW_KEY_REGEX = re.compile(r"""^key\s*=\s*"x'[0-9a-fA-F]{64}'";?$""")
+# Names of the credentials stored by the setup UI
+CREDENTIAL_KEYS = ("client_id", "client_secret", "master_password", "file_password")
+
+
+def _new_pragma_key() -> str:
+    return f"key = \"x'{os.urandom(32).hex()}'\";"
+
 
 def init_db(db_path: str, PRAGMA_KEY_FILE: str) -> None:
     logging.info(
@@ -23,13 +36,7 @@ def init_db(db_path: str, PRAGMA_KEY_FILE: str) -> None:
             PRAGMA_KEY = f.read().strip()
         logging.debug("Pragma key loaded from file.")
     except FileNotFoundError:
-        t_sha = hashlib.sha512()
-        t_sha.update(
-            base64.urlsafe_b64encode(uuid.uuid4().bytes)
-            + base64.urlsafe_b64encode(uuid.uuid4().bytes)
-        )
-        hashed_pragma = base64.urlsafe_b64encode(t_sha.digest())
-        PRAGMA_KEY = f"key='{hashed_pragma.decode('utf-8')}';"
+        PRAGMA_KEY = _new_pragma_key()
         logging.debug("New Pragma key generated.")
         try:
             with open(PRAGMA_KEY_FILE, "w") as f:
@@ -103,3 +110,263 @@ def get_key(conn: sqlcipher3.Connection, name: str) -> str:
     if isinstance(value, bytes):
         value = value.decode("utf-8")
     return value
+
+
+def get_keys(conn: sqlcipher3.Connection, names: Iterable[str]) -> dict[str, str]:
+    """Return the values stored under `names` in one query, leaving out missing names."""
+    names = list(names)
+    rows = conn.execute(
+        f"SELECT name, value FROM keys WHERE name IN ({', '.join('?' * len(names))})",
+        names,
+    ).fetchall()
+    return {
+        name: value.decode("utf-8") if isinstance(value, bytes) else value
+        for name, value in rows
+    }
+
+
+def put_keys(
+    conn: sqlcipher3.Connection, values: dict[str, str | bytes | None]
+) -> None:
+    """Store several values in one transaction; a value of None deletes its key."""
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO keys (name, value) VALUES (?, ?)",
+            [(name, value) for name, value in values.items() if value is not None],
+        )
+        conn.executemany(
+            "DELETE FROM keys WHERE name = ?",
+            [(name,) for name, value in values.items() if value is None],
+        )
+
+
+def get_kdf_salt(conn: sqlcipher3.Connection) -> bytes:
+    """
+    Return the salt of the cached raw-mode master key (see src.crypto),
+    creating and storing it on first use.
+    """
+    row = conn.execute(
+        "SELECT value FROM keys WHERE name = ?", ("kdf_salt",)
+    ).fetchone()
+    if row is not None:
+        value = row[0]
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return bytes.fromhex(value)
+    salt = os.urandom(16)
+    put_key(conn, "kdf_salt", salt.hex())
+    return salt
+
+
+def _ensure_profiles_table(conn: sqlcipher3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS profiles (
+            name TEXT PRIMARY KEY,
+            client_id TEXT NOT NULL,
+            client_secret TEXT NOT NULL,
+            master_password TEXT NOT NULL,
+            file_password TEXT NOT NULL,
+            server TEXT
+        )
+    """)
+
+
+def put_profile(
+    conn: sqlcipher3.Connection,
+    name: str,
+    client_id: str,
+    client_secret: str,
+    master_password: str,
+    file_password: str,
+    server: str | None = None,
+) -> None:
+    _ensure_profiles_table(conn)
+    conn.execute(
+        "INSERT OR REPLACE INTO profiles "
+        "(name, client_id, client_secret, master_password, file_password, server) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (name, client_id, client_secret, master_password, file_password, server),
+    )
+    conn.commit()
+
+
+def delete_profile(conn: sqlcipher3.Connection, name: str) -> bool:
+    _ensure_profiles_table(conn)
+    deleted = conn.execute("DELETE FROM profiles WHERE name = ?", (name,)).rowcount
+    conn.commit()
+    return deleted > 0
+
+
+def list_profiles(conn: sqlcipher3.Connection) -> list[dict[str, str | None]]:
+    """Return every named vault profile, ordered by name."""
+    try:
+        rows = conn.execute(
+            "SELECT name, client_id, client_secret, master_password, file_password, "
+            "server FROM profiles ORDER BY name"
+        ).fetchall()
+    except sqlcipher3.OperationalError:
+        # Databases created before profiles existed have no such table
+        return []
+    columns = (
+        "name",
+        "client_id",
+        "client_secret",
+        "master_password",
+        "file_password",
+        "server",
+    )
+    return [
+        {
+            column: value.decode("utf-8") if isinstance(value, bytes) else value
+            for column, value in zip(columns, row)
+        }
+        for row in rows
+    ]
+
+
+def _session_key(profile: str) -> str:
+    return f"session:{profile}"
+
+
+def get_session(conn: sqlcipher3.Connection, profile: str) -> dict | None:
+    """
+    Return the Bitwarden CLI session stored for `profile` by a previous run,
+    as a dict with `session`, `logged_in`, `client_id` and `server`.
+    """
+    row = conn.execute(
+        "SELECT value FROM keys WHERE name = ?", (_session_key(profile),)
+    ).fetchone()
+    if row is None:
+        return None
+    value = row[0]
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def get_sessions(
+    conn: sqlcipher3.Connection, profiles: Iterable[str]
+) -> dict[str, dict]:
+    """Like get_session, for several profiles in one query."""
+    profiles = list(profiles)
+    stored = get_keys(conn, map(_session_key, profiles))
+    sessions = {}
+    for profile in profiles:
+        try:
+            sessions[profile] = json.loads(stored[_session_key(profile)])
+        except (KeyError, ValueError):
+            continue
+    return sessions
+
+
+def put_session(conn: sqlcipher3.Connection, profile: str, session: dict) -> None:
+    put_key(conn, _session_key(profile), json.dumps(session))
+
+
+def put_sessions(conn: sqlcipher3.Connection, sessions: dict[str, dict | None]) -> None:
+    """Store or, for None, delete the sessions of several profiles at once."""
+    put_keys(
+        conn,
+        {
+            _session_key(profile): None if session is None else json.dumps(session)
+            for profile, session in sessions.items()
+        },
+    )
+
+
+def delete_session(conn: sqlcipher3.Connection, profile: str) -> None:
+    conn.execute("DELETE FROM keys WHERE name = ?", (_session_key(profile),))
+    conn.commit()
+
+
+class CredentialStore:
+    """
+    The credential database behind a single connection that is opened once
+    and then kept. A database keyed with a passphrase is rekeyed with a raw
+    key on first open, so later opens skip SQLCipher's key derivation.
+    Opening, reads and writes are timed in backvault_credential_store_seconds.
+    """
+
+    def __init__(self, db_path: str, pragma_key_file: str):
+        self.db_path = db_path
+        self.pragma_key_file = pragma_key_file
+        self.conn: sqlcipher3.Connection | None = None
+
+    @contextmanager
+    def _timed(self, operation: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.CREDENTIAL_STORE_SECONDS.observe(elapsed, operation=operation)
+            logging.debug(f"Credential store {operation} took {elapsed * 1000:.1f}ms")
+
+    def open(self) -> bool:
+        """Connect unless already connected; False if the database cannot be opened."""
+        if self.conn is not None:
+            return True
+        with self._timed("open"):
+            conn, _ = db_connect(self.db_path, self.pragma_key_file)
+            if conn is None:
+                return False
+            try:
+                conn = self._readable(conn)
+                self._use_raw_key(conn)
+            except (sqlcipher3.DatabaseError, OSError) as e:
+                logging.error(f"Failed to open database: {e}")
+                conn.close()
+                return False
+            self.conn = conn
+        return True
+
+    def _readable(self, conn: sqlcipher3.Connection) -> sqlcipher3.Connection:
+        """
+        Check the key opens the database. If it does not and a new key was
+        written, a rekey got as far as the database but not the key file.
+        """
+        try:
+            conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            return conn
+        except sqlcipher3.DatabaseError:
+            if not os.path.exists(self.pragma_key_file + ".new"):
+                raise
+        conn.close()
+        logging.info("Finishing an interrupted rekey of the database.")
+        os.replace(self.pragma_key_file + ".new", self.pragma_key_file)
+        conn, _ = db_connect(self.db_path, self.pragma_key_file)
+        if conn is None:
+            raise sqlcipher3.DatabaseError("cannot reconnect after rekey")
+        conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        return conn
+
+    def _use_raw_key(self, conn: sqlcipher3.Connection) -> None:
+        with open(self.pragma_key_file, "r") as f:
+            if RAW_KEY_REGEX.match(f.read().strip()):
+                return
+        logging.info("Rekeying the database with a raw key.")
+        key = os.urandom(32).hex()
+        # Written before the rekey so the new key cannot be lost in between
+        new_file = self.pragma_key_file + ".new"
+        with open(new_file, "w") as f:
+            f.write(f"key = \"x'{key}'\";")
+            f.flush()
+            os.fsync(f.fileno())
+        conn.execute(f"PRAGMA rekey = \"x'{key}'\";")
+        os.replace(new_file, self.pragma_key_file)
+
+    def get_keys(self, names: Iterable[str]) -> dict[str, str]:
+        with self._timed("read"):
+            return get_keys(self.conn, names)
+
+    def put_keys(self, values: dict[str, str | bytes | None]) -> None:
+        with self._timed("write"):
+            put_keys(self.conn, values)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
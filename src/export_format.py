@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator
+from src.crypto import MAGIC
+
+# Serialized exports are handed out in pieces of about this many characters
+JSON_PIECE_SIZE = 64 * 1024
+
+# Columns of `bw export --format csv` after the folder or collection ones,
+# and the item types it exports
+CSV_COLUMNS = (
+    "type",
+    "name",
+    "notes",
+    "fields",
+    "reprompt",
+    "login_uri",
+    "login_username",
+    "login_password",
+    "login_totp",
+)
+CSV_TYPES = {1: "login", 2: "note"}
+
+
+def canonical_json(data: Any) -> bytes:
+    """
+    Serialize an export deterministically (sorted keys, no whitespace) so it
+    compresses well and identical vaults always produce identical bytes.
+    """
+    return json.dumps(
+        data, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def _iter_top_level(
+    data: Any, dumps: Callable[[Any], str], indent: str | None, sort_keys: bool
+) -> Iterator[str]:
+    # Only the top-level object is taken apart: its lists (folders, items)
+    # are encoded one element at a time, so the C encoder still does the work
+    if not isinstance(data, dict) or not data:
+        yield dumps(data)
+        return
+
+    def newline(level: int) -> str:
+        return "" if indent is None else "\n" + indent * level
+
+    def nested(text: str, level: int) -> str:
+        # JSON strings cannot contain raw newlines, so these are all line breaks
+        return text if indent is None else text.replace("\n", newline(level))
+
+    key_separator = ":" if indent is None else ": "
+    yield "{"
+    for i, key in enumerate(sorted(data) if sort_keys else data):
+        yield f"{',' if i else ''}{newline(1)}{dumps(key)}{key_separator}"
+        value = data[key]
+        if isinstance(value, list) and value:
+            yield "["
+            for j, element in enumerate(value):
+                yield f"{',' if j else ''}{newline(2)}{nested(dumps(element), 2)}"
+            yield f"{newline(1)}]"
+        else:
+            yield nested(dumps(value), 1)
+    yield f"{newline(0)}}}"
+
+
+def iter_json(data: Any, canonical: bool = False) -> Iterator[bytes]:
+    """
+    Serialize an export in pieces instead of into one string, so its text is
+    never held in memory as a whole. The pieces add up to canonical_json(data)
+    with `canonical`, and otherwise to json.dumps(data, indent=2) with
+    non-ASCII characters kept as they are, as `bw export` writes them.
+    Every transport serializes through here, so the same vault always gives
+    the same bytes.
+    """
+    if canonical:
+        dumps = partial(
+            json.dumps, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        strings = _iter_top_level(data, dumps, None, sort_keys=True)
+    else:
+        dumps = partial(json.dumps, indent=2, ensure_ascii=False)
+        strings = _iter_top_level(data, dumps, "  ", sort_keys=False)
+    return _batched(strings)
+
+
+def _batched(strings: Iterable[str]) -> Iterator[bytes]:
+    pieces, size = [], 0
+    for string in strings:
+        pieces.append(string)
+        size += len(string)
+        if size >= JSON_PIECE_SIZE:
+            yield "".join(pieces).encode("utf-8")
+            pieces, size = [], 0
+    if pieces:
+        yield "".join(pieces).encode("utf-8")
+
+
+def csv_records(export: dict[str, Any]) -> Iterator[list[Any]]:
+    """
+    Yield the rows of `bw export --format csv` for a JSON export, header
+    first. Like the CLI, only logins and secure notes are included, and an
+    organization export lists collections instead of folders.
+    """
+    organization = "collections" in export
+    if organization:
+        groups = {group["id"]: group["name"] for group in export["collections"]}
+        yield ["collections", *CSV_COLUMNS]
+    else:
+        groups = {folder["id"]: folder["name"] for folder in export["folders"]}
+        yield ["folder", "favorite", *CSV_COLUMNS]
+    for item in export["items"]:
+        kind = CSV_TYPES.get(item.get("type"))
+        if kind is None:
+            continue
+        if organization:
+            ids = item.get("collectionIds") or []
+            row = [",".join(groups[i] for i in ids if i in groups)]
+        else:
+            row = [
+                groups.get(item.get("folderId"), ""),
+                1 if item.get("favorite") else "",
+            ]
+        login = item.get("login") or {}
+        row += [
+            kind,
+            item.get("name"),
+            item.get("notes"),
+            "\n".join(
+                f"{field.get('name') or ''}: {field.get('value') or ''}"
+                for field in item.get("fields") or []
+            ),
+            item.get("reprompt", 0),
+            ",".join(uri["uri"] for uri in login.get("uris") or [] if uri.get("uri")),
+            login.get("username"),
+            login.get("password"),
+            login.get("totp"),
+        ]
+        yield row
+
+
+def iter_csv(export: dict[str, Any]) -> Iterator[bytes]:
+    """Serialize an export as `bw export --format csv` would, in pieces."""
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator="\r\n")
+
+    def lines() -> Iterator[str]:
+        for record in csv_records(export):
+            writer.writerow(record)
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+
+    return _batched(lines())
+
+
+def parse_bitwarden_export(data: bytes) -> dict[str, Any] | None:
+    """
+    Return the JSON object of a Bitwarden-mode export, or None for a raw-mode
+    backup. Chunked backups start with src.crypto.MAGIC, but legacy v1 ones
+    start with a random salt, which can begin with "{" too, so only content
+    that parses as a JSON object counts as an export.
+    """
+    if data[: len(MAGIC)] == MAGIC or data.lstrip()[:1] != b"{":
+        return None
+    try:
+        export = json.loads(data)
+    except ValueError:
+        return None
+    return export if isinstance(export, dict) else None
+
+
+def is_bitwarden_export(path: str) -> bool:
+    """Whether the backup at `path` is a Bitwarden-mode export (see above)."""
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC))
+        if head == MAGIC or head.lstrip()[:1] != b"{":
+            return False
+        return parse_bitwarden_export(head + f.read()) is not None
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from src.db import db_connect, put_key
+from src.db import CredentialStore
 import logging
 from sys import stdout
 from threading import Thread
@@ -43,17 +43,22 @@ async def init(
     client_secret: str = Form(...),
     file_password: str = Form(...),
 ):
-    conn, cursor = db_connect(DB_PATH, PRAGMA_KEY_FILE)
-    if not conn or not cursor:
+    store = CredentialStore(DB_PATH, PRAGMA_KEY_FILE)
+    if not store.open():
         return HTMLResponse("Database connection failed", status_code=500)
 
     # Store encrypted passwords and keys
-    put_key(conn, "master_password", master_password.encode())
-    put_key(conn, "client_id", client_id.encode())
-    put_key(conn, "client_secret", client_secret.encode())
-    put_key(conn, "file_password", file_password.encode())
-
-    conn.close()
+    try:
+        store.put_keys(
+            {
+                "master_password": master_password.encode(),
+                "client_id": client_id.encode(),
+                "client_secret": client_secret.encode(),
+                "file_password": file_password.encode(),
+            }
+        )
+    finally:
+        store.close()
 
     return RedirectResponse("/done", status_code=302)
 
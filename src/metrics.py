@@ -0,0 +1,405 @@
+import contextvars
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sys import stdout
+from src import tracing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+PHASE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)")
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    """A metric family in the Prometheus text exposition format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Yield (sample name, label names, label values, value)."""
+        for key, value in sorted(self._values.items()):
+            yield self.name, self.labelnames, key, value
+
+    def restore(self, suffix: str, labels: dict[str, str], value: float) -> None:
+        if suffix == "" and set(labels) == set(self.labelnames):
+            self._values[self._key(labels)] = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = PHASE_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Cumulative bucket counts, then sum and count, per label set
+        self._series: dict[tuple[str, ...], list[float]] = {}
+
+    def _empty(self) -> list[float]:
+        return [0.0] * (len(self.buckets) + 2)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, self._empty())
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def get(self, **labels) -> float:
+        """Return the number of observations."""
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def samples(self):
+        for key, series in sorted(self._series.items()):
+            names = self.labelnames + ("le",)
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", names, key + (_format_value(bound),), count
+            yield f"{self.name}_sum", self.labelnames, key, series[-2]
+            yield f"{self.name}_count", self.labelnames, key, series[-1]
+
+    def restore(self, suffix: str, labels: dict[str, str], value: float) -> None:
+        le = labels.pop("le", None)
+        if set(labels) != set(self.labelnames):
+            return
+        series = self._series.setdefault(self._key(labels), self._empty())
+        if suffix == "_bucket" and le is not None:
+            bound = math.inf if le == "+Inf" else float(le)
+            if bound in self.buckets:
+                series[self.buckets.index(bound)] = value
+        elif suffix == "_sum":
+            series[-2] = value
+        elif suffix == "_count":
+            series[-1] = value
+
+
+class Registry:
+    """The metric families Backvault exposes."""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def reset(self) -> None:
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, value in metric.samples():
+                labels = _format_labels(label_names, label_values)
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def restore(self, text: str) -> None:
+        """
+        Load sample values from an earlier exposition, so counters keep
+        counting across the short-lived processes supercronic starts.
+        """
+        for line in text.splitlines():
+            match = _SAMPLE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+            labels = {k: _unescape(v) for k, v in _LABEL.findall(labels or "")}
+            for suffix in ("", "_bucket", "_sum", "_count"):
+                base = name[: -len(suffix)] if suffix else name
+                if base in self.metrics and name == base + suffix:
+                    self.metrics[base].restore(suffix, labels, value)
+                    break
+
+
+REGISTRY = Registry()
+
+PHASE_SECONDS = REGISTRY.register(
+    Histogram(
+        "backvault_phase_duration_seconds",
+        "Time spent in each phase of a backup.",
+        ("profile", "phase"),
+    )
+)
+FAILURES = REGISTRY.register(
+    Counter(
+        "backvault_failures_total",
+        "Backup failures by the phase that failed.",
+        ("profile", "phase"),
+    )
+)
+BACKUPS = REGISTRY.register(
+    Counter(
+        "backvault_backups_total",
+        "Backups attempted, by result.",
+        ("profile", "result"),
+    )
+)
+BACKUP_SIZE = REGISTRY.register(
+    Gauge(
+        "backvault_backup_size_bytes",
+        "Size of the latest backup file.",
+        ("profile",),
+    )
+)
+ITEMS_EXPORTED = REGISTRY.register(
+    Gauge(
+        "backvault_items_exported",
+        "Items in the latest export, where the exporter can count them.",
+        ("profile",),
+    )
+)
+SUBPROCESSES = REGISTRY.register(
+    Counter(
+        "backvault_subprocesses_total",
+        "Bitwarden CLI processes started, by command.",
+        ("command",),
+    )
+)
+LAST_SUCCESS = REGISTRY.register(
+    Gauge(
+        "backvault_last_success_timestamp_seconds",
+        "Unix time of the latest successful backup.",
+        ("profile",),
+    )
+)
+VERIFICATIONS = REGISTRY.register(
+    Counter(
+        "backvault_verifications_total",
+        "Backups decrypted and checked by src.verify, by result.",
+        ("profile", "result"),
+    )
+)
+UPLOADS = REGISTRY.register(
+    Counter(
+        "backvault_uploads_total",
+        "Backup files uploaded to each BACKUP_SINKS target, by result.",
+        ("profile", "sink", "result"),
+    )
+)
+CREDENTIAL_STORE_SECONDS = REGISTRY.register(
+    Histogram(
+        "backvault_credential_store_seconds",
+        "Time spent opening, reading and writing the credential database.",
+        ("operation",),
+        buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    )
+)
+
+# The vault profile the current thread is backing up
+_profile = contextvars.ContextVar("backvault_profile", default="default")
+
+
+def current_profile() -> str:
+    return _profile.get()
+
+
+def set_profile(name: str) -> None:
+    """Attribute the metrics recorded by this thread to vault profile `name`."""
+    _profile.set(name)
+
+
+# Per-phase durations of the backup running in this context, if collected
+_timings: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "backvault_timings", default=None
+)
+
+
+@contextmanager
+def collect_timings():
+    """Add up the seconds spent in each phase inside the block into a dict."""
+    timings: dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def record_failure(phase: str) -> None:
+    FAILURES.inc(profile=current_profile(), phase=phase)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a backup phase, and trace it as a span. An exception leaving the
+    block is counted as a failure of the innermost phase it passed through.
+    """
+    started = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    except BaseException as e:
+        if not getattr(e, "_backvault_phase", None):
+            record_failure(name)
+            try:
+                e._backvault_phase = name
+            except AttributeError:
+                pass
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_SECONDS.observe(elapsed, profile=current_profile(), phase=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 6)
+
+
+_restored: set[str] = set()
+
+
+def restore_textfile(path: str) -> None:
+    """Continue from the values in `path`, once per process."""
+    if path in _restored:
+        return
+    _restored.add(path)
+    try:
+        with open(path) as f:
+            REGISTRY.restore(f.read())
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not read previous metrics from {path}: {e}")
+
+
+def write_textfile(path: str) -> None:
+    """
+    Write the metrics for node-exporter's textfile collector. The file is
+    replaced atomically, and the temporary name does not end in `.prom`, so
+    the collector never reads a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.partial"
+    with open(partial, "w") as f:
+        f.write(REGISTRY.render())
+    os.replace(partial, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: ThreadingHTTPServer | None = None
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics from a background thread; later calls reuse the server."""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(
+            target=_server.serve_forever,
+            name="backvault-metrics",
+            daemon=True,
+        ).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return _server
@@ -0,0 +1,134 @@
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from sys import stdout
+from typing import Any, Callable
+from src import catalog, metrics, tracing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OrganizationResult:
+    """Outcome of exporting the vault of one organization."""
+
+    id: str
+    name: str
+    success: bool = False
+    backup_file: str | None = None
+    error: str | None = None
+    duration: float = 0.0
+    # Seconds per phase and what src.catalog.note() reported for this export
+    phases: dict[str, float] = field(default_factory=dict)
+    stats: dict[str, Any] = field(default_factory=dict)
+
+
+def organization_dir(backup_dir: str, org_id: str) -> str:
+    """Where the exports of organization `org_id` go, inside a profile's dir."""
+    return os.path.join(backup_dir, f"{catalog.ORG_DIR_PREFIX}{org_id}")
+
+
+def select_organizations(
+    available: list[dict[str, Any]], spec: str | None
+) -> list[dict[str, Any]]:
+    """
+    Pick the organizations to back up from those the account belongs to.
+
+    :param spec: "all", or a comma-separated list of organization ids or
+        names; empty selects none. Unknown entries are logged and ignored.
+    """
+    if not spec or not spec.strip():
+        return []
+    if spec.strip().lower() == "all":
+        return list(available)
+    wanted = [part.strip() for part in spec.split(",") if part.strip()]
+    selected = [
+        org for org in available if org.get("id") in wanted or org.get("name") in wanted
+    ]
+    known = {org.get("id") for org in available} | {
+        org.get("name") for org in available
+    }
+    for name in wanted:
+        if name not in known:
+            logger.warning(f"Not a member of organization '{name}'; skipping it")
+    return selected
+
+
+def backup_organizations(
+    orgs: list[dict[str, Any]],
+    backup_dir: str,
+    export: Callable[[str, str], list[str]],
+    timestamp: str,
+    workers: int = 4,
+) -> list[OrganizationResult]:
+    """
+    Export every organization in `orgs` on a pool of `workers` threads.
+
+    `export(org_id, backup_file)` writes one organization's export, raising
+    on failure, and returns what else went wrong, such as failed uploads. Each
+    export goes to `backup_<timestamp>.enc` in the organization's own dir
+    under `backup_dir`, is timed and traced on its own, and a failing
+    export does not stop the others.
+    """
+    if not orgs:
+        return []
+    workers = max(1, min(workers, len(orgs)))
+    logger.info(f"Exporting {len(orgs)} organizations with {workers} workers")
+
+    def run_one(org: dict[str, Any]) -> OrganizationResult:
+        result = OrganizationResult(id=org["id"], name=org.get("name") or org["id"])
+        started = time.monotonic()
+        org_dir = organization_dir(backup_dir, result.id)
+        backup_file = os.path.join(org_dir, f"backup_{timestamp}.enc")
+        with (
+            tracing.span("organization", organization=result.id) as span,
+            metrics.collect_timings() as phases,
+            catalog.collect() as stats,
+        ):
+            try:
+                os.makedirs(org_dir, exist_ok=True)
+                errors = export(result.id, backup_file)
+                result.backup_file = backup_file
+                if errors:
+                    result.error = "; ".join(errors)
+                else:
+                    result.success = True
+            except Exception as e:
+                result.error = f"Export failed: {e}"
+            span.set(success=result.success)
+        result.phases = dict(phases)
+        result.stats = dict(stats)
+        result.duration = time.monotonic() - started
+        return result
+
+    results = []
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="backvault-organization"
+    ) as pool:
+        # Each export runs in a copy of this context, so it is traced and
+        # counted as part of the profile's backup
+        futures = [
+            pool.submit(contextvars.copy_context().run, run_one, org) for org in orgs
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result.success:
+                logger.info(
+                    f"Organization '{result.name}' exported to "
+                    f"{result.backup_file} in {result.duration:.1f}s"
+                )
+            else:
+                logger.error(
+                    f"Organization '{result.name}' failed after "
+                    f"{result.duration:.1f}s: {result.error}"
+                )
+    return sorted(results, key=lambda result: result.name)
@@ -0,0 +1,76 @@
+import argparse
+import logging
+import os
+import re
+import sys
+from getpass import getpass
+from sys import stdout
+from src.db import db_connect, delete_profile, list_profiles, put_profile
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+PROFILE_NAME_REGEX = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Manage the named vault profiles backed up by run.py.
+
+    Secrets are prompted for interactively so they never appear in the
+    process list or shell history, e.g.:
+
+        docker exec -it backvault python -m src.profiles add alice
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m src.profiles", description="Manage vault profiles"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add or replace a vault profile")
+    add.add_argument("name")
+    add.add_argument("--server", help="Server URL (defaults to BW_SERVER)")
+    commands.add_parser("list", help="List vault profiles")
+    remove = commands.add_parser("remove", help="Remove a vault profile")
+    remove.add_argument("name")
+    args = parser.parse_args(argv)
+
+    DB_PATH = os.getenv("DB_PATH", "/app/db/backvault.db")
+    PRAGMA_KEY_FILE = os.getenv("PRAGMA_KEY_FILE", "/app/db/backvault.db.pragma")
+    conn, cursor = db_connect(DB_PATH, PRAGMA_KEY_FILE)
+    if not conn or not cursor:
+        return 1
+
+    try:
+        if args.command == "add":
+            if not PROFILE_NAME_REGEX.match(args.name) or args.name == "default":
+                logger.error(f"Invalid profile name: '{args.name}'")
+                return 1
+            put_profile(
+                conn,
+                args.name,
+                client_id=getpass("Client ID: "),
+                client_secret=getpass("Client Secret: "),
+                master_password=getpass("Master password: "),
+                file_password=getpass("Backup file password: "),
+                server=args.server,
+            )
+            logger.info(f"Profile '{args.name}' saved.")
+        elif args.command == "list":
+            for profile in list_profiles(conn):
+                print(f"{profile['name']}\t{profile['server'] or '(BW_SERVER)'}")
+        elif args.command == "remove":
+            if not delete_profile(conn, args.name):
+                logger.error(f"No such profile: '{args.name}'")
+                return 1
+            logger.info(f"Profile '{args.name}' removed.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import argparse
+import mmap
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from getpass import getpass
+from typing import BinaryIO, Iterator
+from cryptography.exceptions import InvalidTag
+from src.crypto import MAGIC, BackupFormatError, decrypt_legacy, decrypt_stream
+from src.export_format import is_bitwarden_export
+
+# Mapped pages behind the read position are released every this many bytes
+RELEASE_INTERVAL = 64 * 1024 * 1024
+
+
+class _MappedReader:
+    """
+    Reads a memory-mapped backup front to back, handing the pages it has
+    passed back to the kernel so memory use stays flat for any file size.
+    """
+
+    def __init__(self, mapped: mmap.mmap):
+        self.mapped = mapped
+        self.pos = 0
+        self._released = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.mapped) if size is None or size < 0 else self.pos + size
+        data = self.mapped[self.pos : end]
+        self.pos += len(data)
+        if self.pos - self._released >= RELEASE_INTERVAL:
+            self._release()
+        return data
+
+    def _release(self) -> None:
+        end = self.pos - self.pos % mmap.PAGESIZE
+        if hasattr(self.mapped, "madvise") and end > self._released:
+            self.mapped.madvise(
+                mmap.MADV_DONTNEED, self._released, end - self._released
+            )
+        self._released = end
+
+
+@contextmanager
+def _mapped(path: str) -> Iterator[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise BackupFormatError("Backup file is empty")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        yield mapped
+    finally:
+        mapped.close()
+
+
+def decrypt_file(path: str, dst: BinaryIO, password: str, workers: int = 1) -> int:
+    """
+    Decrypt the raw-mode backup (or attachment) at `path` into `dst`.
+
+    The file is memory-mapped instead of read into memory. Chunked files are
+    decrypted one chunk at a time (see src.crypto), legacy v1 files in
+    blocks after their tag has been checked, so memory use does not depend
+    on the size of the backup.
+
+    :return: number of plaintext bytes written
+    :raises cryptography.exceptions.InvalidTag: wrong password or tampered file
+    """
+    with _mapped(path) as mapped:
+        if mapped[: len(MAGIC)] == MAGIC:
+            return decrypt_stream(_MappedReader(mapped), dst, password, workers)
+        return decrypt_legacy(mapped, dst, password)
+
+
+def _password(args) -> str:
+    if args.password_file:
+        with open(args.password_file) as f:
+            return f.read().rstrip("\n")
+    return os.getenv("BACKUP_FILE_PASSWORD") or getpass("Backup file password: ")
+
+
+class _ImportPipe:
+    """
+    Stdin of `bw import`, which is only started once the first decrypted
+    bytes show the importer the export needs: `bitwardenjson` for JSON and
+    `bitwardencsv` for a personal CSV export. Anything else is refused
+    before it reaches the vault.
+    """
+
+    # Enough of the start of the plaintext to tell the formats apart
+    HEAD = len("collections,")
+
+    def __init__(self):
+        self.process: subprocess.Popen | None = None
+        self.head = b""
+
+    def write(self, data: bytes) -> int:
+        if self.process is not None:
+            self.process.stdin.write(data)
+            return len(data)
+        self.head += data
+        start = self.head.lstrip()
+        if start[:1] == b"{":
+            self._start("bitwardenjson")
+        elif len(start) >= self.HEAD:
+            self._start(self._csv_format(start))
+        return len(data)
+
+    def close(self) -> None:
+        if self.process is None:
+            self._start(self._csv_format(self.head.lstrip()))
+        self.process.stdin.close()
+
+    def _csv_format(self, start: bytes) -> str:
+        if start.startswith(b"folder,"):
+            return "bitwardencsv"
+        if start.startswith(b"collections,"):
+            raise BackupFormatError(
+                "Organization CSV exports have to be imported into the "
+                "organization with `bw import --organizationid`"
+            )
+        raise BackupFormatError("Backup is neither a Bitwarden JSON nor CSV export")
+
+    def _start(self, importer: str) -> None:
+        self.process = subprocess.Popen(
+            ["bw", "import", importer, "/dev/stdin"], stdin=subprocess.PIPE
+        )
+        self.process.stdin.write(self.head)
+
+
+def _bw_import(path: str, password: str, workers: int) -> int:
+    """
+    Decrypt straight into `bw import`, which must be logged in and unlocked.
+    If decryption fails the import is killed before it reads a complete
+    export, so a tampered backup never reaches the vault.
+    """
+    pipe = _ImportPipe()
+    try:
+        total = decrypt_file(path, pipe, password, workers)
+        pipe.close()
+    except BaseException:
+        if pipe.process is not None:
+            pipe.process.kill()
+            pipe.process.wait()
+        raise
+    if pipe.process.wait():
+        raise RuntimeError(f"bw import exited with status {pipe.process.returncode}")
+    return total
+
+
+def _to_file(path: str, output: str, password: str, workers: int) -> int:
+    partial = f"{output}.partial"
+    fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            total = decrypt_file(path, f, password, workers)
+    except BaseException:
+        os.remove(partial)
+        raise
+    os.replace(partial, output)
+    return total
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Decrypt a raw-mode Backvault backup with constant memory use."
+    )
+    parser.add_argument("backup", help="Backup or attachment file to decrypt")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="Write the export to this file instead of stdout",
+    )
+    target.add_argument(
+        "--import",
+        dest="bw_import",
+        action="store_true",
+        help="Pipe the export into `bw import` as bitwardenjson or bitwardencsv (log in and unlock first)",
+    )
+    parser.add_argument(
+        "--password-file",
+        help="Read the file password from here (default: BACKUP_FILE_PASSWORD or a prompt)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Threads decrypting chunks in parallel",
+    )
+    args = parser.parse_args(argv)
+
+    if is_bitwarden_export(args.backup):
+        print(
+            f"{args.backup} is a bitwarden mode export. Restore it with "
+            f"`bw import bitwardenjson {args.backup}`.",
+            file=sys.stderr,
+        )
+        return 1
+
+    password = _password(args)
+    started = time.monotonic()
+    try:
+        if args.bw_import:
+            total = _bw_import(args.backup, password, args.workers)
+        elif args.output == "-":
+            total = decrypt_file(args.backup, sys.stdout.buffer, password, args.workers)
+            sys.stdout.buffer.flush()
+        else:
+            total = _to_file(args.backup, args.output, password, args.workers)
+    except InvalidTag:
+        print("Decryption failed: wrong password or corrupted file.", file=sys.stderr)
+        return 1
+    except (BackupFormatError, OSError, RuntimeError) as e:
+        print(f"Restore failed: {e}", file=sys.stderr)
+        return 1
+    elapsed = time.monotonic() - started
+    size = os.path.getsize(args.backup)
+    print(
+        f"Decrypted {total / 2**20:.1f} MiB from {size / 2**20:.1f} MiB in "
+        f"{elapsed:.2f}s ({size / 2**20 / max(elapsed, 1e-9):.1f} MiB/s)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from sys import stdout
+from src.attachments import BLOBS_DIR
+from src.catalog import BackupEntry, catalog_dirs, load_index, record_removed
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# GFS buckets, from the finest to the coarsest, and how backups are grouped
+BUCKETS = (
+    ("hourly", "%Y-%m-%d %H:00"),
+    ("daily", "%Y-%m-%d"),
+    ("weekly", "%G-W%V"),
+    ("monthly", "%Y-%m"),
+    ("yearly", "%Y"),
+)
+DELETE_BATCH = 100
+DELETE_WORKERS = 8
+
+
+def parse_retain_days(value: str | None) -> int | None:
+    """
+    Parse RETAIN_DAYS the way cleanup.sh does: a positive integer, or None
+    ("keep forever") for 0, empty or non-integer values.
+    """
+    value = (value or "7").strip()
+    if not value.isdigit() or int(value) == 0:
+        return None
+    return int(value)
+
+
+def _backup_files(backup_dir: str, max_depth: int = 4):
+    """
+    Yield *.enc files in backup_dir, its per-profile subdirectories, their
+    attachment blob stores and their organization and format dirs
+    (`find -maxdepth 4`).
+    """
+    with os.scandir(backup_dir) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and entry.name.endswith(".enc"):
+                yield entry
+            elif entry.is_dir(follow_symlinks=False) and max_depth > 1:
+                yield from _backup_files(entry.path, max_depth - 1)
+
+
+def prune_older_than(
+    backup_dir: str, retain_days: int, now: float | None = None
+) -> list[str]:
+    """
+    Delete backups older than `retain_days`, like cleanup.sh's
+    `find -mtime +RETAIN_DAYS`. Returns the deleted paths.
+    """
+    now = time.time() if now is None else now
+    if not os.path.isdir(backup_dir):
+        return []
+    logger.info(
+        f"Starting cleanup of backups older than {retain_days} days in {backup_dir}..."
+    )
+    deleted = []
+    for entry in _backup_files(backup_dir):
+        age_days = int((now - entry.stat(follow_symlinks=False).st_mtime) // DAY)
+        if age_days > retain_days:
+            os.remove(entry.path)
+            logger.info(f"Deleted {entry.path}")
+            deleted.append(entry.path)
+    by_dir: dict[str, list[str]] = {}
+    for path in deleted:
+        by_dir.setdefault(os.path.dirname(path), []).append(path)
+    for directory, paths in by_dir.items():
+        record_removed(directory, paths)
+    logger.info("Cleanup finished.")
+    return deleted
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    How many backups to keep: the `last` newest ones, plus the newest backup
+    of each of the latest `hourly` hours, `daily` days, `weekly` ISO weeks,
+    `monthly` months and `yearly` years that have backups. With
+    `within_days`, every backup younger than that is kept as well.
+    """
+
+    last: int = 0
+    hourly: int = 0
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+    yearly: int = 0
+    within_days: int | None = None
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, f.name) for f in fields(self))
+
+
+@dataclass
+class Decision:
+    """Whether one backup is kept, and which rules keep it."""
+
+    entry: BackupEntry
+    reasons: list[str] = field(default_factory=list)
+
+    @property
+    def keep(self) -> bool:
+        return bool(self.reasons)
+
+
+def policy_from_env() -> RetentionPolicy | None:
+    """
+    Read RETAIN_LAST, RETAIN_HOURLY, RETAIN_DAILY, RETAIN_WEEKLY,
+    RETAIN_MONTHLY and RETAIN_YEARLY. Returns None when none of them is set,
+    so RETAIN_DAYS alone keeps its age-based cleanup. With a GFS policy an
+    explicitly set RETAIN_DAYS keeps every backup younger than that too.
+    """
+    counts = {}
+    for name in ("last", "hourly", "daily", "weekly", "monthly", "yearly"):
+        value = os.getenv(f"RETAIN_{name.upper()}", "").strip()
+        if value:
+            if not value.isdigit():
+                raise ValueError(f"RETAIN_{name.upper()} must be an integer: {value}")
+            counts[name] = int(value)
+    if not any(counts.values()):
+        return None
+    within_days = None
+    if os.getenv("RETAIN_DAYS"):
+        within_days = parse_retain_days(os.getenv("RETAIN_DAYS"))
+    return RetentionPolicy(**counts, within_days=within_days)
+
+
+def plan(
+    entries: list[BackupEntry], policy: RetentionPolicy, now: float | None = None
+) -> list[Decision]:
+    """
+    Decide which backups `policy` keeps. Returns a decision per backup,
+    newest first. The newest backup is always kept.
+    """
+    now = time.time() if now is None else now
+    decisions = [
+        Decision(entry)
+        for entry in sorted(entries, key=lambda e: (e.created, e.file), reverse=True)
+    ]
+    if not decisions:
+        return decisions
+    decisions[0].reasons.append("latest")
+    for decision in decisions[: policy.last]:
+        decision.reasons.append("last")
+    for name, pattern in BUCKETS:
+        count = getattr(policy, name)
+        seen: set[str] = set()
+        for decision in decisions:
+            if len(seen) >= count:
+                break
+            bucket = datetime.fromtimestamp(decision.entry.created).strftime(pattern)
+            if bucket not in seen:
+                seen.add(bucket)
+                decision.reasons.append(f"{name} {bucket}")
+    if policy.within_days is not None:
+        for decision in decisions:
+            if now - decision.entry.created <= policy.within_days * DAY:
+                decision.reasons.append(f"within {policy.within_days}d")
+    return decisions
+
+
+def format_plan(backup_dir: str, decisions: list[Decision]) -> str:
+    """Render a plan as one line per backup, for --dry-run."""
+    lines = [f"{backup_dir}:"]
+    for decision in decisions:
+        action = "keep  " if decision.keep else "delete"
+        reasons = ", ".join(
+            reason for reason in decision.reasons if reason != "latest"
+        ) or ("latest" if decision.keep else "")
+        lines.append(f"  {action} {decision.entry.file}  {reasons}".rstrip())
+    kept = sum(1 for decision in decisions if decision.keep)
+    lines.append(f"  {kept} kept, {len(decisions) - kept} deleted")
+    return "\n".join(lines)
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _prune_blobs(
+    backup_dir: str, kept: list[BackupEntry], now: float, dry_run: bool
+) -> list[str]:
+    """
+    Delete attachment blobs no kept backup references. Blobs written in the
+    last day are left alone, as a running backup may not have indexed them.
+    """
+    blobs_dir = os.path.join(backup_dir, BLOBS_DIR)
+    if not os.path.isdir(blobs_dir):
+        return []
+    if any(entry.attachments and entry.blobs is None for entry in kept):
+        logger.info(
+            f"Keeping all attachment blobs in {blobs_dir}: some backups were "
+            "made before their blobs were indexed"
+        )
+        return []
+    referenced = {blob for entry in kept for blob in entry.blobs or ()}
+    unused = []
+    with os.scandir(blobs_dir) as it:
+        for blob in it:
+            if not blob.name.endswith(".enc") or blob.name[:-4] in referenced:
+                continue
+            if now - blob.stat(follow_symlinks=False).st_mtime > DAY:
+                unused.append(blob.path)
+    if not dry_run:
+        with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+            list(pool.map(_remove, unused))
+    return unused
+
+
+def apply_policy(
+    backup_dir: str,
+    policy: RetentionPolicy,
+    dry_run: bool = False,
+    now: float | None = None,
+) -> list[Decision]:
+    """
+    Apply a GFS policy to one backup dir, using its index (see src.catalog)
+    instead of listing and stat'ing every backup. Backups are deleted in
+    batches of DELETE_BATCH, several at a time, and each batch is dropped
+    from the index with a single write. With `dry_run` nothing is deleted.
+    """
+    now = time.time() if now is None else now
+    decisions = plan(load_index(backup_dir), policy, now)
+    doomed = [decision.entry for decision in decisions if not decision.keep]
+    if dry_run:
+        print(format_plan(backup_dir, decisions))
+    else:
+        with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+            for start in range(0, len(doomed), DELETE_BATCH):
+                batch = doomed[start : start + DELETE_BATCH]
+                paths = [os.path.join(backup_dir, entry.file) for entry in batch]
+                paths += [
+                    os.path.join(backup_dir, entry.attachments)
+                    for entry in batch
+                    if entry.attachments
+                ]
+                list(pool.map(_remove, paths))
+                record_removed(backup_dir, [entry.file for entry in batch])
+        logger.info(
+            f"Deleted {len(doomed)} of {len(decisions)} backups in {backup_dir}"
+        )
+    kept = [decision.entry for decision in decisions if decision.keep]
+    blobs = _prune_blobs(backup_dir, kept, now, dry_run)
+    if blobs:
+        verb = "Would delete" if dry_run else "Deleted"
+        logger.info(f"{verb} {len(blobs)} unused attachment blobs in {backup_dir}")
+    return decisions
+
+
+def prune_gfs(
+    backup_dir: str,
+    policy: RetentionPolicy,
+    dry_run: bool = False,
+    now: float | None = None,
+) -> list[str]:
+    """
+    Apply `policy` to every vault profile's backups separately. Returns the
+    deleted (or, with `dry_run`, the doomed) backup paths.
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+    logger.info(f"Starting GFS cleanup of {backup_dir}...")
+    deleted = []
+    for directory in catalog_dirs(backup_dir):
+        for decision in apply_policy(directory, policy, dry_run, now):
+            if not decision.keep:
+                deleted.append(os.path.join(directory, decision.entry.file))
+    logger.info("Cleanup finished.")
+    return deleted
+
+
+def cleanup_from_env(dry_run: bool = False) -> list[str]:
+    """
+    Run the cleanup configured by BACKUP_DIR and either the RETAIN_LAST ...
+    RETAIN_YEARLY policy or RETAIN_DAYS.
+    """
+    backup_dir = os.getenv("BACKUP_DIR", "/app/backups")
+    policy = policy_from_env()
+    if policy is not None:
+        return prune_gfs(backup_dir, policy, dry_run)
+    retain_days = parse_retain_days(os.getenv("RETAIN_DAYS"))
+    if retain_days is None:
+        logger.info(
+            f"RETAIN_DAYS is set to '{os.getenv('RETAIN_DAYS')}'. Skipping cleanup."
+        )
+        return []
+    if dry_run:
+        logger.info("--dry-run only applies to RETAIN_LAST ... RETAIN_YEARLY.")
+        return []
+    return prune_older_than(backup_dir, retain_days)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete old Backvault backups.")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print which backups the retention policy keeps and deletes.",
+    )
+    cleanup_from_env(dry_run=parser.parse_args().dry_run)
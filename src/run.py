@@ -1,9 +1,29 @@
+import argparse
+import contextvars
 import os
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from src import catalog, metrics, sinks, tracing
+from src.attachments import AttachmentReport, backup_attachments, manifest_path
 from src.bw_client import BitwardenClient
+from src.organizations import (
+    OrganizationResult,
+    backup_organizations,
+    select_organizations,
+)
+from src.vault_api import VaultApiClient
 from datetime import datetime
 from sys import stdout
-from src.db import db_connect, get_key
+from src.db import (
+    CREDENTIAL_KEYS,
+    CredentialStore,
+    get_kdf_salt,
+    get_sessions,
+    list_profiles,
+    put_sessions,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,6 +32,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_PROFILE = "default"
+# What BACKUP_ENCRYPTION_MODE can list
+EXPORT_MODES = ("bitwarden", "raw", "csv")
+
 
 def require_env(name: str) -> str:
     val = os.getenv(name)
@@ -20,75 +44,788 @@ def require_env(name: str) -> str:
     return val
 
 
-def main():
-    # Database setup
-    DB_PATH = os.getenv("DB_PATH", "/app/db/backvault.db")
-    PRAGMA_KEY_FILE = os.getenv("PRAGMA_KEY_FILE", "/app/db/backvault.db.pragma")
-    db_conn, db_cursor = db_connect(DB_PATH, PRAGMA_KEY_FILE)
-    if not db_conn or not db_cursor:
+@dataclass
+class VaultProfile:
+    """Credentials and destination of one vault to back up."""
+
+    name: str
+    client_id: str
+    client_secret: str
+    master_password: str
+    file_password: str
+    server: str | None = None
+
+
+@dataclass
+class FormatResult:
+    """Outcome of writing one of the additional export formats."""
+
+    mode: str
+    backup_file: str
+    success: bool = False
+    error: str | None = None
+    duration: float = 0.0
+
+
+@dataclass
+class BackupResult:
+    """Outcome of backing up one vault."""
+
+    profile: str
+    success: bool
+    backup_file: str | None = None
+    error: str | None = None
+    duration: float = 0.0
+    attachments: AttachmentReport | None = None
+    organizations: list[OrganizationResult] = field(default_factory=list)
+    formats: list[FormatResult] = field(default_factory=list)
+
+
+class RunState:
+    """
+    State kept warm between runs by the resident scheduler: the credential
+    store, the stored kdf salt and the vault clients, whose construction
+    (`bw config server`, appdata setup) only has to happen once per profile.
+    """
+
+    def __init__(self):
+        self.store: CredentialStore | None = None
+        self.kdf_salt: bytes | None = None
+        self.clients: dict[tuple, object] = {}
+
+    def connect(self) -> bool:
+        if self.store is None:
+            self.store = CredentialStore(
+                os.getenv("DB_PATH", "/app/db/backvault.db"),
+                os.getenv("PRAGMA_KEY_FILE", "/app/db/backvault.db.pragma"),
+            )
+        return self.store.open()
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        self.clients.clear()
+
+
+def load_profiles(store: CredentialStore) -> list[VaultProfile]:
+    """
+    Return the vaults to back up: the credentials stored by the setup UI
+    (as the "default" profile) followed by every named profile.
+    """
+    profiles = []
+    credentials = store.get_keys(CREDENTIAL_KEYS)
+    # The keys table is empty when only named profiles are configured
+    if len(credentials) == len(CREDENTIAL_KEYS):
+        profiles.append(VaultProfile(name=DEFAULT_PROFILE, **credentials))
+    for row in list_profiles(store.conn):
+        if row["name"] == DEFAULT_PROFILE:
+            logger.warning(f"Skipping profile named '{DEFAULT_PROFILE}' (reserved)")
+            continue
+        profiles.append(VaultProfile(**row))
+    return profiles
+
+
+def _load_sessions(
+    store: CredentialStore, profiles: list[VaultProfile]
+) -> dict[str, dict]:
+    try:
+        stored = get_sessions(store.conn, [profile.name for profile in profiles])
+    except Exception as e:
+        logger.warning(f"Could not read the stored sessions: {e}")
+        return {}
+    return {
+        name: session
+        for name, session in stored.items()
+        if isinstance(session, dict) and session.get("session")
+    }
+
+
+def _make_client(profile: VaultProfile, settings: dict, appdata_dir: str | None):
+    server = profile.server or settings["server"]
+    engine = settings["engine"]
+    if engine == "native":
+        return VaultApiClient(
+            server=server,
+            client_id=profile.client_id,
+            client_secret=profile.client_secret,
+            encrypt_workers=settings["encryption_workers"],
+            kdf_salt=settings["kdf_salt"],
+        )
+    if engine == "cli":
+        client_kwargs = {}
+        if appdata_dir:
+            client_kwargs["appdata_dir"] = appdata_dir
+        return BitwardenClient(
+            bw_cmd="bw",
+            server=server,
+            client_id=profile.client_id,
+            client_secret=profile.client_secret,
+            use_api_key=True,
+            encrypt_workers=settings["encryption_workers"],
+            transport=settings["transport"],
+            kdf_salt=settings["kdf_salt"],
+            **client_kwargs,
+        )
+    return None
+
+
+def backup_vault(
+    profile: VaultProfile, settings: dict, state: RunState | None = None
+) -> BackupResult:
+    """
+    Log in to one vault, export it and log out again.
+
+    Each profile gets its own client, and profiles other than "default" get
+    a private CLI appdata dir so concurrent backups never share CLI state or
+    BW_SESSION. With a RunState the client is reused by later runs as long
+    as the profile and settings are unchanged. Failures are reported in the
+    result instead of raised. Every phase is recorded in src.metrics, and
+    with a trace file each backup is traced as one trace (see src.tracing).
+    Successful backups are added to the catalog (see src.catalog). The
+    selected organizations are exported after the vault itself, in parallel
+    and within the same session (see src.organizations).
+    """
+    metrics.set_profile(profile.name)
+    with (
+        tracing.trace(
+            settings["trace_file"],
+            profile=profile.name,
+            engine=settings["engine"],
+            transport=settings["transport"],
+            mode=settings["encryption_mode"],
+        ) as root,
+        metrics.collect_timings() as phases,
+        catalog.collect() as stats,
+    ):
+        result = _backup_vault(profile, settings, state)
+        root.set(success=result.success)
+        if result.error:
+            root.set(error=result.error)
+    metrics.BACKUPS.inc(
+        profile=profile.name, result="success" if result.success else "failure"
+    )
+    if stats.get("items") is not None:
+        metrics.ITEMS_EXPORTED.set(stats["items"], profile=profile.name)
+    if result.success:
+        metrics.LAST_SUCCESS.set(time.time(), profile=profile.name)
+        _record_backup(result, settings, phases, stats)
+    _record_organizations(result, settings)
+    return result
+
+
+def _record_backup(
+    result: BackupResult, settings: dict, phases: dict, stats: dict
+) -> None:
+    """Add a successful backup to the catalog; failing to do so is not fatal."""
+    if not os.path.exists(result.backup_file):
         return
+    report = result.attachments
+    try:
+        catalog.record_backup(
+            result.backup_file,
+            attachments=manifest_path(result.backup_file) if report else None,
+            blobs=report.blobs if report else None,
+            profile=result.profile,
+            mode=settings["encryption_modes"][0],
+            phases=phases,
+            **stats,
+        )
+    except OSError as e:
+        logger.warning(
+            f"[{result.profile}] Could not add {result.backup_file} to the catalog: {e}"
+        )
 
-    # Vault access information
-    client_id = get_key(db_conn, "client_id")
-    client_secret = get_key(db_conn, "client_secret")
-    master_pw = get_key(db_conn, "master_password")
-    file_pw = get_key(db_conn, "file_password")
 
-    server = require_env("BW_SERVER")
+def _record_organizations(result: BackupResult, settings: dict) -> None:
+    """Add the organization exports that succeeded to their dirs' catalogs."""
+    for org in result.organizations:
+        if not org.success or not os.path.exists(org.backup_file):
+            continue
+        try:
+            catalog.record_backup(
+                org.backup_file,
+                profile=result.profile,
+                mode=settings["encryption_modes"][0],
+                phases=org.phases,
+                **org.stats,
+            )
+        except OSError as e:
+            logger.warning(
+                f"[{result.profile}] Could not add {org.backup_file} to the catalog: {e}"
+            )
 
-    # Configuration
-    backup_dir = os.getenv("BACKUP_DIR", "/app/backups")
-    log_file = os.getenv("LOG_FILE")  # Optional log file
-    encryption_mode = os.getenv("BACKUP_ENCRYPTION_MODE", "bitwarden").lower()
 
-    if log_file:
-        logger.addHandler(logging.FileHandler(log_file))
+def parse_modes(spec: str) -> list[str]:
+    """Split BACKUP_ENCRYPTION_MODE into its export formats, in order."""
+    modes = []
+    for mode in spec.lower().split(","):
+        mode = mode.strip()
+        if mode and mode not in modes:
+            modes.append(mode)
+    return modes
+
+
+def format_file(backup_file: str, mode: str) -> str:
+    """Where an additional export format of `backup_file` goes."""
+    directory, name = os.path.split(backup_file)
+    return os.path.join(directory, f"{catalog.FORMAT_DIR_PREFIX}{mode}", name)
+
+
+def _export_mode(
+    source,
+    profile: VaultProfile,
+    settings: dict,
+    mode: str,
+    backup_file: str,
+    organization_id: str | None = None,
+) -> list[str]:
+    """
+    Export the vault, or one organization's vault, to `backup_file` in one
+    format while streaming it to the remote sinks.
+
+    :return: the sinks the upload to failed
+    """
+    # Only passed when set, so clients without organization support still work
+    org_kwargs = {"organization_id": organization_id} if organization_id else {}
+    # Remote copies mirror the layout of BACKUP_DIR
+    remote_key = os.path.relpath(backup_file, settings["backup_dir"])
+    with sinks.streaming(settings["sinks"], remote_key) as upload:
+        with metrics.phase("export"):
+            if mode == "bitwarden":
+                source.export_bitwarden_encrypted(
+                    backup_file, profile.file_password, **org_kwargs
+                )
+            else:
+                export = (
+                    source.export_raw_encrypted
+                    if mode == "raw"
+                    else source.export_csv_encrypted
+                )
+                export(
+                    backup_file,
+                    profile.file_password,
+                    dedup=settings["dedup"],
+                    compression=settings["compression"],
+                    **org_kwargs,
+                )
+        if upload is not None:
+            with metrics.phase("upload"):
+                return upload.finish(backup_file)
+    return []
+
+
+def _export_format(
+    source,
+    profile: VaultProfile,
+    settings: dict,
+    mode: str,
+    backup_file: str,
+    organization_id: str | None,
+) -> FormatResult:
+    """
+    Write one additional format into its own dir and add it to that dir's
+    catalog. Failures are reported in the result instead of raised.
+    """
+    result = FormatResult(mode=mode, backup_file=backup_file)
+    started = time.monotonic()
+    with (
+        tracing.span("format", mode=mode) as span,
+        metrics.collect_timings() as phases,
+        catalog.collect() as stats,
+    ):
+        try:
+            os.makedirs(os.path.dirname(backup_file), exist_ok=True)
+            failed_uploads = _export_mode(
+                source, profile, settings, mode, backup_file, organization_id
+            )
+            if failed_uploads:
+                metrics.record_failure("upload")
+                result.error = f"Upload to {', '.join(failed_uploads)} failed"
+            else:
+                result.success = True
+        except Exception as e:
+            result.error = f"Export failed: {e}"
+        span.set(success=result.success)
+    result.duration = time.monotonic() - started
+    if result.success and os.path.exists(backup_file):
+        try:
+            catalog.record_backup(
+                backup_file, profile=profile.name, mode=mode, phases=phases, **stats
+            )
+        except OSError as e:
+            logger.warning(
+                f"[{profile.name}] Could not add {backup_file} to the catalog: {e}"
+            )
+    return result
+
+
+def _export(
+    source,
+    profile: VaultProfile,
+    settings: dict,
+    backup_file: str,
+    organization_id: str | None = None,
+) -> tuple[list[str], list[FormatResult]]:
+    """
+    Export the vault, or one organization's vault, in every format of
+    BACKUP_ENCRYPTION_MODE. The first one goes to `backup_file`, the others
+    into a dir of their own next to it (see format_file()) while the first
+    is written. They share one decryption of the vault where the client
+    allows it.
+
+    :return: the sinks the upload of `backup_file` failed to, and the
+        outcome of each additional format
+    """
+    first, *others = settings["encryption_modes"]
+    if not others:
+        return _export_mode(
+            source, profile, settings, first, backup_file, organization_id
+        ), []
+    with (
+        source.shared_export(),
+        ThreadPoolExecutor(
+            max_workers=len(others), thread_name_prefix="backvault-format"
+        ) as pool,
+    ):
+        # Each format runs in a copy of this context, so it is traced and
+        # counted as part of the backup
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run,
+                _export_format,
+                source,
+                profile,
+                settings,
+                mode,
+                format_file(backup_file, mode),
+                organization_id,
+            )
+            for mode in others
+        ]
+        try:
+            failed_uploads = _export_mode(
+                source, profile, settings, first, backup_file, organization_id
+            )
+        finally:
+            formats = [future.result() for future in futures]
+    for result in formats:
+        if result.success:
+            logger.info(
+                f"[{profile.name}] {result.mode} export written to "
+                f"{result.backup_file} in {result.duration:.1f}s"
+            )
+        else:
+            logger.error(
+                f"[{profile.name}] {result.mode} export failed: {result.error}"
+            )
+    return failed_uploads, formats
+
 
+def _format_errors(formats: list[FormatResult]) -> list[str]:
+    return [
+        f"{result.mode}: {result.error}" for result in formats if not result.success
+    ]
+
+
+def _export_organization(
+    source, profile: VaultProfile, settings: dict, org_id: str, backup_file: str
+) -> list[str]:
+    failed_uploads, formats = _export(source, profile, settings, backup_file, org_id)
+    errors = _format_errors(formats)
+    if failed_uploads:
+        errors.insert(0, f"Upload to {', '.join(failed_uploads)} failed")
+    return errors
+
+
+def _backup_organizations(
+    profile: VaultProfile, source, settings: dict, backup_dir: str, timestamp: str
+) -> list[OrganizationResult]:
+    with metrics.phase("organizations"):
+        orgs = select_organizations(
+            source.list_organizations(), settings["organizations"]
+        )
+        return backup_organizations(
+            orgs,
+            backup_dir,
+            lambda org_id, backup_file: _export_organization(
+                source, profile, settings, org_id, backup_file
+            ),
+            timestamp,
+            workers=settings["organization_workers"],
+        )
+
+
+def _resume_session(profile: VaultProfile, source, settings: dict, server: str) -> str:
+    """
+    Pick up the CLI session an earlier run left open for `profile`, checking
+    it with `bw status`. Sessions older than the maximum age, or created for
+    other credentials, are logged out instead.
+
+    :return: the status to continue from: "unlocked", "locked" or "unauthenticated"
+    """
+    stored = settings["sessions"].get(profile.name)
+    if stored is None:
+        return "unauthenticated"
+    age = time.time() - stored.get("logged_in", 0)
+    if (
+        stored.get("client_id") != profile.client_id
+        or stored.get("server") != server
+        or age > settings["session_max_age"]
+    ):
+        logger.info(f"[{profile.name}] Stored session has expired, logging in again")
+        try:
+            source.logout()
+        except Exception:
+            pass
+        return "unauthenticated"
+    source.session = stored["session"]
+    try:
+        status = source.status().get("status", "unauthenticated")
+    except Exception as e:
+        logger.warning(f"[{profile.name}] Could not check the stored session: {e}")
+        status = "unauthenticated"
+    if status == "unauthenticated":
+        source.session = None
+    logger.info(f"[{profile.name}] Stored session is {status}")
+    return status
+
+
+def _backup_vault(
+    profile: VaultProfile, settings: dict, state: RunState | None
+) -> BackupResult:
+    started = time.monotonic()
+    result = BackupResult(profile=profile.name, success=False)
+    server = profile.server or settings["server"]
+    encryption_mode = settings["encryption_mode"]
+    engine = settings["engine"]
+    if profile.name == DEFAULT_PROFILE:
+        backup_dir = settings["backup_dir"]
+        appdata_dir = None
+    else:
+        backup_dir = os.path.join(settings["backup_dir"], profile.name)
+        appdata_dir = os.path.join(settings["state_dir"], profile.name, "bw")
     os.makedirs(backup_dir, exist_ok=True)
 
     # Create client
-    logger.info("Connecting to vault...")
-    source = BitwardenClient(
-        bw_cmd="bw",
-        server=server,
-        client_id=client_id,
-        client_secret=client_secret,
-        use_api_key=True,
+    logger.info(f"[{profile.name}] Connecting to vault...")
+    client_key = (
+        profile.name,
+        server,
+        profile.client_id,
+        profile.client_secret,
+        engine,
+        settings["transport"],
+        settings["encryption_workers"],
     )
-    try:
+    source = state.clients.get(client_key) if state else None
+    if source is None:
         try:
-            source.login()
+            with metrics.phase("config"):
+                source = _make_client(profile, settings, appdata_dir)
         except Exception as e:
-            logger.error(f"Login failed: {e}")
-            return
+            result.error = f"Client setup failed: {e}"
+            logger.error(f"[{profile.name}] {result.error}")
+            return result
+        if source is None:
+            metrics.record_failure("config")
+            result.error = (
+                f"Invalid BACKUP_ENGINE: '{engine}'. Must be 'cli' or 'native'."
+            )
+            logger.error(result.error)
+            return result
+        if state:
+            state.clients[client_key] = source
 
+    # Sessions are only kept by the CLI, whose state outlives this process
+    reuse_session = settings["session_reuse"] and engine == "cli"
+    unlocked = False
+    logged_in = time.time()
+    try:
         try:
-            source.unlock(master_pw)
+            with metrics.phase("login"):
+                status = "unauthenticated"
+                if reuse_session:
+                    status = _resume_session(profile, source, settings, server)
+                if status == "unauthenticated":
+                    source.login()
+                else:
+                    logged_in = settings["sessions"][profile.name]["logged_in"]
         except Exception as e:
-            logger.error(f"Unlock failed: {e}")
-            return
+            result.error = f"Login failed: {e}"
+            logger.error(f"[{profile.name}] {result.error}")
+            return result
+
+        if status != "unlocked":
+            try:
+                with metrics.phase("unlock"):
+                    source.unlock(profile.master_password)
+            except Exception as e:
+                result.error = f"Unlock failed: {e}"
+                logger.error(f"[{profile.name}] {result.error}")
+                return result
+        unlocked = True
 
         # Generate timestamped filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_file = os.path.join(backup_dir, f"backup_{timestamp}.enc")
 
-        logger.info(f"Starting export with mode: '{encryption_mode}'")
+        logger.info(f"[{profile.name}] Starting export with mode: '{encryption_mode}'")
 
-        if encryption_mode == "raw":
-            source.export_raw_encrypted(backup_file, file_pw)
-        elif encryption_mode == "bitwarden":
-            source.export_bitwarden_encrypted(backup_file, file_pw)
-        else:
-            logger.error(
-                f"Invalid BACKUP_ENCRYPTION_MODE: '{encryption_mode}'. Must be 'bitwarden' or 'raw'."
+        modes = settings["encryption_modes"]
+        if not modes or any(mode not in EXPORT_MODES for mode in modes):
+            metrics.record_failure("config")
+            result.error = (
+                f"Invalid BACKUP_ENCRYPTION_MODE: '{encryption_mode}'. "
+                "Must be 'bitwarden', 'raw', 'csv' or a comma-separated list of them."
+            )
+            logger.error(result.error)
+            return result
+        try:
+            failed_uploads, result.formats = _export(
+                source, profile, settings, backup_file
             )
-            return
+        except Exception as e:
+            result.error = f"Export failed: {e}"
+            logger.error(f"[{profile.name}] {result.error}")
+            return result
+
+        result.backup_file = backup_file
+        if os.path.exists(backup_file):
+            metrics.BACKUP_SIZE.set(os.path.getsize(backup_file), profile=profile.name)
+        logger.info(f"[{profile.name}] Export completed successfully to {backup_file}.")
+
+        if settings["attachments"]:
+            try:
+                with metrics.phase("attachments"):
+                    report = backup_attachments(
+                        source,
+                        backup_file,
+                        profile.file_password,
+                        kdf_salt=settings["kdf_salt"],
+                        workers=settings["attachment_workers"],
+                    )
+            except Exception as e:
+                result.error = f"Attachment backup failed: {e}"
+                logger.error(f"[{profile.name}] {result.error}")
+                return result
+            result.attachments = report
+            if report.failed:
+                metrics.record_failure("attachments")
+                result.error = f"{report.failed} attachments could not be backed up"
+                logger.error(f"[{profile.name}] {result.error}")
+                return result
+
+        if settings["organizations"]:
+            try:
+                result.organizations = _backup_organizations(
+                    profile, source, settings, backup_dir, timestamp
+                )
+            except Exception as e:
+                result.error = f"Organization export failed: {e}"
+                logger.error(f"[{profile.name}] {result.error}")
+                return result
+            failed_orgs = [org for org in result.organizations if not org.success]
+            if failed_orgs:
+                metrics.record_failure("organizations")
+                result.error = (
+                    f"{len(failed_orgs)} of {len(result.organizations)} "
+                    "organization exports failed"
+                )
+                logger.error(f"[{profile.name}] {result.error}")
+                return result
+
+        format_errors = _format_errors(result.formats)
+        if format_errors:
+            result.error = "; ".join(format_errors)
+            logger.error(f"[{profile.name}] {result.error}")
+            return result
 
-        logger.info(f"Export completed successfully to {backup_file}.")
+        if failed_uploads:
+            metrics.record_failure("upload")
+            result.error = f"Upload to {', '.join(failed_uploads)} failed"
+            logger.error(f"[{profile.name}] {result.error}")
+            return result
+
+        result.success = True
     finally:
-        source.logout()
-        logger.info("Successfully logged out.")
+        if reuse_session and unlocked and source.session:
+            settings["sessions"][profile.name] = {
+                "session": source.session,
+                "logged_in": logged_in,
+                "client_id": profile.client_id,
+                "server": server,
+            }
+            logger.info(f"[{profile.name}] Keeping the session for the next run.")
+        else:
+            if reuse_session:
+                settings["sessions"].pop(profile.name, None)
+            try:
+                with metrics.phase("logout"):
+                    source.logout()
+                logger.info(f"[{profile.name}] Successfully logged out.")
+            except Exception as e:
+                logger.error(f"[{profile.name}] Logout failed: {e}")
+        result.duration = time.monotonic() - started
+    return result
+
+
+def _save_sessions(store: CredentialStore, before: dict, after: dict) -> None:
+    """Store the CLI sessions that changed during the run in the database."""
+    changed = {name: None for name in before.keys() - after.keys()}
+    changed.update(
+        (name, session)
+        for name, session in after.items()
+        if before.get(name) != session
+    )
+    if not changed:
+        return
+    try:
+        put_sessions(store.conn, changed)
+    except Exception as e:
+        logger.error(f"Could not store CLI sessions: {e}")
+
+
+def main(state: RunState | None = None) -> list[BackupResult] | None:
+    """
+    Back up every configured vault once. Without a RunState the credential
+    store and clients are thrown away afterwards.
+    """
+    if state is None:
+        state = RunState()
+        try:
+            return main(state)
+        finally:
+            state.close()
+
+    session_reuse = os.getenv("BW_SESSION_REUSE", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    sessions = {}
+    if not state.connect():
+        return
+    # Vault access information
+    profiles = load_profiles(state.store)
+    if state.kdf_salt is None:
+        state.kdf_salt = get_kdf_salt(state.store.conn)
+    kdf_salt = state.kdf_salt
+    if session_reuse:
+        sessions = _load_sessions(state.store, profiles)
+    if not profiles:
+        logger.error("No vault credentials configured.")
+        return
+
+    server = require_env("BW_SERVER")
+    try:
+        upload_sinks = sinks.sinks_from_env()
+    except (sinks.SinkError, ValueError) as e:
+        logger.error(f"Invalid BACKUP_SINKS: {e}")
+        return
+
+    # Configuration
+    log_file = os.getenv("LOG_FILE")  # Optional log file
+    settings = {
+        "server": server,
+        "backup_dir": os.getenv("BACKUP_DIR", "/app/backups"),
+        "state_dir": os.getenv("BACKUP_STATE_DIR", "/tmp/backvault"),
+        "encryption_mode": os.getenv("BACKUP_ENCRYPTION_MODE", "bitwarden").lower(),
+        "encryption_modes": parse_modes(
+            os.getenv("BACKUP_ENCRYPTION_MODE", "bitwarden")
+        ),
+        "encryption_workers": int(os.getenv("BACKUP_ENCRYPTION_WORKERS", "1")),
+        "transport": os.getenv("BW_TRANSPORT", "cli").lower(),
+        "engine": os.getenv("BACKUP_ENGINE", "cli").lower(),
+        "kdf_salt": kdf_salt,
+        "dedup": os.getenv("BACKUP_DEDUP", "true").lower() in ("1", "true", "yes"),
+        "compression": os.getenv("BACKUP_COMPRESSION", "none"),
+        "attachments": os.getenv("BACKUP_ATTACHMENTS", "false").lower()
+        in ("1", "true", "yes"),
+        "attachment_workers": max(1, int(os.getenv("BACKUP_ATTACHMENT_WORKERS", "4"))),
+        "organizations": os.getenv("BACKUP_ORGANIZATIONS"),
+        "organization_workers": max(
+            1, int(os.getenv("BACKUP_ORGANIZATION_WORKERS") or 4)
+        ),
+        "trace_file": os.getenv("BACKUP_TRACE_FILE"),
+        "sinks": upload_sinks,
+        "session_reuse": session_reuse,
+        "session_max_age": float(os.getenv("BW_SESSION_MAX_AGE_HOURS") or 24) * 3600,
+        # Updated by the backups as sessions are kept or dropped
+        "sessions": dict(sessions),
+    }
+    max_workers = max(1, int(os.getenv("BACKUP_MAX_WORKERS", "4")))
+    metrics_file = os.getenv("BACKUP_METRICS_FILE")
+    metrics_port = os.getenv("BACKUP_METRICS_PORT")
+    if metrics_file:
+        metrics.restore_textfile(metrics_file)
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+
+    if log_file and not any(
+        getattr(handler, "baseFilename", None) == os.path.abspath(log_file)
+        for handler in logger.handlers
+    ):
+        logger.addHandler(logging.FileHandler(log_file))
+
+    os.makedirs(settings["backup_dir"], exist_ok=True)
+
+    started = time.monotonic()
+    if len(profiles) == 1:
+        results = [backup_vault(profiles[0], settings, state)]
+    else:
+        workers = min(max_workers, len(profiles))
+        logger.info(f"Backing up {len(profiles)} vaults with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(
+                pool.map(
+                    lambda profile: backup_vault(profile, settings, state), profiles
+                )
+            )
+    elapsed = time.monotonic() - started
+    if session_reuse:
+        _save_sessions(state.store, sessions, settings["sessions"])
+
+    succeeded = sum(1 for result in results if result.success)
+    for result in results:
+        if result.success:
+            logger.info(f"[{result.profile}] OK in {result.duration:.1f}s")
+        else:
+            logger.error(
+                f"[{result.profile}] FAILED in {result.duration:.1f}s: {result.error}"
+            )
+    logger.info(
+        f"Backup run finished: {succeeded}/{len(results)} vaults succeeded "
+        f"in {elapsed:.1f}s"
+    )
+    if metrics_file:
+        try:
+            metrics.write_textfile(metrics_file)
+        except OSError as e:
+            logger.error(f"Could not write metrics to {metrics_file}: {e}")
+    return results
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Back up Bitwarden vaults.")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Stay resident and run backups and cleanup on the configured schedule.",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Decrypt and check the backups that are due instead of backing up.",
+    )
+    args = parser.parse_args()
+    if args.daemon:
+        from src.scheduler import serve
+
+        serve()
+    elif args.verify:
+        from src.verify import verify_from_env
+
+        verify_from_env()
+    else:
+        main()
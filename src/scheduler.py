@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sys import stdout
+from typing import Callable
+from src.retention import cleanup_from_env
+from src.run import RunState, main as run_backup
+from src.verify import verify_from_env
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+CLEANUP_CRON = "0 0 * * *"
+
+CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),
+)
+
+
+class CronSchedule:
+    """
+    A standard five-field cron expression (minute hour dom month dow).
+
+    Supports `*`, lists, ranges and steps, plus the @daily-style aliases. As
+    in cron, when both day of month and day of week are restricted a day
+    matches if either does, and 7 is an alias for Sunday.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Invalid cron expression '{expression}': expected 5 fields"
+            )
+        parsed = [
+            self._parse_field(field, name, low, high)
+            for field, (name, low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, name: str, low: int, high: int) -> set[int]:
+        values = set()
+        for part in field.split(","):
+            base, _, step = part.partition("/")
+            if base == "*":
+                start, end = low, high
+            elif "-" in base:
+                start, end = (int(v) for v in base.split("-", 1))
+            else:
+                start = end = int(base)
+                if step:
+                    end = high
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Invalid cron {name} field: '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        in_weekdays = (moment.isoweekday() % 7) in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Return the first matching minute strictly after `moment`."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year = candidate.year + candidate.month // 12
+                month = candidate.month % 12 + 1
+                candidate = candidate.replace(
+                    year=year, month=month, day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+
+def backup_cron_from_env() -> str:
+    """Resolve the backup schedule exactly like entrypoint.sh does."""
+    expression = os.getenv("CRON_EXPRESSION")
+    if expression:
+        return expression
+    hours = os.getenv("BACKUP_INTERVAL_HOURS") or "12"
+    return f"0 */{hours} * * *"
+
+
+class Scheduler:
+    """
+    Runs backups, cleanup and verification from one resident process.
+
+    Every job executes on the same single worker thread, so two runs can
+    never overlap: a run that takes longer than its interval simply delays
+    the next one. The worker thread also owns the warm RunState (database
+    connection and configured clients), which SQLCipher requires anyway.
+    """
+
+    def __init__(self, jobs: dict[str, tuple[CronSchedule, Callable[[], object]]]):
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="backvault-job"
+        )
+        self._stopping = asyncio.Event()
+
+    async def run_job(self, name: str) -> None:
+        _, job = self.jobs[name]
+        logger.info(f"Running scheduled job '{name}'")
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, job)
+        except Exception as e:
+            logger.error(f"Scheduled job '{name}' failed: {e}")
+
+    async def _loop(self, name: str) -> None:
+        schedule, _ = self.jobs[name]
+        while not self._stopping.is_set():
+            now = datetime.now()
+            fire_at = schedule.next_after(now)
+            logger.info(f"Next '{name}' run at {fire_at:%Y-%m-%d %H:%M}")
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), (fire_at - now).total_seconds()
+                )
+            except TimeoutError:
+                await self.run_job(name)
+
+    def stop(self) -> None:
+        logger.info("Stopping scheduler...")
+        self._stopping.set()
+
+    async def serve(self, run_first: str | None = None) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+        if run_first:
+            await self.run_job(run_first)
+        await asyncio.gather(*(self._loop(name) for name in self.jobs))
+        self.executor.shutdown(wait=True)
+
+
+def serve() -> None:
+    """Entry point for `python -m src.run --daemon`."""
+    state = RunState()
+    backup_schedule = CronSchedule(backup_cron_from_env())
+    jobs = {
+        "backup": (backup_schedule, lambda: run_backup(state)),
+        "cleanup": (CronSchedule(CLEANUP_CRON), cleanup_from_env),
+    }
+    verify_cron = os.getenv("BACKUP_VERIFY_CRON")
+    if verify_cron:
+        jobs["verify"] = (CronSchedule(verify_cron), lambda: verify_from_env(state))
+    scheduler = Scheduler(jobs)
+    logger.info(
+        f"Starting resident scheduler (backup: '{backup_schedule.expression}', "
+        f"cleanup: '{CLEANUP_CRON}'"
+        + (f", verify: '{verify_cron}')" if verify_cron else ")")
+    )
+    try:
+        asyncio.run(scheduler.serve(run_first="backup"))
+    finally:
+        state.close()
@@ -0,0 +1,692 @@
+import contextvars
+import hashlib
+import hmac
+import logging
+import os
+import posixpath
+import queue
+import re
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from sys import stdout
+from typing import BinaryIO, Iterator
+from xml.etree import ElementTree
+from src import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+# S3 rejects parts other than the last that are smaller than this
+MIN_PART_SIZE = 5 * MIB
+# Chunks queued per destination before the writer has to wait for it
+QUEUE_CHUNKS = 16
+# Read size when a finished file has to be uploaded from disk
+COPY_BUFFER = MIB
+# Seconds before the first retry of a failed request; doubled for each retry
+RETRY_BACKOFF = 1.0
+SSH_TIMEOUT = 60
+
+
+class SinkError(Exception):
+    """An upload to a remote target failed."""
+
+    pass
+
+
+class _TransientError(SinkError):
+    """A failure worth retrying: a network error, a throttle or a 5xx."""
+
+    pass
+
+
+class Upload:
+    """One file on its way to a sink: write() it, then commit() or abort()."""
+
+    def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> None:
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        pass
+
+
+# -------------------------------
+# Local directory
+# -------------------------------
+class LocalSink:
+    """Copies backups into another directory, such as a mounted NAS share."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.name = f"file://{directory}"
+
+    def open(self, key: str) -> Upload:
+        return _LocalUpload(os.path.join(self.directory, key))
+
+
+class _LocalUpload(Upload):
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.partial = f"{path}.partial"
+        self.f = open(self.partial, "wb")
+
+    def write(self, data: bytes) -> None:
+        self.f.write(data)
+
+    def commit(self) -> None:
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self.partial, self.path)
+
+    def abort(self) -> None:
+        self.f.close()
+        if os.path.exists(self.partial):
+            os.remove(self.partial)
+
+
+# -------------------------------
+# S3-compatible storage
+# -------------------------------
+def _quote(value: str, safe: str = "-_.~") -> str:
+    return urllib.parse.quote(value, safe=safe)
+
+
+class S3Sink:
+    """
+    Uploads to an S3-compatible bucket (AWS, MinIO, Garage, Backblaze B2,
+    ...) with path-style requests signed with AWS Signature Version 4.
+
+    Files are sent as multipart uploads whose parts are uploaded in parallel
+    while the backup is still being written. Each part is kept in memory
+    until it is stored, so a failed part is retried on its own. At most
+    `concurrency` parts are in flight per file; the writer waits for a free
+    slot beyond that. Files smaller than one part are sent with a single PUT.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint: str | None = None,
+        region: str = "us-east-1",
+        access_key: str | None = None,
+        secret_key: str | None = None,
+        part_size: int = 8 * MIB,
+        concurrency: int = 4,
+        retries: int = 3,
+        timeout: float = 60,
+    ):
+        """
+        :param bucket: Bucket name
+        :param prefix: Key prefix of every upload (optional)
+        :param endpoint: Service URL, e.g. "http://minio:9000" (default: AWS in `region`)
+        :param part_size: Bytes per multipart part, at least 5 MiB (Default to 8 MiB)
+        :param concurrency: Parts uploaded in parallel per file (Default to 4)
+        :param retries: Times a failed request is retried (Default to 3)
+        """
+        if not access_key or not secret_key:
+            raise SinkError("S3 uploads need an access key id and a secret access key")
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        self.endpoint = (endpoint or f"https://s3.{region}.amazonaws.com").rstrip("/")
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.name = f"s3://{bucket}/{self.prefix}"
+
+    def open(self, key: str) -> Upload:
+        return _S3Upload(self, self.prefix + key)
+
+    def _signed_headers(
+        self, method: str, host: str, path: str, query: str, payload_hash: str
+    ) -> dict[str, str]:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        headers = {
+            "host": host,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date,
+        }
+        signed = ";".join(sorted(headers))
+        canonical = "\n".join(
+            [
+                method,
+                path,
+                query,
+                "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+                signed,
+                payload_hash,
+            ]
+        )
+        to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                amz_date,
+                scope,
+                hashlib.sha256(canonical.encode()).hexdigest(),
+            ]
+        )
+        key = f"AWS4{self.secret_key}".encode()
+        for part in scope.split("/"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed}, Signature={signature}"
+        )
+        return headers
+
+    def _request(
+        self,
+        method: str,
+        key: str,
+        query: dict[str, str] | None = None,
+        body: bytes = b"",
+    ) -> tuple[dict[str, str], bytes]:
+        url = urllib.parse.urlsplit(self.endpoint)
+        path = f"{url.path}/{_quote(self.bucket)}/{_quote(key, safe='/-_.~')}"
+        canonical_query = "&".join(
+            f"{_quote(name)}={_quote(value)}"
+            for name, value in sorted((query or {}).items())
+        )
+        headers = self._signed_headers(
+            method, url.netloc, path, canonical_query, hashlib.sha256(body).hexdigest()
+        )
+        request = urllib.request.Request(
+            f"{url.scheme}://{url.netloc}{path}"
+            + (f"?{canonical_query}" if canonical_query else ""),
+            data=body if method in ("PUT", "POST") else None,
+            headers=headers,
+            method=method,
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return dict(response.headers), response.read()
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", errors="replace")[:500]
+            message = f"HTTP {e.code} from S3 for {method} {key}: {detail}"
+            if e.code == 429 or e.code >= 500:
+                raise _TransientError(message) from None
+            raise SinkError(message) from None
+        except (urllib.error.URLError, OSError) as e:
+            raise _TransientError(f"S3 request {method} {key} failed: {e}") from None
+
+    def _retrying(self, what: str, *args, **kwargs) -> tuple[dict[str, str], bytes]:
+        for attempt in range(self.retries + 1):
+            try:
+                return self._request(*args, **kwargs)
+            except _TransientError as e:
+                if attempt == self.retries:
+                    raise
+                delay = RETRY_BACKOFF * 2**attempt
+                logger.warning(f"{what} failed, retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+
+    def _put_object(self, key: str, data: bytes) -> None:
+        self._retrying(f"Upload of {key}", "PUT", key, body=data)
+
+    def _create_multipart(self, key: str) -> str:
+        _, body = self._retrying(
+            f"Starting the upload of {key}", "POST", key, {"uploads": ""}
+        )
+        upload_id = _xml_text(body, "UploadId")
+        if not upload_id:
+            raise SinkError(f"S3 returned no upload id for {key}")
+        return upload_id
+
+    def _upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        headers, _ = self._retrying(
+            f"Part {number} of {key}",
+            "PUT",
+            key,
+            {"partNumber": str(number), "uploadId": upload_id},
+            data,
+        )
+        etag = {name.lower(): value for name, value in headers.items()}.get("etag")
+        if not etag:
+            raise SinkError(f"S3 returned no ETag for part {number} of {key}")
+        return etag
+
+    def _complete(self, key: str, upload_id: str, etags: list[str]) -> None:
+        parts = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in enumerate(etags, 1)
+        )
+        _, body = self._retrying(
+            f"Completing the upload of {key}",
+            "POST",
+            key,
+            {"uploadId": upload_id},
+            f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode(),
+        )
+        # S3 can report a failed completion in the body of a 200 response
+        if b"<Error>" in body:
+            raise SinkError(f"Completing the upload of {key} failed: {body[:500]!r}")
+
+    def _abort(self, key: str, upload_id: str) -> None:
+        self._retrying(
+            f"Aborting the upload of {key}", "DELETE", key, {"uploadId": upload_id}
+        )
+
+
+def _xml_text(body: bytes, tag: str) -> str | None:
+    """Return the text of the first `tag` element, whatever its namespace."""
+    try:
+        root = ElementTree.fromstring(body)
+    except ElementTree.ParseError:
+        return None
+    for element in root.iter():
+        if element.tag.rsplit("}", 1)[-1] == tag:
+            return element.text
+    return None
+
+
+class _S3Upload(Upload):
+    def __init__(self, sink: S3Sink, key: str):
+        self.sink = sink
+        self.key = key
+        self.buffer = bytearray()
+        self.upload_id: str | None = None
+        self.parts: list[Future] = []
+        self.pool = ThreadPoolExecutor(
+            sink.concurrency, thread_name_prefix="backvault-s3"
+        )
+        self.slots = threading.Semaphore(sink.concurrency)
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= self.sink.part_size:
+            part = bytes(self.buffer[: self.sink.part_size])
+            del self.buffer[: self.sink.part_size]
+            self._submit(part)
+
+    def _submit(self, part: bytes) -> None:
+        if self.upload_id is None:
+            self.upload_id = self.sink._create_multipart(self.key)
+        # Wait for a free slot, so memory use stays at `concurrency` parts
+        self.slots.acquire()
+        for future in self.parts:
+            if future.done() and future.exception() is not None:
+                self.slots.release()
+                raise future.exception()
+        future = self.pool.submit(
+            self.sink._upload_part, self.key, self.upload_id, len(self.parts) + 1, part
+        )
+        future.add_done_callback(lambda _: self.slots.release())
+        self.parts.append(future)
+
+    def commit(self) -> None:
+        try:
+            if self.upload_id is None:
+                self.sink._put_object(self.key, bytes(self.buffer))
+                return
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            etags = [future.result() for future in self.parts]
+            self.sink._complete(self.key, self.upload_id, etags)
+            self.upload_id = None
+        finally:
+            self.pool.shutdown()
+
+    def abort(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+        if self.upload_id is not None:
+            try:
+                self.sink._abort(self.key, self.upload_id)
+            except SinkError as e:
+                logger.warning(f"Could not abort the upload of {self.key}: {e}")
+            self.upload_id = None
+
+
+# -------------------------------
+# SSH/SFTP server
+# -------------------------------
+class SshSink:
+    """
+    Streams backups to a server through the `ssh` client, into a `.partial`
+    file that is renamed once it is complete. The account needs a shell with
+    `cat`, `mkdir` and `mv`; SFTP-only accounts are not supported.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        path: str = ".",
+        user: str | None = None,
+        port: int | None = None,
+        identity_file: str | None = None,
+        ssh_cmd: str = "ssh",
+    ):
+        self.host = host
+        self.path = path or "."
+        self.user = user
+        self.port = port
+        self.identity_file = identity_file
+        self.ssh_cmd = ssh_cmd
+        destination = f"{user}@{host}" if user else host
+        if port:
+            destination += f":{port}"
+        self.name = f"sftp://{destination}/{self.path.lstrip('/')}"
+
+    def command(self, remote: str) -> list[str]:
+        cmd = [self.ssh_cmd, "-o", "BatchMode=yes"]
+        if self.port:
+            cmd += ["-p", str(self.port)]
+        if self.identity_file:
+            cmd += ["-i", self.identity_file]
+        return cmd + [f"{self.user}@{self.host}" if self.user else self.host, remote]
+
+    def run(self, remote: str) -> None:
+        try:
+            result = subprocess.run(
+                self.command(remote),
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=SSH_TIMEOUT,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise SinkError(f"ssh to {self.host} failed: {e}") from None
+        if result.returncode != 0:
+            raise SinkError(f"ssh to {self.host} failed: {result.stderr.strip()}")
+
+    def open(self, key: str) -> Upload:
+        return _SshUpload(self, posixpath.join(self.path, key))
+
+
+class _SshUpload(Upload):
+    def __init__(self, sink: SshSink, path: str):
+        self.sink = sink
+        self.path = path
+        self.partial = f"{path}.partial"
+        # stderr goes to a file so a chatty server can never block the pipe
+        self.stderr = tempfile.TemporaryFile()
+        directory = shlex.quote(posixpath.dirname(path) or ".")
+        try:
+            self.process = subprocess.Popen(
+                sink.command(
+                    f"mkdir -p {directory} && cat > {shlex.quote(self.partial)}"
+                ),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=self.stderr,
+            )
+        except OSError as e:
+            self.stderr.close()
+            raise SinkError(f"Could not start ssh: {e}") from None
+
+    def _error(self) -> SinkError:
+        self.stderr.seek(0)
+        message = self.stderr.read().decode("utf-8", errors="replace").strip()
+        return SinkError(
+            f"ssh to {self.sink.host} exited with status {self.process.returncode}: "
+            f"{message}"
+        )
+
+    def write(self, data: bytes) -> None:
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self.process.wait()
+            raise self._error() from None
+
+    def commit(self) -> None:
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.process.wait():
+            raise self._error()
+        self.stderr.close()
+        # Only a complete file gets the final name
+        self.sink.run(f"mv -f {shlex.quote(self.partial)} {shlex.quote(self.path)}")
+
+    def abort(self) -> None:
+        self.process.kill()
+        self.process.wait()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.stderr.close()
+        try:
+            self.sink.run(f"rm -f {shlex.quote(self.partial)}")
+        except SinkError as e:
+            logger.warning(f"Could not remove {self.partial} on {self.sink.host}: {e}")
+
+
+# -------------------------------
+# Fan-out
+# -------------------------------
+class _Destination:
+    """One sink fed from a bounded queue by its own thread."""
+
+    def __init__(self, sink, key: str):
+        self.sink = sink
+        self.key = key
+        self.error: Exception | None = None
+        self.commit = False
+        self.queue: queue.Queue[bytes | None] = queue.Queue(QUEUE_CHUNKS)
+        self.thread = threading.Thread(
+            target=self._run, name=f"backvault-upload-{sink.name}", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self) -> None:
+        upload = None
+        drained = False
+        try:
+            upload = self.sink.open(self.key)
+            while (data := self.queue.get()) is not None:
+                upload.write(data)
+            drained = True
+            if self.commit:
+                upload.commit()
+                return
+        except Exception as e:
+            self.error = e
+            # Keep taking chunks so a failed sink never blocks the others
+            while not drained and self.queue.get() is not None:
+                pass
+        if upload is not None:
+            try:
+                upload.abort()
+            except Exception as e:
+                logger.warning(f"Could not abort the upload to {self.sink.name}: {e}")
+
+
+class FanOut:
+    """
+    Copies one stream to several sinks at once. Every sink has its own
+    thread and a queue of QUEUE_CHUNKS chunks; write() waits while the
+    slowest sink's queue is full, so a slow destination throttles the writer
+    instead of piling the backup up in memory. A failing sink is dropped
+    without affecting the others.
+    """
+
+    def __init__(self, sinks: list, key: str):
+        self.key = key
+        self.size = 0
+        self.destinations = [_Destination(sink, key) for sink in sinks]
+
+    def write(self, data: bytes) -> None:
+        data = bytes(data)
+        self.size += len(data)
+        for destination in self.destinations:
+            destination.queue.put(data)
+
+    def close(self, commit: bool = True) -> dict[str, Exception | None]:
+        """
+        Finish every upload, committing them only if `commit`.
+
+        :return: the error of each sink by name, None for those that succeeded
+        """
+        for destination in self.destinations:
+            destination.commit = commit
+            destination.queue.put(None)
+        for destination in self.destinations:
+            destination.thread.join()
+        return {d.sink.name: d.error for d in self.destinations}
+
+
+# The uploads of the backup file being written in this context, if any
+_stream: contextvars.ContextVar["Stream | None"] = contextvars.ContextVar(
+    "backvault_upload_stream", default=None
+)
+
+
+class Stream:
+    """
+    The uploads of one backup file. Writers of backup files call attach()
+    with the file they write to (see src.snapshots.HashingWriter), so the
+    encrypted data goes to the sinks as it is produced. finish() then
+    commits those uploads if the finished backup is exactly what was
+    streamed. Exports the CLI writes itself, and unchanged exports linked to
+    the previous snapshot, are uploaded from disk instead.
+    """
+
+    def __init__(self, sinks: list, key: str):
+        self.sinks = sinks
+        self.key = key
+        self.fanout: FanOut | None = None
+        self.file_id: tuple[int, int] | None = None
+
+    def attach(self, f: BinaryIO) -> FanOut:
+        if self.fanout is not None:
+            # Only the last file written can become the backup
+            self.fanout.close(commit=False)
+        try:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_dev, stat.st_ino)
+        except (AttributeError, OSError, ValueError):
+            self.file_id = None
+        self.fanout = FanOut(self.sinks, self.key)
+        return self.fanout
+
+    def finish(self, path: str) -> list[str]:
+        """
+        Complete the upload of the finished backup at `path` to every sink.
+
+        :return: names of the sinks the upload failed for
+        """
+        fanout, self.fanout = self.fanout, None
+        stat = os.stat(path)
+        if (
+            fanout is None
+            or (stat.st_dev, stat.st_ino) != self.file_id
+            or fanout.size != stat.st_size
+        ):
+            if fanout is not None:
+                fanout.close(commit=False)
+            logger.info(f"Uploading {os.path.basename(path)} from disk")
+            fanout = FanOut(self.sinks, self.key)
+            with open(path, "rb") as f:
+                while chunk := f.read(COPY_BUFFER):
+                    fanout.write(chunk)
+        failed = []
+        for name, error in fanout.close(commit=True).items():
+            result = "failure" if error else "success"
+            metrics.UPLOADS.inc(
+                profile=metrics.current_profile(), sink=name, result=result
+            )
+            if error:
+                logger.error(f"Upload of {self.key} to {name} failed: {error}")
+                failed.append(name)
+            else:
+                logger.info(f"Uploaded {self.key} to {name}")
+        return failed
+
+    def abort(self) -> None:
+        if self.fanout is not None:
+            self.fanout.close(commit=False)
+            self.fanout = None
+
+
+@contextmanager
+def streaming(sinks: list, key: str) -> Iterator[Stream | None]:
+    """
+    Stream the backup file written inside the block to `sinks` as object
+    `key`. Uploads that were not finished when the block is left are
+    aborted. Yields None when there are no sinks.
+    """
+    if not sinks:
+        yield None
+        return
+    stream = Stream(sinks, key)
+    token = _stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _stream.reset(token)
+        stream.abort()
+
+
+def attach(f: BinaryIO) -> FanOut | None:
+    """Return where to copy what is written to the backup file `f`, if anywhere."""
+    stream = _stream.get()
+    return stream.attach(f) if stream is not None else None
+
+
+def sink_from_url(url: str):
+    """
+    Build a sink from a BACKUP_SINKS entry:
+    s3://bucket/prefix, sftp://user@host:port/path or a local directory.
+    S3 and SSH settings are read from the BACKUP_S3_* and BACKUP_SFTP_*
+    environment variables.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "s3":
+        return S3Sink(
+            bucket=parsed.netloc,
+            prefix=parsed.path,
+            endpoint=os.getenv("BACKUP_S3_ENDPOINT") or None,
+            region=os.getenv("BACKUP_S3_REGION") or "us-east-1",
+            access_key=os.getenv("BACKUP_S3_ACCESS_KEY_ID"),
+            secret_key=os.getenv("BACKUP_S3_SECRET_ACCESS_KEY"),
+            part_size=int(float(os.getenv("BACKUP_S3_PART_SIZE_MB") or 8) * MIB),
+            concurrency=int(os.getenv("BACKUP_UPLOAD_CONCURRENCY") or 4),
+            retries=int(os.getenv("BACKUP_UPLOAD_RETRIES") or 3),
+        )
+    if parsed.scheme in ("sftp", "ssh"):
+        if not parsed.hostname:
+            raise SinkError(f"Missing host in upload target: {url}")
+        return SshSink(
+            host=parsed.hostname,
+            path=urllib.parse.unquote(parsed.path) or ".",
+            user=parsed.username,
+            port=parsed.port,
+            identity_file=os.getenv("BACKUP_SFTP_IDENTITY_FILE") or None,
+        )
+    if parsed.scheme in ("file", ""):
+        return LocalSink(urllib.parse.unquote(parsed.path))
+    raise SinkError(f"Unsupported upload target: {url}")
+
+
+def sinks_from_env() -> list:
+    """Return the sinks listed in BACKUP_SINKS (comma or space separated)."""
+    targets = re.split(r"[,\s]+", os.getenv("BACKUP_SINKS") or "")
+    return [sink_from_url(target) for target in targets if target]
@@ -0,0 +1,268 @@
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from sys import stdout
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
+from src import catalog, metrics, sinks
+from src.compression import parse_compression
+from src.crypto import encrypt_stream, fingerprint_key
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+# Records the newest raw backup of a backup dir and its plaintext fingerprint
+MANIFEST_NAME = ".latest-snapshot.json"
+
+
+def new_fingerprint(
+    file_pw: str, kdf_salt: bytes | None = None, compression: str | None = None
+) -> hmac.HMAC:
+    """
+    Return an HMAC-SHA256 to fingerprint a plaintext export with.
+
+    The key is derived from the file password, so the fingerprint reveals
+    nothing about the vault to someone who can read the manifest. The codec
+    is hashed in as well, so changing BACKUP_COMPRESSION writes a new file.
+    """
+    codec, level = parse_compression(compression)
+    fingerprint = hmac.new(fingerprint_key(file_pw, kdf_salt), digestmod=hashlib.sha256)
+    fingerprint.update(f"{codec.name}:{level}\n".encode() if codec else b"none\n")
+    return fingerprint
+
+
+class HashingWriter:
+    """
+    A binary file wrapper that hashes everything written through it, and
+    streams it to the upload sinks of the backup being written, if any (see
+    src.sinks.streaming).
+    """
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.tee = sinks.attach(f)
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        if self.tee is not None:
+            self.tee.write(data)
+        return self.f.write(data)
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+def latest_snapshot(backup_dir: str) -> dict | None:
+    """Return the manifest entry of the newest backup if that file still exists."""
+    try:
+        with open(os.path.join(backup_dir, MANIFEST_NAME)) as f:
+            latest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.isfile(os.path.join(backup_dir, latest.get("file", ""))):
+        return None
+    return latest
+
+
+def record_snapshot(
+    backup_file: str, fingerprint: str, sha256: str | None = None
+) -> None:
+    """
+    Make `backup_file` the snapshot later exports are compared against, and
+    report its SHA-256 to the backup catalog.
+    """
+    backup_dir = os.path.dirname(os.path.abspath(backup_file))
+    manifest = os.path.join(backup_dir, MANIFEST_NAME)
+    with open(f"{manifest}.partial", "w") as f:
+        json.dump(
+            {
+                "file": os.path.basename(backup_file),
+                "fingerprint": fingerprint,
+                "sha256": sha256,
+            },
+            f,
+        )
+    os.replace(f"{manifest}.partial", manifest)
+    catalog.note(sha256=sha256)
+
+
+def link_previous(backup_file: str, fingerprint: str) -> str | None:
+    """
+    Hardlink the latest snapshot to `backup_file` if its fingerprint matches.
+
+    The link shares the inode, and therefore the mtime, of the earlier file.
+    The mtime is refreshed so age-based retention keeps the data for as long
+    as its newest reference, and deleting either name leaves the other one
+    intact.
+
+    :return: path of the reused snapshot, or None if a full file is needed
+    """
+    backup_dir = os.path.dirname(os.path.abspath(backup_file))
+    latest = latest_snapshot(backup_dir)
+    if latest is None or not hmac.compare_digest(
+        latest.get("fingerprint", ""), fingerprint
+    ):
+        return None
+    previous = os.path.join(backup_dir, latest["file"])
+    try:
+        os.link(previous, backup_file)
+    except OSError as e:
+        logger.warning(f"Could not link unchanged export to {previous}: {e}")
+        return None
+    os.utime(backup_file)
+    # Same file, so the same ciphertext hash
+    record_snapshot(backup_file, fingerprint, latest.get("sha256"))
+    logger.info(
+        f"Export is identical to {os.path.basename(previous)}; "
+        "linked it instead of writing a new copy."
+    )
+    return previous
+
+
+def finish_snapshot(
+    partial_file: str,
+    backup_file: str,
+    fingerprint: str,
+    dedup: bool = True,
+    sha256: str | None = None,
+) -> bool:
+    """
+    Move a fully written `.partial` backup into place, or discard it in favour
+    of a link when it matches the latest snapshot.
+
+    :param sha256: SHA-256 of the partial file, as computed while writing it
+    :return: True if the previous snapshot was reused
+    """
+    if dedup and link_previous(backup_file, fingerprint):
+        os.remove(partial_file)
+        return True
+    os.replace(partial_file, backup_file)
+    record_snapshot(backup_file, fingerprint, sha256)
+    return False
+
+
+class ExportCache:
+    """
+    Lets several formats be written from one decrypted export: inside
+    sharing(), each export is built once and handed to every caller, which
+    must not modify it. Blocks may overlap, for example one per organization
+    exported in parallel; the exports are dropped when the last one ends.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._depth = 0
+        # Key -> [lock held while building, export]
+        self._exports: dict[Any, list] = {}
+
+    @contextmanager
+    def sharing(self) -> Iterator[None]:
+        with self._lock:
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if not self._depth:
+                    self._exports = {}
+
+    def get(self, key: Any, build: Callable[[], dict]) -> dict:
+        with self._lock:
+            if not self._depth:
+                entry = None
+            else:
+                entry = self._exports.setdefault(key, [threading.Lock(), None])
+        if entry is None:
+            return build()
+        # Concurrent callers of the same export wait for the first one's
+        with entry[0]:
+            if entry[1] is None:
+                entry[1] = build()
+            return entry[1]
+
+
+class _PieceReader:
+    """A read()-able view of an iterator of byte strings."""
+
+    def __init__(self, pieces: Iterable[bytes]):
+        self.pieces: Iterator[bytes] = iter(pieces)
+        self._pending = b""
+
+    def read(self, size: int) -> bytes:
+        parts, wanted = [], size
+        while wanted > 0:
+            if not self._pending:
+                self._pending = next(self.pieces, b"")
+                if not self._pending:
+                    break
+            parts.append(self._pending[:wanted])
+            self._pending = self._pending[wanted:]
+            wanted -= len(parts[-1])
+        return b"".join(parts)
+
+
+def write_encrypted(
+    backup_file: str,
+    data: bytes | Callable[[], Iterable[bytes]],
+    file_pw: str,
+    workers: int = 1,
+    kdf_salt: bytes | None = None,
+    dedup: bool = True,
+    compression: str | None = None,
+) -> int:
+    """
+    Encrypt an export to `backup_file`.
+
+    `data` is either the export itself or a function that serializes it in
+    pieces (see src.export_format.iter_json), so the whole text never has to
+    exist in memory. With `dedup` the fingerprint is checked before
+    encrypting, which takes a separate serialization pass, so an unchanged
+    vault costs neither encryption nor a new file.
+
+    :return: number of plaintext bytes encrypted (0 if the previous snapshot was linked)
+    """
+
+    def plaintext() -> BinaryIO:
+        if isinstance(data, bytes):
+            return io.BytesIO(data)
+        return _PieceReader(data())
+
+    fingerprint = new_fingerprint(file_pw, kdf_salt, compression)
+    if dedup:
+        for piece in [data] if isinstance(data, bytes) else data():
+            fingerprint.update(piece)
+        with metrics.phase("write"):
+            if link_previous(backup_file, fingerprint.hexdigest()):
+                return 0
+    partial_file = f"{backup_file}.partial"
+    try:
+        with metrics.phase("encrypt"), open(partial_file, "wb") as f:
+            writer = HashingWriter(f)
+            size = encrypt_stream(
+                plaintext(),
+                writer,
+                file_pw,
+                workers=workers,
+                kdf_salt=kdf_salt,
+                # Without dedup the fingerprint is taken while encrypting
+                hasher=None if dedup else fingerprint,
+                compression=compression,
+            )
+    except BaseException:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+    with metrics.phase("write"):
+        os.replace(partial_file, backup_file)
+        record_snapshot(backup_file, fingerprint.hexdigest(), writer.hexdigest())
+    return size
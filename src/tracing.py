@@ -0,0 +1,249 @@
+import contextvars
+import json
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from sys import stdout
+from typing import Any, Iterator
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+_write_lock = threading.Lock()
+
+
+@dataclass
+class Trace:
+    path: str
+    trace_id: str = field(default_factory=lambda: secrets.token_hex(16))
+
+
+@dataclass
+class Span:
+    name: str
+    trace: Trace | None
+    parent_id: str | None
+    start: float = field(default_factory=time.time)
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add_child(self, pid: int, status: int, rusage) -> None:
+        """Account a reaped child process to this span."""
+        a = self.attributes
+        a["children"] = a.get("children", 0) + 1
+        a["child_pid"] = pid
+        a["child_exit_code"] = os.waitstatus_to_exitcode(status)
+        a["child_user_s"] = round(a.get("child_user_s", 0) + rusage.ru_utime, 6)
+        a["child_sys_s"] = round(a.get("child_sys_s", 0) + rusage.ru_stime, 6)
+        # ru_maxrss is in KiB on Linux
+        a["child_max_rss_kb"] = max(a.get("child_max_rss_kb", 0), rusage.ru_maxrss)
+
+
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "backvault_trace", default=None
+)
+_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "backvault_span", default=None
+)
+
+
+def current_trace_id() -> str | None:
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+def _write(span: Span, duration: float) -> None:
+    record = {
+        "trace_id": span.trace.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "start": span.start,
+        "duration_s": round(duration, 6),
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+        "attributes": span.attributes,
+    }
+    line = json.dumps(record, default=str) + "\n"
+    try:
+        with _write_lock, open(span.trace.path, "a") as f:
+            f.write(line)
+    except OSError as e:
+        logger.warning(f"Could not write trace span to {span.trace.path}: {e}")
+
+
+@contextmanager
+def span(name: str, start: float | None = None, **attributes) -> Iterator[Span]:
+    """
+    Record a span nested in the current one. Outside a trace nothing is
+    written, but the span can still be used.
+
+    :param start: Unix time the span began, if earlier than now
+    """
+    parent = _span.get()
+    current = Span(
+        name=name,
+        trace=_trace.get(),
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes,
+    )
+    if start is not None:
+        current.start = start
+    token = _span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _span.reset(token)
+        if current.trace is not None:
+            if start is None:
+                duration = time.perf_counter() - started
+            else:
+                duration = time.time() - start
+            _write(current, duration)
+
+
+@contextmanager
+def trace(path: str | None, name: str = "backup", **attributes) -> Iterator[Span]:
+    """
+    Start a new trace with a root span `name`. Spans opened inside it, such
+    as the phases in src.metrics and every bw process, are appended to the
+    JSON lines file `path` under the trace's id. Without a path no spans are
+    written.
+    """
+    if not path:
+        with span(name, **attributes) as root:
+            yield root
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    trace_token = _trace.set(Trace(path))
+    span_token = _span.set(None)
+    try:
+        with span(name, **attributes) as root:
+            yield root
+    finally:
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+
+
+def wait(process: subprocess.Popen, timeout: float | None = None) -> int:
+    """
+    Popen.wait() that reaps the process with wait4() and records the
+    child's resource usage on the current span. Sets and returns the
+    process's returncode; raises TimeoutExpired like Popen.wait().
+    """
+    if process.returncode is not None:
+        return process.returncode
+    if not hasattr(os, "wait4"):
+        return process.wait(timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        pid, status, rusage = os.wait4(
+            process.pid, 0 if deadline is None else os.WNOHANG
+        )
+        if pid == process.pid:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    current = _span.get()
+    if current is not None:
+        current.add_child(pid, status, rusage)
+    return process.returncode
+
+
+def _read(pipe, output: dict, name: str) -> None:
+    with pipe:
+        output[name] = pipe.read()
+
+
+def run(
+    args,
+    *,
+    capture_output: bool = False,
+    timeout: float | None = None,
+    check: bool = False,
+    **kwargs,
+) -> subprocess.CompletedProcess:
+    """
+    subprocess.run() that reaps the process with wait() above. The output
+    pipes are read on threads, as Popen.communicate() would reap the process
+    itself.
+    """
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    output: dict[str, Any] = {}
+    with subprocess.Popen(args, **kwargs) as process:
+        readers = [
+            threading.Thread(target=_read, args=(pipe, output, name), daemon=True)
+            for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr))
+            if pipe is not None
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            returncode = wait(process, timeout)
+        except BaseException:
+            process.kill()
+            wait(process)
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+    stdout, stderr = output.get("stdout"), output.get("stderr")
+    if check and returncode:
+        raise subprocess.CalledProcessError(
+            returncode, process.args, output=stdout, stderr=stderr
+        )
+    return subprocess.CompletedProcess(process.args, returncode, stdout, stderr)
+
+
+def to_chrome_trace(lines) -> dict:
+    """Convert trace JSON lines to the Chrome trace event format."""
+    events = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        events.append(
+            {
+                "name": record["name"],
+                "cat": "bw" if record["name"].startswith("bw ") else "backvault",
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["duration_s"] * 1e6,
+                "pid": record["pid"],
+                "tid": record["tid"],
+                "args": {"trace_id": record["trace_id"], **record["attributes"]},
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python -m src.tracing <trace.jsonl>")
+    with open(sys.argv[1]) as f:
+        json.dump(to_chrome_trace(f), sys.stdout)
@@ -0,0 +1,777 @@
+import base64
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import ssl
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from sys import stdout
+from typing import Any, BinaryIO, Iterator
+from cryptography.hazmat.primitives import hashes, padding, serialization
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from src import catalog, metrics
+from src.attachments import AttachmentRef
+from src.bw_client import BitwardenError
+from src.export_format import CSV_TYPES, iter_csv, iter_json
+from src.snapshots import ExportCache, write_encrypted
+
+# Bitwarden KDF types
+KDF_PBKDF2 = 0
+KDF_ARGON2ID = 1
+
+# Bitwarden EncString types
+ENC_AES_CBC_256_B64 = 0
+ENC_AES_CBC_256_HMAC_SHA256_B64 = 2
+ENC_RSA_OAEP_SHA256_B64 = 3
+ENC_RSA_OAEP_SHA1_B64 = 4
+ENC_RSA_OAEP_SHA1_HMAC_SHA256_B64 = 6
+
+# Cipher types
+CIPHER_LOGIN = 1
+CIPHER_SECURE_NOTE = 2
+CIPHER_CARD = 3
+CIPHER_IDENTITY = 4
+CIPHER_SSH_KEY = 5
+
+DEVICE_TYPE_LINUX_CLI = 25
+EXPORT_KDF_ITERATIONS = 600000
+
+CARD_FIELDS = ("cardholderName", "brand", "number", "expMonth", "expYear", "code")
+IDENTITY_FIELDS = (
+    "title",
+    "firstName",
+    "middleName",
+    "lastName",
+    "address1",
+    "address2",
+    "address3",
+    "city",
+    "state",
+    "postalCode",
+    "country",
+    "company",
+    "email",
+    "phone",
+    "ssn",
+    "username",
+    "passportNumber",
+    "licenseNumber",
+)
+SSH_KEY_FIELDS = ("privateKey", "publicKey", "keyFingerprint")
+FIDO2_FIELDS = (
+    "credentialId",
+    "keyType",
+    "keyAlgorithm",
+    "keyCurve",
+    "keyValue",
+    "rpId",
+    "userHandle",
+    "userName",
+    "counter",
+    "rpName",
+    "userDisplayName",
+    "discoverable",
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SymmetricKey:
+    """A 64-byte Bitwarden symmetric key split into its AES and HMAC halves."""
+
+    def __init__(self, key: bytes):
+        if len(key) == 64:
+            self.enc_key, self.mac_key = key[:32], key[32:]
+        elif len(key) == 32:
+            self.enc_key, self.mac_key = key, None
+        else:
+            raise BitwardenError(f"Unsupported symmetric key length: {len(key)}")
+
+    @classmethod
+    def stretch(cls, key: bytes) -> "SymmetricKey":
+        """Expand a 32-byte master key into an encryption and a MAC key."""
+        enc = HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b"enc")
+        mac = HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b"mac")
+        return cls(enc.derive(key) + mac.derive(key))
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def derive_master_key(
+    password: str,
+    salt: str,
+    kdf: int,
+    iterations: int,
+    memory: int | None = None,
+    parallelism: int | None = None,
+) -> bytes:
+    """
+    Derive the Bitwarden master key from the master password.
+
+    :param salt: the account email (or export salt) the key is bound to
+    :param kdf: KDF_PBKDF2 or KDF_ARGON2ID
+    :param memory: Argon2id memory in MiB
+    """
+    password_bytes = password.encode("utf-8")
+    salt_bytes = salt.encode("utf-8")
+    if kdf == KDF_PBKDF2:
+        return PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt_bytes,
+            iterations=iterations,
+        ).derive(password_bytes)
+    if kdf == KDF_ARGON2ID:
+        return Argon2id(
+            salt=hashlib.sha256(salt_bytes).digest(),
+            length=32,
+            iterations=iterations,
+            lanes=parallelism or 4,
+            memory_cost=(memory or 64) * 1024,
+        ).derive(password_bytes)
+    raise BitwardenError(f"Unsupported KDF type: {kdf}")
+
+
+def _aes_cbc_decrypt(
+    key: SymmetricKey, iv: bytes, ciphertext: bytes, mac: bytes | None
+) -> bytes:
+    """AES-256-CBC decrypt, verifying the HMAC-SHA256 first when there is one."""
+    if mac is not None:
+        if key.mac_key is None:
+            raise BitwardenError("Missing MAC key")
+        expected = hmac.new(key.mac_key, iv + ciphertext, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, mac):
+            raise BitwardenError("Encrypted string failed MAC validation")
+    decryptor = Cipher(algorithms.AES(key.enc_key), modes.CBC(iv)).decryptor()
+    padded = decryptor.update(ciphertext) + decryptor.finalize()
+    unpadder = padding.PKCS7(128).unpadder()
+    return unpadder.update(padded) + unpadder.finalize()
+
+
+def decrypt_enc_string(
+    enc_string: str, key: SymmetricKey | None = None, private_key=None
+) -> bytes:
+    """
+    Decrypt a Bitwarden EncString ("<type>.<data>").
+
+    Symmetric strings are AES-256-CBC, authenticated with HMAC-SHA256 when the
+    key has a MAC half. RSA strings are decrypted with the user's private key.
+    """
+    enc_type, _, data = enc_string.partition(".")
+    if not data:
+        raise BitwardenError("Malformed encrypted string")
+    enc_type = int(enc_type)
+    parts = data.split("|")
+
+    if enc_type in (ENC_AES_CBC_256_B64, ENC_AES_CBC_256_HMAC_SHA256_B64):
+        if key is None:
+            raise BitwardenError("Missing symmetric key")
+        return _aes_cbc_decrypt(
+            key,
+            base64.b64decode(parts[0]),
+            base64.b64decode(parts[1]),
+            base64.b64decode(parts[2])
+            if enc_type == ENC_AES_CBC_256_HMAC_SHA256_B64
+            else None,
+        )
+
+    if enc_type in (
+        ENC_RSA_OAEP_SHA256_B64,
+        ENC_RSA_OAEP_SHA1_B64,
+        ENC_RSA_OAEP_SHA1_HMAC_SHA256_B64,
+    ):
+        if private_key is None:
+            raise BitwardenError("Missing private key")
+        algorithm = (
+            hashes.SHA256() if enc_type == ENC_RSA_OAEP_SHA256_B64 else hashes.SHA1()
+        )
+        return private_key.decrypt(
+            base64.b64decode(parts[0]),
+            asym_padding.OAEP(
+                mgf=asym_padding.MGF1(algorithm=algorithm),
+                algorithm=algorithm,
+                label=None,
+            ),
+        )
+
+    raise BitwardenError(f"Unsupported encrypted string type: {enc_type}")
+
+
+def decrypt_enc_bytes(data: bytes, key: SymmetricKey) -> bytes:
+    """
+    Decrypt a Bitwarden EncArrayBuffer, the binary form attachments are
+    stored in: a type byte, the IV, the MAC (type 2 only) and the ciphertext.
+    """
+    if not data:
+        raise BitwardenError("Malformed encrypted buffer")
+    if data[0] == ENC_AES_CBC_256_HMAC_SHA256_B64 and len(data) > 49:
+        return _aes_cbc_decrypt(key, data[1:17], data[49:], data[17:49])
+    if data[0] == ENC_AES_CBC_256_B64 and len(data) > 17:
+        return _aes_cbc_decrypt(key, data[1:17], data[17:], None)
+    raise BitwardenError(f"Unsupported encrypted buffer type: {data[0]}")
+
+
+def encrypt_enc_string(data: bytes, key: SymmetricKey) -> str:
+    """Encrypt data into a type 2 (AES-256-CBC + HMAC-SHA256) EncString."""
+    iv = os.urandom(16)
+    padder = padding.PKCS7(128).padder()
+    padded = padder.update(data) + padder.finalize()
+    encryptor = Cipher(algorithms.AES(key.enc_key), modes.CBC(iv)).encryptor()
+    ciphertext = encryptor.update(padded) + encryptor.finalize()
+    mac = hmac.new(key.mac_key, iv + ciphertext, hashlib.sha256).digest()
+    return (
+        f"{ENC_AES_CBC_256_HMAC_SHA256_B64}.{_b64(iv)}|{_b64(ciphertext)}|{_b64(mac)}"
+    )
+
+
+def _camel(obj: Any) -> Any:
+    """Normalise PascalCase keys (older Vaultwarden) to the camelCase API."""
+    if isinstance(obj, dict):
+        return {
+            (key[:1].lower() + key[1:] if key else key): _camel(value)
+            for key, value in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_camel(value) for value in obj]
+    return obj
+
+
+def _service_urls(server: str) -> tuple[str, str]:
+    """Return the identity and API base URLs for a server URL."""
+    base = server.rstrip("/")
+    host = urllib.parse.urlparse(base).hostname or ""
+    for domain in ("bitwarden.com", "bitwarden.eu"):
+        if host == domain or host == f"vault.{domain}":
+            return f"https://identity.{domain}", f"https://api.{domain}"
+    return f"{base}/identity", f"{base}/api"
+
+
+class VaultApiClient:
+    """
+    Bitwarden/Vaultwarden client that talks to the server API directly.
+
+    Exposes the same backup surface as BitwardenClient (login, unlock, status,
+    export_*, logout) without the Node.js CLI: the API key is exchanged for
+    an access token, the vault is fetched with a single /api/sync call and
+    every cipher string is decrypted locally.
+    """
+
+    def __init__(
+        self,
+        server: str,
+        client_id: str,
+        client_secret: str,
+        encrypt_workers: int = 1,
+        timeout: float = 60.0,
+        kdf_salt: bytes | None = None,
+    ):
+        """
+        :param server: Bitwarden server URL (Vaultwarden compatible)
+        :param client_id: Client ID for API key login
+        :param client_secret: Client Secret for API key login
+        :param encrypt_workers: Number of threads encrypting raw exports in parallel (Default to 1)
+        :param timeout: HTTP timeout in seconds
+        :param kdf_salt: Stored salt shared by raw exports so their master key is derived once (optional)
+        """
+        self.server = server
+        self.identity_url, self.api_url = _service_urls(server)
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.encrypt_workers = encrypt_workers
+        self.kdf_salt = kdf_salt
+        self.timeout = timeout
+        self.device_id = str(uuid.uuid4())
+        self.access_token: str | None = None
+        self.token_response: dict[str, Any] = {}
+        self.sync_data: dict[str, Any] | None = None
+        self.user_key: SymmetricKey | None = None
+        # (KDF inputs, master key) of the last unlock; survives logout so a
+        # client kept by the resident scheduler skips the KDF on later runs
+        self._master_key_cache: tuple[tuple, bytes] | None = None
+        self.org_keys: dict[str, SymmetricKey] = {}
+        self._exports = ExportCache()
+        self._ssl_context = None
+        if os.getenv("NODE_TLS_REJECT_UNAUTHORIZED") == "0":
+            # Mirror the CLI's escape hatch for self-signed certificates
+            self._ssl_context = ssl._create_unverified_context()
+
+    def __enter__(self):
+        self.login()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.logout()
+
+    def _request(
+        self,
+        url: str,
+        data: bytes | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> dict[str, Any]:
+        request = urllib.request.Request(url, data=data, headers=headers or {})
+        request.add_header("Accept", "application/json")
+        request.add_header("Device-Type", str(DEVICE_TYPE_LINUX_CLI))
+        if self.access_token:
+            request.add_header("Authorization", f"Bearer {self.access_token}")
+        try:
+            with urllib.request.urlopen(
+                request, timeout=self.timeout, context=self._ssl_context
+            ) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            body = e.read().decode("utf-8", errors="replace")
+            logger.error(f"Vault API error: HTTP {e.code} for {url}")
+            raise BitwardenError(f"HTTP {e.code} from {url}: {body}") from None
+        except (urllib.error.URLError, json.JSONDecodeError) as e:
+            raise BitwardenError(f"Request to {url} failed: {e}") from None
+
+    # -------------------------------
+    # Core API methods
+    # -------------------------------
+    def login(self) -> str:
+        """Exchange the API key for an access token and fetch the vault."""
+        logger.info("Logging in via API key")
+        form = urllib.parse.urlencode(
+            {
+                "grant_type": "client_credentials",
+                "scope": "api",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "deviceType": DEVICE_TYPE_LINUX_CLI,
+                "deviceIdentifier": self.device_id,
+                "deviceName": "backvault",
+            }
+        ).encode("ascii")
+        self.token_response = _camel(
+            self._request(
+                f"{self.identity_url}/connect/token",
+                data=form,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+        )
+        self.access_token = self.token_response["access_token"]
+        logger.info("Logged in successfully")
+        self.sync()
+        return self.access_token
+
+    def sync(self) -> None:
+        """Fetch the full vault with one /api/sync call."""
+        self.sync_data = _camel(
+            self._request(f"{self.api_url}/sync?excludeDomains=true")
+        )
+        logger.info("Vault synced successfully")
+
+    def unlock(self, password: str) -> None:
+        """Derive the master key and decrypt the user and organization keys."""
+        if self.sync_data is None:
+            raise BitwardenError("Not logged in")
+        profile = self.sync_data["profile"]
+        token = self.token_response
+        kdf_inputs = (
+            password,
+            profile["email"].strip().lower(),
+            token.get("kdf", KDF_PBKDF2),
+            token.get("kdfIterations", EXPORT_KDF_ITERATIONS),
+            token.get("kdfMemory"),
+            token.get("kdfParallelism"),
+        )
+        if self._master_key_cache and self._master_key_cache[0] == kdf_inputs:
+            master_key = self._master_key_cache[1]
+        else:
+            master_key = derive_master_key(*kdf_inputs)
+        self._master_key_cache = None
+        try:
+            user_key = decrypt_enc_string(
+                token.get("key") or profile["key"], SymmetricKey.stretch(master_key)
+            )
+        except (BitwardenError, ValueError):
+            logger.error("Unlock failed: invalid master password")
+            raise BitwardenError("Invalid master password") from None
+        self.user_key = SymmetricKey(user_key)
+        self._master_key_cache = (kdf_inputs, master_key)
+
+        private_key = None
+        encrypted_private_key = token.get("privateKey") or profile.get("privateKey")
+        if encrypted_private_key:
+            private_key = serialization.load_der_private_key(
+                decrypt_enc_string(encrypted_private_key, self.user_key), None
+            )
+        self.org_keys = {}
+        for org in profile.get("organizations") or []:
+            if org.get("key") and private_key is not None:
+                self.org_keys[org["id"]] = SymmetricKey(
+                    decrypt_enc_string(org["key"], private_key=private_key)
+                )
+        logger.info("Vault unlocked successfully")
+
+    def status(self) -> dict[str, Any]:
+        """Return a status object shaped like `bw status`."""
+        if self.access_token is None:
+            status = "unauthenticated"
+        elif self.user_key is None:
+            status = "locked"
+        else:
+            status = "unlocked"
+        profile = (self.sync_data or {}).get("profile") or {}
+        return {
+            "serverUrl": self.server,
+            "userEmail": profile.get("email"),
+            "userId": profile.get("id"),
+            "status": status,
+        }
+
+    def logout(self) -> None:
+        """Forget the access token and every decrypted key."""
+        self.access_token = None
+        self.token_response = {}
+        self.sync_data = None
+        self.user_key = None
+        self.org_keys = {}
+        logger.info("Logged out successfully")
+
+    # -------------------------------
+    # Export
+    # -------------------------------
+    def _decrypt_str(self, value: str | None, key: SymmetricKey) -> str | None:
+        if value is None:
+            return None
+        return decrypt_enc_string(value, key).decode("utf-8")
+
+    def _cipher_key(self, cipher: dict[str, Any]) -> SymmetricKey:
+        org_id = cipher.get("organizationId")
+        key = self.org_keys.get(org_id) if org_id else self.user_key
+        if key is None:
+            raise BitwardenError(f"No key available for cipher {cipher.get('id')}")
+        if cipher.get("key"):
+            # Item-level key, wrapped with the user or organization key
+            key = SymmetricKey(decrypt_enc_string(cipher["key"], key))
+        return key
+
+    def _export_item(self, cipher: dict[str, Any]) -> dict[str, Any]:
+        """Decrypt a sync cipher into the `bw export --format json` item layout."""
+        key = self._cipher_key(cipher)
+
+        def dec(value: str | None) -> str | None:
+            return self._decrypt_str(value, key)
+
+        item: dict[str, Any] = {
+            "passwordHistory": [
+                {
+                    "lastUsedDate": entry.get("lastUsedDate"),
+                    "password": dec(entry.get("password")),
+                }
+                for entry in cipher["passwordHistory"]
+            ]
+            if cipher.get("passwordHistory")
+            else None,
+            "revisionDate": cipher.get("revisionDate"),
+            "creationDate": cipher.get("creationDate"),
+            "deletedDate": cipher.get("deletedDate"),
+            "id": cipher["id"],
+            "organizationId": cipher.get("organizationId"),
+            "folderId": cipher.get("folderId"),
+            "type": cipher["type"],
+            "reprompt": cipher.get("reprompt", 0),
+            "name": dec(cipher.get("name")),
+            "notes": dec(cipher.get("notes")),
+            "favorite": cipher.get("favorite", False),
+        }
+        if cipher.get("fields"):
+            item["fields"] = [
+                {
+                    "name": dec(field.get("name")),
+                    "value": dec(field.get("value")),
+                    "type": field.get("type"),
+                    "linkedId": field.get("linkedId"),
+                }
+                for field in cipher["fields"]
+            ]
+
+        cipher_type = cipher["type"]
+        if cipher_type == CIPHER_LOGIN:
+            login = cipher.get("login") or {}
+            item["login"] = {
+                "fido2Credentials": [
+                    {
+                        **{name: dec(cred.get(name)) for name in FIDO2_FIELDS},
+                        "creationDate": cred.get("creationDate"),
+                    }
+                    for cred in login.get("fido2Credentials") or []
+                ],
+                "uris": [
+                    {"match": uri.get("match"), "uri": dec(uri.get("uri"))}
+                    for uri in login.get("uris") or []
+                ],
+                "username": dec(login.get("username")),
+                "password": dec(login.get("password")),
+                "totp": dec(login.get("totp")),
+            }
+        elif cipher_type == CIPHER_SECURE_NOTE:
+            item["secureNote"] = {
+                "type": (cipher.get("secureNote") or {}).get("type", 0)
+            }
+        elif cipher_type == CIPHER_CARD:
+            card = cipher.get("card") or {}
+            item["card"] = {name: dec(card.get(name)) for name in CARD_FIELDS}
+        elif cipher_type == CIPHER_IDENTITY:
+            identity = cipher.get("identity") or {}
+            item["identity"] = {
+                name: dec(identity.get(name)) for name in IDENTITY_FIELDS
+            }
+        elif cipher_type == CIPHER_SSH_KEY:
+            ssh_key = cipher.get("sshKey") or {}
+            item["sshKey"] = {name: dec(ssh_key.get(name)) for name in SSH_KEY_FIELDS}
+        item["collectionIds"] = None
+        return item
+
+    def _personal_ciphers(self) -> list[dict[str, Any]]:
+        return self._ciphers(None)
+
+    def _ciphers(self, organization_id: str | None) -> list[dict[str, Any]]:
+        return [
+            cipher
+            for cipher in self.sync_data.get("ciphers") or []
+            if cipher.get("organizationId") == organization_id
+            and cipher.get("deletedDate") is None
+        ]
+
+    def list_organizations(self) -> list[dict[str, Any]]:
+        """Return the organizations whose key could be decrypted, like `bw list organizations`."""
+        if self.sync_data is None or self.user_key is None:
+            raise BitwardenError("Vault is locked")
+        return [
+            {"object": "organization", "id": org["id"], "name": org.get("name")}
+            for org in self.sync_data["profile"].get("organizations") or []
+            if org["id"] in self.org_keys
+        ]
+
+    def list_attachments(self) -> list[AttachmentRef]:
+        """Return the attachments of every personal item."""
+        if self.sync_data is None or self.user_key is None:
+            raise BitwardenError("Vault is locked")
+        refs = []
+        for cipher in self._personal_ciphers():
+            key = self._cipher_key(cipher)
+            for attachment in cipher.get("attachments") or []:
+                refs.append(
+                    AttachmentRef(
+                        item_id=cipher["id"],
+                        attachment_id=attachment["id"],
+                        file_name=self._decrypt_str(attachment.get("fileName"), key),
+                        size=int(attachment.get("size") or 0),
+                    )
+                )
+        return refs
+
+    def _download(self, url: str) -> bytes:
+        # Download URLs carry their own token (Vaultwarden) or SAS signature
+        # (Azure storage), which rejects an extra Authorization header
+        try:
+            with urllib.request.urlopen(
+                url, timeout=self.timeout, context=self._ssl_context
+            ) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            logger.error(f"Vault API error: HTTP {e.code} downloading attachment")
+            raise BitwardenError(f"HTTP {e.code} downloading attachment") from None
+        except urllib.error.URLError as e:
+            raise BitwardenError(f"Attachment download failed: {e}") from None
+
+    @contextmanager
+    def open_attachment(self, ref: AttachmentRef) -> Iterator[BinaryIO]:
+        """
+        Download and decrypt one attachment. Attachments with their own key
+        are wrapped with the item key; older ones use the item key directly.
+        Safe to call from several threads at once.
+        """
+        cipher = next(
+            (
+                cipher
+                for cipher in self._personal_ciphers()
+                if cipher["id"] == ref.item_id
+            ),
+            None,
+        )
+        if cipher is None:
+            raise BitwardenError(f"Item {ref.item_id} not found")
+        meta = _camel(
+            self._request(
+                f"{self.api_url}/ciphers/{ref.item_id}/attachment/{ref.attachment_id}"
+            )
+        )
+        key = self._cipher_key(cipher)
+        if meta.get("key"):
+            key = SymmetricKey(decrypt_enc_string(meta["key"], key))
+        yield io.BytesIO(decrypt_enc_bytes(self._download(meta["url"]), key))
+
+    def shared_export(self):
+        """Decrypt the vault once for every format exported inside the block."""
+        return self._exports.sharing()
+
+    def export_json(self, organization_id: str | None = None) -> dict[str, Any]:
+        """
+        Build the personal vault export, as `bw export --format json` does,
+        or with `organization_id` that organization's export.
+        """
+        if self.sync_data is None or self.user_key is None:
+            raise BitwardenError("Vault is locked")
+        export = self._exports.get(
+            organization_id, lambda: self._build_export(organization_id)
+        )
+        catalog.note(
+            items=len(export["items"]),
+            folders=len(export["folders"]) if "folders" in export else None,
+        )
+        return export
+
+    def _build_export(self, organization_id: str | None) -> dict[str, Any]:
+        if organization_id:
+            return self._organization_export(organization_id)
+        folders = [
+            {
+                "id": folder["id"],
+                "name": self._decrypt_str(folder["name"], self.user_key),
+            }
+            for folder in self.sync_data.get("folders") or []
+        ]
+        items = [self._export_item(cipher) for cipher in self._personal_ciphers()]
+        return {"encrypted": False, "folders": folders, "items": items}
+
+    def _organization_export(self, organization_id: str) -> dict[str, Any]:
+        key = self.org_keys.get(organization_id)
+        if key is None:
+            raise BitwardenError(f"No key available for organization {organization_id}")
+        collections = [
+            {
+                "id": collection["id"],
+                "organizationId": organization_id,
+                "name": self._decrypt_str(collection["name"], key),
+                "externalId": collection.get("externalId"),
+            }
+            for collection in self.sync_data.get("collections") or []
+            if collection.get("organizationId") == organization_id
+        ]
+        items = []
+        for cipher in self._ciphers(organization_id):
+            item = self._export_item(cipher)
+            item["collectionIds"] = cipher.get("collectionIds") or []
+            items.append(item)
+        return {"encrypted": False, "collections": collections, "items": items}
+
+    def export_raw_encrypted(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool = True,
+        compression: str | None = None,
+        organization_id: str | None = None,
+    ):
+        """
+        Exports the decrypted vault JSON and encrypts it with src.crypto. With
+        `dedup`, an unchanged export is linked to the previous backup instead
+        (see src.snapshots). Compressed exports are serialized canonically,
+        which compresses better. With `organization_id`, that organization's
+        vault is exported instead of the personal one.
+        """
+        logger.info("Exporting raw data from the vault API...")
+        export = self.export_json(organization_id)
+        canonical = bool(compression and compression.lower() != "none")
+        size = write_encrypted(
+            backup_file,
+            # Serialized piece by piece, so the JSON text is never held whole
+            lambda: iter_json(export, canonical=canonical),
+            file_pw,
+            workers=self.encrypt_workers,
+            kdf_salt=self.kdf_salt,
+            dedup=dedup,
+            compression=compression,
+        )
+        if size:
+            logger.info(f"Encrypted {size} bytes of raw export.")
+
+    def export_csv_encrypted(
+        self,
+        backup_file: str,
+        file_pw: str,
+        dedup: bool = True,
+        compression: str | None = None,
+        organization_id: str | None = None,
+    ):
+        """
+        Exports the vault in the layout of `bw export --format csv`, which
+        only holds logins and secure notes, and encrypts it like a raw export.
+        """
+        logger.info("Exporting CSV data from the vault API...")
+        export = self.export_json(organization_id)
+        catalog.note(
+            items=sum(1 for item in export["items"] if item.get("type") in CSV_TYPES),
+            folders=None,
+        )
+        size = write_encrypted(
+            backup_file,
+            lambda: iter_csv(export),
+            file_pw,
+            workers=self.encrypt_workers,
+            kdf_salt=self.kdf_salt,
+            dedup=dedup,
+            compression=compression,
+        )
+        if size:
+            logger.info(f"Encrypted {size} bytes of CSV export.")
+
+    def export_bitwarden_encrypted(
+        self, backup_file: str, file_pw: str, organization_id: str | None = None
+    ):
+        """
+        Exports in Bitwarden's password-protected JSON format, as produced by
+        `bw export --format json --password`, so it can be restored with
+        `bw import bitwardenjson`. With `organization_id`, that organization's
+        vault is exported instead of the personal one.
+        """
+        logger.info(f"Exporting with Bitwarden encryption to {backup_file}...")
+        data = json.dumps(
+            self.export_json(organization_id), indent=2, ensure_ascii=False
+        )
+        with metrics.phase("encrypt"):
+            salt = _b64(os.urandom(16))
+            key = SymmetricKey.stretch(
+                derive_master_key(file_pw, salt, KDF_PBKDF2, EXPORT_KDF_ITERATIONS)
+            )
+            export = {
+                "encrypted": True,
+                "passwordProtected": True,
+                "salt": salt,
+                "kdfType": KDF_PBKDF2,
+                "kdfIterations": EXPORT_KDF_ITERATIONS,
+                "kdfMemory": None,
+                "kdfParallelism": None,
+                "encKeyValidation_DO_NOT_EDIT": encrypt_enc_string(
+                    str(uuid.uuid4()).encode("utf-8"), key
+                ),
+                "data": encrypt_enc_string(data.encode("utf-8"), key),
+            }
+        with metrics.phase("write"):
+            body = json.dumps(export, indent=2).encode("utf-8")
+            partial_file = f"{backup_file}.partial"
+            with open(partial_file, "wb") as f:
+                f.write(body)
+            os.replace(partial_file, backup_file)
+            catalog.note(sha256=hashlib.sha256(body).hexdigest())
@@ -0,0 +1,465 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from sys import stdout
+from typing import Any, BinaryIO
+from cryptography.exceptions import InvalidTag
+from src import catalog, metrics
+from src.attachments import BLOBS_DIR, load_manifest
+from src.bw_client import _CsvRecordCounter, _ExportItemCounter
+from src.catalog import BackupEntry
+from src.crypto import decrypt_stream
+from src.export_format import parse_bitwarden_export
+from src.vault_api import SymmetricKey, decrypt_enc_string, derive_master_key
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.StreamHandler(stdout)],
+)
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+READ_SIZE = 1024 * 1024
+
+# Keys every password-protected Bitwarden JSON export has
+BITWARDEN_KEYS = (
+    "encrypted",
+    "passwordProtected",
+    "salt",
+    "kdfType",
+    "kdfIterations",
+    "encKeyValidation_DO_NOT_EDIT",
+    "data",
+)
+
+
+class VerifyError(Exception):
+    pass
+
+
+@dataclass
+class VerifyResult:
+    """Outcome of checking that one backup can be restored."""
+
+    path: str
+    ok: bool
+    error: str | None = None
+    items: int | None = None
+    folders: int | None = None
+    sha256: str | None = None
+    duration: float = 0.0
+
+
+class _ThrottledReader:
+    """
+    Reads a backup at no more than `rate` bytes per second, hashing what it
+    reads, and drops the pages it read from the page cache afterwards so a
+    verification run does not evict the host's working set.
+    """
+
+    def __init__(self, f: BinaryIO, rate: float | None = None):
+        self.f = f
+        self.rate = rate
+        self.sha256 = hashlib.sha256()
+        self.total = 0
+        self._started = time.monotonic()
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            chunks = []
+            while chunk := self.read(READ_SIZE):
+                chunks.append(chunk)
+            return b"".join(chunks)
+        data = self.f.read(size)
+        self.sha256.update(data)
+        self.total += len(data)
+        if self.rate:
+            ahead = self.total / self.rate - (time.monotonic() - self._started)
+            if ahead > 0:
+                time.sleep(ahead)
+        return data
+
+    def drop_cache(self) -> None:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _count(export: Any) -> tuple[int, int]:
+    if not isinstance(export, dict) or not isinstance(export.get("items"), list):
+        raise VerifyError("Export has no items list")
+    return len(export["items"]), len(export.get("folders") or [])
+
+
+class _ExportCounter:
+    """
+    Output file for decrypt_stream() that counts what a decrypted export
+    holds as it is written, instead of keeping the plaintext: JSON exports
+    with bw_client._ExportItemCounter, CSV exports with _CsvRecordCounter.
+    """
+
+    # Enough of the start of a CSV export to check its header
+    HEAD = len("collections,")
+
+    def __init__(self):
+        self.counter: _ExportItemCounter | _CsvRecordCounter | None = None
+        self.head = b""
+
+    def write(self, data: bytes) -> int:
+        if self.counter is None:
+            self.head += data
+            start = self.head.lstrip()
+            if not start:
+                return len(data)
+            if start[:1] == b"{":
+                self.counter = _ExportItemCounter()
+            else:
+                self.counter = _CsvRecordCounter()
+            self.counter.update(self.head)
+            self.head = start[: self.HEAD]
+        else:
+            self.counter.update(data)
+            if len(self.head) < self.HEAD:
+                self.head += data[: self.HEAD - len(self.head)]
+        return len(data)
+
+    def counts(self) -> tuple[int, int | None]:
+        """Items and folders, or records and None for CSV exports."""
+        if isinstance(self.counter, _ExportItemCounter):
+            if not self.counter.is_json_object():
+                raise VerifyError("Export is not a JSON object")
+            if not self.counter.has_items:
+                raise VerifyError("Export has no items list")
+            return self.counter.count, self.counter.folders
+        if not self.head.startswith((b"folder,", b"collections,")):
+            raise VerifyError("Export is neither JSON nor a Bitwarden CSV export")
+        return self.counter.count, None
+
+
+def _check_raw(reader: BinaryIO, file_pw: str) -> tuple[int, int | None]:
+    counter = _ExportCounter()
+    decrypt_stream(reader, counter, file_pw)
+    return counter.counts()
+
+
+def _check_bitwarden(export: dict[str, Any], file_pw: str) -> tuple[int, int]:
+    """Check the structure of a Bitwarden JSON export, then decrypt it."""
+    missing = [key for key in BITWARDEN_KEYS if key not in export]
+    if missing:
+        raise VerifyError(f"Export is missing {', '.join(missing)}")
+    if not (export["encrypted"] and export["passwordProtected"]):
+        raise VerifyError("Export is not password protected")
+    key = SymmetricKey.stretch(
+        derive_master_key(
+            file_pw,
+            export["salt"],
+            export["kdfType"],
+            export["kdfIterations"],
+            export.get("kdfMemory"),
+            export.get("kdfParallelism"),
+        )
+    )
+    decrypt_enc_string(export["encKeyValidation_DO_NOT_EDIT"], key)
+    return _count(json.loads(decrypt_enc_string(export["data"], key)))
+
+
+def _check_attachments(manifest: str, file_pw: str) -> None:
+    blobs_dir = os.path.join(os.path.dirname(manifest), BLOBS_DIR)
+    missing = [
+        entry["blob"]
+        for entry in load_manifest(manifest, file_pw)
+        if not os.path.isfile(os.path.join(blobs_dir, f"{entry['blob']}.enc"))
+    ]
+    if missing:
+        raise VerifyError(f"{len(missing)} attachment blobs are missing")
+
+
+def verify_file(
+    path: str,
+    file_pw: str,
+    expected: dict[str, Any] | None = None,
+    rate: float | None = None,
+) -> VerifyResult:
+    """
+    Decrypt one backup and check it holds a well-formed export.
+
+    Raw and CSV backups are decrypted with src.crypto, Bitwarden-mode exports
+    are checked for the keys `bw import` needs and then decrypted the way it
+    would. Never raises: a backup that cannot be restored is a failed result.
+
+    :param expected: what the catalog knows (`sha256`, `items`, `folders` and
+        the `attachments` manifest path); known values must match
+    :param rate: read at most this many bytes per second
+    """
+    expected = expected or {}
+    started = time.monotonic()
+    result = VerifyResult(path=path, ok=False)
+    try:
+        with open(path, "rb") as f:
+            reader = _ThrottledReader(f, rate)
+            try:
+                if f.peek(1)[:1] != b"{":
+                    result.items, result.folders = _check_raw(reader, file_pw)
+                else:
+                    data = reader.read()
+                    export = parse_bitwarden_export(data)
+                    if export is None:
+                        # A legacy v1 backup whose random salt starts with "{"
+                        result.items, result.folders = _check_raw(
+                            io.BytesIO(data), file_pw
+                        )
+                    else:
+                        result.items, result.folders = _check_bitwarden(export, file_pw)
+                reader.read()
+            finally:
+                reader.drop_cache()
+        result.sha256 = reader.sha256.hexdigest()
+        if expected.get("sha256") and expected["sha256"] != result.sha256:
+            raise VerifyError("Checksum does not match the catalog")
+        for count in ("items", "folders"):
+            known = expected.get(count)
+            if known is not None and known != getattr(result, count):
+                raise VerifyError(
+                    f"Expected {known} {count}, found {getattr(result, count)}"
+                )
+        if expected.get("attachments"):
+            _check_attachments(expected["attachments"], file_pw)
+        result.ok = True
+    except InvalidTag:
+        result.error = "Decryption failed: wrong password or corrupted file"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.duration = time.monotonic() - started
+    return result
+
+
+def _lower_priority(niceness: int) -> None:
+    """Pool initializer: verification only gets the CPU the backups leave."""
+    if niceness:
+        os.nice(niceness)
+
+
+def due_backups(
+    backup_dir: str, max_age_days: float, now: float | None = None
+) -> list[tuple[str, BackupEntry]]:
+    """
+    Return the backups to verify: never verified first, then failed ones,
+    then those last verified more than `max_age_days` ago, oldest check first.
+
+    Due backups whose file is gone, deleted by hand or by an older cleanup,
+    are dropped from the catalog instead of failing every run.
+    """
+    now = time.time() if now is None else now
+    due = []
+    missing: dict[str, list[str]] = {}
+    for directory, entry in catalog.list_backups(backup_dir):
+        if not (
+            entry.verified is None
+            or not entry.verify_ok
+            or now - entry.verified > max_age_days * DAY
+        ):
+            continue
+        if os.path.exists(os.path.join(directory, entry.file)):
+            due.append((directory, entry))
+        else:
+            missing.setdefault(directory, []).append(entry.file)
+    for directory, files in missing.items():
+        logger.warning(
+            f"{len(files)} backups in {directory} no longer exist; "
+            "removing them from the catalog"
+        )
+        catalog.record_removed(directory, files)
+    return sorted(
+        due,
+        key=lambda pair: (
+            pair[1].verified is not None,
+            bool(pair[1].verify_ok),
+            pair[1].verified or 0,
+            pair[1].created,
+        ),
+    )
+
+
+def _password_for(passwords: dict[str, str], directory: str) -> str | None:
+    """
+    Organization exports and additional formats are encrypted with their
+    profile's file password.
+    """
+    while directory not in passwords:
+        parent, name = os.path.split(directory)
+        if not name.startswith(catalog.EXPORT_DIR_PREFIXES):
+            return None
+        directory = parent
+    return passwords[directory]
+
+
+def verify_backups(
+    backup_dir: str,
+    passwords: dict[str, str],
+    max_age_days: float = 30,
+    limit: int | None = None,
+    workers: int = 1,
+    niceness: int = 10,
+    max_bytes_per_s: float | None = None,
+    now: float | None = None,
+) -> list[VerifyResult]:
+    """
+    Verify the due backups under `backup_dir` on a pool of `workers`
+    processes, and record the outcomes in the catalog.
+
+    Decryption is CPU-bound, so each worker runs at `niceness` and reads are
+    capped at `max_bytes_per_s` in total. Backups with the same content (the
+    hardlinks of unchanged exports) are decrypted once.
+
+    :param passwords: file password per profile backup dir, which also
+        covers its organization and format dirs; other dirs are skipped
+    """
+    groups: dict[tuple[str, str], list[tuple[str, BackupEntry]]] = {}
+    skipped = set()
+    for directory, entry in due_backups(backup_dir, max_age_days, now):
+        if _password_for(passwords, directory) is None:
+            skipped.add(directory)
+            continue
+        key = (directory, entry.sha256 or entry.file)
+        if key not in groups and limit and len(groups) >= limit:
+            continue
+        groups.setdefault(key, []).append((directory, entry))
+    for directory in sorted(skipped):
+        logger.warning(f"No vault profile backs up to {directory}; not verifying it")
+    if not groups:
+        logger.info("No backups are due for verification.")
+        return []
+
+    workers = max(1, min(workers, len(groups)))
+    rate = max_bytes_per_s / workers if max_bytes_per_s else None
+    logger.info(f"Verifying {len(groups)} backups with {workers} workers")
+    results = []
+    # Workers are started from a fork server rather than forked from this
+    # process, which in the daemon also runs the scheduler and metrics threads
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_lower_priority,
+        initargs=(niceness,),
+    ) as pool:
+        futures = {}
+        for (directory, _), group in groups.items():
+            entry = group[0][1]
+            expected = {
+                "sha256": entry.sha256,
+                "items": entry.items,
+                "folders": entry.folders,
+                "attachments": os.path.join(directory, entry.attachments)
+                if entry.attachments
+                else None,
+            }
+            path = os.path.join(directory, entry.file)
+            future = pool.submit(
+                verify_file,
+                path,
+                _password_for(passwords, directory),
+                expected,
+                rate,
+            )
+            futures[future] = group
+        for future in as_completed(futures):
+            group = futures[future]
+            result = future.result()
+            results.append(result)
+            directory = group[0][0]
+            for _, entry in group:
+                profile = entry.profile or (
+                    os.path.basename(directory)
+                    if directory != backup_dir
+                    else "default"
+                )
+                metrics.VERIFICATIONS.inc(
+                    profile=profile, result="success" if result.ok else "failure"
+                )
+                if not result.ok:
+                    logger.error(f"[{profile}] {entry.file} FAILED: {result.error}")
+            catalog.record_verified(
+                directory, [(entry.file, result.ok, result.error) for _, entry in group]
+            )
+    failed = sum(1 for result in results if not result.ok)
+    logger.info(
+        f"Verification finished: {len(results) - failed}/{len(results)} backups "
+        "restored cleanly"
+    )
+    return results
+
+
+def verify_from_env(
+    state=None, max_age_days: float | None = None
+) -> list[VerifyResult]:
+    """
+    Verify the backups of every configured vault profile, as configured by
+    BACKUP_DIR and BACKUP_VERIFY_*.
+
+    :param state: the resident scheduler's RunState, whose DB connection is reused
+    """
+    from src.run import DEFAULT_PROFILE, RunState, load_profiles
+
+    if state is None:
+        state = RunState()
+        try:
+            return verify_from_env(state, max_age_days)
+        finally:
+            state.close()
+    if not state.connect():
+        return []
+    profiles = load_profiles(state.store)
+
+    backup_dir = os.path.abspath(os.getenv("BACKUP_DIR", "/app/backups"))
+    passwords = {
+        backup_dir
+        if profile.name == DEFAULT_PROFILE
+        else os.path.join(backup_dir, profile.name): profile.file_password
+        for profile in profiles
+    }
+    if max_age_days is None:
+        max_age_days = float(os.getenv("BACKUP_VERIFY_MAX_AGE_DAYS") or 30)
+    max_mbps = float(os.getenv("BACKUP_VERIFY_MAX_MBPS") or 0)
+    metrics_file = os.getenv("BACKUP_METRICS_FILE")
+    if metrics_file:
+        metrics.restore_textfile(metrics_file)
+    results = verify_backups(
+        backup_dir,
+        passwords,
+        max_age_days=max_age_days,
+        limit=int(os.getenv("BACKUP_VERIFY_LIMIT") or 0) or None,
+        workers=int(
+            os.getenv("BACKUP_VERIFY_WORKERS") or max(1, (os.cpu_count() or 2) // 2)
+        ),
+        niceness=int(os.getenv("BACKUP_VERIFY_NICE") or 10),
+        max_bytes_per_s=max_mbps * 1024 * 1024 or None,
+    )
+    if metrics_file:
+        try:
+            metrics.write_textfile(metrics_file)
+        except OSError as e:
+            logger.error(f"Could not write metrics to {metrics_file}: {e}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that Backvault backups decrypt to complete exports."
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Verify every backup, not only those due (BACKUP_VERIFY_MAX_AGE_DAYS)",
+    )
+    results = verify_from_env(max_age_days=0 if parser.parse_args().all else None)
+    sys.exit(1 if any(not result.ok for result in results) else 0)
@@ -0,0 +1,208 @@
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pytest
+from src import crypto
+from src.attachments import (
+    BLOBS_DIR,
+    AttachmentRef,
+    AttachmentReport,
+    attachment_refs,
+    backup_attachments,
+    load_manifest,
+    manifest_path,
+)
+from src.crypto import decrypt_stream
+from src.retention import DAY, prune_older_than
+
+KDF_SALT = b"a" * 16
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+
+
+class FakeSource:
+    """Serves attachments from memory and records every download."""
+
+    def __init__(self, files: dict[tuple[str, str], bytes], fail: set = ()):
+        self.files = files
+        self.fail = set(fail)
+        self.downloads = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def list_attachments(self):
+        return [
+            AttachmentRef(item_id, attachment_id, f"{attachment_id}.bin", len(data))
+            for (item_id, attachment_id), data in self.files.items()
+        ]
+
+    @contextmanager
+    def open_attachment(self, ref):
+        with self._lock:
+            self.downloads.append(ref.attachment_id)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.02)
+            if ref.attachment_id in self.fail:
+                raise OSError("download failed")
+            yield io.BytesIO(self.files[(ref.item_id, ref.attachment_id)])
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _backup(source, backup_dir, name="backup_1.enc", workers=4) -> AttachmentReport:
+    return backup_attachments(
+        source,
+        os.path.join(backup_dir, name),
+        "file_pw",
+        kdf_salt=KDF_SALT,
+        workers=workers,
+    )
+
+
+def _blobs(backup_dir) -> list[str]:
+    return sorted(
+        name
+        for name in os.listdir(os.path.join(backup_dir, BLOBS_DIR))
+        if name.endswith(".enc")
+    )
+
+
+def _decrypt(path) -> bytes:
+    out = io.BytesIO()
+    with open(path, "rb") as f:
+        decrypt_stream(f, out, "file_pw")
+    return out.getvalue()
+
+
+def test_attachments_are_stored_encrypted_and_content_addressed(tmp_path):
+    """
+    Tests that every attachment ends up in the manifest, that identical files
+    share one encrypted blob and that blobs decrypt back to the original.
+    """
+    files = {
+        ("item1", "a1"): b"scan of passport",
+        ("item1", "a2"): b"recovery codes",
+        ("item2", "a3"): b"scan of passport",
+    }
+    report = _backup(FakeSource(files), tmp_path)
+
+    assert (report.total, report.downloaded, report.stored) == (3, 3, 2)
+    assert report.bytes_downloaded == sum(len(data) for data in files.values())
+    assert len(report.latencies) == 3
+    assert len(_blobs(tmp_path)) == 2
+    entries = load_manifest(manifest_path(str(tmp_path / "backup_1.enc")), "file_pw")
+    assert [entry["attachment_id"] for entry in entries] == ["a1", "a2", "a3"]
+    for entry in entries:
+        blob = tmp_path / BLOBS_DIR / f"{entry['blob']}.enc"
+        assert b"passport" not in blob.read_bytes()
+        assert _decrypt(blob) == files[(entry["item_id"], entry["attachment_id"])]
+    assert not [name for name in os.listdir(tmp_path / BLOBS_DIR) if "partial" in name]
+
+
+def test_unchanged_attachments_are_not_downloaded_again(tmp_path):
+    """
+    Tests that a later run only downloads attachments the previous manifest
+    does not know, and still lists every attachment in its own manifest.
+    """
+    files = {("item1", "a1"): b"first", ("item1", "a2"): b"second"}
+    _backup(FakeSource(files), tmp_path, "backup_1.enc")
+
+    files[("item2", "a3")] = b"third"
+    source = FakeSource(files)
+    report = _backup(source, tmp_path, "backup_2.enc")
+
+    assert source.downloads == ["a3"]
+    assert (report.reused, report.downloaded, report.stored) == (2, 1, 1)
+    entries = load_manifest(manifest_path(str(tmp_path / "backup_2.enc")), "file_pw")
+    assert len(entries) == 3
+    assert len(_blobs(tmp_path)) == 3
+
+
+def test_missing_blob_is_downloaded_again(tmp_path):
+    """
+    Tests that an attachment whose blob was deleted is fetched again.
+    """
+    files = {("item1", "a1"): b"first"}
+    _backup(FakeSource(files), tmp_path, "backup_1.enc")
+    for name in _blobs(tmp_path):
+        os.remove(tmp_path / BLOBS_DIR / name)
+
+    source = FakeSource(files)
+    _backup(source, tmp_path, "backup_2.enc")
+    assert source.downloads == ["a1"]
+    assert len(_blobs(tmp_path)) == 1
+
+
+def test_downloads_run_on_a_bounded_pool(tmp_path):
+    """
+    Tests that downloads overlap but never exceed the worker count.
+    """
+    files = {("item", f"a{i}"): os.urandom(64) for i in range(12)}
+    source = FakeSource(files)
+    _backup(source, tmp_path, workers=3)
+    assert 1 < source.peak <= 3
+
+
+def test_failed_attachment_is_reported_and_retried(tmp_path):
+    """
+    Tests that one failed download does not stop the others, leaks no file
+    descriptor and is left out of the manifest, so the next run tries it again.
+    """
+    files = {("item1", "a1"): b"first", ("item1", "a2"): b"second"}
+    open_fds = len(os.listdir("/proc/self/fd"))
+    report = _backup(FakeSource(files, fail={"a2"}), tmp_path, "backup_1.enc")
+    assert (report.downloaded, report.failed) == (1, 1)
+    assert len(os.listdir("/proc/self/fd")) == open_fds
+
+    source = FakeSource(files)
+    _backup(source, tmp_path, "backup_2.enc")
+    assert source.downloads == ["a2"]
+
+
+def test_referenced_blobs_survive_retention(tmp_path):
+    """
+    Tests that blobs still referenced by the newest backup are kept by
+    age-based retention even though they were first stored long ago.
+    """
+    files = {("item1", "a1"): b"first"}
+    _backup(FakeSource(files), tmp_path, "backup_1.enc")
+    old = time.time() - 10 * DAY
+    for name in os.listdir(tmp_path):
+        if name.endswith(".enc"):
+            os.utime(tmp_path / name, (old, old))
+    for name in _blobs(tmp_path):
+        os.utime(tmp_path / BLOBS_DIR / name, (old, old))
+
+    _backup(FakeSource(files), tmp_path, "backup_2.enc")
+    deleted = prune_older_than(str(tmp_path), 7)
+
+    assert [os.path.basename(path) for path in deleted] == ["backup_1.attachments.enc"]
+    assert len(_blobs(tmp_path)) == 1
+
+
+def test_attachment_refs_and_report():
+    """
+    Tests that only personal, non-deleted items contribute attachments and
+    that latency percentiles use the nearest rank.
+    """
+    items = [
+        {"id": "i1", "attachments": [{"id": "a1", "fileName": "x", "size": "10"}]},
+        {"id": "i2", "organizationId": "org", "attachments": [{"id": "a2"}]},
+        {"id": "i3", "deletedDate": "2025-01-01", "attachments": [{"id": "a3"}]},
+        {"id": "i4", "attachments": None},
+    ]
+    assert attachment_refs(items) == [AttachmentRef("i1", "a1", "x", 10)]
+
+    report = AttachmentReport(latencies=[float(i) for i in range(1, 101)])
+    assert report.percentile(50) == 50.0
+    assert report.percentile(99) == 99.0
+    assert "p90 90.00s" in report.summary()
@@ -0,0 +1,24 @@
+from benchmarks.bench_run import run_scenario
+
+
+def test_bench_run_smoke():
+    """
+    Tests that one tiny end-to-end benchmark scenario still runs, so changes
+    to src.run cannot silently break the benchmark's instrumentation.
+    """
+    result = run_scenario(
+        {
+            "items": 20,
+            "mode": "raw",
+            "transport": "cli",
+            "compression": "none",
+            "org_ratio": 0.0,
+            "attachment_ratio": 0.0,
+            "latency": "0",
+            "runs": 1,
+        }
+    )
+    assert result["succeeded"] == 1
+    assert result["bytes_written"] > 0
+    for phase in ("database", "login", "unlock", "export", "logout"):
+        assert result["phases_s"][phase] > 0
@@ -0,0 +1,110 @@
+import asyncio
+import io
+import json
+import sys
+import time
+import pytest
+from src import crypto
+from src.bw_async import AsyncBitwardenClient
+from src.bw_client import BitwardenError
+from src.crypto import decrypt_stream
+from benchmarks.vaultgen import personal_export, synthetic_export
+from tests.test_fake_bw import FAKE_BW
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """Point the fake CLI at a small synthetic vault."""
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    vault = synthetic_export(30, org_ratio=0.3)
+    vault_file = tmp_path / "vault.json"
+    vault_file.write_text(json.dumps(vault))
+    bw = tmp_path / "bw"
+    bw.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_BW}" "$@"\n')
+    bw.chmod(0o755)
+    monkeypatch.setenv("FAKE_BW_VAULT", str(vault_file))
+    monkeypatch.setenv("FAKE_BW_PASSWORD", "master_pw")
+    monkeypatch.setenv("FAKE_BW_LOG", str(tmp_path / "commands.log"))
+    return vault, str(bw)
+
+
+def make_client(bw, appdata_dir):
+    return AsyncBitwardenClient(
+        bw_cmd=bw,
+        server="https://vault.example",
+        client_id="user.id",
+        client_secret="secret",
+        appdata_dir=str(appdata_dir),
+    )
+
+
+def test_async_backup(vault, tmp_path):
+    """
+    Tests a full raw backup through the async client, including the logout
+    after a failed command and the redaction of the master password.
+    """
+    vault, bw = vault
+    backup_file = tmp_path / "backup.enc"
+
+    async def scenario():
+        client = make_client(bw, tmp_path / "appdata")
+        await client.login()
+        with pytest.raises(BitwardenError) as error:
+            await client.unlock("wrong")
+        assert "wrong" not in str(error.value)
+        assert (await client.status())["status"] == "unauthenticated"
+        async with client:
+            await client.unlock("master_pw")
+            await client.export_raw_encrypted(str(backup_file), "file_pw")
+        return await client.status()
+
+    assert asyncio.run(scenario())["status"] == "unauthenticated"
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert json.loads(decrypted.getvalue()) == personal_export(vault)
+    assert not (tmp_path / "backup.enc.partial").exists()
+    assert "master_pw" not in (tmp_path / "commands.log").read_text()
+
+
+def test_clients_run_concurrently(vault, tmp_path, monkeypatch):
+    """Tests that commands of several clients overlap on one event loop."""
+    _, bw = vault
+    monkeypatch.setenv("FAKE_BW_LATENCY", "login=1")
+
+    async def scenario():
+        clients = [make_client(bw, tmp_path / f"appdata{i}") for i in range(3)]
+        return await asyncio.gather(*(client.login() for client in clients))
+
+    started = time.monotonic()
+    assert len(asyncio.run(scenario())) == 3
+    assert time.monotonic() - started < 2.5
+
+
+@pytest.mark.parametrize("command", ["sync", "export"])
+def test_cancel_stops_bw(vault, tmp_path, monkeypatch, command):
+    """
+    Tests that cancelling a command stops its bw process right away and
+    leaves no partial backup behind.
+    """
+    _, bw = vault
+    monkeypatch.setenv("FAKE_BW_LATENCY", f"{command}=30")
+    backup_file = tmp_path / "backup.enc"
+
+    async def scenario():
+        client = make_client(bw, tmp_path / "appdata")
+        if command == "sync":
+            task = asyncio.create_task(client.sync())
+        else:
+            task = asyncio.create_task(
+                client.export_raw_encrypted(str(backup_file), "file_pw")
+            )
+        await asyncio.sleep(1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    started = time.monotonic()
+    asyncio.run(scenario())
+    assert time.monotonic() - started < 10
+    assert list(tmp_path.glob("backup.enc*")) == []
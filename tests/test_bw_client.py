@@ -1,6 +1,19 @@
+import hashlib
+import io
+import json
+import os
 import pytest
+from subprocess import CompletedProcess
 from unittest.mock import patch, ANY
-from src.bw_client import BitwardenClient, BitwardenError
+from src import catalog, crypto
+from src.attachments import AttachmentRef
+from src.bw_client import (
+    BitwardenClient,
+    BitwardenError,
+    _CsvRecordCounter,
+    _ExportItemCounter,
+)
+from src.crypto import decrypt_stream
 
 
 @patch("src.bw_client.sprun")
@@ -196,3 +209,203 @@ def test_encrypt_data():
     password = "test_password"
     encrypted_data = client.encrypt_data(data, password)
     assert encrypted_data != data
+
+
+@patch("src.bw_client.Popen")
+def test_export_raw_encrypted_streams_cli_output(mock_popen, tmp_path, monkeypatch):
+    """
+    Tests that export_raw_encrypted pipes `bw export` stdout through the
+    chunked encryptor into the backup file.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    raw_export = b'{"encrypted": false, "folders": [], "items": []}'
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.stdout = io.BytesIO(raw_export)
+    proc.returncode = 0
+    backup_file = tmp_path / "backup.enc"
+
+    client = BitwardenClient(session="test_session")
+    client.export_raw_encrypted(str(backup_file), "file_pw")
+
+    args, kwargs = mock_popen.call_args
+    assert args[0] == ["bw", "export", "--format", "json", "--raw"]
+    assert kwargs["env"]["BW_SESSION"] == "test_session"
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert decrypted.getvalue() == raw_export
+    assert not (tmp_path / "backup.enc.partial").exists()
+
+
+@patch("src.bw_client.Popen")
+def test_export_raw_encrypted_links_unchanged_export(mock_popen, tmp_path, monkeypatch):
+    """
+    Tests that a streamed export identical to the previous one is discarded
+    and the previous backup hardlinked in its place.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.returncode = 0
+    client = BitwardenClient(session="test_session", kdf_salt=b"s" * 16)
+
+    for name in ("backup_1.enc", "backup_2.enc"):
+        proc.stdout = io.BytesIO(b'{"items": []}')
+        client.export_raw_encrypted(str(tmp_path / name), "file_pw")
+
+    assert os.path.samefile(tmp_path / "backup_1.enc", tmp_path / "backup_2.enc")
+    assert not (tmp_path / "backup_2.enc.partial").exists()
+
+
+@pytest.mark.parametrize(
+    "output,returncode",
+    [(b"", 1), (b"You are not logged in.", 0), (b'{"items": [', 0)],
+)
+@patch("src.bw_client.Popen")
+def test_export_raw_encrypted_cli_failure(
+    mock_popen, tmp_path, monkeypatch, output, returncode
+):
+    """
+    Tests that a failing `bw export`, or one that did not write a whole JSON
+    export, raises and leaves no backup behind.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.stdout = io.BytesIO(output)
+    proc.returncode = returncode
+    backup_file = tmp_path / "backup.enc"
+
+    client = BitwardenClient(session="test_session")
+    with pytest.raises(BitwardenError):
+        client.export_raw_encrypted(str(backup_file), "file_pw")
+    assert list(tmp_path.iterdir()) == []
+
+
+@patch("src.bw_client.sprun")
+def test_run_does_not_leak_session_between_clients(mock_sprun):
+    """
+    Tests that each _run call gets a fresh environment, so one client's
+    BW_SESSION never reaches another client's process.
+    """
+    mock_sprun.return_value.stdout = "OK"
+    mock_sprun.return_value.stderr = ""
+    mock_sprun.return_value.returncode = 0
+    first = BitwardenClient(session="first_session", appdata_dir=None)
+    second = BitwardenClient()
+    first._run(["status"], capture_json=False)
+    second._run(["status"], capture_json=False)
+    first_env = mock_sprun.call_args_list[0].kwargs["env"]
+    second_env = mock_sprun.call_args_list[1].kwargs["env"]
+    assert first_env["BW_SESSION"] == "first_session"
+    assert "BW_SESSION" not in second_env
+
+
+@patch("src.bw_client.sprun")
+def test_appdata_dir_is_passed_to_cli(mock_sprun, tmp_path):
+    """
+    Tests that a client with its own appdata dir points every bw process at it.
+    """
+    mock_sprun.return_value.stdout = "OK"
+    mock_sprun.return_value.stderr = ""
+    mock_sprun.return_value.returncode = 0
+    appdata_dir = str(tmp_path / "alice")
+    client = BitwardenClient(server="https://vault.example", appdata_dir=appdata_dir)
+    client._run(["status"], capture_json=False)
+    for call in mock_sprun.call_args_list:
+        assert call.kwargs["env"]["BITWARDENCLI_APPDATA_DIR"] == appdata_dir
+    assert os.path.isdir(appdata_dir)
+
+
+@patch("src.bw_client.sprun")
+def test_open_attachment_via_cli(mock_sprun):
+    """
+    Tests that attachments are saved by `bw get attachment` into a private
+    temporary file that is removed once it has been read.
+    """
+
+    def save(cmd, **kwargs):
+        with open(cmd[cmd.index("--output") + 1], "wb") as f:
+            f.write(b"attachment bytes")
+        return CompletedProcess(cmd, 0, stdout="Saved", stderr="")
+
+    mock_sprun.side_effect = save
+    client = BitwardenClient(session="test_session")
+    with client.open_attachment(AttachmentRef("item1", "att1")) as f:
+        assert f.read() == b"attachment bytes"
+        output = f.name
+
+    cmd = mock_sprun.call_args.args[0]
+    assert cmd[:5] == ["bw", "get", "attachment", "att1", "--itemid"]
+    assert cmd[5] == "item1"
+    assert mock_sprun.call_args.kwargs["check"] is False
+    assert not os.path.exists(os.path.dirname(output))
+
+
+def test_export_item_counter_across_chunks():
+    """
+    Tests that items and folders are counted when their markers straddle
+    chunks, and that escaped quotes in values never match.
+    """
+    raw_export = json.dumps(
+        {
+            "encrypted": False,
+            "folders": [{"id": str(i), "name": f'f{i} "name":'} for i in range(3)],
+            "items": [
+                {"id": str(i), "name": "item", "revisionDate": "x"} for i in range(5)
+            ],
+        },
+        indent=2,
+    ).encode()
+    for size in (1, 7, 4096):
+        hasher = hashlib.sha256()
+        counter = _ExportItemCounter(hasher)
+        for start in range(0, len(raw_export), size):
+            counter.update(raw_export[start : start + size])
+        assert (counter.count, counter.folders) == (5, 3)
+        assert hasher.digest() == hashlib.sha256(raw_export).digest()
+
+
+@pytest.mark.parametrize("end", [b"", b"\r\n"])
+def test_csv_record_counter(end):
+    """
+    Tests that CSV records are counted at any chunk size, with line breaks
+    and escaped quotes inside quoted fields and with or without a final
+    line break.
+    """
+    export = (
+        b"folder,favorite,type,name,notes\r\n"
+        b',,login,a,"two\r\nlines"\r\n'
+        b',1,note,"say ""hi""","x"\r\n'
+        b',,login,"""quoted\nstart""",' + end
+    )
+    for size in (1, 5, 4096):
+        hasher = hashlib.sha256()
+        counter = _CsvRecordCounter(hasher)
+        for start in range(0, len(export), size):
+            counter.update(export[start : start + size])
+        assert counter.count == 3
+        assert hasher.digest() == hashlib.sha256(export).digest()
+
+
+@patch("src.bw_client.Popen")
+def test_export_raw_encrypted_reports_catalog_stats(mock_popen, tmp_path, monkeypatch):
+    """
+    Tests that a streamed export reports its counts and the SHA-256 of the
+    file it wrote, and that a linked export reports the earlier file's hash.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    proc = mock_popen.return_value.__enter__.return_value
+    proc.returncode = 0
+    client = BitwardenClient(session="test_session", kdf_salt=b"s" * 16)
+
+    hashes = []
+    for name in ("backup_1.enc", "backup_2.enc"):
+        proc.stdout = io.BytesIO(
+            b'{"folders": [{"id": "1", "name": "f"}], "items": [{"revisionDate": 1}]}'
+        )
+        with catalog.collect() as stats:
+            client.export_raw_encrypted(str(tmp_path / name), "file_pw")
+        assert (stats["items"], stats["folders"]) == (1, 1)
+        hashes.append(stats["sha256"])
+
+    digest = hashlib.sha256((tmp_path / "backup_1.enc").read_bytes()).hexdigest()
+    assert hashes == [digest, digest]
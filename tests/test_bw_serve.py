@@ -0,0 +1,243 @@
+import io
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from src import crypto
+from src.bw_client import BitwardenClient, BitwardenError
+from src.bw_serve import BwServe, BwServeError
+from src.crypto import decrypt_stream
+from src.export_format import iter_json
+
+FOLDERS = [
+    {"object": "folder", "id": "f1", "name": "Work"},
+    {"object": "folder", "id": None, "name": "No Folder"},
+]
+ITEMS = [
+    {"object": "item", "id": "i1", "organizationId": None, "name": "Café"},
+    {"object": "item", "id": "i2", "organizationId": "org1", "name": "Shared"},
+]
+
+
+class StubBwServe(BaseHTTPRequestHandler):
+    """Stands in for the `bw serve` Vault Management API."""
+
+    protocol_version = "HTTP/1.1"
+    connections: set = set()
+    paths: list = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        self.connections.add(self.client_address)
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        if self.path == "/status":
+            self._reply(
+                200,
+                {
+                    "success": True,
+                    "data": {"object": "template", "template": {"status": "unlocked"}},
+                },
+            )
+        elif self.path == "/list/object/folders":
+            self._reply(200, {"success": True, "data": {"data": FOLDERS}})
+        elif self.path == "/list/object/items":
+            self._reply(200, {"success": True, "data": {"data": ITEMS}})
+        else:
+            self._reply(404, {"success": False, "message": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/unlock":
+            if body.get("password") == "master_pw":
+                self._reply(200, {"success": True, "data": {"raw": "serve_session"}})
+            else:
+                self._reply(
+                    400, {"success": False, "message": "Invalid master password."}
+                )
+        elif self.path == "/sync":
+            self._reply(200, {"success": True, "data": {"title": "Syncing complete."}})
+        else:
+            self._reply(404, {"success": False, "message": "Not found"})
+
+
+@pytest.fixture
+def stub_server():
+    StubBwServe.connections = set()
+    StubBwServe.paths = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBwServe)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def serve(stub_server):
+    with patch("src.bw_serve.Popen") as mock_popen:
+        mock_popen.return_value.poll.return_value = None
+        instance = BwServe(port=stub_server.server_address[1])
+        instance.start()
+        yield instance
+        instance.stop()
+
+
+def test_bw_serve_start_command(stub_server):
+    """
+    Tests that `bw serve` is started bound to the loopback interface.
+    """
+    with patch("src.bw_serve.Popen") as mock_popen:
+        mock_popen.return_value.poll.return_value = None
+        instance = BwServe(port=stub_server.server_address[1])
+        instance.start()
+        instance.stop()
+    args = mock_popen.call_args[0][0]
+    assert args == [
+        "bw",
+        "serve",
+        "--hostname",
+        "127.0.0.1",
+        "--port",
+        str(stub_server.server_address[1]),
+    ]
+    mock_popen.return_value.terminate.assert_called_once()
+
+
+def test_bw_serve_exits_during_startup():
+    """
+    Tests that a `bw serve` process dying on startup raises BwServeError.
+    """
+    with patch("src.bw_serve.Popen") as mock_popen:
+        mock_popen.return_value.poll.return_value = 1
+        mock_popen.return_value.returncode = 1
+        with pytest.raises(BwServeError, match="exited during startup"):
+            BwServe().start()
+
+
+def test_bw_serve_requests_reuse_connection(serve):
+    """
+    Tests that API calls share one keep-alive HTTP connection.
+    """
+    assert serve.unlock("master_pw") == "serve_session"
+    assert serve.status() == {"status": "unlocked"}
+    serve.sync()
+    assert serve.list_objects("items") == ITEMS
+    assert len(StubBwServe.connections) == 1
+
+
+def test_bw_serve_api_failure(serve):
+    """
+    Tests that an unsuccessful API response raises BwServeError.
+    """
+    with pytest.raises(BwServeError, match="Invalid master password"):
+        serve.unlock("wrong")
+
+
+@patch("src.bw_client.sprun")
+def test_client_serve_transport(mock_sprun, serve, tmp_path, monkeypatch):
+    """
+    Tests that BitwardenClient drives unlock, status, listing and raw export
+    through `bw serve` and writes the personal vault in export layout.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    client = BitwardenClient(transport="serve")
+    client._serve = serve
+
+    assert client.unlock("master_pw") == "serve_session"
+    assert client.session == "serve_session"
+    assert client.status() == {"status": "unlocked"}
+    assert client.list_items() == ITEMS
+
+    backup_file = tmp_path / "backup.enc"
+    client.export_raw_encrypted(str(backup_file), "file_pw")
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    export = json.loads(decrypted.getvalue())
+    assert export == {
+        "encrypted": False,
+        "folders": [{"id": "f1", "name": "Work"}],
+        "items": [{"id": "i1", "organizationId": None, "name": "Café"}],
+    }
+    # Serialized like the native engine's exports, non-ASCII included
+    assert decrypted.getvalue() == b"".join(iter_json(export))
+    mock_sprun.assert_not_called()
+
+
+@patch("src.bw_client.sprun")
+def test_client_serve_export_leaves_listing_alone(
+    mock_sprun, serve, tmp_path, monkeypatch
+):
+    """
+    Tests that building the export from `bw serve` listings copies the
+    listed objects instead of trimming them in place.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    listed = {
+        "folders": json.loads(json.dumps(FOLDERS)),
+        "items": json.loads(json.dumps(ITEMS)),
+    }
+    monkeypatch.setattr(serve, "list_objects", lambda kind: listed[kind])
+    client = BitwardenClient(transport="serve")
+    client._serve = serve
+    client.unlock("master_pw")
+
+    client.export_raw_encrypted(str(tmp_path / "backup.enc"), "file_pw")
+    assert listed == {"folders": FOLDERS, "items": ITEMS}
+
+
+@patch("src.bw_client.sprun")
+def test_client_serve_shares_listing(mock_sprun, serve, tmp_path, monkeypatch):
+    """
+    Tests that the raw and CSV exports written inside shared_export() list
+    the vault through `bw serve` once, and that the CSV export decrypts to
+    the CLI's CSV layout.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    client = BitwardenClient(transport="serve")
+    client._serve = serve
+    client.unlock("master_pw")
+
+    with client.shared_export():
+        client.export_raw_encrypted(str(tmp_path / "raw.enc"), "file_pw")
+        client.export_csv_encrypted(str(tmp_path / "csv.enc"), "file_pw")
+    assert StubBwServe.paths.count("/list/object/items") == 1
+    client.export_raw_encrypted(str(tmp_path / "again.enc"), "file_pw")
+    assert StubBwServe.paths.count("/list/object/items") == 2
+
+    decrypted = io.BytesIO()
+    with open(tmp_path / "csv.enc", "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert decrypted.getvalue().startswith(b"folder,favorite,type,name,")
+    mock_sprun.assert_not_called()
+
+
+@patch("src.bw_client.sprun")
+def test_client_serve_unlock_failure(mock_sprun, serve):
+    """
+    Tests that API failures surface as BitwardenError.
+    """
+    client = BitwardenClient(transport="serve")
+    client._serve = serve
+    with pytest.raises(BitwardenError):
+        client.unlock("wrong")
+
+
+def test_client_invalid_transport():
+    """
+    Tests that an unknown transport is rejected.
+    """
+    with pytest.raises(BitwardenError, match="Invalid transport"):
+        BitwardenClient(transport="grpc")
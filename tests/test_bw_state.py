@@ -0,0 +1,88 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+from src.bw_state import CliState, read_cli_state
+
+USER_ID = "4f3c1f6e-0000-4000-8000-000000000001"
+SESSION = base64.b64encode(os.urandom(64)).decode("ascii")
+
+
+def protect(session: str) -> str:
+    key = base64.b64decode(session)
+    iv, ciphertext = os.urandom(16), os.urandom(32)
+    mac = hmac.new(key[32:], iv + ciphertext, hashlib.sha256).digest()
+    return "2." + "|".join(
+        base64.b64encode(part).decode("ascii") for part in (iv, ciphertext, mac)
+    )
+
+
+def write_data(tmp_path, data):
+    (tmp_path / "data.json").write_text(json.dumps(data))
+    return read_cli_state(str(tmp_path))
+
+
+def test_read_current_layout(tmp_path):
+    """
+    Tests that the flat layout of current CLI versions is read, with the
+    session checked against the protected user key.
+    """
+    state = write_data(
+        tmp_path,
+        {
+            "global_environment_environment": {
+                "region": "Self-hosted",
+                "urls": {"base": "https://vault.example/"},
+            },
+            "global_account_activeAccountId": USER_ID,
+            "global_account_accounts": {USER_ID: {"email": "me@example.com"}},
+            f"user_{USER_ID}_sync_lastSync": "2025-01-01T00:00:00.000Z",
+            f"__PROTECTED__{USER_ID}_user_auto": protect(SESSION),
+        },
+    )
+    assert state.as_status(SESSION) == {
+        "serverUrl": "https://vault.example",
+        "lastSync": "2025-01-01T00:00:00.000Z",
+        "userEmail": "me@example.com",
+        "userId": USER_ID,
+        "status": "unlocked",
+    }
+    other = base64.b64encode(os.urandom(64)).decode("ascii")
+    assert state.status(other) == "locked"
+    assert state.status(None) == "locked"
+    assert state.status("not base64!") == "locked"
+
+
+def test_read_legacy_layout(tmp_path):
+    """Tests that the nested layout of older CLI versions is read."""
+    state = write_data(
+        tmp_path,
+        {
+            "activeUserId": USER_ID,
+            "global": {"environmentUrls": {"base": "https://old.example"}},
+            USER_ID: {
+                "profile": {"email": "me@example.com", "lastSync": "2024-01-01"},
+            },
+        },
+    )
+    assert state.server_url == "https://old.example"
+    assert state.user_email == "me@example.com"
+    assert state.status(SESSION) == "locked"
+
+
+def test_unknown_state_falls_back(tmp_path):
+    """
+    Tests that a missing, corrupt or unrecognized data.json is left to
+    `bw status`, while a configured but unused CLI is read.
+    """
+    assert read_cli_state(str(tmp_path)) is None
+    (tmp_path / "data.json").write_text("{")
+    assert read_cli_state(str(tmp_path)) is None
+    assert write_data(tmp_path, {f"user_{USER_ID}_token_accessToken": "x"}) is None
+    state = write_data(
+        tmp_path,
+        {"global_environment_environment": {"region": "EU", "urls": {}}},
+    )
+    assert state == CliState(server_url="https://vault.bitwarden.eu")
+    assert state.status(SESSION) == "unauthenticated"
@@ -0,0 +1,119 @@
+import json
+from dataclasses import asdict
+from datetime import datetime
+from src.catalog import INDEX_FILE, load_index, main, record_backup, record_removed
+
+
+def test_existing_backups_are_indexed_once(tmp_path):
+    """
+    Tests that a dir without an index is scanned once, and that later reads
+    come from the index alone.
+    """
+    (tmp_path / "backup_20250101_000000.enc").write_bytes(b"old")
+    (tmp_path / "backup_20250101_000000.attachments.enc").write_bytes(b"m")
+    (tmp_path / "notes.txt").write_bytes(b"x")
+
+    entries = load_index(str(tmp_path))
+    assert [(e.file, e.size, e.attachments) for e in entries] == [
+        (
+            "backup_20250101_000000.enc",
+            3,
+            "backup_20250101_000000.attachments.enc",
+        )
+    ]
+    assert entries[0].created == datetime(2025, 1, 1).timestamp()
+    assert entries[0].blobs is None
+
+    # Not rescanned: a backup that was never recorded stays invisible
+    (tmp_path / "backup_20250102_000000.enc").write_bytes(b"x")
+    assert len(load_index(str(tmp_path))) == 1
+
+
+def test_record_and_remove(tmp_path):
+    """
+    Tests that recorded backups are listed oldest first, removals are
+    applied, and a torn last line is ignored.
+    """
+    for day in (3, 1, 2):
+        path = tmp_path / f"backup_2025010{day}_000000.enc"
+        path.write_bytes(b"x" * day)
+        record_backup(str(path), blobs=["b", "a", "b"])
+    record_removed(str(tmp_path), [str(tmp_path / "backup_20250102_000000.enc")])
+    with open(tmp_path / INDEX_FILE, "a") as f:
+        f.write('{"op": "add", "fi')
+
+    entries = load_index(str(tmp_path))
+    assert [e.file for e in entries] == [
+        "backup_20250101_000000.enc",
+        "backup_20250103_000000.enc",
+    ]
+    assert [e.size for e in entries] == [1, 3]
+    assert entries[0].blobs == ["a", "b"]
+
+
+def test_index_is_compacted(tmp_path):
+    """Tests that an index full of removed backups is rewritten compactly."""
+    path = tmp_path / "backup_20250101_000000.enc"
+    path.write_bytes(b"x")
+    entry = record_backup(str(path))
+    add = json.dumps({"op": "add", **asdict(entry)})
+    remove = json.dumps({"op": "remove", "file": path.name})
+    (tmp_path / INDEX_FILE).write_text(f"{add}\n{remove}\n" * 100 + f"{add}\n")
+
+    assert load_index(str(tmp_path)) == [entry]
+    lines = (tmp_path / INDEX_FILE).read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [json.loads(add)]
+
+
+def test_list_and_show(tmp_path, capsys):
+    """Tests the list and show commands across profile dirs."""
+    work = tmp_path / "work"
+    work.mkdir()
+    first = tmp_path / "backup_20250101_000000.enc"
+    second = work / "backup_20250102_000000.enc"
+    for path in (first, second):
+        path.write_bytes(b"x" * 2048)
+    record_backup(str(first), profile="default", mode="raw", sha256="ab" * 32)
+    record_backup(
+        str(second),
+        profile="work",
+        mode="bitwarden",
+        items=12,
+        folders=3,
+        phases={"export": 1.5},
+    )
+
+    assert main(["--backup-dir", str(tmp_path), "list"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == [
+        "created",
+        "profile",
+        "mode",
+        "size",
+        "items",
+        "folders",
+        "sha256",
+        "file",
+    ]
+    assert lines[1].split()[2:] == [
+        "default",
+        "raw",
+        "2.0",
+        "KiB",
+        "-",
+        "-",
+        "abababababab",
+        first.name,
+    ]
+    assert lines[2].split()[2:7] == ["work", "bitwarden", "2.0", "KiB", "12"]
+
+    assert main(["--backup-dir", str(tmp_path), "list", "--profile", "work"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 2
+
+    assert main(["--backup-dir", str(tmp_path), "show", second.name]) == 0
+    shown = json.loads(capsys.readouterr().out)
+    assert shown["path"] == str(second)
+    assert shown["phases"] == {"export": 1.5}
+    assert shown["folders"] == 3
+
+    assert main(["--backup-dir", str(tmp_path), "show", "backup_missing.enc"]) == 1
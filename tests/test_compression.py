@@ -0,0 +1,21 @@
+import pytest
+from src.compression import CODECS, parse_compression
+
+
+def test_parse_compression():
+    """
+    Tests codec and level parsing, including defaults and "none".
+    """
+    assert parse_compression(None) == (None, None)
+    assert parse_compression("none") == (None, None)
+    assert parse_compression("zlib") == (CODECS["zlib"], 6)
+    assert parse_compression("LZMA:9") == (CODECS["lzma"], 9)
+
+
+@pytest.mark.parametrize("spec", ["zstd", "zlib:10", "bz2:0", "zlib:fast"])
+def test_parse_compression_invalid(spec):
+    """
+    Tests that unknown codecs and out-of-range levels are rejected.
+    """
+    with pytest.raises(ValueError):
+        parse_compression(spec)
@@ -0,0 +1,267 @@
+import io
+import os
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from src import crypto
+from src.crypto import (
+    FORMAT_V2,
+    HEADER_V2,
+    HEADER_V3,
+    MAGIC,
+    TAG_SIZE,
+    BackupFormatError,
+    decrypt_stream,
+    derive_key,
+    encrypt_stream,
+)
+
+CHUNK_SIZE = 64
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    """Keep PBKDF2 cheap so the format tests stay fast."""
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    crypto._master_keys.clear()
+
+
+def _encrypt(data: bytes, password: str = "pw") -> bytes:
+    out = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), out, password, chunk_size=CHUNK_SIZE)
+    return out.getvalue()
+
+
+def _decrypt(data: bytes, password: str = "pw") -> bytes:
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(data), out, password)
+    return out.getvalue()
+
+
+def _records(blob: bytes) -> list[bytes]:
+    body = blob[HEADER_V3.size :]
+    size = CHUNK_SIZE + TAG_SIZE
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE, CHUNK_SIZE * 3, CHUNK_SIZE * 3 + 5])
+def test_encrypt_stream_roundtrip(size):
+    """
+    Tests that chunked containers decrypt back to the original plaintext,
+    including empty input and exact multiples of the chunk size.
+    """
+    data = os.urandom(size)
+    blob = _encrypt(data)
+    assert blob.startswith(MAGIC)
+    assert _decrypt(blob) == data
+
+
+def test_encrypt_stream_returns_plaintext_size():
+    """
+    Tests that encrypt_stream reports the number of plaintext bytes consumed.
+    """
+    assert encrypt_stream(io.BytesIO(b"x" * 100), io.BytesIO(), "pw", CHUNK_SIZE) == 100
+
+
+def test_decrypt_stream_wrong_password():
+    """
+    Tests that a wrong password fails authentication.
+    """
+    blob = _encrypt(b"secret vault")
+    with pytest.raises(InvalidTag):
+        _decrypt(blob, "wrong")
+
+
+def test_decrypt_stream_detects_truncation():
+    """
+    Tests that dropping trailing chunks is detected, even on a chunk boundary.
+    """
+    blob = _encrypt(os.urandom(CHUNK_SIZE * 3 + 5))
+    records = _records(blob)
+    truncated = blob[: HEADER_V3.size] + b"".join(records[:-1])
+    with pytest.raises(InvalidTag):
+        _decrypt(truncated)
+    with pytest.raises(BackupFormatError):
+        _decrypt(blob[: HEADER_V3.size])
+
+
+def test_decrypt_stream_detects_reordering():
+    """
+    Tests that swapping two chunks is detected.
+    """
+    blob = _encrypt(os.urandom(CHUNK_SIZE * 3 + 5))
+    records = _records(blob)
+    records[0], records[1] = records[1], records[0]
+    with pytest.raises(InvalidTag):
+        _decrypt(blob[: HEADER_V3.size] + b"".join(records))
+
+
+def test_decrypt_stream_detects_header_tampering():
+    """
+    Tests that the header is authenticated with every chunk.
+    """
+    blob = bytearray(_encrypt(b"secret vault"))
+    blob[HEADER_V3.size - 1] ^= 0x01  # chunk size field
+    with pytest.raises((InvalidTag, BackupFormatError)):
+        _decrypt(bytes(blob))
+
+
+def test_decrypt_stream_legacy_v1():
+    """
+    Tests that v1 files (salt + nonce + ciphertext) remain readable.
+    """
+    salt = os.urandom(16)
+    nonce = os.urandom(12)
+    ciphertext = AESGCM(derive_key("pw", salt)).encrypt(nonce, b'{"items": []}', None)
+    assert _decrypt(salt + nonce + ciphertext) == b'{"items": []}'
+
+
+@pytest.mark.parametrize("enc_workers,dec_workers", [(4, 1), (1, 4), (3, 3)])
+def test_parallel_encrypt_decrypt_roundtrip(enc_workers, dec_workers):
+    """
+    Tests that chunks processed on a thread pool are reassembled in order and
+    that the output does not depend on the worker count.
+    """
+    data = os.urandom(CHUNK_SIZE * 20 + 7)
+    blob = io.BytesIO()
+    size = encrypt_stream(
+        io.BytesIO(data), blob, "pw", chunk_size=CHUNK_SIZE, workers=enc_workers
+    )
+    assert size == len(data)
+    out = io.BytesIO()
+    size = decrypt_stream(io.BytesIO(blob.getvalue()), out, "pw", dec_workers)
+    assert size == len(data)
+    assert out.getvalue() == data
+
+
+def test_parallel_decrypt_detects_reordering():
+    """
+    Tests that tampering is still detected when decrypting in parallel.
+    """
+    blob = _encrypt(os.urandom(CHUNK_SIZE * 8))
+    records = _records(blob)
+    records[2], records[5] = records[5], records[2]
+    with pytest.raises(InvalidTag):
+        decrypt_stream(
+            io.BytesIO(blob[: HEADER_V3.size] + b"".join(records)),
+            io.BytesIO(),
+            "pw",
+            workers=4,
+        )
+
+
+def test_decrypt_stream_legacy_v2():
+    """
+    Tests that v2 files (one PBKDF2 key per file) remain readable.
+    """
+    salt = os.urandom(16)
+    prefix = os.urandom(7)
+    header = HEADER_V2.pack(MAGIC, FORMAT_V2, 0, salt, 1000, prefix, CHUNK_SIZE)
+    aesgcm = AESGCM(derive_key("pw", salt, 1000))
+    data = os.urandom(CHUNK_SIZE + 5)
+    records = [
+        aesgcm.encrypt(prefix + bytes(4) + b"\x00", data[:CHUNK_SIZE], header),
+        aesgcm.encrypt(
+            prefix + (1).to_bytes(4, "big") + b"\x01", data[CHUNK_SIZE:], header
+        ),
+    ]
+    assert _decrypt(header + b"".join(records)) == data
+
+
+def test_master_key_is_derived_once(monkeypatch):
+    """
+    Tests that files sharing a kdf salt cost one PBKDF2 run in total, while
+    every file still gets its own salt and key.
+    """
+    calls = []
+    original = crypto.derive_key
+    monkeypatch.setattr(
+        crypto,
+        "derive_key",
+        lambda *args: calls.append(args) or original(*args),
+    )
+    kdf_salt = os.urandom(16)
+    blobs = []
+    for _ in range(3):
+        out = io.BytesIO()
+        encrypt_stream(io.BytesIO(b"vault"), out, "pw", CHUNK_SIZE, kdf_salt=kdf_salt)
+        blobs.append(out.getvalue())
+    assert all(_decrypt(blob) == b"vault" for blob in blobs)
+    assert len(calls) == 1
+    headers = [HEADER_V3.unpack(blob[: HEADER_V3.size]) for blob in blobs]
+    assert {h[3] for h in headers} == {kdf_salt}
+    assert len({h[5] for h in headers}) == 3
+    with pytest.raises(InvalidTag):
+        _decrypt(blobs[0], "wrong")
+
+
+def test_master_key_cache_holds_no_passwords():
+    """Tests that cached master keys are not looked up by the plain password."""
+    crypto.master_key("file_pw", b"s" * 16, 1000)
+    assert len(crypto._master_keys) == 1
+    assert not any(
+        b"file_pw" in part or part == "file_pw"
+        for cache_key in crypto._master_keys
+        for part in cache_key
+        if isinstance(part, (bytes, str))
+    )
+
+
+@pytest.mark.parametrize("iterations", [0, crypto.MAX_PBKDF2_ITERATIONS + 1])
+def test_decrypt_stream_rejects_header_iterations(monkeypatch, iterations):
+    """
+    Tests that an iteration count outside the supported range is refused
+    before any key is derived, so a crafted header cannot stall a restore.
+    """
+    blob = _encrypt(b"vault")
+    fields = list(HEADER_V3.unpack(blob[: HEADER_V3.size]))
+    fields[4] = iterations
+    monkeypatch.setattr(crypto, "derive_key", lambda *args: pytest.fail("derived"))
+    with pytest.raises(BackupFormatError, match="iteration count"):
+        _decrypt(HEADER_V3.pack(*fields) + blob[HEADER_V3.size :])
+
+
+def test_decrypt_stream_unknown_version():
+    """
+    Tests that containers from a newer format version are rejected clearly.
+    """
+    blob = bytearray(_encrypt(b"secret vault"))
+    blob[len(MAGIC)] = 9
+    with pytest.raises(BackupFormatError, match="version"):
+        _decrypt(bytes(blob))
+
+
+@pytest.mark.parametrize("compression", ["zlib", "zlib:1", "lzma:0", "bz2"])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_compressed_roundtrip(compression, workers):
+    """
+    Tests that compressed containers record the codec in the header flags,
+    shrink repetitive JSON and decrypt back to the original plaintext.
+    """
+    data = b'{"name": "login", "password": "hunter2"}, ' * 500
+    out = io.BytesIO()
+    size = encrypt_stream(
+        io.BytesIO(data),
+        out,
+        "pw",
+        CHUNK_SIZE,
+        workers=workers,
+        compression=compression,
+    )
+    blob = out.getvalue()
+    assert size == len(data)
+    assert blob[len(MAGIC) + 1] != 0
+    assert len(blob) < len(data) / 4
+    decrypted = io.BytesIO()
+    assert decrypt_stream(io.BytesIO(blob), decrypted, "pw", workers) == len(data)
+    assert decrypted.getvalue() == data
+
+
+def test_compressed_unknown_codec_rejected():
+    """
+    Tests that a codec id this version does not know is reported as such.
+    """
+    blob = bytearray(_encrypt(b"secret vault"))
+    blob[len(MAGIC) + 1] = 0x0F
+    with pytest.raises(BackupFormatError, match="flags"):
+        _decrypt(bytes(blob))
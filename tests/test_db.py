@@ -1,23 +1,33 @@
 from unittest.mock import patch, MagicMock, mock_open
-from src.db import init_db, db_connect, put_key, get_key
+from src import metrics
+from src.db import (
+    CredentialStore,
+    init_db,
+    db_connect,
+    put_key,
+    get_key,
+    get_kdf_salt,
+    put_profile,
+    list_profiles,
+    delete_profile,
+    get_session,
+    get_sessions,
+    put_session,
+    put_sessions,
+    delete_session,
+)
+import pytest
 import sqlcipher3
 
 
 @patch("src.db.sqlcipher3.connect")
 @patch("src.db.open", new_callable=mock_open)
-@patch("src.db.hashlib.sha512")
-@patch("src.db.uuid.uuid4")
-@patch("src.db.base64.urlsafe_b64encode")
-def test_init_db_new_pragma_key(
-    mock_b64encode, mock_uuid, mock_sha512, mock_file_open, mock_sql_connect
-):
+@patch("src.db.os.urandom", return_value=b"\xab" * 32)
+def test_init_db_new_pragma_key(mock_urandom, mock_file_open, mock_sql_connect):
     """
-    Tests that init_db creates a new pragma key when one doesn't exist.
+    Tests that init_db creates a new raw pragma key when one doesn't exist.
     """
     mock_file_open.side_effect = [FileNotFoundError, MagicMock()]
-    mock_uuid.return_value.bytes = b"test_uuid_bytes"
-    mock_b64encode.return_value = b"test_b64_encoded_uuid"
-    mock_sha512.return_value.digest.return_value = b"test_digest"
 
     init_db("test.db", "test.key")
 
@@ -26,7 +36,7 @@ def test_init_db_new_pragma_key(
     mock_sql_connect.assert_called_once_with("test.db")
     conn = mock_sql_connect.return_value
     cursor = conn.cursor.return_value
-    cursor.execute.assert_any_call("PRAGMA key='test_b64_encoded_uuid';")
+    cursor.execute.assert_any_call(f"""PRAGMA key = "x'{"ab" * 32}'";""")
     cursor.execute.assert_any_call("""
             CREATE TABLE IF NOT EXISTS keys (
                 name TEXT PRIMARY KEY,
@@ -122,3 +132,115 @@ def test_get_key_bytes_value():
     conn.execute.return_value.fetchone.return_value = (b"test_value",)
     value = get_key(conn, "test_name")
     assert value == "test_value"
+
+
+def test_profiles_roundtrip(tmp_path):
+    """
+    Tests that named vault profiles can be stored, listed and removed.
+    """
+    conn = sqlcipher3.connect(str(tmp_path / "profiles.db"))
+    assert list_profiles(conn) == []
+    put_profile(conn, "bob", "id_b", "secret_b", "master_b", "file_b")
+    put_profile(conn, "alice", "id_a", "secret_a", "master_a", "file_a", "https://a")
+    profiles = list_profiles(conn)
+    assert [p["name"] for p in profiles] == ["alice", "bob"]
+    assert profiles[0] == {
+        "name": "alice",
+        "client_id": "id_a",
+        "client_secret": "secret_a",
+        "master_password": "master_a",
+        "file_password": "file_a",
+        "server": "https://a",
+    }
+    assert delete_profile(conn, "bob")
+    assert not delete_profile(conn, "bob")
+    assert [p["name"] for p in list_profiles(conn)] == ["alice"]
+    conn.close()
+
+
+def test_get_kdf_salt_is_created_once(tmp_path):
+    """
+    Tests that the kdf salt is generated on first use and then stays stable.
+    """
+    conn = sqlcipher3.connect(str(tmp_path / "salt.db"))
+    conn.execute("CREATE TABLE keys (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    salt = get_kdf_salt(conn)
+    assert len(salt) == 16
+    assert get_kdf_salt(conn) == salt
+    assert get_key(conn, "kdf_salt") == salt.hex()
+    conn.close()
+
+
+def test_sessions_roundtrip(tmp_path):
+    """Tests that a stored CLI session can be read back and forgotten."""
+    conn = sqlcipher3.connect(str(tmp_path / "sessions.db"))
+    conn.execute("CREATE TABLE keys (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    assert get_session(conn, "default") is None
+    stored = {"session": "abc", "logged_in": 1.5, "client_id": "id", "server": "s"}
+    put_session(conn, "default", stored)
+    assert get_session(conn, "default") == stored
+    assert get_session(conn, "work") is None
+    delete_session(conn, "default")
+    assert get_session(conn, "default") is None
+    conn.close()
+
+
+def test_sessions_batched(tmp_path):
+    """Tests that sessions of several profiles are read and written at once."""
+    conn = sqlcipher3.connect(str(tmp_path / "sessions.db"))
+    conn.execute("CREATE TABLE keys (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    put_sessions(conn, {"default": {"session": "a"}, "work": {"session": "b"}})
+    assert get_sessions(conn, ["default", "work", "home"]) == {
+        "default": {"session": "a"},
+        "work": {"session": "b"},
+    }
+    put_sessions(conn, {"default": None, "home": {"session": "c"}})
+    assert get_sessions(conn, ["default", "work", "home"]) == {
+        "work": {"session": "b"},
+        "home": {"session": "c"},
+    }
+    conn.close()
+
+
+@pytest.mark.parametrize("interrupted", [False, True])
+def test_credential_store_rekeys_with_raw_key(tmp_path, interrupted):
+    """
+    Tests that a database keyed with a passphrase is moved to a raw key on
+    first open, also when a previous rekey stopped before the key file was
+    replaced, and that reads and writes are batched and timed.
+    """
+    db_path, key_file = str(tmp_path / "backvault.db"), tmp_path / "backvault.pragma"
+    key_file.write_text("key='passphrase';")
+    conn, _ = db_connect(db_path, str(key_file))
+    put_key(conn, "client_id", "id")
+    if interrupted:
+        conn.execute("""PRAGMA rekey = "x'{}'";""".format("ab" * 32))
+        (tmp_path / "backvault.pragma.new").write_text(
+            """key = "x'{}'";""".format("ab" * 32)
+        )
+    conn.close()
+
+    metrics.REGISTRY.reset()
+    store = CredentialStore(db_path, str(key_file))
+    assert store.open()
+    store.put_keys({"client_secret": "secret", "master_password": b"master"})
+    assert store.get_keys(["client_id", "client_secret", "master_password", "x"]) == {
+        "client_id": "id",
+        "client_secret": "secret",
+        "master_password": "master",
+    }
+    store.close()
+    assert key_file.read_text().startswith("key = \"x'")
+    assert not (tmp_path / "backvault.pragma.new").exists()
+    for operation in ("open", "read", "write"):
+        assert metrics.CREDENTIAL_STORE_SECONDS.get(operation=operation) == 1
+
+    raw_key = key_file.read_text()
+    store = CredentialStore(db_path, str(key_file))
+    assert store.open()
+    assert store.get_keys(["client_id"]) == {"client_id": "id"}
+    store.close()
+    assert key_file.read_text() == raw_key
+
+    key_file.write_text("key='wrong';")
+    assert not CredentialStore(db_path, str(key_file)).open()
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import pytest
+from src import export_format
+from src.export_format import canonical_json, iter_csv, iter_json
+from benchmarks.vaultgen import personal_export, synthetic_export
+
+
+def test_canonical_json_is_deterministic():
+    """
+    Tests that key order does not change the serialized export.
+    """
+    first = canonical_json({"items": [{"name": "é", "id": "1"}], "encrypted": False})
+    second = canonical_json({"encrypted": False, "items": [{"id": "1", "name": "é"}]})
+    assert (
+        first
+        == second
+        == '{"encrypted":false,"items":[{"id":"1","name":"é"}]}'.encode()
+    )
+    assert json.loads(first)["items"][0]["name"] == "é"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        personal_export(synthetic_export(50, org_ratio=0.3)),
+        {"items": [], "folders": [{"id": "f", "name": "é\n"}], "z": {"a": [1, []]}},
+        {},
+        [1, "x"],
+    ],
+)
+def test_iter_json_matches_whole_serialization(data, monkeypatch):
+    """
+    Tests that the pieces of iter_json add up to exactly what serializing
+    the export in one go produces.
+    """
+    monkeypatch.setattr(export_format, "JSON_PIECE_SIZE", 100)
+    assert b"".join(iter_json(data, canonical=True)) == canonical_json(data)
+    assert (
+        b"".join(iter_json(data))
+        == json.dumps(data, indent=2, ensure_ascii=False).encode()
+    )
+
+
+def test_iter_csv_matches_cli_layout(monkeypatch):
+    """
+    Tests that CSV exports have the columns of `bw export --format csv`,
+    leave out cards and identities, and survive quoting across pieces.
+    """
+    monkeypatch.setattr(export_format, "JSON_PIECE_SIZE", 16)
+    export = {
+        "encrypted": False,
+        "folders": [{"id": "f1", "name": "Work"}],
+        "items": [
+            {
+                "type": 1,
+                "folderId": "f1",
+                "favorite": True,
+                "name": "Mail, personal",
+                "notes": 'line one\nsaid "hi"',
+                "fields": [{"name": "PIN", "value": "1234", "type": 1}],
+                "reprompt": 0,
+                "login": {
+                    "uris": [
+                        {"uri": "https://a.example"},
+                        {"uri": "https://b.example"},
+                    ],
+                    "username": "alice",
+                    "password": "hunter2",
+                    "totp": None,
+                },
+            },
+            {"type": 2, "folderId": None, "name": "Note", "notes": "n", "reprompt": 1},
+            {"type": 3, "name": "Card", "card": {"number": "4111"}},
+        ],
+    }
+
+    text = b"".join(iter_csv(export)).decode("utf-8")
+    assert list(csv.reader(io.StringIO(text, newline=""))) == [
+        ["folder", "favorite", "type", "name", "notes", "fields", "reprompt"]
+        + ["login_uri", "login_username", "login_password", "login_totp"],
+        ["Work", "1", "login", "Mail, personal", 'line one\nsaid "hi"', "PIN: 1234"]
+        + ["0", "https://a.example,https://b.example", "alice", "hunter2", ""],
+        ["", "", "note", "Note", "n", "", "1", "", "", "", ""],
+    ]
+
+    organization = {
+        "encrypted": False,
+        "collections": [{"id": "c1", "name": "Shared"}],
+        "items": [{**export["items"][1], "collectionIds": ["c1", "gone"]}],
+    }
+    text = b"".join(iter_csv(organization)).decode("utf-8")
+    [header, row] = csv.reader(io.StringIO(text, newline=""))
+    assert header[:2] == ["collections", "type"]
+    assert row[:3] == ["Shared", "note", "Note"]
@@ -0,0 +1,265 @@
+import io
+import json
+import os
+import sys
+import tracemalloc
+import pytest
+from src import catalog, crypto, tracing
+from src.bw_client import BitwardenClient, BitwardenError
+from src.export_format import iter_csv
+from src.crypto import decrypt_stream
+from src.verify import verify_file
+from benchmarks.vaultgen import (
+    organization_export,
+    personal_export,
+    synthetic_export,
+)
+
+FAKE_BW = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "benchmarks", "fake_bw.py"
+)
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """Point the fake CLI at a small synthetic vault with org items and attachments."""
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    vault = synthetic_export(
+        30, org_ratio=0.3, attachment_ratio=0.3, attachment_size=100
+    )
+    vault_file = tmp_path / "vault.json"
+    vault_file.write_text(json.dumps(vault))
+    bw = tmp_path / "bw"
+    bw.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_BW}" "$@"\n')
+    bw.chmod(0o755)
+    monkeypatch.setenv("FAKE_BW_VAULT", str(vault_file))
+    monkeypatch.setenv("FAKE_BW_PASSWORD", "master_pw")
+    monkeypatch.setenv("BITWARDENCLI_APPDATA_DIR", str(tmp_path / "appdata"))
+    monkeypatch.setenv("FAKE_BW_LOG", str(tmp_path / "commands.log"))
+    return vault, str(bw)
+
+
+def test_synthetic_export_is_deterministic():
+    """
+    Tests that the generator is reproducible and that organization items and
+    attachments do not change the personal part of the vault.
+    """
+    plain = synthetic_export(50)
+    mixed = synthetic_export(50, org_ratio=0.5, attachment_ratio=0.5)
+    assert synthetic_export(50) == plain
+    assert [item["id"] for item in mixed["items"]] == [
+        item["id"] for item in plain["items"]
+    ]
+    assert any(item["organizationId"] for item in mixed["items"])
+    assert len(personal_export(mixed)["items"]) < len(mixed["items"])
+
+
+def test_backup_against_fake_bw(vault, tmp_path):
+    """
+    Tests a full CLI backup against the fake `bw`: the session has to be
+    threaded through correctly for the raw export and attachments to work.
+    """
+    vault, bw = vault
+    client = BitwardenClient(
+        bw_cmd=bw,
+        server="https://vault.example",
+        client_id="user.id",
+        client_secret="secret",
+    )
+    client.login()
+    with pytest.raises(BitwardenError):
+        client.unlock("wrong")
+    # A failed CLI command logs the session out
+    assert client.status()["status"] == "unauthenticated"
+    client.login()
+    client.unlock("master_pw")
+
+    backup_file = tmp_path / "backup.enc"
+    client.export_raw_encrypted(str(backup_file), "file_pw")
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert json.loads(decrypted.getvalue()) == personal_export(vault)
+
+    refs = client.list_attachments()
+    assert refs
+    with client.open_attachment(refs[0]) as f:
+        assert len(f.read()) == 100
+
+    client.logout()
+    assert client.status()["status"] == "unauthenticated"
+    log = (tmp_path / "commands.log").read_text()
+    assert "master_pw" not in log
+    assert "unlock [REDACTED] --raw" in log
+
+
+def test_organization_exports_against_fake_bw(vault, tmp_path, monkeypatch):
+    """
+    Tests that every organization is exported on its own with the session of
+    the personal export, and that an unknown organization fails.
+    """
+    _, bw = vault
+    vault = synthetic_export(30, org_ratio=0.5, orgs=2)
+    (tmp_path / "vault.json").write_text(json.dumps(vault))
+    client = BitwardenClient(
+        bw_cmd=bw,
+        server="https://vault.example",
+        client_id="user.id",
+        client_secret="secret",
+    )
+    client.login()
+    client.unlock("master_pw")
+
+    orgs = client.list_organizations()
+    assert len(orgs) == 2
+    for org in orgs:
+        backup_file = tmp_path / f"{org['id']}.enc"
+        client.export_raw_encrypted(
+            str(backup_file), "file_pw", organization_id=org["id"]
+        )
+        decrypted = io.BytesIO()
+        with open(backup_file, "rb") as f:
+            decrypt_stream(f, decrypted, "file_pw")
+        export = json.loads(decrypted.getvalue())
+        assert export == organization_export(vault, org["id"])
+        assert export["items"]
+
+    with pytest.raises(BitwardenError):
+        client.export_raw_encrypted(
+            str(tmp_path / "missing.enc"), "file_pw", organization_id="missing"
+        )
+
+
+def test_csv_export_against_fake_bw(vault, tmp_path):
+    """
+    Tests that a CSV export streamed out of the CLI is encrypted, counted
+    and passes verification with the counts it reported.
+    """
+    vault, bw = vault
+    client = BitwardenClient(
+        bw_cmd=bw,
+        server="https://vault.example",
+        client_id="user.id",
+        client_secret="secret",
+    )
+    client.login()
+    client.unlock("master_pw")
+
+    backup_file = tmp_path / "backup.enc"
+    with catalog.collect() as stats:
+        client.export_csv_encrypted(str(backup_file), "file_pw")
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    expected = b"".join(iter_csv(personal_export(vault)))
+    assert decrypted.getvalue() == expected.rstrip(b"\r\n") + b"\n"
+    assert stats["items"] == len(personal_export(vault)["items"])
+
+    result = verify_file(str(backup_file), "file_pw", stats)
+    assert result.ok, result.error
+    assert (result.items, result.folders) == (stats["items"], None)
+
+
+def test_raw_export_memory_against_fake_bw(vault, tmp_path):
+    """
+    Tests that a raw export streamed out of the CLI is encrypted without
+    ever being held in memory: the peak stays within a few chunk buffers
+    for an export many chunks long.
+    """
+    _, bw = vault
+    large = synthetic_export(5000)
+    large["items"] *= 5
+    with open(os.environ["FAKE_BW_VAULT"], "w") as f:
+        json.dump(large, f)
+    client = BitwardenClient(
+        bw_cmd=bw,
+        server="https://vault.example",
+        client_id="user.id",
+        client_secret="secret",
+    )
+    client.login()
+    client.unlock("master_pw")
+
+    backup_file = tmp_path / "backup.enc"
+    tracemalloc.start()
+    try:
+        with catalog.collect() as stats:
+            client.export_raw_encrypted(str(backup_file), "file_pw", dedup=False)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert stats["items"] == len(personal_export(large)["items"])
+    assert backup_file.stat().st_size > 16 * crypto.DEFAULT_CHUNK_SIZE
+    assert peak < 8 * crypto.DEFAULT_CHUNK_SIZE
+
+
+def test_bw_processes_are_traced(vault, tmp_path):
+    """
+    Tests that every bw process of a backup is traced with its resource
+    usage, including the streamed raw export.
+    """
+    _, bw = vault
+    trace_file = tmp_path / "trace.jsonl"
+    with tracing.trace(str(trace_file)):
+        client = BitwardenClient(
+            bw_cmd=bw,
+            server="https://vault.example",
+            client_id="user.id",
+            client_secret="secret",
+        )
+        client.login()
+        client.unlock("master_pw")
+        client.export_raw_encrypted(str(tmp_path / "backup.enc"), "file_pw")
+        client.logout()
+
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    bw_spans = [span for span in spans if span["name"].startswith("bw ")]
+    assert [span["name"] for span in bw_spans] == [
+        "bw config",
+        "bw login",
+        "bw unlock",
+        "bw export",
+        "bw logout",
+    ]
+    for span in bw_spans:
+        assert span["attributes"]["children"] == 1
+        assert span["attributes"]["child_max_rss_kb"] > 0
+    assert bw_spans[2]["attributes"]["argv"] == ["unlock", "[REDACTED]", "--raw"]
+
+
+def test_cli_state_is_read_in_process(vault, tmp_path):
+    """
+    Tests that status checks and an unchanged server configuration are
+    answered from the CLI state without starting bw.
+    """
+    _, bw = vault
+    log = tmp_path / "commands.log"
+
+    def client():
+        return BitwardenClient(
+            bw_cmd=bw,
+            server="https://vault.example/",
+            client_id="user.id",
+            client_secret="secret",
+        )
+
+    first = client()
+    assert first.status()["status"] == "unauthenticated"
+    first.login()
+    first.unlock("master_pw")
+    first.sync()
+    status = first.status()
+    assert status["status"] == "unlocked"
+    assert status["serverUrl"] == "https://vault.example"
+    assert status["lastSync"]
+
+    second = client()
+    assert second.status()["status"] == "locked"
+    second.session = first.session
+    assert second.status()["status"] == "unlocked"
+    assert [line.split()[0] for line in log.read_text().splitlines()] == [
+        "config",
+        "login",
+        "unlock",
+        "sync",
+    ]
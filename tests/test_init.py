@@ -1,6 +1,6 @@
 from fastapi.testclient import TestClient
 from src.init import app, DB_PATH, PRAGMA_KEY_FILE
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 client = TestClient(app)
 
@@ -23,15 +23,13 @@ def test_index():
     assert "<h3>Setup complete.</h3>" not in response.text
 
 
-@patch("src.init.db_connect")
-@patch("src.init.put_key")
-def test_init(mock_put_key, mock_db_connect):
+@patch("src.init.CredentialStore")
+def test_init(mock_store):
     """
-    Tests the /init endpoint.
+    Tests that the /init endpoint stores all credentials in one write.
     """
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_db_connect.return_value = (mock_conn, mock_cursor)
+    store = mock_store.return_value
+    store.open.return_value = True
 
     response = client.post(
         "/init",
@@ -46,19 +44,24 @@ def test_init(mock_put_key, mock_db_connect):
 
     assert response.status_code == 302
     assert response.headers["location"] == "/done"
-    mock_db_connect.assert_called_once_with(DB_PATH, PRAGMA_KEY_FILE)
-    mock_put_key.assert_any_call(mock_conn, "master_password", b"test_master_password")
-    mock_put_key.assert_any_call(mock_conn, "client_id", b"test_client_id")
-    mock_put_key.assert_any_call(mock_conn, "client_secret", b"test_client_secret")
-    mock_put_key.assert_any_call(mock_conn, "file_password", b"test_file_password")
-    mock_conn.close.assert_called_once()
+    mock_store.assert_called_once_with(DB_PATH, PRAGMA_KEY_FILE)
+    store.put_keys.assert_called_once_with(
+        {
+            "master_password": b"test_master_password",
+            "client_id": b"test_client_id",
+            "client_secret": b"test_client_secret",
+            "file_password": b"test_file_password",
+        }
+    )
+    store.close.assert_called_once()
 
 
-@patch("src.init.db_connect", return_value=(None, None))
-def test_init_db_connection_fails(mock_db_connect):
+@patch("src.init.CredentialStore")
+def test_init_db_connection_fails(mock_store):
     """
     Tests that the /init endpoint handles a database connection failure.
     """
+    mock_store.return_value.open.return_value = False
     response = client.post(
         "/init",
         data={
@@ -0,0 +1,98 @@
+import urllib.request
+import pytest
+from src import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.REGISTRY.reset()
+    metrics.set_profile("default")
+    yield
+    metrics.REGISTRY.reset()
+
+
+def test_render_exposition_format():
+    """
+    Tests that counters, gauges and histograms render in the Prometheus text
+    format with escaped labels and cumulative buckets.
+    """
+    metrics.BACKUPS.inc(profile='we"ird', result="success")
+    metrics.BACKUPS.inc(profile='we"ird', result="success")
+    metrics.BACKUP_SIZE.set(1234, profile="default")
+    metrics.PHASE_SECONDS.observe(0.3, profile="default", phase="login")
+    metrics.PHASE_SECONDS.observe(7, profile="default", phase="login")
+
+    text = metrics.REGISTRY.render()
+    assert "# TYPE backvault_backups_total counter" in text
+    assert 'backvault_backups_total{profile="we\\"ird",result="success"} 2' in text
+    assert 'backvault_backup_size_bytes{profile="default"} 1234' in text
+    bucket = (
+        'backvault_phase_duration_seconds_bucket{profile="default",phase="login",le='
+    )
+    assert f'{bucket}"0.25"}} 0' in text
+    assert f'{bucket}"0.5"}} 1' in text
+    assert f'{bucket}"10"}} 2' in text
+    assert f'{bucket}"+Inf"}} 2' in text
+    assert (
+        'backvault_phase_duration_seconds_sum{profile="default",phase="login"} 7.3'
+        in text
+    )
+
+
+def test_labels_are_checked():
+    """Tests that a metric refuses samples with the wrong label names."""
+    with pytest.raises(ValueError):
+        metrics.BACKUPS.inc(profile="default")
+
+
+def test_restore_round_trip():
+    """Tests that restoring a rendered registry continues from the same values."""
+    metrics.BACKUPS.inc(profile="default", result="failure")
+    metrics.SUBPROCESSES.inc(3, command="export")
+    metrics.PHASE_SECONDS.observe(2, profile="default", phase="export")
+    text = metrics.REGISTRY.render()
+
+    metrics.REGISTRY.reset()
+    metrics.REGISTRY.restore(text)
+    assert metrics.REGISTRY.render() == text
+    metrics.SUBPROCESSES.inc(command="export")
+    assert metrics.SUBPROCESSES.get(command="export") == 4
+
+
+def test_phase_counts_innermost_failure():
+    """
+    Tests that a failure is counted once, against the innermost phase, and
+    that every phase it passed through is still timed.
+    """
+    metrics.set_profile("work")
+    with pytest.raises(RuntimeError):
+        with metrics.phase("export"):
+            with metrics.phase("encrypt"):
+                raise RuntimeError("boom")
+
+    assert metrics.FAILURES.get(profile="work", phase="encrypt") == 1
+    assert metrics.FAILURES.get(profile="work", phase="export") == 0
+    assert metrics.PHASE_SECONDS.get(profile="work", phase="export") == 1
+    assert metrics.PHASE_SECONDS.get(profile="work", phase="encrypt") == 1
+
+
+def test_write_textfile(tmp_path):
+    """Tests that the textfile is written atomically without leftovers."""
+    metrics.LAST_SUCCESS.set(1700000000, profile="default")
+    path = tmp_path / "metrics" / "backvault.prom"
+    metrics.write_textfile(str(path))
+
+    assert path.read_text() == metrics.REGISTRY.render()
+    assert [p.name for p in path.parent.iterdir()] == ["backvault.prom"]
+
+
+def test_http_server():
+    """Tests that /metrics serves the current registry."""
+    metrics.ITEMS_EXPORTED.set(42, profile="default")
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    port = server.server_address[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        assert (
+            'backvault_items_exported{profile="default"} 42' in response.read().decode()
+        )
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from src import catalog, metrics
+from src.organizations import (
+    backup_organizations,
+    organization_dir,
+    select_organizations,
+)
+
+ORGS = [
+    {"object": "organization", "id": "o1", "name": "Engineering"},
+    {"object": "organization", "id": "o2", "name": "Finance"},
+    {"object": "organization", "id": "o3", "name": "Legal"},
+]
+
+
+class FakeExporter:
+    """Writes organization exports slowly, failing for the given ids."""
+
+    def __init__(self, fail: set = (), delay: float = 0.0):
+        self.fail = set(fail)
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, org_id: str, backup_file: str) -> list[str]:
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            with metrics.phase("export"):
+                time.sleep(self.delay)
+                if org_id in self.fail:
+                    raise RuntimeError("Organization not found.")
+                with open(backup_file, "wb") as f:
+                    f.write(org_id.encode())
+                catalog.note(items=len(org_id))
+            return []
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_select_organizations():
+    """Tests selecting all, none or some organizations by id or name."""
+    assert select_organizations(ORGS, None) == []
+    assert select_organizations(ORGS, " ") == []
+    assert select_organizations(ORGS, "ALL") == ORGS
+    assert select_organizations(ORGS, "o2, Legal,missing") == ORGS[1:]
+
+
+def test_backup_organizations_runs_in_parallel(tmp_path):
+    """
+    Tests that organizations are exported concurrently, each to its own dir
+    with its own phase timings and catalog stats.
+    """
+    exporter = FakeExporter(delay=0.2)
+
+    started = time.monotonic()
+    results = backup_organizations(
+        ORGS, str(tmp_path), exporter, "20240101_000000", workers=3
+    )
+    elapsed = time.monotonic() - started
+
+    assert exporter.peak == 3
+    assert elapsed < 0.5
+    assert [result.id for result in results] == ["o1", "o2", "o3"]
+    for result in results:
+        assert result.success
+        assert result.backup_file == os.path.join(
+            organization_dir(str(tmp_path), result.id), "backup_20240101_000000.enc"
+        )
+        with open(result.backup_file, "rb") as f:
+            assert f.read() == result.id.encode()
+        assert result.stats == {"items": 2}
+        assert result.phases["export"] >= 0.2
+        assert result.duration >= 0.2
+
+
+def test_backup_organizations_isolates_failures(tmp_path):
+    """Tests that one failing organization does not stop the others."""
+    results = backup_organizations(
+        ORGS, str(tmp_path), FakeExporter(fail={"o2"}), "20240101_000000", workers=1
+    )
+
+    assert [result.success for result in results] == [True, False, True]
+    assert results[1].error == "Export failed: Organization not found."
+    assert not os.path.exists(results[1].backup_file or "")
+
+
+def test_backup_organizations_reports_failed_uploads(tmp_path):
+    """Tests that an export whose upload failed is not a successful backup."""
+    [result] = backup_organizations(
+        ORGS[:1],
+        str(tmp_path),
+        lambda org_id, backup_file: ["Upload to s3 failed"],
+        "20240101_000000",
+    )
+
+    assert not result.success
+    assert result.error == "Upload to s3 failed"
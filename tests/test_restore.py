@@ -0,0 +1,131 @@
+import io
+import json
+import os
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from src import crypto, restore
+from src.restore import decrypt_file, main
+
+EXPORT = json.dumps({"items": [{"id": str(i)} for i in range(2000)]}).encode()
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setenv("BACKUP_FILE_PASSWORD", "file_pw")
+
+
+def write_legacy(path, data=EXPORT, salt=None):
+    salt = salt or os.urandom(crypto.SALT_SIZE)
+    nonce = os.urandom(crypto.NONCE_SIZE)
+    key = crypto.derive_key("file_pw", salt)
+    path.write_bytes(salt + nonce + AESGCM(key).encrypt(nonce, data, None))
+
+
+def test_restore_chunked_to_file(tmp_path, monkeypatch, capsys):
+    """
+    Tests that a compressed, chunked backup is restored to a private file,
+    releasing mapped pages as it goes, and that throughput is reported.
+    """
+    monkeypatch.setattr(restore, "RELEASE_INTERVAL", 4096)
+    backup = tmp_path / "backup.enc"
+    with open(backup, "wb") as f:
+        crypto.encrypt_stream(
+            io.BytesIO(EXPORT), f, "file_pw", chunk_size=1000, compression="zlib"
+        )
+    output = tmp_path / "vault.json"
+
+    assert main([str(backup), "-o", str(output), "--workers", "2"]) == 0
+    assert output.read_bytes() == EXPORT
+    assert output.stat().st_mode & 0o777 == 0o600
+    assert "MiB/s" in capsys.readouterr().err
+
+    monkeypatch.setenv("BACKUP_FILE_PASSWORD", "wrong")
+    assert main([str(backup), "-o", str(tmp_path / "other.json")]) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["backup.enc", "vault.json"]
+
+
+def test_restore_legacy_backup(tmp_path):
+    """
+    Tests that v1 backups are decrypted in blocks, and that nothing is
+    written for a tampered one.
+    """
+    backup = tmp_path / "backup.enc"
+    write_legacy(backup)
+    out = io.BytesIO()
+    assert decrypt_file(str(backup), out, "file_pw") == len(EXPORT)
+    assert out.getvalue() == EXPORT
+
+    data = bytearray(backup.read_bytes())
+    data[100] ^= 1
+    backup.write_bytes(bytes(data))
+    out = io.BytesIO()
+    with pytest.raises(InvalidTag):
+        crypto.decrypt_legacy(backup.read_bytes(), out, "file_pw", block_size=64)
+    assert out.getvalue() == b""
+
+
+def test_restore_into_bw_import(tmp_path, monkeypatch):
+    """Tests that --import pipes the decrypted export into `bw import`."""
+    imported = tmp_path / "imported.json"
+    bw = tmp_path / "bin" / "bw"
+    bw.parent.mkdir()
+    bw.write_text(f'#!/bin/sh\necho "$@" > "{tmp_path}/args"\ncat > "{imported}"\n')
+    bw.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bw.parent}{os.pathsep}{os.environ['PATH']}")
+    backup = tmp_path / "backup.enc"
+    write_legacy(backup)
+
+    assert main([str(backup), "--import"]) == 0
+    assert imported.read_bytes() == EXPORT
+    assert (tmp_path / "args").read_text().split() == [
+        "import",
+        "bitwardenjson",
+        "/dev/stdin",
+    ]
+
+
+def test_restore_csv_into_bw_import(tmp_path, monkeypatch, capsys):
+    """
+    Tests that a CSV backup is imported with the CSV importer, and that a
+    plaintext that is neither JSON nor a personal CSV export never reaches
+    `bw import`.
+    """
+    bw = tmp_path / "bin" / "bw"
+    bw.parent.mkdir()
+    bw.write_text(f'#!/bin/sh\necho "$@" >> "{tmp_path}/args"\ncat > /dev/null\n')
+    bw.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bw.parent}{os.pathsep}{os.environ['PATH']}")
+    backup = tmp_path / "backup.enc"
+
+    write_legacy(backup, b"folder,favorite,type,name\r\nWork,,login,Mail")
+    assert main([str(backup), "--import"]) == 0
+    assert (tmp_path / "args").read_text().split() == [
+        "import",
+        "bitwardencsv",
+        "/dev/stdin",
+    ]
+
+    for plaintext in (b"collections,type,name\r\n", b"Not found."):
+        write_legacy(backup, plaintext)
+        assert main([str(backup), "--import"]) == 1
+        assert "Restore failed" in capsys.readouterr().err
+    assert len((tmp_path / "args").read_text().splitlines()) == 1
+
+
+def test_restore_legacy_backup_with_brace_salt(tmp_path, capsys):
+    """
+    Tests that a v1 backup whose random salt starts with "{" is restored,
+    while a real Bitwarden-mode export is still refused.
+    """
+    backup = tmp_path / "backup.enc"
+    write_legacy(backup, salt=b"{" + os.urandom(crypto.SALT_SIZE - 1))
+    output = tmp_path / "vault.json"
+    assert main([str(backup), "-o", str(output)]) == 0
+    assert output.read_bytes() == EXPORT
+
+    export = tmp_path / "export.json"
+    export.write_text(json.dumps({"encrypted": True, "passwordProtected": True}))
+    assert main([str(export), "-o", str(tmp_path / "other.json")]) == 1
+    assert "bitwarden mode export" in capsys.readouterr().err
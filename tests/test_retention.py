@@ -0,0 +1,162 @@
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from src import retention
+from src.catalog import BackupEntry, load_index, record_backup
+from src.retention import (
+    DAY,
+    RetentionPolicy,
+    parse_retain_days,
+    plan,
+    policy_from_env,
+    prune_gfs,
+    prune_older_than,
+)
+
+
+def test_parse_retain_days():
+    """
+    Tests that RETAIN_DAYS follows cleanup.sh's rules.
+    """
+    assert parse_retain_days(None) == 7
+    assert parse_retain_days("30") == 30
+    assert parse_retain_days("0") is None
+    assert parse_retain_days("forever") is None
+    assert parse_retain_days("-1") is None
+
+
+def test_prune_older_than(tmp_path):
+    """
+    Tests that old backups are deleted in the backup dir and profile
+    subdirectories, while recent and non-backup files are kept.
+    """
+    now = time.time()
+    profile_dir = tmp_path / "alice"
+    profile_dir.mkdir()
+    old = tmp_path / "backup_old.enc"
+    old_profile = profile_dir / "backup_old.enc"
+    recent = tmp_path / "backup_recent.enc"
+    other = tmp_path / "notes.txt"
+    for path in (old, old_profile, recent, other):
+        path.write_bytes(b"x")
+    for path in (old, old_profile, other):
+        os.utime(path, (now - 9 * DAY, now - 9 * DAY))
+    os.utime(recent, (now - 7.5 * DAY, now - 7.5 * DAY))
+
+    deleted = prune_older_than(str(tmp_path), 7, now=now)
+
+    assert sorted(deleted) == sorted([str(old), str(old_profile)])
+    assert recent.exists()
+    assert other.exists()
+
+
+def _backup(directory, moment: datetime, blobs=None):
+    """Write a backup named for `moment` and index it."""
+    path = directory / f"backup_{moment.strftime('%Y%m%d_%H%M%S')}.enc"
+    path.write_bytes(b"x")
+    manifest = None
+    if blobs is not None:
+        manifest = directory / (path.name[: -len(".enc")] + ".attachments.enc")
+        manifest.write_bytes(b"m")
+    record_backup(str(path), attachments=manifest and str(manifest), blobs=blobs)
+    return path
+
+
+def test_plan_keeps_gfs_buckets():
+    """
+    Tests that the newest backup of each bucket is kept, up to the number of
+    buckets the policy asks for.
+    """
+    start = datetime(2025, 1, 1, 0, 0)
+    # Every 12 hours for 100 days
+    entries = [
+        BackupEntry(
+            file=f"backup_{i}.enc",
+            created=(start + timedelta(hours=12 * i)).timestamp(),
+        )
+        for i in range(200)
+    ]
+    policy = RetentionPolicy(last=3, daily=7, weekly=4, monthly=12, yearly=2)
+    decisions = plan(entries, policy, now=entries[-1].created)
+    kept = [d.entry.file for d in decisions if d.keep]
+
+    # The 3 last, then the evening backup of each of the last 7 days
+    assert kept[:8] == [
+        f"backup_{i}.enc" for i in (199, 198, 197, 195, 193, 191, 189, 187)
+    ]
+    assert "backup_0.enc" not in kept
+    reasons = {d.entry.file: d.reasons for d in decisions}
+    assert reasons["backup_199.enc"][:2] == ["latest", "last"]
+    # The newest backup of January is the one on the evening of Jan 31
+    assert "monthly 2025-01" in reasons["backup_61.enc"]
+    assert "yearly 2025" in reasons["backup_199.enc"]
+    assert len(kept) == len(set(kept))
+    assert (
+        len([r for rs in reasons.values() for r in rs if r.startswith("weekly")]) == 4
+    )
+
+
+def test_plan_always_keeps_latest():
+    """Tests that even an empty policy never deletes the newest backup."""
+    entries = [BackupEntry(file=f"b{i}", created=float(i)) for i in range(3)]
+    decisions = plan(entries, RetentionPolicy(), now=3)
+    assert [d.keep for d in decisions] == [True, False, False]
+
+
+def test_policy_from_env(monkeypatch):
+    """
+    Tests that GFS retention is only enabled by RETAIN_LAST ... RETAIN_YEARLY,
+    and that RETAIN_DAYS then keeps recent backups on top.
+    """
+    assert policy_from_env() is None
+    monkeypatch.setenv("RETAIN_DAILY", "7")
+    monkeypatch.setenv("RETAIN_MONTHLY", "12")
+    assert policy_from_env() == RetentionPolicy(daily=7, monthly=12)
+    monkeypatch.setenv("RETAIN_DAYS", "2")
+    assert policy_from_env().within_days == 2
+    monkeypatch.setenv("RETAIN_WEEKLY", "many")
+    with pytest.raises(ValueError):
+        policy_from_env()
+
+
+def test_prune_gfs(tmp_path, monkeypatch, capsys):
+    """
+    Tests that GFS cleanup works per profile dir from the index, deletes in
+    batches, removes manifests and unused blobs, and that --dry-run deletes
+    nothing.
+    """
+    monkeypatch.setattr(retention, "DELETE_BATCH", 2)
+    now = datetime(2025, 6, 10, 12, 0)
+    profile_dir = tmp_path / "work"
+    profile_dir.mkdir()
+    blobs_dir = tmp_path / "attachments"
+    blobs_dir.mkdir()
+    for blob in ("old", "shared", "fresh"):
+        (blobs_dir / f"{blob}.enc").write_bytes(b"b")
+    stale = now.timestamp() - 2 * DAY
+    os.utime(blobs_dir / "old.enc", (stale, stale))
+    os.utime(blobs_dir / "shared.enc", (stale, stale))
+    root = [
+        _backup(
+            tmp_path, now - timedelta(days=d), blobs=["old"] if d > 2 else ["shared"]
+        )
+        for d in range(6)
+    ]
+    work = [_backup(profile_dir, now - timedelta(hours=h)) for h in range(4)]
+    policy = RetentionPolicy(last=2)
+
+    doomed = prune_gfs(str(tmp_path), policy, dry_run=True, now=now.timestamp())
+    assert len(doomed) == 6
+    assert all(path.exists() for path in root + work)
+    assert "delete backup_20250605_120000.enc" in capsys.readouterr().out
+
+    deleted = prune_gfs(str(tmp_path), policy, now=now.timestamp())
+
+    assert sorted(deleted) == sorted(str(p) for p in root[2:] + work[2:])
+    assert [p.exists() for p in root] == [True, True, False, False, False, False]
+    assert not (tmp_path / (root[3].name[:-4] + ".attachments.enc")).exists()
+    assert [p.exists() for p in work] == [True, True, False, False]
+    # "fresh" is unreferenced but too new to be deleted
+    assert sorted(p.name for p in blobs_dir.iterdir()) == ["fresh.enc", "shared.enc"]
+    assert [e.file for e in load_index(str(tmp_path))] == [p.name for p in root[1::-1]]
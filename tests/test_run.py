@@ -1,12 +1,21 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from src.run import main, require_env
+from src import catalog, metrics
+from src.db import CREDENTIAL_KEYS
+from src.run import RunState, main, require_env
 import os
 from subprocess import CompletedProcess
 
+KDF_SALT = b"k" * 16
 
-@patch("src.run.db_connect")
-@patch("src.run.get_key")
+
+@pytest.fixture(autouse=True)
+def stored_kdf_salt():
+    with patch("src.run.get_kdf_salt", return_value=KDF_SALT) as mock_get_kdf_salt:
+        yield mock_get_kdf_salt
+
+
+@patch("src.run.CredentialStore")
 @patch("src.bw_client.sprun")
 @patch("src.run.BitwardenClient")
 @patch.dict(
@@ -18,19 +27,16 @@ from subprocess import CompletedProcess
         "PRAGMA_KEY_FILE": "/tmp/db.key",
     },
 )
-def test_main_bitwarden_encryption(
-    mock_bw_client, mock_sprun, mock_get_key, mock_db_connect
-):
+def test_main_bitwarden_encryption(mock_bw_client, mock_sprun, mock_store):
     """
     Tests the main function with 'bitwarden' encryption mode.
     """
-    mock_db_connect.return_value = (MagicMock(), MagicMock())
-    mock_get_key.side_effect = [
-        "test_client_id",
-        "test_client_secret",
-        "test_master_pw",
-        "test_file_pw",
-    ]
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
     mock_client_instance = mock_bw_client.return_value
     mock_sprun.return_value = CompletedProcess(
         args=[], returncode=0, stdout="", stderr=""
@@ -38,14 +44,17 @@ def test_main_bitwarden_encryption(
 
     main()
 
-    mock_db_connect.assert_called_once()
-    mock_get_key.assert_any_call(mock_db_connect.return_value[0], "client_id")
+    mock_store.assert_called_once()
+    mock_store.return_value.get_keys.assert_called_once_with(CREDENTIAL_KEYS)
     mock_bw_client.assert_called_once_with(
         bw_cmd="bw",
         server="https://test.server",
         client_id="test_client_id",
         client_secret="test_client_secret",
         use_api_key=True,
+        encrypt_workers=1,
+        transport="cli",
+        kdf_salt=KDF_SALT,
     )
     mock_client_instance.login.assert_called_once()
     mock_client_instance.unlock.assert_called_once_with("test_master_pw")
@@ -53,8 +62,7 @@ def test_main_bitwarden_encryption(
     mock_client_instance.logout.assert_called_once()
 
 
-@patch("src.run.db_connect")
-@patch("src.run.get_key")
+@patch("src.run.CredentialStore")
 @patch("src.bw_client.sprun")
 @patch("src.run.BitwardenClient")
 @patch.dict(
@@ -67,17 +75,16 @@ def test_main_bitwarden_encryption(
         "PRAGMA_KEY_FILE": "/tmp/db.key",
     },
 )
-def test_main_raw_encryption(mock_bw_client, mock_sprun, mock_get_key, mock_db_connect):
+def test_main_raw_encryption(mock_bw_client, mock_sprun, mock_store):
     """
     Tests the main function with 'raw' encryption mode.
     """
-    mock_db_connect.return_value = (MagicMock(), MagicMock())
-    mock_get_key.side_effect = [
-        "test_client_id",
-        "test_client_secret",
-        "test_master_pw",
-        "test_file_pw",
-    ]
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
     mock_client_instance = mock_bw_client.return_value
     mock_sprun.return_value = CompletedProcess(
         args=[], returncode=0, stdout="", stderr=""
@@ -85,14 +92,17 @@ def test_main_raw_encryption(mock_bw_client, mock_sprun, mock_get_key, mock_db_c
 
     main()
 
-    mock_db_connect.assert_called_once()
-    mock_get_key.assert_any_call(mock_db_connect.return_value[0], "client_id")
+    mock_store.assert_called_once()
+    mock_store.return_value.get_keys.assert_called_once_with(CREDENTIAL_KEYS)
     mock_bw_client.assert_called_once_with(
         bw_cmd="bw",
         server="https://test.server",
         client_id="test_client_id",
         client_secret="test_client_secret",
         use_api_key=True,
+        encrypt_workers=1,
+        transport="cli",
+        kdf_salt=KDF_SALT,
     )
     mock_client_instance.login.assert_called_once()
     mock_client_instance.unlock.assert_called_once_with("test_master_pw")
@@ -100,8 +110,7 @@ def test_main_raw_encryption(mock_bw_client, mock_sprun, mock_get_key, mock_db_c
     mock_client_instance.logout.assert_called_once()
 
 
-@patch("src.run.db_connect")
-@patch("src.run.get_key")
+@patch("src.run.CredentialStore")
 @patch("src.run.BitwardenClient")
 @patch.dict(
     os.environ,
@@ -113,17 +122,16 @@ def test_main_raw_encryption(mock_bw_client, mock_sprun, mock_get_key, mock_db_c
         "PRAGMA_KEY_FILE": "/tmp/db.key",
     },
 )
-def test_main_invalid_encryption_mode(mock_bw_client, mock_get_key, mock_db_connect):
+def test_main_invalid_encryption_mode(mock_bw_client, mock_store):
     """
     Tests that the main function handles an invalid encryption mode.
     """
-    mock_db_connect.return_value = (MagicMock(), MagicMock())
-    mock_get_key.side_effect = [
-        "test_client_id",
-        "test_client_secret",
-        "test_master_pw",
-        "test_file_pw",
-    ]
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
     mock_client_instance = mock_bw_client.return_value
 
     main()
@@ -132,8 +140,7 @@ def test_main_invalid_encryption_mode(mock_bw_client, mock_get_key, mock_db_conn
     mock_client_instance.export_raw_encrypted.assert_not_called()
 
 
-@patch("src.run.db_connect")
-@patch("src.run.get_key")
+@patch("src.run.CredentialStore")
 @patch("src.run.BitwardenClient")
 @patch.dict(
     os.environ,
@@ -144,17 +151,16 @@ def test_main_invalid_encryption_mode(mock_bw_client, mock_get_key, mock_db_conn
         "PRAGMA_KEY_FILE": "/tmp/db.key",
     },
 )
-def test_main_login_fails(mock_bw_client, mock_get_key, mock_db_connect):
+def test_main_login_fails(mock_bw_client, mock_store):
     """
     Tests that the main function handles a login failure.
     """
-    mock_db_connect.return_value = (MagicMock(), MagicMock())
-    mock_get_key.side_effect = [
-        "test_client_id",
-        "test_client_secret",
-        "test_master_pw",
-        "test_file_pw",
-    ]
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
     mock_client_instance = mock_bw_client.return_value
     mock_client_instance.login.side_effect = Exception("Login failed")
 
@@ -164,8 +170,7 @@ def test_main_login_fails(mock_bw_client, mock_get_key, mock_db_connect):
     mock_client_instance.logout.assert_called_once()
 
 
-@patch("src.run.db_connect")
-@patch("src.run.get_key")
+@patch("src.run.CredentialStore")
 @patch("src.run.BitwardenClient")
 @patch.dict(
     os.environ,
@@ -176,17 +181,16 @@ def test_main_login_fails(mock_bw_client, mock_get_key, mock_db_connect):
         "PRAGMA_KEY_FILE": "/tmp/db.key",
     },
 )
-def test_main_unlock_fails(mock_bw_client, mock_get_key, mock_db_connect):
+def test_main_unlock_fails(mock_bw_client, mock_store):
     """
     Tests that the main function handles an unlock failure.
     """
-    mock_db_connect.return_value = (MagicMock(), MagicMock())
-    mock_get_key.side_effect = [
-        "test_client_id",
-        "test_client_secret",
-        "test_master_pw",
-        "test_file_pw",
-    ]
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
     mock_client_instance = mock_bw_client.return_value
     mock_client_instance.unlock.side_effect = Exception("Unlock failed")
 
@@ -212,3 +216,496 @@ def test_require_env_exists():
     Tests that require_env returns the value of an existing environment variable.
     """
     assert require_env("EXISTING_VAR") == "test_value"
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch("src.run.VaultApiClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_ENGINE": "native",
+        "BACKUP_ENCRYPTION_MODE": "raw",
+        "BACKUP_DIR": "/tmp",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_native_engine(mock_vault_api, mock_bw_client, mock_store):
+    """
+    Tests that BACKUP_ENGINE=native backs up through the API client instead of
+    the Bitwarden CLI.
+    """
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    mock_client_instance = mock_vault_api.return_value
+
+    main()
+
+    mock_bw_client.assert_not_called()
+    mock_vault_api.assert_called_once_with(
+        server="https://test.server",
+        client_id="test_client_id",
+        client_secret="test_client_secret",
+        encrypt_workers=1,
+        kdf_salt=KDF_SALT,
+    )
+    mock_client_instance.login.assert_called_once()
+    mock_client_instance.unlock.assert_called_once_with("test_master_pw")
+    mock_client_instance.export_raw_encrypted.assert_called_once()
+    mock_client_instance.logout.assert_called_once()
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.list_profiles")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_DIR": "/tmp/backvault-test",
+        "BACKUP_STATE_DIR": "/tmp/backvault-test-state",
+        "BACKUP_MAX_WORKERS": "2",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_multiple_profiles(mock_bw_client, mock_list_profiles, mock_store):
+    """
+    Tests that every named profile is backed up with its own client and
+    appdata dir, and that one failing vault does not stop the others.
+    """
+    mock_store.return_value.get_keys.return_value = {}  # no default credentials
+    mock_list_profiles.return_value = [
+        {
+            "name": name,
+            "client_id": f"{name}_id",
+            "client_secret": f"{name}_secret",
+            "master_password": f"{name}_master",
+            "file_password": f"{name}_file",
+            "server": None,
+        }
+        for name in ("alice", "bob", "carol")
+    ]
+    clients = {}
+
+    def make_client(**kwargs):
+        client = MagicMock()
+        if kwargs["client_id"] == "bob_id":
+            client.unlock.side_effect = Exception("bad password")
+        clients[kwargs["client_id"]] = (client, kwargs)
+        return client
+
+    mock_bw_client.side_effect = make_client
+
+    results = main()
+
+    assert [r.profile for r in results] == ["alice", "bob", "carol"]
+    assert [r.success for r in results] == [True, False, True]
+    assert "bad password" in results[1].error
+    assert results[0].backup_file.startswith("/tmp/backvault-test/alice/")
+    for name in ("alice", "bob", "carol"):
+        client, kwargs = clients[f"{name}_id"]
+        assert kwargs["appdata_dir"] == f"/tmp/backvault-test-state/{name}/bw"
+        client.unlock.assert_called_once_with(f"{name}_master")
+        client.logout.assert_called_once()
+    clients["bob_id"][0].export_bitwarden_encrypted.assert_not_called()
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_DIR": "/tmp",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_reuses_warm_state(mock_bw_client, mock_store):
+    """
+    Tests that runs sharing a RunState open the database and build the client
+    only once, but still log in and out on every run.
+    """
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    mock_client_instance = mock_bw_client.return_value
+    state = RunState()
+
+    main(state)
+    main(state)
+
+    mock_store.assert_called_once()
+    mock_bw_client.assert_called_once()
+    assert mock_client_instance.login.call_count == 2
+    assert mock_client_instance.logout.call_count == 2
+    mock_store.return_value.close.assert_not_called()
+
+    state.close()
+    mock_store.return_value.close.assert_called_once()
+    assert state.clients == {}
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BW_SESSION_REUSE": "true",
+        "BACKUP_DIR": "/tmp",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_reuses_stored_session(mock_bw_client, mock_store):
+    """
+    Tests that with BW_SESSION_REUSE the session is kept instead of logged
+    out, resumed when `bw status` reports it unlocked, only unlocked again
+    when it is locked, and replaced by a full login once it is too old.
+    """
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    client = mock_bw_client.return_value
+    client.session = "session_key"
+    stored = {}
+    state = RunState()
+
+    with (
+        patch(
+            "src.run.get_sessions",
+            side_effect=lambda conn, names: {
+                n: stored[n] for n in names if n in stored
+            },
+        ),
+        patch(
+            "src.run.put_sessions",
+            side_effect=lambda conn, sessions: stored.update(sessions),
+        ) as mock_put_sessions,
+    ):
+        main(state)
+        assert stored["default"]["session"] == "session_key"
+        assert stored["default"]["client_id"] == "test_client_id"
+        client.status.return_value = {"status": "unlocked"}
+        main(state)
+        client.status.return_value = {"status": "locked"}
+        main(state)
+        assert client.login.call_count == 1
+        assert client.unlock.call_count == 2
+        client.logout.assert_not_called()
+        mock_put_sessions.assert_called_once()
+
+        with patch.dict(os.environ, {"BW_SESSION_MAX_AGE_HOURS": "0"}):
+            main(state)
+        client.logout.assert_called_once()
+        assert client.login.call_count == 2
+        assert client.unlock.call_count == 3
+        assert mock_put_sessions.call_count == 2
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.backup_attachments")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_ENCRYPTION_MODE": "raw",
+        "BACKUP_ATTACHMENTS": "true",
+        "BACKUP_ATTACHMENT_WORKERS": "8",
+        "BACKUP_DIR": "/tmp",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_backs_up_attachments(mock_bw_client, mock_backup_attachments, mock_store):
+    """
+    Tests that attachments are backed up next to the export while the vault
+    is unlocked, and that attachments which could not be stored fail the run.
+    """
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    mock_client_instance = mock_bw_client.return_value
+    mock_backup_attachments.return_value.failed = 2
+
+    results = main()
+
+    backup_file = mock_client_instance.export_raw_encrypted.call_args.args[0]
+    mock_backup_attachments.assert_called_once_with(
+        mock_client_instance,
+        backup_file,
+        "test_file_pw",
+        kdf_salt=KDF_SALT,
+        workers=8,
+    )
+    assert not results[0].success
+    assert results[0].backup_file == backup_file
+    assert "2 attachments" in results[0].error
+    mock_client_instance.logout.assert_called_once()
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_DIR": "/tmp",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_writes_metrics(mock_bw_client, mock_store, tmp_path, monkeypatch):
+    """
+    Tests that every run writes the metrics file, and that a second run
+    continues counting from the values the first one wrote.
+    """
+    metrics.REGISTRY.reset()
+    metrics_file = tmp_path / "backvault.prom"
+    metrics_file.write_text(
+        'backvault_backups_total{profile="default",result="success"} 5\n'
+    )
+    monkeypatch.setenv("BACKUP_METRICS_FILE", str(metrics_file))
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    mock_client_instance = mock_bw_client.return_value
+    mock_client_instance.unlock.side_effect = [Exception("Unlock failed"), None]
+
+    main()
+    main()
+
+    text = metrics_file.read_text()
+    assert 'backvault_backups_total{profile="default",result="success"} 6' in text
+    assert 'backvault_backups_total{profile="default",result="failure"} 1' in text
+    assert 'backvault_failures_total{profile="default",phase="unlock"} 1' in text
+    assert (
+        'backvault_phase_duration_seconds_count{profile="default",phase="login"} 2'
+        in text
+    )
+    assert 'backvault_last_success_timestamp_seconds{profile="default"}' in text
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_ENCRYPTION_MODE": "raw",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_records_catalog_entry(mock_bw_client, mock_store, tmp_path, monkeypatch):
+    """
+    Tests that a successful backup is added to the catalog with what the
+    exporter reported and the time spent in each phase.
+    """
+    monkeypatch.setenv("BACKUP_DIR", str(tmp_path))
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+
+    def export(backup_file, *args, **kwargs):
+        with open(backup_file, "wb") as f:
+            f.write(b"ciphertext")
+        catalog.note(sha256="ab" * 32, items=7, folders=2)
+
+    mock_bw_client.return_value.export_raw_encrypted.side_effect = export
+
+    results = main()
+
+    [entry] = catalog.load_index(str(tmp_path))
+    assert entry.file == os.path.basename(results[0].backup_file)
+    assert (entry.profile, entry.mode, entry.size) == ("default", "raw", 10)
+    assert (entry.sha256, entry.items, entry.folders) == ("ab" * 32, 7, 2)
+    assert {"login", "unlock", "export", "logout"} <= set(entry.phases)
+    assert metrics.ITEMS_EXPORTED.get(profile="default") == 7
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_ENCRYPTION_MODE": "raw, bitwarden,CSV",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_exports_several_formats(
+    mock_bw_client, mock_store, tmp_path, monkeypatch
+):
+    """
+    Tests that every format of BACKUP_ENCRYPTION_MODE is exported in one
+    session, the first next to the other backups and the rest in their own
+    catalogued dirs, and that a failing format fails the run without losing
+    the others.
+    """
+    monkeypatch.setenv("BACKUP_DIR", str(tmp_path))
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    client = mock_bw_client.return_value
+
+    def exporter(items):
+        def export(backup_file, *args, **kwargs):
+            with open(backup_file, "wb") as f:
+                f.write(b"ciphertext")
+            catalog.note(items=items)
+
+        return export
+
+    client.export_raw_encrypted.side_effect = exporter(7)
+    client.export_bitwarden_encrypted.side_effect = exporter(None)
+    client.export_csv_encrypted.side_effect = exporter(5)
+
+    [result] = main()
+
+    assert result.success, result.error
+    assert client.login.call_count == 1
+    client.logout.assert_called_once()
+    client.shared_export.return_value.__enter__.assert_called_once()
+    [entry] = catalog.load_index(str(tmp_path))
+    assert entry.file == os.path.basename(result.backup_file)
+    assert (entry.mode, entry.items) == ("raw", 7)
+    for mode, items in (("bitwarden", None), ("csv", 5)):
+        [entry] = catalog.load_index(str(tmp_path / f"format-{mode}"))
+        assert entry.file == os.path.basename(result.backup_file)
+        assert (entry.mode, entry.items) == (mode, items)
+        assert "export" in entry.phases
+    assert [fmt.mode for fmt in result.formats] == ["bitwarden", "csv"]
+
+    second = tmp_path / "second"
+    monkeypatch.setenv("BACKUP_DIR", str(second))
+    client.export_csv_encrypted.side_effect = RuntimeError("boom")
+    [result] = main()
+
+    assert not result.success
+    assert result.error == "csv: Export failed: boom"
+    assert os.path.exists(result.backup_file)
+    assert len(catalog.load_index(str(second / "format-bitwarden"))) == 1
+    assert catalog.load_index(str(second / "format-csv")) == []
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "BACKUP_ENCRYPTION_MODE": "raw",
+        "BACKUP_ORGANIZATIONS": "all",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_exports_organizations(mock_bw_client, mock_store, tmp_path, monkeypatch):
+    """
+    Tests that every organization is exported within the vault's session
+    into its own dir and catalog, and that a failing one fails the run
+    without losing the others.
+    """
+    monkeypatch.setenv("BACKUP_DIR", str(tmp_path))
+    mock_store.return_value.get_keys.return_value = {
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "master_password": "test_master_pw",
+        "file_password": "test_file_pw",
+    }
+    client = mock_bw_client.return_value
+    client.list_organizations.return_value = [
+        {"object": "organization", "id": "o1", "name": "Engineering"},
+        {"object": "organization", "id": "o2", "name": "Finance"},
+    ]
+
+    def export(backup_file, *args, organization_id=None, **kwargs):
+        if organization_id == "o2":
+            raise RuntimeError("Organization not found.")
+        with open(backup_file, "wb") as f:
+            f.write(b"ciphertext")
+        catalog.note(items=3 if organization_id else 7)
+
+    client.export_raw_encrypted.side_effect = export
+
+    [result] = main()
+
+    assert not result.success
+    assert result.error == "1 of 2 organization exports failed"
+    assert [org.success for org in result.organizations] == [True, False]
+    assert client.login.call_count == 1
+    client.logout.assert_called_once()
+    [entry] = catalog.load_index(str(tmp_path / "org-o1"))
+    assert entry.file == os.path.basename(result.organizations[0].backup_file)
+    assert (entry.profile, entry.items) == ("default", 3)
+    assert "export" in entry.phases
+    assert not os.path.exists(tmp_path / "org-o2" / catalog.INDEX_FILE)
+
+
+@patch("src.run.CredentialStore")
+@patch("src.run.BitwardenClient")
+@patch.dict(
+    os.environ,
+    {
+        "BW_SERVER": "https://test.server",
+        "DB_PATH": "/tmp/db.db",
+        "PRAGMA_KEY_FILE": "/tmp/db.key",
+    },
+)
+def test_main_uploads_to_sinks(mock_bw_client, mock_store, tmp_path, monkeypatch):
+    """
+    Tests that the backup is copied to every BACKUP_SINKS target, and that
+    a failed upload fails the backup while the local copy is kept.
+    """
+    (tmp_path / "not-a-dir").write_text("")
+    monkeypatch.setenv("BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.setenv(
+        "BACKUP_SINKS", f"{tmp_path / 'copy'},file://{tmp_path / 'not-a-dir'}"
+    )
+    mock_store.return_value.get_keys.return_value = {
+        key: f"test_{key}" for key in CREDENTIAL_KEYS
+    }
+
+    def export(backup_file, *args, **kwargs):
+        with open(backup_file, "wb") as f:
+            f.write(b"ciphertext")
+
+    mock_bw_client.return_value.export_bitwarden_encrypted.side_effect = export
+
+    [result] = main()
+
+    name = os.path.basename(result.backup_file)
+    assert (tmp_path / "copy" / name).read_bytes() == b"ciphertext"
+    assert not result.success
+    assert "not-a-dir failed" in result.error
+    assert os.path.exists(result.backup_file)
+    mock_bw_client.return_value.logout.assert_called_once()
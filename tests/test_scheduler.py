@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import pytest
+from datetime import datetime
+from src.scheduler import CronSchedule, Scheduler, backup_cron_from_env
+
+
+def test_cron_interval_expression():
+    """
+    Tests the default BACKUP_INTERVAL_HOURS style expression.
+    """
+    schedule = CronSchedule("0 */12 * * *")
+    assert schedule.next_after(datetime(2025, 1, 1, 0, 0)) == datetime(
+        2025, 1, 1, 12, 0
+    )
+    assert schedule.next_after(datetime(2025, 1, 1, 12, 30, 15)) == datetime(
+        2025, 1, 2, 0, 0
+    )
+
+
+def test_cron_ranges_lists_and_rollover():
+    """
+    Tests ranges, lists, steps and month/year rollover.
+    """
+    schedule = CronSchedule("15,45 9-17/4 * * *")
+    assert sorted(schedule.hours) == [9, 13, 17]
+    assert schedule.next_after(datetime(2025, 1, 1, 17, 45)) == datetime(
+        2025, 1, 2, 9, 15
+    )
+    assert CronSchedule("@yearly").next_after(datetime(2025, 3, 1)) == datetime(
+        2026, 1, 1, 0, 0
+    )
+    assert CronSchedule("0 0 31 * *").next_after(datetime(2025, 4, 1)) == datetime(
+        2025, 5, 31, 0, 0
+    )
+
+
+def test_cron_day_of_week():
+    """
+    Tests weekday matching, Sunday as 7 and cron's day-of-month OR
+    day-of-week rule.
+    """
+    # 2025-01-01 is a Wednesday
+    assert CronSchedule("30 2 * * 7").next_after(datetime(2025, 1, 1)) == datetime(
+        2025, 1, 5, 2, 30
+    )
+    assert CronSchedule("0 0 10 * 1").next_after(datetime(2025, 1, 1)) == datetime(
+        2025, 1, 6, 0, 0
+    )
+
+
+@pytest.mark.parametrize(
+    "expression", ["* * * *", "60 * * * *", "* * 0 * *", "*/0 * * * *", "a * * * *"]
+)
+def test_cron_invalid_expression(expression):
+    """
+    Tests that malformed expressions are rejected when parsed.
+    """
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_backup_cron_from_env(monkeypatch):
+    """
+    Tests that CRON_EXPRESSION wins over BACKUP_INTERVAL_HOURS.
+    """
+    monkeypatch.delenv("CRON_EXPRESSION", raising=False)
+    monkeypatch.setenv("BACKUP_INTERVAL_HOURS", "6")
+    assert backup_cron_from_env() == "0 */6 * * *"
+    monkeypatch.setenv("CRON_EXPRESSION", "@daily")
+    assert backup_cron_from_env() == "@daily"
+
+
+def test_scheduler_runs_jobs_serially():
+    """
+    Tests that jobs never overlap, all run on one worker thread, and a
+    failing job does not stop the scheduler.
+    """
+    running = []
+    overlaps = []
+    threads = set()
+
+    def job():
+        if running:
+            overlaps.append(True)
+        running.append(True)
+        threads.add(threading.get_ident())
+        time.sleep(0.02)
+        running.pop()
+
+    def failing_job():
+        job()
+        raise RuntimeError("boom")
+
+    async def scenario():
+        scheduler = Scheduler(
+            {
+                "backup": (CronSchedule("* * * * *"), job),
+                "cleanup": (CronSchedule("* * * * *"), failing_job),
+            }
+        )
+        await asyncio.gather(
+            *(scheduler.run_job(name) for name in ("backup", "cleanup") * 3)
+        )
+        scheduler.stop()
+        await scheduler.serve()
+
+    asyncio.run(scenario())
+    assert overlaps == []
+    assert len(threads) == 1
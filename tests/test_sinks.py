@@ -0,0 +1,225 @@
+import io
+import os
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from src import crypto, sinks
+from src.sinks import FanOut, LocalSink, S3Sink, SinkError, SshSink, streaming
+from src.snapshots import write_encrypted
+
+
+class FakeS3(BaseHTTPRequestHandler):
+    """An in-process stand-in for the S3 multipart upload API."""
+
+    objects: dict[str, bytes] = {}
+    uploads: dict[str, dict[int, bytes]] = {}
+    requests: list[str] = []
+    # Part numbers whose first attempt fails with a 500
+    flaky_parts: set[int] = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        key = urllib.parse.unquote(url.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        assert self.headers["Authorization"].startswith("AWS4-HMAC-SHA256 ")
+        self.requests.append(f"{self.command} {sorted(query)}")
+        if self.command == "POST" and "uploads" in query:
+            upload_id = f"upload-{len(self.uploads)}"
+            self.uploads[upload_id] = {}
+            self._reply(
+                200,
+                f"<InitiateMultipartUploadResult><UploadId>{upload_id}"
+                "</UploadId></InitiateMultipartUploadResult>".encode(),
+            )
+        elif self.command == "PUT" and "partNumber" in query:
+            number = int(query["partNumber"])
+            if number in self.flaky_parts:
+                self.flaky_parts.discard(number)
+                self._reply(500, b"<Error>InternalError</Error>")
+                return
+            self.uploads[query["uploadId"]][number] = body
+            self._reply(200, headers={"ETag": f'"{number}"'})
+        elif self.command == "POST" and "uploadId" in query:
+            parts = self.uploads.pop(query["uploadId"])
+            numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)<", body)]
+            self.objects[key] = b"".join(parts[n] for n in numbers)
+            self._reply(200, b"<CompleteMultipartUploadResult/>")
+        elif self.command == "DELETE" and "uploadId" in query:
+            self.uploads.pop(query["uploadId"], None)
+            self._reply(204)
+        elif self.command == "PUT":
+            self.objects[key] = body
+            self._reply(200, headers={"ETag": '"x"'})
+        else:
+            self._reply(400)
+
+    do_GET = do_PUT = do_POST = do_DELETE = _handle
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(sinks, "RETRY_BACKOFF", 0)
+    FakeS3.objects, FakeS3.uploads, FakeS3.requests = {}, {}, []
+    FakeS3.flaky_parts = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeS3)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield S3Sink(
+        "bucket",
+        prefix="vaults",
+        endpoint=f"http://127.0.0.1:{server.server_port}",
+        access_key="access",
+        secret_key="secret",
+        part_size=sinks.MIN_PART_SIZE,
+        concurrency=2,
+    )
+    server.shutdown()
+    server.server_close()
+
+
+class BrokenSink:
+    name = "broken"
+
+    def open(self, key):
+        raise SinkError("unreachable")
+
+
+def test_s3_multipart_upload_retries_parts(s3):
+    """
+    Tests that a large file is uploaded in parts, that a failed part is
+    retried on its own, and that a small file is sent with one PUT.
+    """
+    FakeS3.flaky_parts = {2}
+    data = os.urandom(2 * sinks.MIN_PART_SIZE + 1000)
+    upload = s3.open("backup.enc")
+    for start in range(0, len(data), 64 * 1024):
+        upload.write(data[start : start + 64 * 1024])
+    upload.commit()
+    assert FakeS3.objects["/bucket/vaults/backup.enc"] == data
+    assert FakeS3.requests.count("PUT ['partNumber', 'uploadId']") == 4
+    assert FakeS3.uploads == {}
+
+    small = s3.open("small.enc")
+    small.write(b"tiny")
+    small.commit()
+    assert FakeS3.objects["/bucket/vaults/small.enc"] == b"tiny"
+
+    aborted = s3.open("aborted.enc")
+    aborted.write(data)
+    aborted.abort()
+    assert "/bucket/vaults/aborted.enc" not in FakeS3.objects
+    assert FakeS3.uploads == {}
+
+
+def test_fan_out_isolates_failing_sinks(tmp_path):
+    """
+    Tests that every sink gets the whole stream, and that a failing sink
+    neither blocks nor fails the others.
+    """
+    fanout = FanOut([LocalSink(str(tmp_path / "a")), BrokenSink()], "p/backup.enc")
+    for _ in range(sinks.QUEUE_CHUNKS * 4):
+        fanout.write(b"x" * 1000)
+    errors = fanout.close()
+    assert errors[f"file://{tmp_path / 'a'}"] is None
+    assert isinstance(errors["broken"], SinkError)
+    assert (tmp_path / "a" / "p" / "backup.enc").read_bytes() == b"x" * 64000
+
+    fanout = FanOut([LocalSink(str(tmp_path / "b"))], "backup.enc")
+    fanout.write(b"partial")
+    fanout.close(commit=False)
+    assert list((tmp_path / "b").iterdir()) == []
+
+
+def test_backup_is_streamed_while_written(tmp_path, s3, monkeypatch):
+    """
+    Tests that a raw backup reaches the sinks as it is encrypted, and that
+    an unchanged export linked to the previous snapshot is uploaded from
+    disk instead.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    targets = [s3, LocalSink(str(tmp_path / "copy"))]
+    backups = tmp_path / "backups"
+    backups.mkdir()
+    for name in ("backup_1.enc", "backup_2.enc"):
+        backup_file = backups / name
+        with streaming(targets, name) as upload:
+            write_encrypted(str(backup_file), b'{"items": []}', "file_pw")
+            streamed = upload.fanout is not None
+            assert upload.finish(str(backup_file)) == []
+        assert streamed == (name == "backup_1.enc")
+        assert FakeS3.objects[f"/bucket/vaults/{name}"] == backup_file.read_bytes()
+        assert (tmp_path / "copy" / name).read_bytes() == backup_file.read_bytes()
+    out = io.BytesIO()
+    crypto.decrypt_stream(
+        io.BytesIO(FakeS3.objects["/bucket/vaults/backup_1.enc"]), out, "file_pw"
+    )
+    assert out.getvalue() == b'{"items": []}'
+
+    with pytest.raises(RuntimeError), streaming(targets, "backup_3.enc") as upload:
+        write_encrypted(str(backups / "backup_3.enc"), b"{}", "file_pw", dedup=False)
+        raise RuntimeError("export failed")
+    assert "/bucket/vaults/backup_3.enc" not in FakeS3.objects
+    assert FakeS3.uploads == {}
+    assert sorted(p.name for p in (tmp_path / "copy").iterdir()) == [
+        "backup_1.enc",
+        "backup_2.enc",
+    ]
+
+
+def test_ssh_sink(tmp_path):
+    """Tests that the SSH sink only gives a complete file its final name."""
+    ssh = tmp_path / "ssh"
+    ssh.write_text(
+        '#!/bin/sh\nfor last; do :; done\necho "$@" >> "$0.log"\nexec sh -c "$last"\n'
+    )
+    ssh.chmod(0o755)
+    remote = tmp_path / "remote"
+    sink = SshSink(
+        "backup.example", path=str(remote), user="me", port=2222, ssh_cmd=str(ssh)
+    )
+
+    upload = sink.open("p/backup.enc")
+    upload.write(b"data")
+    upload.commit()
+    assert (remote / "p" / "backup.enc").read_bytes() == b"data"
+    assert "-p 2222 me@backup.example" in (tmp_path / "ssh.log").read_text()
+
+    upload = sink.open("p/other.enc")
+    upload.write(b"data")
+    upload.abort()
+    assert sorted(p.name for p in (remote / "p").iterdir()) == ["backup.enc"]
+
+
+def test_sinks_from_env(monkeypatch):
+    """Tests that BACKUP_SINKS lists targets of every kind."""
+    monkeypatch.setenv(
+        "BACKUP_SINKS", "s3://bucket/prefix, sftp://me@host:2222/srv/backups /mnt/nas"
+    )
+    monkeypatch.setenv("BACKUP_S3_ACCESS_KEY_ID", "access")
+    monkeypatch.setenv("BACKUP_S3_SECRET_ACCESS_KEY", "secret")
+    s3, ssh, local = sinks.sinks_from_env()
+    assert (s3.bucket, s3.prefix) == ("bucket", "prefix/")
+    assert s3.endpoint == "https://s3.us-east-1.amazonaws.com"
+    assert (ssh.user, ssh.host, ssh.port, ssh.path) == (
+        "me",
+        "host",
+        2222,
+        "/srv/backups",
+    )
+    assert local.directory == "/mnt/nas"
+    monkeypatch.setenv("BACKUP_SINKS", "ftp://host/")
+    with pytest.raises(SinkError):
+        sinks.sinks_from_env()
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import threading
+import time
+import pytest
+from src import crypto
+from src.crypto import decrypt_stream
+from src.retention import DAY, prune_older_than
+from src.snapshots import MANIFEST_NAME, ExportCache, write_encrypted
+
+KDF_SALT = b"s" * 16
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+
+
+def _decrypt(path) -> bytes:
+    out = io.BytesIO()
+    with open(path, "rb") as f:
+        decrypt_stream(f, out, "file_pw")
+    return out.getvalue()
+
+
+def _write(path, data: bytes, **kwargs) -> int:
+    return write_encrypted(str(path), data, "file_pw", kdf_salt=KDF_SALT, **kwargs)
+
+
+def test_unchanged_export_is_linked(tmp_path):
+    """
+    Tests that an identical export is hardlinked to the previous backup
+    without being encrypted again, and becomes the new latest snapshot.
+    """
+    first = tmp_path / "backup_1.enc"
+    second = tmp_path / "backup_2.enc"
+    assert _write(first, b'{"items": []}') > 0
+    assert _write(second, b'{"items": []}') == 0
+    assert os.path.samefile(first, second)
+    assert _decrypt(second) == b'{"items": []}'
+    with open(tmp_path / MANIFEST_NAME) as f:
+        assert json.load(f)["file"] == "backup_2.enc"
+
+
+def test_changed_export_is_written(tmp_path):
+    """
+    Tests that a different export, or dedup turned off, writes a full file.
+    """
+    first = tmp_path / "backup_1.enc"
+    second = tmp_path / "backup_2.enc"
+    third = tmp_path / "backup_3.enc"
+    _write(first, b'{"items": []}')
+    assert _write(second, b'{"items": [1]}') > 0
+    assert not os.path.samefile(first, second)
+    assert _write(third, b'{"items": [1]}', dedup=False) > 0
+    assert not os.path.samefile(second, third)
+
+
+def test_missing_latest_snapshot_is_rewritten(tmp_path):
+    """
+    Tests that a full file is written when the latest backup was deleted.
+    """
+    first = tmp_path / "backup_1.enc"
+    second = tmp_path / "backup_2.enc"
+    _write(first, b"vault")
+    os.remove(first)
+    assert _write(second, b"vault") > 0
+    assert _decrypt(second) == b"vault"
+
+
+def test_linked_snapshot_survives_retention(tmp_path):
+    """
+    Tests that linking refreshes the shared mtime, so retention does not
+    delete the data of the newest backup, and that removing the old name
+    leaves the new one readable.
+    """
+    now = time.time()
+    first = tmp_path / "backup_1.enc"
+    second = tmp_path / "backup_2.enc"
+    _write(first, b"vault")
+    os.utime(first, (now - 30 * DAY, now - 30 * DAY))
+    _write(second, b"vault")
+    assert prune_older_than(str(tmp_path), 7, now=now) == []
+    os.remove(first)
+    assert _decrypt(second) == b"vault"
+
+
+def test_export_cache_builds_once_while_sharing():
+    """
+    Tests that concurrent callers inside overlapping sharing() blocks get
+    one export per key, and that nothing is kept once the last block ends.
+    """
+    cache = ExportCache()
+    builds = []
+
+    def build(key):
+        def run():
+            builds.append(key)
+            time.sleep(0.05)
+            return {"key": key}
+
+        return run
+
+    assert cache.get("a", build("a")) == {"key": "a"}
+    assert builds == ["a"]
+    with cache.sharing():
+        with cache.sharing():
+            threads = [
+                threading.Thread(target=cache.get, args=(key, build(key)))
+                for key in ("a", "a", "b")
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert sorted(builds) == ["a", "a", "b"]
+        cache.get("b", build("b"))
+        assert len(builds) == 3
+    cache.get("b", build("b"))
+    assert len(builds) == 4
@@ -0,0 +1,112 @@
+import json
+import subprocess
+import sys
+import pytest
+from src import metrics, tracing
+
+BURN = "x = bytearray(32 * 1024 * 1024); sum(range(200000))"
+
+
+def _spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_spans_are_linked_under_one_trace(tmp_path):
+    """
+    Tests that phases and child processes are written as spans of one trace,
+    each pointing at its parent, with the child's resource usage.
+    """
+    trace_file = tmp_path / "traces" / "trace.jsonl"
+    with tracing.trace(str(trace_file), profile="default") as root:
+        with metrics.phase("export"):
+            with tracing.span("bw export", argv=["export"]):
+                result = tracing.run(
+                    [sys.executable, "-c", BURN], capture_output=True, check=True
+                )
+        root.set(success=True)
+
+    assert result.returncode == 0
+    spans = {span["name"]: span for span in _spans(trace_file)}
+    assert set(spans) == {"backup", "export", "bw export"}
+    assert len({span["trace_id"] for span in spans.values()}) == 1
+    assert spans["backup"]["parent_id"] is None
+    assert spans["backup"]["attributes"] == {"profile": "default", "success": True}
+    assert spans["export"]["parent_id"] == spans["backup"]["span_id"]
+    assert spans["bw export"]["parent_id"] == spans["export"]["span_id"]
+
+    child = spans["bw export"]["attributes"]
+    assert child["argv"] == ["export"]
+    assert child["children"] == 1
+    assert child["child_exit_code"] == 0
+    assert child["child_user_s"] + child["child_sys_s"] > 0
+    # The child allocated 32 MiB
+    assert child["child_max_rss_kb"] > 32 * 1024
+
+
+def test_run_matches_subprocess_run(tmp_path):
+    """Tests that tracing.run behaves like subprocess.run outside a trace."""
+    result = tracing.run(
+        [sys.executable, "-c", "print('out')"], text=True, capture_output=True
+    )
+    assert result.stdout == "out\n"
+    assert result.returncode == 0
+
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        tracing.run(
+            [sys.executable, "-c", "import sys; sys.exit(3)"],
+            capture_output=True,
+            check=True,
+        )
+    assert e.value.returncode == 3
+
+
+def test_wait_reaps_with_resource_usage(tmp_path):
+    """
+    Tests that tracing.wait reaps a process started with a plain Popen,
+    with its real exit code and resource usage, and times out like
+    Popen.wait.
+    """
+    trace_file = tmp_path / "trace.jsonl"
+    with tracing.trace(str(trace_file)), tracing.span("bw serve"):
+        with subprocess.Popen(
+            [sys.executable, "-c", f"{BURN}; import sys; sys.exit(4)"]
+        ) as process:
+            assert tracing.wait(process, timeout=30) == 4
+        assert process.returncode == 4
+        with subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(30)"]
+        ) as process:
+            with pytest.raises(subprocess.TimeoutExpired):
+                tracing.wait(process, timeout=0.1)
+            process.kill()
+            assert tracing.wait(process) == -9
+
+    child = {span["name"]: span for span in _spans(trace_file)}["bw serve"]
+    attributes = child["attributes"]
+    assert attributes["children"] == 2
+    assert attributes["child_max_rss_kb"] > 32 * 1024
+
+
+def test_failed_span_and_chrome_trace(tmp_path):
+    """
+    Tests that a span records the error that left it, and that a trace file
+    converts to Chrome trace events.
+    """
+    trace_file = tmp_path / "trace.jsonl"
+    with pytest.raises(ValueError):
+        with tracing.trace(str(trace_file)):
+            with tracing.span("bw unlock"):
+                raise ValueError("wrong password")
+
+    spans = {span["name"]: span for span in _spans(trace_file)}
+    assert spans["bw unlock"]["attributes"]["error"] == "ValueError"
+    assert spans["backup"]["attributes"]["error"] == "ValueError"
+    assert tracing.current_trace_id() is None
+
+    events = tracing.to_chrome_trace(trace_file.read_text().splitlines())
+    assert [event["name"] for event in events["traceEvents"]] == [
+        "bw unlock",
+        "backup",
+    ]
+    assert all(event["ph"] == "X" for event in events["traceEvents"])
+    assert events["traceEvents"][0]["cat"] == "bw"
@@ -0,0 +1,389 @@
+import base64
+import io
+import json
+import os
+import threading
+import tracemalloc
+import urllib.parse
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src import catalog, crypto
+from src.bw_client import BitwardenError
+from src.export_format import canonical_json, iter_csv
+from src.crypto import decrypt_stream
+from benchmarks.vaultgen import personal_export, synthetic_export
+from src.vault_api import (
+    KDF_PBKDF2,
+    SymmetricKey,
+    VaultApiClient,
+    _service_urls,
+    decrypt_enc_bytes,
+    decrypt_enc_string,
+    derive_master_key,
+    encrypt_enc_string,
+)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "vault_sync.json")
+
+with open(FIXTURE) as f:
+    RECORDED = json.load(f)
+
+
+class FakeVaultServer(BaseHTTPRequestHandler):
+    """Serves a recorded token response and /api/sync payload."""
+
+    token_requests: list = []
+    # Extra GET routes: path -> JSON payload, or raw bytes for file downloads
+    routes: dict = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("ascii"))
+        self.token_requests.append(form)
+        if self.path != "/identity/connect/token":
+            self._reply(404, {})
+        elif form.get("client_secret") == ["test_client_secret"]:
+            self._reply(200, RECORDED["token"])
+        else:
+            self._reply(400, {"error": "invalid_client"})
+
+    def do_GET(self):
+        if self.path.startswith("/api/sync"):
+            if self.headers.get("Authorization") == "Bearer test-access-token":
+                self._reply(200, RECORDED["sync"])
+            else:
+                self._reply(401, {})
+        elif isinstance(self.routes.get(self.path), bytes):
+            if self.headers.get("Authorization"):
+                self._reply(403, {})
+                return
+            body = self.routes[self.path]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path in self.routes:
+            self._reply(200, self.routes[self.path])
+        else:
+            self._reply(404, {})
+
+
+@pytest.fixture
+def server_url():
+    FakeVaultServer.token_requests = []
+    FakeVaultServer.routes = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeVaultServer)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server_url):
+    client = VaultApiClient(server_url, "test_client_id", "test_client_secret")
+    client.login()
+    client.unlock("master_pw")
+    return client
+
+
+def test_enc_string_roundtrip():
+    """
+    Tests that type 2 EncStrings decrypt back and reject a wrong key.
+    """
+    key = SymmetricKey(os.urandom(64))
+    enc = encrypt_enc_string(b"hello", key)
+    assert enc.startswith("2.")
+    assert decrypt_enc_string(enc, key) == b"hello"
+    with pytest.raises(BitwardenError, match="MAC"):
+        decrypt_enc_string(enc, SymmetricKey(os.urandom(64)))
+
+
+def test_service_urls():
+    """
+    Tests identity/API URL resolution for cloud and self-hosted servers.
+    """
+    assert _service_urls("https://vault.bitwarden.com") == (
+        "https://identity.bitwarden.com",
+        "https://api.bitwarden.com",
+    )
+    assert _service_urls("https://vault.example.com/") == (
+        "https://vault.example.com/identity",
+        "https://vault.example.com/api",
+    )
+
+
+def test_login_uses_client_credentials(server_url):
+    """
+    Tests the API key identity token exchange and the follow-up sync.
+    """
+    client = VaultApiClient(server_url, "test_client_id", "test_client_secret")
+    assert client.login() == "test-access-token"
+    form = FakeVaultServer.token_requests[0]
+    assert form["grant_type"] == ["client_credentials"]
+    assert form["scope"] == ["api"]
+    assert form["client_id"] == ["test_client_id"]
+    assert client.status()["status"] == "locked"
+    assert client.status()["userEmail"] == "backup@example.com"
+
+
+def test_login_invalid_credentials(server_url):
+    """
+    Tests that a rejected API key raises BitwardenError.
+    """
+    client = VaultApiClient(server_url, "test_client_id", "wrong")
+    with pytest.raises(BitwardenError, match="HTTP 400"):
+        client.login()
+
+
+def test_unlock_wrong_password(server_url):
+    """
+    Tests that a wrong master password fails to unlock.
+    """
+    client = VaultApiClient(server_url, "test_client_id", "test_client_secret")
+    client.login()
+    with pytest.raises(BitwardenError, match="Invalid master password"):
+        client.unlock("wrong")
+
+
+def test_export_json_matches_cli_layout(client):
+    """
+    Tests that the decrypted export has the `bw export --format json` layout,
+    skips organization and deleted items, and honours item-level keys.
+    """
+    assert client.status()["status"] == "unlocked"
+    export = client.export_json()
+    assert export["encrypted"] is False
+    assert export["folders"] == [
+        {"id": "3b2f1c9e-6a51-4d0f-9a6e-0c1d2e3f4a5b", "name": "Personal"}
+    ]
+    items = {item["id"]: item for item in export["items"]}
+    assert sorted(items) == ["c1", "c2", "c3", "c4", "c5"]
+
+    login = items["c1"]
+    assert list(login)[:12] == [
+        "passwordHistory",
+        "revisionDate",
+        "creationDate",
+        "deletedDate",
+        "id",
+        "organizationId",
+        "folderId",
+        "type",
+        "reprompt",
+        "name",
+        "notes",
+        "favorite",
+    ]
+    assert login["name"] == "Email account"
+    assert login["notes"] == "primary inbox"
+    assert login["login"] == {
+        "fido2Credentials": [],
+        "uris": [{"match": None, "uri": "https://mail.example.com"}],
+        "username": "alice",
+        "password": "hunter2",
+        "totp": None,
+    }
+    assert login["fields"] == [
+        {"name": "PIN", "value": "1234", "type": 1, "linkedId": None}
+    ]
+    assert login["passwordHistory"] == [
+        {"lastUsedDate": "2024-12-15T00:00:00.000Z", "password": "hunter1"}
+    ]
+    assert items["c2"]["secureNote"] == {"type": 0}
+    assert items["c3"]["card"]["number"] == "4111111111111111"
+    assert items["c4"]["identity"]["firstName"] == "Alice"
+    assert items["c5"]["login"]["password"] == "s3cret"
+    assert client.org_keys.keys() == {"o1"}
+
+
+def test_export_json_of_organization(client):
+    """
+    Tests that an organization is exported with its own items and
+    collections, like `bw export --organizationid`.
+    """
+    assert client.list_organizations() == [
+        {"object": "organization", "id": "o1", "name": "Team"}
+    ]
+    export = client.export_json("o1")
+    assert export["collections"] == []
+    assert [item["id"] for item in export["items"]] == ["c6"]
+    assert export["items"][0]["organizationId"] == "o1"
+    assert export["items"][0]["collectionIds"] == []
+    with pytest.raises(BitwardenError):
+        client.export_json("missing")
+
+
+def test_shared_export_decrypts_once(client, tmp_path, monkeypatch):
+    """
+    Tests that formats exported inside shared_export() decrypt the vault
+    once, that each still reports its own counts, and that CSV exports only
+    hold logins and secure notes.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    builds = []
+    build_export = client._build_export
+    monkeypatch.setattr(
+        client,
+        "_build_export",
+        lambda organization_id: (
+            builds.append(organization_id) or build_export(organization_id)
+        ),
+    )
+
+    with client.shared_export():
+        with catalog.collect() as raw_stats:
+            client.export_raw_encrypted(str(tmp_path / "raw.enc"), "file_pw")
+        with catalog.collect() as csv_stats:
+            client.export_csv_encrypted(str(tmp_path / "csv.enc"), "file_pw")
+    assert builds == [None]
+    assert (raw_stats["items"], raw_stats["folders"]) == (5, 1)
+    assert (csv_stats["items"], csv_stats["folders"]) == (3, None)
+
+    export = client.export_json()
+    assert builds == [None, None]
+    decrypted = io.BytesIO()
+    with open(tmp_path / "csv.enc", "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert decrypted.getvalue() == b"".join(iter_csv(export))
+
+
+def test_export_raw_encrypted(client, tmp_path, monkeypatch):
+    """
+    Tests that the raw export is written in the same container as the CLI
+    engine and decrypts to the export JSON.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    backup_file = tmp_path / "backup.enc"
+    client.export_raw_encrypted(str(backup_file), "file_pw")
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert json.loads(decrypted.getvalue()) == client.export_json()
+
+
+def test_export_raw_encrypted_compressed(client, tmp_path, monkeypatch):
+    """
+    Tests that compressed raw exports hold the canonical export JSON.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    backup_file = tmp_path / "backup.enc"
+    client.export_raw_encrypted(str(backup_file), "file_pw", compression="zlib")
+    decrypted = io.BytesIO()
+    with open(backup_file, "rb") as f:
+        decrypt_stream(f, decrypted, "file_pw")
+    assert decrypted.getvalue() == canonical_json(client.export_json())
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_export_raw_encrypted_memory(client, tmp_path, monkeypatch, compression):
+    """
+    Tests that serializing and encrypting an export many chunks long does not
+    hold a plaintext copy of it: the peak stays within a few chunk buffers,
+    however large the export is.
+    """
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    export = personal_export(synthetic_export(5000))
+    export["items"] *= 5
+    size = len(json.dumps(export, indent=2).encode())
+    assert size > 16 * crypto.DEFAULT_CHUNK_SIZE
+    monkeypatch.setattr(client, "export_json", lambda organization_id=None: export)
+    tracemalloc.start()
+    try:
+        # dedup would serialize the export a second time, only to hash it
+        client.export_raw_encrypted(
+            str(tmp_path / "backup.enc"),
+            "file_pw",
+            dedup=False,
+            compression=compression,
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 8 * crypto.DEFAULT_CHUNK_SIZE
+
+
+def test_export_bitwarden_encrypted(client, tmp_path, monkeypatch):
+    """
+    Tests the password-protected Bitwarden export format.
+    """
+    monkeypatch.setattr("src.vault_api.EXPORT_KDF_ITERATIONS", 1000)
+    backup_file = tmp_path / "backup.json"
+    client.export_bitwarden_encrypted(str(backup_file), "file_pw")
+    with open(backup_file) as f:
+        export = json.load(f)
+    assert export["encrypted"] is True
+    assert export["passwordProtected"] is True
+    key = SymmetricKey.stretch(
+        derive_master_key("file_pw", export["salt"], KDF_PBKDF2, 1000)
+    )
+    decrypt_enc_string(export["encKeyValidation_DO_NOT_EDIT"], key)
+    assert json.loads(decrypt_enc_string(export["data"], key)) == client.export_json()
+
+
+def test_logout_forgets_keys(client):
+    """
+    Tests that logout drops the token and decrypted keys.
+    """
+    client.logout()
+    assert client.user_key is None
+    assert client.status()["status"] == "unauthenticated"
+    with pytest.raises(BitwardenError):
+        client.export_json()
+
+
+def _enc_bytes(data: bytes, key: SymmetricKey) -> bytes:
+    """Encrypt data into a type 2 EncArrayBuffer, like attachment uploads."""
+    iv, ciphertext, mac = (
+        base64.b64decode(part) for part in encrypt_enc_string(data, key)[2:].split("|")
+    )
+    return b"\x02" + iv + mac + ciphertext
+
+
+def test_download_attachment(client, server_url):
+    """
+    Tests that attachments are listed with decrypted names and downloaded
+    without the bearer token, then decrypted with their own key.
+    """
+    cipher = next(c for c in client.sync_data["ciphers"] if c["id"] == "c1")
+    cipher_key = client._cipher_key(cipher)
+    attachment_key = SymmetricKey(os.urandom(64))
+    cipher["attachments"] = [
+        {
+            "id": "a1",
+            "fileName": encrypt_enc_string(b"scan.pdf", cipher_key),
+            "size": "11",
+        }
+    ]
+    FakeVaultServer.routes = {
+        "/api/ciphers/c1/attachment/a1": {
+            "Url": f"{server_url}/attachments/c1/a1?token=t",
+            "Key": encrypt_enc_string(
+                attachment_key.enc_key + attachment_key.mac_key, cipher_key
+            ),
+        },
+        "/attachments/c1/a1?token=t": _enc_bytes(b"pdf content", attachment_key),
+    }
+
+    refs = client.list_attachments()
+    assert [
+        (ref.item_id, ref.attachment_id, ref.file_name, ref.size) for ref in refs
+    ] == [("c1", "a1", "scan.pdf", 11)]
+    with client.open_attachment(refs[0]) as stream:
+        assert stream.read() == b"pdf content"
+    with pytest.raises(BitwardenError, match="MAC"):
+        decrypt_enc_bytes(
+            _enc_bytes(b"pdf content", attachment_key), SymmetricKey(os.urandom(64))
+        )
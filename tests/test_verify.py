@@ -0,0 +1,201 @@
+import hashlib
+import io
+import json
+import os
+from unittest.mock import patch
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from src import crypto, metrics
+from src.catalog import load_index, record_backup
+from src.vault_api import VaultApiClient
+from src.verify import DAY, due_backups, verify_backups, verify_file
+
+VAULT = {
+    "encrypted": False,
+    "folders": [{"id": "f1", "name": "Work"}],
+    "items": [
+        {"id": "1", "name": "a", "revisionDate": "2025-01-01T00:00:00.000Z"},
+        {"id": "2", "name": "b", "revisionDate": "2025-01-01T00:00:00.000Z"},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    monkeypatch.setattr(crypto, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr("src.vault_api.EXPORT_KDF_ITERATIONS", 1000)
+    metrics.REGISTRY.reset()
+
+
+def write_raw(path, vault=VAULT, password="file_pw", created=None):
+    out = io.BytesIO()
+    crypto.encrypt_stream(io.BytesIO(json.dumps(vault).encode()), out, password)
+    path.write_bytes(out.getvalue())
+    return record_backup(
+        str(path),
+        created=created,
+        mode="raw",
+        sha256=hashlib.sha256(out.getvalue()).hexdigest(),
+        items=len(vault["items"]),
+        folders=len(vault["folders"]),
+    )
+
+
+def test_verify_raw_backup(tmp_path):
+    """Tests that a raw backup decrypts and matches what the catalog recorded."""
+    path = tmp_path / "backup_20250101_000000.enc"
+    entry = write_raw(path)
+    expected = {"sha256": entry.sha256, "items": 2, "folders": 1}
+
+    result = verify_file(str(path), "file_pw", expected)
+    assert result.ok, result.error
+    assert (result.items, result.folders) == (2, 1)
+
+    assert "wrong password" in verify_file(str(path), "nope", expected).error
+    assert (
+        "Expected 3 items"
+        in verify_file(str(path), "file_pw", {**expected, "items": 3}).error
+    )
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 1
+    path.write_bytes(bytes(data))
+    assert not verify_file(str(path), "file_pw").ok
+
+
+def test_verify_raw_backup_counts_while_decrypting(tmp_path):
+    """
+    Tests that raw JSON and CSV exports are counted chunk by chunk, and that
+    a plaintext that is neither is a failed verification.
+    """
+    path = tmp_path / "backup_20250101_000000.enc"
+
+    def check(plaintext: bytes):
+        out = io.BytesIO()
+        crypto.encrypt_stream(io.BytesIO(plaintext), out, "file_pw", chunk_size=7)
+        path.write_bytes(out.getvalue())
+        return verify_file(str(path), "file_pw")
+
+    result = check(b"  " + json.dumps(VAULT, indent=2).encode())
+    assert result.ok, result.error
+    assert (result.items, result.folders) == (2, 1)
+
+    csv_export = (
+        b'folder,favorite,type,name,notes\r\nWork,,login,a,"two\r\nlines"\r\n,1,note,b,'
+    )
+    result = check(csv_export)
+    assert result.ok, result.error
+    assert (result.items, result.folders) == (2, None)
+
+    assert "not a JSON object" in check(json.dumps(VAULT).encode()[:-1]).error
+    assert "no items list" in check(b'{"encrypted": false}').error
+    assert "neither JSON nor" in check(b"Not found.").error
+
+
+def test_verify_legacy_backup_with_brace_salt(tmp_path):
+    """
+    Tests that a v1 backup whose random salt happens to start with "{" is
+    verified as a raw backup, not misread as a Bitwarden-mode export.
+    """
+    path = tmp_path / "backup_20250101_000000.enc"
+    salt = b"{" + os.urandom(crypto.SALT_SIZE - 1)
+    nonce = os.urandom(crypto.NONCE_SIZE)
+    key = crypto.derive_key("file_pw", salt)
+    plaintext = json.dumps(VAULT).encode()
+    path.write_bytes(salt + nonce + AESGCM(key).encrypt(nonce, plaintext, None))
+
+    result = verify_file(str(path), "file_pw", {"items": 2, "folders": 1})
+    assert result.ok, result.error
+    assert "wrong password" in verify_file(str(path), "nope").error
+
+
+def test_verify_bitwarden_export(tmp_path):
+    """
+    Tests that a Bitwarden-mode export is decrypted with the file password,
+    and that a structurally broken one fails.
+    """
+    path = tmp_path / "backup_20250101_000000.enc"
+    client = VaultApiClient("https://vault.example", "user.id", "secret")
+    with patch.object(VaultApiClient, "export_json", return_value=VAULT):
+        client.export_bitwarden_encrypted(str(path), "file_pw")
+
+    result = verify_file(str(path), "file_pw", {"items": 2, "folders": 1})
+    assert result.ok, result.error
+    assert not verify_file(str(path), "nope").ok
+
+    export = json.loads(path.read_text())
+    del export["encKeyValidation_DO_NOT_EDIT"]
+    path.write_text(json.dumps(export))
+    assert "missing encKeyValidation" in verify_file(str(path), "file_pw").error
+
+
+def test_verify_backups_records_results(tmp_path):
+    """
+    Tests that due backups are verified once per distinct content, that the
+    outcome is recorded in the catalog, and that verified backups are not
+    due again until they are old enough.
+    """
+    first = write_raw(tmp_path / "backup_20250101_000000.enc")
+    linked = tmp_path / "backup_20250102_000000.enc"
+    os.link(tmp_path / first.file, linked)
+    record_backup(str(linked), mode="raw", sha256=first.sha256, items=2, folders=1)
+    write_raw(tmp_path / "backup_20250103_000000.enc", password="other_pw")
+
+    results = verify_backups(
+        str(tmp_path), {str(tmp_path): "file_pw"}, workers=2, niceness=0
+    )
+    assert sorted(result.ok for result in results) == [False, True]
+    entries = {entry.file: entry for entry in load_index(str(tmp_path))}
+    assert entries["backup_20250101_000000.enc"].verify_ok
+    assert entries["backup_20250102_000000.enc"].verify_ok
+    assert not entries["backup_20250103_000000.enc"].verify_ok
+    assert entries["backup_20250103_000000.enc"].verify_error
+    assert metrics.VERIFICATIONS.get(profile="default", result="success") == 2
+
+    # Only the failure is retried until the others are 30 days old
+    assert [e.file for _, e in due_backups(str(tmp_path), 30)] == [
+        "backup_20250103_000000.enc"
+    ]
+    later = entries["backup_20250101_000000.enc"].verified + 31 * DAY
+    assert len(due_backups(str(tmp_path), 30, now=later)) == 3
+
+
+def test_due_backups_drops_missing_files(tmp_path):
+    """
+    Tests that a backup deleted without updating the catalog is dropped
+    from it rather than verified and reported as corrupt.
+    """
+    write_raw(tmp_path / "backup_20250101_000000.enc")
+    write_raw(tmp_path / "backup_20250102_000000.enc")
+    os.remove(tmp_path / "backup_20250101_000000.enc")
+
+    results = verify_backups(str(tmp_path), {str(tmp_path): "file_pw"}, niceness=0)
+    assert [(os.path.basename(r.path), r.ok) for r in results] == [
+        ("backup_20250102_000000.enc", True)
+    ]
+    assert [entry.file for entry in load_index(str(tmp_path))] == [
+        "backup_20250102_000000.enc"
+    ]
+
+
+def test_verify_backups_uses_profile_password_for_organizations(tmp_path):
+    """
+    Tests that organization exports and additional formats are verified
+    with the file password of the profile whose dir they are in, and that
+    unknown dirs are skipped.
+    """
+    org_dir = tmp_path / "work" / "org-o1"
+    format_dir = org_dir / "format-raw"
+    format_dir.mkdir(parents=True)
+    write_raw(org_dir / "backup_20250101_000000.enc", password="work_pw")
+    write_raw(format_dir / "backup_20250101_000000.enc", password="work_pw")
+    stray = tmp_path / "stray" / "org-o1"
+    stray.mkdir(parents=True)
+    write_raw(stray / "backup_20250101_000000.enc", password="work_pw")
+
+    results = verify_backups(
+        str(tmp_path), {str(tmp_path / "work"): "work_pw"}, niceness=0
+    )
+    assert sorted((result.path, result.ok) for result in results) == [
+        (str(org_dir / "backup_20250101_000000.enc"), True),
+        (str(format_dir / "backup_20250101_000000.enc"), True),
+    ]